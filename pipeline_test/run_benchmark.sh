@@ -0,0 +1,21 @@
+#!/bin/bash
+
+set -o nounset
+set -o errexit
+#set -o xtrace
+
+# Time each stage of the species separation pipeline for synthetic reads,
+# with the read aligner replaced by the "fake_mapper" stand-in, at several
+# numbers of threads and data sizes, and write strong and weak scaling results
+# to a JSON file. Any arguments are passed to pipeline_benchmark (e.g.
+# "--data-type=dnaseq --num-threads=1,2,4,8").
+
+source common.sh
+
+BENCHMARK_DIR=${RESULTS_DIR}/benchmark
+BENCHMARK_RESULTS_FILE=${RESULTS_DIR}/benchmark_results.json
+
+rm -rf ${BENCHMARK_DIR}
+mkdir -p ${BENCHMARK_DIR}
+
+pipeline_benchmark --work-dir=${BENCHMARK_DIR} "$@" ${MAIN_DIR}/fake_mapper ${BENCHMARK_RESULTS_FILE}
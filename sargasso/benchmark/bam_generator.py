@@ -0,0 +1,260 @@
+"""
+Functions for generating synthetic, read name sorted, per-species BAM files,
+resembling those produced by mapping a set of mixed-species reads to each
+species' genome. Exports:
+
+GeneratorParameters: Parameters controlling the synthetic reads generated.
+generate_bams: Write a synthetic BAM file for each species.
+generate_fastqs: Write synthetic FASTQ files for a set of mixed-species reads.
+get_origin: Return the species of origin of a read written by generate_fastqs.
+get_header: Return the header for synthetic BAM files.
+get_species_hits: Return synthetic hits for a read against a species' genome.
+"""
+
+import gzip
+import math
+import random
+
+from collections import namedtuple
+
+import pysam
+
+# For RNA-seq data, the mapper (STAR) records numbers of multiple mappings and
+# mismatches in the NH and nM tags; otherwise (Bowtie2) mismatches are recorded
+# in the XM tag.
+_RNASEQ = "rnaseq"
+
+_SEQUENCE_LENGTH = 100000000
+_HEADER = {"HD": {"VN": "1.0", "SO": "queryname"},
+           "SQ": [{"SN": "chr1", "LN": _SEQUENCE_LENGTH}]}
+_MAX_CLIP_FRACTION = 0.2
+
+_FLAG_PAIRED = 0x1
+_FLAG_FIRST = 0x40
+_FLAG_SECOND = 0x80
+_FLAG_SECONDARY = 0x100
+
+_CIGAR_MATCH = 0
+_CIGAR_SOFT_CLIP = 4
+
+# Reads written to FASTQ files are named "<read-id>:<species-of-origin>"
+_ORIGIN_SEPARATOR = ":"
+_NUM_FASTQ_SEQUENCES = 1024
+
+GeneratorParameters = namedtuple(
+    'GeneratorParameters',
+    ['data_type', 'species', 'num_reads', 'read_length', 'paired_end',
+     'multimap_weights', 'mismatch_rate', 'divergence', 'cross_mapping_rate',
+     'clip_rate', 'seed'])
+GeneratorParameters.__new__.__defaults__ = (
+    _RNASEQ, ["species1", "species2"], 100000, 100, True,
+    [0.8, 0.1, 0.05, 0.05], 0.005, 0.02, 0.5, 0.05, 1)
+
+
+def _poisson(rng, mean):
+    """
+    Return a Poisson-distributed random integer (Knuth's algorithm, adequate
+    for the small means used here).
+    """
+    limit = math.exp(-mean)
+    count = 0
+    product = rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+def _choose(rng, weights):
+    """
+    Return an index into 'weights', chosen with probability proportional to
+    its weight.
+    """
+    target = rng.random() * sum(weights)
+    for index, weight in enumerate(weights):
+        target -= weight
+        if target < 0:
+            return index
+    return len(weights) - 1
+
+
+def _get_read_hits(rng, params, read_name, mismatches, multimaps, clip,
+                   header):
+    """
+    Return the hits for a read mapping to a species' genome.
+    """
+    length = params.read_length
+    sequence = "A" * length
+    qualities = pysam.qualitystring_to_array("I" * length)
+    cigar = [(_CIGAR_SOFT_CLIP, clip), (_CIGAR_MATCH, length - clip)] \
+        if clip else [(_CIGAR_MATCH, length)]
+    mates = [_FLAG_FIRST, _FLAG_SECOND] if params.paired_end else [0]
+
+    hits = []
+    for multimap in range(multimaps):
+        position = rng.randint(0, _SEQUENCE_LENGTH - 2 * length)
+
+        for mate, mate_flag in enumerate(mates):
+            hit = pysam.AlignedSegment(header)
+            hit.query_name = read_name
+            hit.query_sequence = sequence
+            hit.flag = mate_flag | \
+                (_FLAG_PAIRED if params.paired_end else 0) | \
+                (_FLAG_SECONDARY if multimap > 0 else 0)
+            hit.reference_id = 0
+            hit.reference_start = position + mate * length
+            hit.mapping_quality = 255 if multimaps == 1 else 3
+            hit.cigartuples = cigar
+            hit.query_qualities = qualities
+
+            if params.data_type == _RNASEQ:
+                hit.set_tag("NH", multimaps)
+                hit.set_tag("nM", mismatches)
+            else:
+                hit.set_tag("XM", mismatches // len(mates))
+            hit.set_tag("AS", len(mates) * length - 6 * mismatches)
+
+            hits.append(hit)
+
+    return hits
+
+
+def _get_name_format(params):
+    # Zero-padded names are in the same order whether sorted lexically or
+    # naturally
+    return "read{{i:0{w}d}}".format(w=len(str(params.num_reads)))
+
+
+def get_header():
+    """
+    Return the header for synthetic BAM files, describing a single reference
+    sequence.
+    """
+    return pysam.AlignmentHeader.from_dict(_HEADER)
+
+
+def get_species_hits(rng, params, read_name, is_origin, header):
+    """
+    Return a list of synthetic hits for a read against a species' genome; the
+    list is empty if the read does not map to that genome.
+
+    A read always maps to the genome of its species of origin; it maps to each
+    other species' genome with probability 'cross_mapping_rate', with
+    additional mismatches reflecting the divergence between the species. The
+    number of multiple mappings for a read is drawn from 'multimap_weights',
+    in which the i'th value is the relative frequency of reads with i+1
+    mappings.
+    rng: a random.Random object.
+    params: a GeneratorParameters object.
+    read_name: name of the read.
+    is_origin: True if the species is the read's species of origin.
+    header: a pysam.AlignmentHeader for the hits.
+    """
+    if not is_origin and rng.random() >= params.cross_mapping_rate:
+        return []
+
+    bases = params.read_length * (2 if params.paired_end else 1)
+    mismatch_rate = params.mismatch_rate + \
+        (0 if is_origin else params.divergence)
+    mismatches = _poisson(rng, bases * mismatch_rate)
+    multimaps = _choose(rng, params.multimap_weights) + 1
+    clip = rng.randint(
+        1, max(1, int(params.read_length * _MAX_CLIP_FRACTION))) \
+        if rng.random() < params.clip_rate else 0
+
+    return _get_read_hits(rng, params, read_name, mismatches, multimaps, clip,
+                          header)
+
+
+def get_origin(read_name):
+    """
+    Return the name of the species of origin of a read written by
+    'generate_fastqs'.
+    """
+    return read_name.split(_ORIGIN_SEPARATOR, 1)[1]
+
+
+def generate_fastqs(output_prefix, params):
+    """
+    Write gzipped FASTQ files, named "<output-prefix>_1.fastq.gz" (and
+    "<output-prefix>_2.fastq.gz" for paired-end reads), containing a set of
+    synthetic mixed-species reads, each originating from a species chosen
+    uniformly at random. The species of origin of each read is recorded in its
+    name, and can be retrieved with 'get_origin'. Return the list of FASTQ
+    files written.
+
+    output_prefix: path prefix of the FASTQ files to write.
+    params: a GeneratorParameters object.
+    """
+    rng = random.Random(params.seed)
+    fastq_files = ["{p}_{m}.fastq.gz".format(p=output_prefix, m=m) for m in
+                   ([1, 2] if params.paired_end else [1])]
+    outputs = [gzip.open(f, 'wb') for f in fastq_files]
+
+    name_format = _get_name_format(params)
+    qualities = "I" * params.read_length
+
+    # Read sequences are not examined by the fake mapper, so are drawn from a
+    # small pool of random sequences, rather than generated for each read
+    sequences = ["".join([rng.choice("ACGT") for b in
+                          range(params.read_length)])
+                 for i in range(_NUM_FASTQ_SEQUENCES)]
+
+    try:
+        for i in range(params.num_reads):
+            read_name = name_format.format(i=i) + _ORIGIN_SEPARATOR + \
+                params.species[rng.randrange(len(params.species))]
+
+            for output in outputs:
+                output.write("@{r}\n{s}\n+\n{q}\n".format(
+                    r=read_name, s=rng.choice(sequences),
+                    q=qualities).encode())
+    finally:
+        for output in outputs:
+            output.close()
+
+    return fastq_files
+
+
+def generate_bams(output_prefix, params, truth_file=None):
+    """
+    Write a read name sorted BAM file for each species, named
+    "<output-prefix>.<species>.bam", containing synthetic hits for a set of
+    mixed-species reads. Return the list of BAM files written.
+
+    Each read originates from a species chosen uniformly at random; its hits
+    against each species' genome are generated by 'get_species_hits'.
+    output_prefix: path prefix of the BAM files to write.
+    params: a GeneratorParameters object.
+    truth_file: if specified, a file to which the name and species of origin
+    of each read will be written, separated by a tab.
+    """
+    rng = random.Random(params.seed)
+    header = get_header()
+    bam_files = ["{p}.{s}.bam".format(p=output_prefix, s=s)
+                 for s in params.species]
+    outputs = [pysam.AlignmentFile(f, "wb", header=header) for f in bam_files]
+    truth = open(truth_file, 'w') if truth_file else None
+
+    name_format = _get_name_format(params)
+
+    try:
+        for i in range(params.num_reads):
+            read_name = name_format.format(i=i)
+            origin = rng.randrange(len(params.species))
+
+            if truth:
+                truth.write("{r}\t{s}\n".format(
+                    r=read_name, s=params.species[origin]))
+
+            for index, output in enumerate(outputs):
+                for hit in get_species_hits(
+                        rng, params, read_name, index == origin, header):
+                    output.write(hit)
+    finally:
+        for output in outputs:
+            output.close()
+        if truth:
+            truth.close()
+
+    return bam_files
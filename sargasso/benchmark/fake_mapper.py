@@ -0,0 +1,177 @@
+"""
+A stand-in for the STAR and Bowtie2 read aligners, which, rather than aligning
+reads, writes synthetic hits for reads generated by
+bam_generator.generate_fastqs. It accepts the command line arguments with
+which the map_reads_rnaseq and map_reads_dnaseq scripts invoke the aligners,
+so that the whole species separation pipeline can be run, and timed, without
+genome indexes. Exports:
+
+run: Write synthetic hits for a set of reads, as STAR or Bowtie2 would.
+"""
+
+import gzip
+import os.path
+import random
+import sys
+import zlib
+
+import pysam
+
+from sargasso.benchmark import bam_generator
+
+# Arguments recognised when invoked as STAR
+_STAR_GENOME_DIR = "--genomeDir"
+_STAR_READ_FILES = "--readFilesIn"
+_STAR_OUTPUT_PREFIX = "--outFileNamePrefix"
+_STAR_BAM_SUFFIX = "Aligned.out.bam"
+_STAR_LOG_SUFFIX = "Log.final.out"
+
+# Arguments recognised when invoked as Bowtie2
+_BOWTIE2_INDEX = "-x"
+_BOWTIE2_UNPAIRED = "-U"
+_BOWTIE2_MATE_1 = "-1"
+_BOWTIE2_OUTPUT = "-S"
+
+_BOWTIE2_FLAGS = ["--no-unal", "--no-discordant", "--no-mixed"]
+
+# STAR is used to map RNA-seq reads, and Bowtie2 to map DNA-seq reads
+_RNASEQ = "rnaseq"
+_DNASEQ = "dnaseq"
+
+
+def _get_star_arguments(args):
+    """
+    Return a dictionary mapping each STAR option to the list of values which
+    follow it.
+    """
+    arguments = {}
+    option = None
+    for arg in args:
+        if arg.startswith("--"):
+            option = arg
+            arguments[option] = []
+        elif option is not None:
+            arguments[option].append(arg)
+    return arguments
+
+
+def _get_bowtie2_arguments(args):
+    """
+    Return a dictionary mapping each Bowtie2 option to its value.
+    """
+    args = [a for a in args if a not in _BOWTIE2_FLAGS]
+    return dict(zip(args[::2], args[1::2]))
+
+
+def _open_fastq(fastq_file):
+    return gzip.open(fastq_file, 'rb') if fastq_file.endswith(".gz") \
+        else open(fastq_file, 'rb')
+
+
+def _read_names(fastq_files):
+    """
+    Yield the name and sequence length of each read in a list of FASTQ files.
+    """
+    for fastq_file in fastq_files:
+        with _open_fastq(fastq_file) as fastq:
+            for line_number, line in enumerate(fastq):
+                if line_number % 4 == 0:
+                    read_name = line[1:].split()[0].decode()
+                    if read_name.endswith("/1"):
+                        read_name = read_name[:-2]
+                elif line_number % 4 == 1:
+                    yield read_name, len(line.rstrip())
+
+
+def _write_hits(output, fastq_files, species, data_type, paired_end):
+    """
+    Write synthetic hits against a species' genome for each read in a list
+    of FASTQ files, and return the numbers of reads read and mapped.
+
+    The hits for a read depend only on the read's name and the species, so
+    that the same hits are written however the reads are split between
+    invocations.
+    """
+    header = bam_generator.get_header()
+    params = None
+    num_reads = 0
+    num_mapped = 0
+
+    for read_name, read_length in _read_names(fastq_files):
+        if params is None:
+            params = bam_generator.GeneratorParameters(
+                data_type=data_type, read_length=read_length,
+                paired_end=paired_end)
+
+        rng = random.Random(
+            zlib.crc32((read_name + "\t" + species).encode()) ^ params.seed)
+        hits = bam_generator.get_species_hits(
+            rng, params, read_name,
+            bam_generator.get_origin(read_name) == species, header)
+
+        for hit in hits:
+            output.write(hit)
+
+        num_reads += 1
+        num_mapped += 1 if hits else 0
+
+    return num_reads, num_mapped
+
+
+def _run_star(args):
+    arguments = _get_star_arguments(args)
+    species = os.path.basename(
+        os.path.normpath(arguments[_STAR_GENOME_DIR][0]))
+    read_files = arguments[_STAR_READ_FILES]
+    prefix = arguments[_STAR_OUTPUT_PREFIX][0]
+
+    output = pysam.AlignmentFile(
+        prefix + _STAR_BAM_SUFFIX, "wb", header=bam_generator.get_header())
+    try:
+        num_reads, num_mapped = _write_hits(
+            output, read_files[0].split(","), species,
+            _RNASEQ, len(read_files) > 1)
+    finally:
+        output.close()
+
+    with open(prefix + _STAR_LOG_SUFFIX, 'w') as log:
+        log.write("{d:>50} |\t{n}\n".format(
+            d="Number of input reads", n=num_reads))
+        log.write("{d:>50} |\t{n}\n".format(
+            d="Number of mapped reads", n=num_mapped))
+
+
+def _run_bowtie2(args):
+    arguments = _get_bowtie2_arguments(args)
+    species = os.path.basename(
+        os.path.dirname(os.path.normpath(arguments[_BOWTIE2_INDEX])))
+    paired_end = _BOWTIE2_MATE_1 in arguments
+    read_files = arguments[_BOWTIE2_MATE_1 if paired_end
+                           else _BOWTIE2_UNPAIRED]
+
+    output = pysam.AlignmentFile(
+        arguments[_BOWTIE2_OUTPUT], "w", header=bam_generator.get_header())
+    try:
+        num_reads, num_mapped = _write_hits(
+            output, read_files.split(","), species, _DNASEQ, paired_end)
+    finally:
+        output.close()
+
+    sys.stderr.write("{n} reads; of these:\n".format(n=num_reads))
+    sys.stderr.write("  {m} aligned\n".format(m=num_mapped))
+
+
+def run(args):
+    """
+    Write synthetic hits for a set of reads, in the manner of STAR if the
+    command line arguments are those with which STAR is invoked, and
+    otherwise in the manner of Bowtie2. The species to whose genome reads are
+    "mapped" is taken from the name of the index directory, and the species
+    of origin of each read from its name.
+
+    args: list of command line arguments
+    """
+    if _STAR_GENOME_DIR in args:
+        _run_star(args)
+    else:
+        _run_bowtie2(args)
@@ -0,0 +1,367 @@
+import json
+import os
+import os.path
+import platform
+import resource
+import schema
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import sargasso
+import sargasso.separator.options as opts
+import sargasso.utils.samutils as su
+
+from sargasso.benchmark import bam_generator
+from sargasso.filter import fastq_writer, hits_checker, hits_info, \
+    sample_filterer
+from sargasso.filter.separation_stats import SeparationStats
+from sargasso.separator.parameter_validator import ParameterValidator
+from sargasso.utils import log
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# Maximum resident set size is reported in kilobytes on Linux, but in bytes
+# on macOS
+_MAX_RSS_PER_MB = 1024.0 * 1024 if sys.platform == "darwin" else 1024.0
+_BYTES_PER_MB = 1024.0 * 1024
+
+_HITS_INFO_CLASSES = {
+    "rnaseq": hits_info.RnaSeqHitsInfo,
+    "dnaseq": hits_info.DnaSeqHitsInfo,
+}
+
+_SAMPLE_FILTERER_CLASSES = {
+    "rnaseq": sample_filterer.RnaSeqSampleFilterer,
+    "dnaseq": sample_filterer.DnaSeqSampleFilterer,
+}
+
+
+def get_version_info():
+    """
+    Return a dictionary describing the versions of Sargasso and Python, the
+    platform, and, if Sargasso is run from a git working tree, the current
+    commit, against which benchmark results were obtained.
+    """
+    version_info = {"sargasso_version": sargasso.__version__,
+                    "python_version": platform.python_version(),
+                    "platform": platform.platform(),
+                    "git_commit": None}
+
+    try:
+        version_info["git_commit"] = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(sargasso.__file__)),
+            stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+
+    return version_info
+
+
+class _DecisionInput(object):
+    """
+    Stands in for a hits manager when timing HitsChecker decisions, holding
+    the information for the hits for a read against one species.
+    """
+
+    def __init__(self, species_id, read_hits_info):
+        self.species_id = species_id
+        self.hits_info = read_hits_info
+        self.stats = SeparationStats(species_id)
+
+
+class FilterBenchmark(object):
+    DOC = """Usage:
+    filter_benchmark [--log-level=<log-level>] [--data-type=<data-type>]
+        [--num-reads=<num-reads>] [--read-length=<read-length>]
+        [--single-end] [--num-species=<num-species>]
+        [--multimap-weights=<multimap-weights>]
+        [--mismatch-rate=<mismatch-rate>]
+        [--mismatch-threshold=<mismatch-threshold>]
+        [--minmatch-threshold=<minmatch-threshold>]
+        [--multimap-threshold=<multimap-threshold>]
+        [--repeats=<repeats>] [--work-dir=<work-dir>]
+        <results-file>
+
+Options:
+<results-file>
+    JSON file to which benchmark results will be written.
+--data-type=<data-type>
+    Type of data to generate and filter (one of "rnaseq" or "dnaseq")
+    [default: rnaseq].
+--num-reads=<num-reads>
+    Number of synthetic reads to generate [default: 100000].
+--read-length=<read-length>
+    Length of each synthetic read (or of each mate, for paired-end reads)
+    [default: 100].
+--single-end
+    If set, single-end rather than paired-end reads are generated.
+--num-species=<num-species>
+    Number of species to which reads are mapped [default: 2].
+--multimap-weights=<multimap-weights>
+    Comma-separated list of the relative frequencies of reads mapping to one,
+    two, three, etc. locations in a species' genome [default: 0.8,0.1,0.05,0.05].
+--mismatch-rate=<mismatch-rate>
+    Probability of each base of a read mismatching the genome of the species
+    from which it originates [default: 0.005].
+--mismatch-threshold=<mismatch-threshold>
+    Maximum percentage of read bases allowed to be mismatches against the
+    genome during filtering [default: 1].
+--minmatch-threshold=<minmatch-threshold>
+    Maximum percentage of read length allowed to not be mapped during
+    filtering [default: 2].
+--multimap-threshold=<multimap-threshold>
+    Maximum number of multiple mappings allowed during filtering
+    [default: 999999].
+--repeats=<repeats>
+    Number of times each benchmark is run; the fastest time is reported
+    [default: 3].
+--work-dir=<work-dir>
+    If specified, the directory in which synthetic BAM files and filtered
+    output are written, and retained; otherwise a temporary directory is used,
+    and deleted afterwards.
+{help_option_spec}
+    {help_option_description}
+{ver_option_spec}
+    {ver_option_description}
+{log_option_spec}
+    {log_option_description}
+
+filter_benchmark generates synthetic, read name sorted BAM files for a number
+of species, and times the stages of filtering reads to their species of
+origin: reading the hits for each read from a BAM file; extracting the
+information used to filter hits; deciding the species to which each read is
+assigned; and filtering the BAM files end to end, as performed by
+filter_sample_reads. For each benchmark, the time taken, the number of reads
+processed per second and the peak memory allocated are reported. Results are
+written, along with the benchmark parameters and details of the software
+version, to a JSON file, so that the results of runs against different
+versions of the code can be compared. Filtering thresholds default to those of
+species_separator's "--best" strategy.
+"""
+    DATA_TYPE = "--data-type"
+    NUM_READS = "--num-reads"
+    READ_LENGTH = "--read-length"
+    SINGLE_END = "--single-end"
+    NUM_SPECIES = "--num-species"
+    MULTIMAP_WEIGHTS = "--multimap-weights"
+    MISMATCH_RATE = "--mismatch-rate"
+    REPEATS = "--repeats"
+    WORK_DIR = "--work-dir"
+    RESULTS_FILE = "<results-file>"
+
+    def __init__(self, commandline_parser):
+        self.commandline_parser = commandline_parser
+
+    @classmethod
+    def _validate_command_line_options(cls, options):
+        try:
+            ParameterValidator.validate_log_level(options)
+            ParameterValidator.validate_dict_option(
+                options[FilterBenchmark.DATA_TYPE], _HITS_INFO_CLASSES,
+                "Invalid data type")
+            for option, description in [
+                    (FilterBenchmark.NUM_READS, "Number of reads"),
+                    (FilterBenchmark.READ_LENGTH, "Read length"),
+                    (FilterBenchmark.NUM_SPECIES, "Number of species"),
+                    (FilterBenchmark.REPEATS, "Number of repeats")]:
+                options[option] = ParameterValidator.validate_int_option(
+                    options[option],
+                    description + " must be a positive integer", min_val=1)
+            options[FilterBenchmark.MISMATCH_RATE] = \
+                ParameterValidator.validate_float_option(
+                    options[FilterBenchmark.MISMATCH_RATE],
+                    "Mismatch rate must be between 0 and 1",
+                    min_val=0, max_val=1)
+            options[FilterBenchmark.MULTIMAP_WEIGHTS] = [
+                ParameterValidator.validate_float_option(
+                    w, "Multimap weights must be non-negative numbers",
+                    min_val=0)
+                for w in options[FilterBenchmark.MULTIMAP_WEIGHTS].split(",")]
+            ParameterValidator.validate_threshold_options(
+                options, opts.MISMATCH_THRESHOLD, opts.MINMATCH_THRESHOLD,
+                opts.MULTIMAP_THRESHOLD)
+        except schema.SchemaError as exc:
+            exit("Exiting: " + exc.code)
+
+    @classmethod
+    def _get_generator_parameters(cls, options):
+        return bam_generator.GeneratorParameters(
+            data_type=options[FilterBenchmark.DATA_TYPE],
+            species=["species{n}".format(n=i + 1) for i in
+                     range(options[FilterBenchmark.NUM_SPECIES])],
+            num_reads=options[FilterBenchmark.NUM_READS],
+            read_length=options[FilterBenchmark.READ_LENGTH],
+            paired_end=not options[FilterBenchmark.SINGLE_END],
+            multimap_weights=options[FilterBenchmark.MULTIMAP_WEIGHTS],
+            mismatch_rate=options[FilterBenchmark.MISMATCH_RATE])
+
+    @classmethod
+    def _read_all_hits(cls, bam_file):
+        input_hits = su.open_samfile_for_read(bam_file)
+        try:
+            return list(su.hits_generator(input_hits))
+        finally:
+            input_hits.close()
+
+    @classmethod
+    def _measure(cls, func, repeats):
+        """
+        Return the shortest time taken by several runs of a function, and the
+        peak memory, in megabytes, allocated by a further run, or None if
+        memory allocation cannot be traced.
+        """
+        times = []
+        for i in range(repeats):
+            start = time.time()
+            func()
+            times.append(time.time() - start)
+
+        peak_memory = None
+        if tracemalloc is not None:
+            tracemalloc.start()
+            func()
+            peak_memory = tracemalloc.get_traced_memory()[1] / _BYTES_PER_MB
+            tracemalloc.stop()
+
+        return min(times), peak_memory
+
+    def _get_benchmarks(self, bam_files, output_dir, params, options):
+        """
+        Return a list of (name, function, number of reads processed) tuples
+        for each benchmark.
+        """
+        hits_info_cls = _HITS_INFO_CLASSES[params.data_type]
+        checker = hits_checker.HitsChecker(
+            options[opts.MISMATCH_THRESHOLD], options[opts.MINMATCH_THRESHOLD],
+            options[opts.MULTIMAP_THRESHOLD], False, self.logger)
+
+        species_hits = [self._read_all_hits(f) for f in bam_files]
+
+        # Collect the information for each read mapping to more than one
+        # species, for which a decision between species must be made
+        hits_infos = {}
+        for species_id, all_hits in enumerate(species_hits):
+            for hits in all_hits:
+                hits_infos.setdefault(hits[0].query_name, []).append(
+                    _DecisionInput(species_id + 1, hits_info_cls(hits)))
+        competing = [m for m in hits_infos.values() if len(m) > 1]
+
+        def read_hits():
+            input_hits = su.open_samfile_for_read(bam_files[0])
+            for hits in su.hits_generator(input_hits):
+                pass
+            input_hits.close()
+
+        def get_hits_info():
+            for hits in species_hits[0]:
+                hits_info_cls(hits)
+
+        def decide():
+            for managers in competing:
+                checker._assign_hits([checker._check_thresholds(i, m)
+                                      for i, m in enumerate(managers)])
+
+        filterer = _SAMPLE_FILTERER_CLASSES[params.data_type](None)
+        filter_options = {
+            opts.SPECIES_ARG: params.species,
+            sample_filterer.SampleFilterer.SPECIES_INPUT_BAM: bam_files,
+            sample_filterer.SampleFilterer.SPECIES_OUTPUT_BAM: [
+                os.path.join(output_dir, s + ".filtered.bam")
+                for s in params.species],
+            opts.MISMATCH_THRESHOLD_ARG: options[opts.MISMATCH_THRESHOLD],
+            opts.MINMATCH_THRESHOLD_ARG: options[opts.MINMATCH_THRESHOLD],
+            opts.MULTIMAP_THRESHOLD_ARG: options[opts.MULTIMAP_THRESHOLD],
+            opts.REJECT_MULTIMAPS: False,
+            opts.PROFILE: False,
+            opts.TRACE_SAMPLE_RATE: None,
+            opts.OUTPUT_FORMAT: fastq_writer.OUTPUT_FORMAT_BAM,
+            opts.DECIDE_ONLY: [],
+            opts.COMPRESSION_LEVEL: None,
+            opts.MAX_HITS_IN_MEMORY: None,
+            sample_filterer.SampleFilterer.COMBINED: False,
+            sample_filterer.SampleFilterer.DUPLICATES: None,
+            sample_filterer.SampleFilterer.READ_NAMES: None,
+        }
+
+        def filter_sample_reads():
+            filterer._filter_sample_reads(self.logger, filter_options)
+
+        return [
+            ("hits_generator", read_hits, len(species_hits[0])),
+            ("hits_info", get_hits_info, len(species_hits[0])),
+            ("hits_checker", decide, len(competing)),
+            ("filter_sample_reads", filter_sample_reads, params.num_reads),
+        ]
+
+    def _run_benchmarks(self, work_dir, options):
+        params = self._get_generator_parameters(options)
+
+        self.logger.info("Generating {n} synthetic reads".format(
+            n=params.num_reads))
+        bam_files = bam_generator.generate_bams(
+            os.path.join(work_dir, "synthetic"), params)
+
+        results = {}
+        for name, func, num_reads in self._get_benchmarks(
+                bam_files, work_dir, params, options):
+            self.logger.info("Running benchmark {b}".format(b=name))
+            seconds, peak_memory = self._measure(
+                func, options[FilterBenchmark.REPEATS])
+            results[name] = {
+                "seconds": seconds,
+                "reads": num_reads,
+                "reads_per_second": num_reads / seconds if seconds > 0 else None,
+                "peak_memory_mb": peak_memory}
+            self.logger.info(
+                "{b}: {s:.3f} s, {r:.0f} reads/s".format(
+                    b=name, s=seconds,
+                    r=results[name]["reads_per_second"] or 0))
+
+        return {
+            "version": get_version_info(),
+            "parameters": dict(params._asdict()),
+            "thresholds": {
+                "mismatch": options[opts.MISMATCH_THRESHOLD],
+                "minmatch": options[opts.MINMATCH_THRESHOLD],
+                "multimap": options[opts.MULTIMAP_THRESHOLD]},
+            "benchmarks": results,
+            "peak_rss_mb": resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss / _MAX_RSS_PER_MB,
+        }
+
+    def run(self, args):
+        """
+        Run filtering benchmarks, and write the results to a file.
+
+        args: list of command line arguments
+        """
+        options = self.commandline_parser.parse(args, self.DOC)
+
+        self._validate_command_line_options(options)
+
+        self.logger = log.get_logger_for_options(options)
+
+        work_dir = options[FilterBenchmark.WORK_DIR]
+        if work_dir is None:
+            work_dir = tempfile.mkdtemp(prefix="sargasso_benchmark_")
+        elif not os.path.isdir(work_dir):
+            os.makedirs(work_dir)
+
+        try:
+            results = self._run_benchmarks(work_dir, options)
+        finally:
+            if options[FilterBenchmark.WORK_DIR] is None:
+                shutil.rmtree(work_dir)
+
+        with open(options[FilterBenchmark.RESULTS_FILE], 'w') as results_file:
+            json.dump(results, results_file, indent=2, sort_keys=True)
+
+        self.logger.info("Wrote benchmark results to {f}".format(
+            f=options[FilterBenchmark.RESULTS_FILE]))
@@ -0,0 +1,346 @@
+import json
+import os
+import os.path
+import schema
+import shutil
+import subprocess
+import tempfile
+
+import sargasso.utils.telemetry as telemetry
+
+from sargasso.benchmark import bam_generator
+from sargasso.benchmark.filter_benchmark import get_version_info
+from sargasso.separator.parameter_validator import ParameterValidator
+from sargasso.utils import log
+
+_DATA_TYPES = {"rnaseq": "STAR", "dnaseq": "Bowtie2"}
+
+_TOTAL = "total"
+_ORCHESTRATION = "excluding_map_reads"
+
+
+class PipelineBenchmark(object):
+    DOC = """Usage:
+    pipeline_benchmark [--log-level=<log-level>] [--data-type=<data-type>]
+        [--num-threads=<num-threads>] [--num-reads=<num-reads>]
+        [--reads-per-thread=<reads-per-thread>] [--num-samples=<num-samples>]
+        [--read-length=<read-length>] [--single-end]
+        [--num-species=<num-species>] [--work-dir=<work-dir>]
+        <mapper-executable> <results-file>
+
+Options:
+<mapper-executable>
+    Stand-in for the read aligner, passed to species_separator via its
+    "--mapper-executable" option (normally the "fake_mapper" script in the
+    pipeline_test directory).
+<results-file>
+    JSON file to which benchmark results will be written.
+--data-type=<data-type>
+    Type of data to generate and separate (one of "rnaseq" or "dnaseq")
+    [default: rnaseq].
+--num-threads=<num-threads>
+    Comma-separated list of the numbers of threads with which species
+    separation is run [default: 1,2,4].
+--num-reads=<num-reads>
+    Comma-separated list of the total numbers of reads, over all samples, for
+    which strong scaling is measured [default: 100000,400000].
+--reads-per-thread=<reads-per-thread>
+    Number of reads per thread for which weak scaling is measured
+    [default: 100000].
+--num-samples=<num-samples>
+    Number of samples between which reads are divided [default: 2].
+--read-length=<read-length>
+    Length of each synthetic read (or of each mate, for paired-end reads)
+    [default: 100].
+--single-end
+    If set, single-end rather than paired-end reads are generated.
+--num-species=<num-species>
+    Number of species from which reads originate [default: 2].
+--work-dir=<work-dir>
+    If specified, the directory in which synthetic reads and species
+    separation output are written, and retained; otherwise a temporary
+    directory is used, and deleted afterwards.
+{help_option_spec}
+    {help_option_description}
+{ver_option_spec}
+    {ver_option_description}
+{log_option_spec}
+    {log_option_description}
+
+pipeline_benchmark times the whole species separation pipeline, as run by the
+Makefile written by species_separator, for synthetic mixed-species reads,
+with the read aligner replaced by a stand-in which writes synthetic hits
+rather than aligning reads. The wall time of each stage is taken from the run
+report written when the Makefile completes. For strong scaling, each total
+number of reads is separated with each number of threads; for weak scaling,
+the number of reads is increased in proportion to the number of threads.
+Speedups and parallel efficiencies relative to the smallest number of threads
+are reported for each stage, for the pipeline as a whole, and for the
+pipeline excluding read mapping, so that the scaling of species separation
+itself can be assessed independently of the aligner.
+"""
+    DATA_TYPE = "--data-type"
+    NUM_THREADS = "--num-threads"
+    NUM_READS = "--num-reads"
+    READS_PER_THREAD = "--reads-per-thread"
+    NUM_SAMPLES = "--num-samples"
+    READ_LENGTH = "--read-length"
+    SINGLE_END = "--single-end"
+    NUM_SPECIES = "--num-species"
+    WORK_DIR = "--work-dir"
+    MAPPER_EXECUTABLE = "<mapper-executable>"
+    RESULTS_FILE = "<results-file>"
+
+    def __init__(self, commandline_parser):
+        self.commandline_parser = commandline_parser
+
+    @classmethod
+    def _validate_int_list_option(cls, option, description):
+        return [ParameterValidator.validate_int_option(
+            value, description + " must be positive integers", min_val=1)
+            for value in option.split(",")]
+
+    @classmethod
+    def _validate_command_line_options(cls, options):
+        try:
+            ParameterValidator.validate_log_level(options)
+            ParameterValidator.validate_dict_option(
+                options[PipelineBenchmark.DATA_TYPE], _DATA_TYPES,
+                "Invalid data type")
+            options[PipelineBenchmark.NUM_THREADS] = sorted(
+                cls._validate_int_list_option(
+                    options[PipelineBenchmark.NUM_THREADS],
+                    "Numbers of threads"))
+            options[PipelineBenchmark.NUM_READS] = \
+                cls._validate_int_list_option(
+                    options[PipelineBenchmark.NUM_READS], "Numbers of reads")
+            for option, description in [
+                    (PipelineBenchmark.READS_PER_THREAD, "Reads per thread"),
+                    (PipelineBenchmark.NUM_SAMPLES, "Number of samples"),
+                    (PipelineBenchmark.READ_LENGTH, "Read length"),
+                    (PipelineBenchmark.NUM_SPECIES, "Number of species")]:
+                options[option] = ParameterValidator.validate_int_option(
+                    options[option],
+                    description + " must be a positive integer", min_val=1)
+            ParameterValidator.validate_file_option(
+                options[PipelineBenchmark.MAPPER_EXECUTABLE],
+                "Mapper executable should exist")
+        except schema.SchemaError as exc:
+            exit("Exiting: " + exc.code)
+
+    def _get_species(self):
+        return ["species{n}".format(n=i + 1) for i in
+                range(self.options[PipelineBenchmark.NUM_SPECIES])]
+
+    def _get_samples_file(self, num_reads):
+        """
+        Generate synthetic reads for each sample, dividing a total number of
+        reads between samples, and return the path of a samples file
+        describing them. Reads are generated only once for each total number
+        of reads.
+        """
+        data_dir = os.path.join(
+            self.work_dir, "data", "{n}_reads".format(n=num_reads))
+        samples_file = os.path.join(data_dir, "samples.tsv")
+
+        if os.path.isfile(samples_file):
+            return samples_file
+
+        os.makedirs(data_dir)
+        num_samples = self.options[PipelineBenchmark.NUM_SAMPLES]
+
+        self.logger.info("Generating {n} synthetic reads".format(n=num_reads))
+
+        with open(samples_file, 'w') as samples:
+            for i in range(num_samples):
+                sample = "sample{n}".format(n=i + 1)
+                params = bam_generator.GeneratorParameters(
+                    data_type=self.options[PipelineBenchmark.DATA_TYPE],
+                    species=self._get_species(),
+                    num_reads=num_reads // num_samples +
+                    (1 if i < num_reads % num_samples else 0),
+                    read_length=self.options[PipelineBenchmark.READ_LENGTH],
+                    paired_end=not self.options[PipelineBenchmark.SINGLE_END],
+                    seed=i + 1)
+                fastq_files = bam_generator.generate_fastqs(
+                    os.path.join(data_dir, sample), params)
+                samples.write(" ".join([sample] + fastq_files) + "\n")
+
+        return samples_file
+
+    def _get_index_dirs(self):
+        """
+        Return the paths of (empty) mapper index directories for each species;
+        the stand-in aligner takes the species name from the directory name.
+        """
+        index_dirs = []
+        for species in self._get_species():
+            index_dir = os.path.join(self.work_dir, "indexes", species)
+            if not os.path.isdir(index_dir):
+                os.makedirs(index_dir)
+            index_dirs.append(index_dir)
+        return index_dirs
+
+    def _run_pipeline(self, num_reads, num_threads):
+        """
+        Run species separation for a number of reads with a number of threads,
+        and return the wall time of each stage.
+        """
+        samples_file = self._get_samples_file(num_reads)
+        output_dir = os.path.join(
+            self.work_dir, "runs",
+            "{r}_reads_{t}_threads".format(r=num_reads, t=num_threads))
+
+        if os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+        elif not os.path.isdir(os.path.dirname(output_dir)):
+            os.makedirs(os.path.dirname(output_dir))
+
+        self.logger.info(
+            "Running species separation for {r} reads with {t} threads".format(
+                r=num_reads, t=num_threads))
+
+        species_args = []
+        for species, index_dir in zip(self._get_species(),
+                                      self._get_index_dirs()):
+            species_args += [species, index_dir]
+
+        log_path = output_dir + ".log"
+        with open(log_path, 'w') as log_file:
+            commands = [
+                (["species_separator",
+                  self.options[PipelineBenchmark.DATA_TYPE],
+                  "--reads-base-dir=/",
+                  "--num-threads={t}".format(t=num_threads),
+                  "--mapper-executable=" + os.path.abspath(
+                      self.options[PipelineBenchmark.MAPPER_EXECUTABLE]),
+                  samples_file, output_dir] + species_args, None),
+                (["make"], output_dir)]
+
+            for command, cwd in commands:
+                if subprocess.call(command, cwd=cwd, stdout=log_file,
+                                   stderr=subprocess.STDOUT) != 0:
+                    raise RuntimeError(
+                        "Species separation failed; see " + log_path)
+
+        with open(os.path.join(output_dir, telemetry.RUN_REPORT_FILE)) \
+                as report_file:
+            report = json.load(report_file)
+
+        stage_times = dict([(s[telemetry.STAGE], s[telemetry.WALL_TIME])
+                            for s in report[telemetry.STAGES]])
+        stage_times[_TOTAL] = sum(stage_times.values())
+        stage_times[_ORCHESTRATION] = \
+            stage_times[_TOTAL] - stage_times.get("map_reads", 0)
+
+        return stage_times
+
+    @classmethod
+    def _add_scaling(cls, runs, strong):
+        """
+        Add, to each of a list of runs with increasing numbers of threads, the
+        speedup (for strong scaling) and parallel efficiency of each stage,
+        relative to the first run.
+        """
+        base_threads = runs[0]["num_threads"]
+        base_times = runs[0]["stage_times"]
+
+        for run in runs:
+            speedups = {}
+            efficiencies = {}
+            for stage, seconds in run["stage_times"].items():
+                if seconds <= 0 or stage not in base_times:
+                    continue
+                speedup = base_times[stage] / seconds
+                if strong:
+                    speedups[stage] = speedup
+                    efficiencies[stage] = \
+                        speedup * base_threads / run["num_threads"]
+                else:
+                    efficiencies[stage] = speedup
+
+            if strong:
+                run["speedup"] = speedups
+            run["efficiency"] = efficiencies
+
+    def _log_scaling(self, title, runs):
+        self.logger.info(title)
+        for run in runs:
+            self.logger.info((
+                "  {t} threads, {r} reads: total {s:.1f} s (efficiency " +
+                "{e:.2f}); excluding mapping {o:.1f} s (efficiency " +
+                "{f:.2f})").format(
+                    t=run["num_threads"], r=run["num_reads"],
+                    s=run["stage_times"][_TOTAL],
+                    e=run["efficiency"].get(_TOTAL, 0),
+                    o=run["stage_times"][_ORCHESTRATION],
+                    f=run["efficiency"].get(_ORCHESTRATION, 0)))
+
+    def _run_benchmarks(self):
+        strong_scaling = []
+        for num_reads in self.options[PipelineBenchmark.NUM_READS]:
+            runs = [{"num_threads": t, "num_reads": num_reads,
+                     "stage_times": self._run_pipeline(num_reads, t)}
+                    for t in self.options[PipelineBenchmark.NUM_THREADS]]
+            self._add_scaling(runs, True)
+            self._log_scaling(
+                "Strong scaling for {n} reads:".format(n=num_reads), runs)
+            strong_scaling.append({"num_reads": num_reads, "runs": runs})
+
+        reads_per_thread = self.options[PipelineBenchmark.READS_PER_THREAD]
+        weak_scaling = [{"num_threads": t, "num_reads": reads_per_thread * t,
+                         "stage_times": self._run_pipeline(
+                             reads_per_thread * t, t)}
+                        for t in self.options[PipelineBenchmark.NUM_THREADS]]
+        self._add_scaling(weak_scaling, False)
+        self._log_scaling(
+            "Weak scaling for {n} reads per thread:".format(
+                n=reads_per_thread), weak_scaling)
+
+        return {
+            "version": get_version_info(),
+            "parameters": {
+                "data_type": self.options[PipelineBenchmark.DATA_TYPE],
+                "num_samples": self.options[PipelineBenchmark.NUM_SAMPLES],
+                "num_species": self.options[PipelineBenchmark.NUM_SPECIES],
+                "read_length": self.options[PipelineBenchmark.READ_LENGTH],
+                "paired_end": not self.options[PipelineBenchmark.SINGLE_END],
+                "mapper_executable":
+                    self.options[PipelineBenchmark.MAPPER_EXECUTABLE]},
+            "strong_scaling": strong_scaling,
+            "weak_scaling": {"reads_per_thread": reads_per_thread,
+                             "runs": weak_scaling},
+        }
+
+    def run(self, args):
+        """
+        Run species separation pipeline benchmarks, and write the results to
+        a file.
+
+        args: list of command line arguments
+        """
+        self.options = self.commandline_parser.parse(args, self.DOC)
+
+        self._validate_command_line_options(self.options)
+
+        self.logger = log.get_logger_for_options(self.options)
+
+        self.work_dir = self.options[PipelineBenchmark.WORK_DIR]
+        if self.work_dir is None:
+            self.work_dir = tempfile.mkdtemp(prefix="sargasso_benchmark_")
+        elif not os.path.isdir(self.work_dir):
+            os.makedirs(self.work_dir)
+        self.work_dir = os.path.abspath(self.work_dir)
+
+        try:
+            results = self._run_benchmarks()
+        finally:
+            if self.options[PipelineBenchmark.WORK_DIR] is None:
+                shutil.rmtree(self.work_dir)
+
+        with open(self.options[PipelineBenchmark.RESULTS_FILE], 'w') \
+                as results_file:
+            json.dump(results, results_file, indent=2, sort_keys=True)
+
+        self.logger.info("Wrote benchmark results to {f}".format(
+            f=self.options[PipelineBenchmark.RESULTS_FILE]))
@@ -0,0 +1,127 @@
+import schema
+import shutil
+import tempfile
+
+from sargasso.classify import kmer_index
+from sargasso.separator.parameter_validator import ParameterValidator
+from sargasso.utils import log
+
+
+class KmerIndexBuilder(object):
+    DOC = """Usage:
+    build_kmer_index [--log-level=<log-level>] [--num-threads=<num-threads>]
+        [--kmer-size=<kmer-size>] [--sampling=<sampling>] [--tmp-dir=<tmp-dir>]
+        <index-file> (<species> <genome-fasta>) (<species> <genome-fasta>) ...
+
+Options:
+<index-file>
+    File to which the k-mer index will be written.
+<species>
+    Name of species.
+<genome-fasta>
+    Genome FASTA file for the species, a comma-separated list of such files,
+    or a directory containing them (with suffix ".fa" or ".fasta", optionally
+    gzipped).
+-t <num-threads> --num-threads=<num-threads>
+    Number of processes used to find the k-mers in species' genomes; each
+    species' genome is processed by a single process [default: 1].
+--kmer-size=<kmer-size>
+    Length of indexed k-mers, at most 28 [default: 27].
+--sampling=<sampling>
+    Only approximately one in this number of k-mers, chosen by a hash of the
+    k-mer, is indexed (and looked up when classifying reads) [default: 16].
+--tmp-dir=<tmp-dir>
+    Directory in which temporary files are written while the index is built
+    [default: .].
+{help_option_spec}
+    {help_option_description}
+{ver_option_spec}
+    {ver_option_description}
+{log_option_spec}
+    {log_option_description}
+
+build_kmer_index finds the k-mers which occur in the genome of only one of a
+set of species, and writes an index of them, from which the classify_reads
+script determines those reads which can confidently be assigned to a species
+without being mapped to every species' genome.
+
+In normal operation, the user should not need to execute this script by hand
+themselves.
+"""
+
+    INDEX_FILE = "<index-file>"
+    SPECIES = "<species>"
+    GENOME_FASTA = "<genome-fasta>"
+    NUM_THREADS = "--num-threads"
+    KMER_SIZE = "--kmer-size"
+    SAMPLING = "--sampling"
+    TMP_DIR = "--tmp-dir"
+
+    def __init__(self, commandline_parser):
+        self.commandline_parser = commandline_parser
+
+    @classmethod
+    def _validate_command_line_options(cls, options):
+        try:
+            ParameterValidator.validate_log_level(options)
+            options[KmerIndexBuilder.NUM_THREADS] = \
+                ParameterValidator.validate_int_option(
+                    options[KmerIndexBuilder.NUM_THREADS],
+                    "Number of threads must be a positive integer",
+                    min_val=1)
+            options[KmerIndexBuilder.KMER_SIZE] = \
+                ParameterValidator.validate_int_option(
+                    options[KmerIndexBuilder.KMER_SIZE],
+                    "K-mer size must be a positive integer", min_val=1)
+            if options[KmerIndexBuilder.KMER_SIZE] > kmer_index.MAX_KMER_SIZE:
+                raise schema.SchemaError(
+                    None, "K-mer size must be at most {m}".format(
+                        m=kmer_index.MAX_KMER_SIZE))
+            options[KmerIndexBuilder.SAMPLING] = \
+                ParameterValidator.validate_int_option(
+                    options[KmerIndexBuilder.SAMPLING],
+                    "Sampling must be a positive integer", min_val=1)
+            ParameterValidator.validate_dir_option(
+                options[KmerIndexBuilder.TMP_DIR],
+                "Temporary directory does not exist")
+
+            if len(options[KmerIndexBuilder.SPECIES]) > \
+                    kmer_index.MAX_SPECIES:
+                raise schema.SchemaError(
+                    None, "At most {m} species may be indexed".format(
+                        m=kmer_index.MAX_SPECIES))
+
+            for genome in options[KmerIndexBuilder.GENOME_FASTA]:
+                fasta_files = kmer_index.get_fasta_files(genome)
+                if len(fasta_files) == 0:
+                    raise schema.SchemaError(
+                        None, "No genome FASTA files found: " + genome)
+                for fasta_file in fasta_files:
+                    ParameterValidator.validate_file_option(
+                        fasta_file, "Could not open genome FASTA file")
+        except schema.SchemaError as exc:
+            exit("Exiting: " + exc.code)
+
+    def run(self, args):
+        """
+        Build an index of species-discriminative k-mers.
+
+        args: list of command line arguments
+        """
+        options = self.commandline_parser.parse(args, self.DOC)
+
+        self._validate_command_line_options(options)
+
+        self.logger = log.get_logger_for_options(options)
+
+        tmp_dir = tempfile.mkdtemp(dir=options[KmerIndexBuilder.TMP_DIR])
+        try:
+            kmer_index.build_index(
+                options[KmerIndexBuilder.INDEX_FILE],
+                options[KmerIndexBuilder.SPECIES],
+                options[KmerIndexBuilder.GENOME_FASTA],
+                options[KmerIndexBuilder.KMER_SIZE],
+                options[KmerIndexBuilder.SAMPLING],
+                options[KmerIndexBuilder.NUM_THREADS], tmp_dir, self.logger)
+        finally:
+            shutil.rmtree(tmp_dir)
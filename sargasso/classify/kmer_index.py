@@ -0,0 +1,343 @@
+"""
+Utility functions and classes for building and querying an index of
+species-discriminative k-mers: k-mers which occur in the genome of only one of
+a set of species. Exports:
+
+MAX_KMER_SIZE: Maximum length of indexed k-mers.
+MAX_SPECIES: Maximum number of species in an index.
+get_fasta_files: Return the genome FASTA files given by a species' genome path.
+sampled_kmers: Yield the sampled, canonical k-mers in a sequence.
+build_index: Build an index of the k-mers unique to each species' genome.
+KmerIndex: Look up the species in whose genome k-mers uniquely occur.
+"""
+
+import array
+import bisect
+import gzip
+import heapq
+import mmap
+import multiprocessing
+import os
+import os.path
+import struct
+import sys
+import tempfile
+
+# Each index entry holds a k-mer, at two bits per base, in its upper bits, and
+# the index of the species in whose genome it occurs in its lowest byte
+_SPECIES_BITS = 8
+_SPECIES_MASK = (1 << _SPECIES_BITS) - 1
+MAX_KMER_SIZE = (64 - _SPECIES_BITS) // 2
+MAX_SPECIES = _SPECIES_MASK
+
+# Number of distinct k-mers accumulated for a species before they are sorted
+# and written to a temporary run file
+_RUN_SIZE = 5000000
+
+# Multiplier of the Fibonacci hash used to sample k-mers. Only k-mers whose
+# hash is divisible by the sampling value are indexed (and looked up), which
+# reduces the size of the index by about this factor.
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_HASH_MASK = (1 << 64) - 1
+_HASH_SHIFT = 40
+
+_MAGIC = b"SGKI"
+_VERSION = 1
+_HEADER = struct.Struct("<4sBBBxIQ")
+_SPECIES_NAME_LENGTH = struct.Struct("<B")
+_ENTRY_TYPE = 'Q'
+_ENTRY_SIZE = struct.calcsize("<Q")
+
+_FASTA_SUFFIXES = (".fa", ".fasta", ".fa.gz", ".fasta.gz")
+
+# Translate bases to two-bit codes; any other character (e.g. N) breaks k-mers
+_NOT_A_BASE = 4
+_BASE_CODES = bytearray([_NOT_A_BASE]) * 256
+for _code, _bases in enumerate([b"Aa", b"Cc", b"Gg", b"Tt"]):
+    for _base in bytearray(_bases):
+        _BASE_CODES[_base] = _code
+_BASE_CODES = bytes(_BASE_CODES)
+
+
+def get_fasta_files(genome_path):
+    """
+    Return the list of FASTA files containing a species' genome sequence.
+
+    genome_path: a FASTA file, a comma-separated list of FASTA files, or a
+    directory containing FASTA files.
+    """
+    if os.path.isdir(genome_path):
+        return sorted([os.path.join(genome_path, f)
+                       for f in os.listdir(genome_path)
+                       if f.endswith(_FASTA_SUFFIXES)])
+
+    return genome_path.split(",")
+
+
+def _open(path):
+    return gzip.open(path, 'rb') if path.endswith(".gz") else open(path, 'rb')
+
+
+def _read_fasta_sequences(fasta_files):
+    """
+    Yield the sequence of each record in a list of FASTA files.
+    """
+    for fasta_file in fasta_files:
+        with _open(fasta_file) as fasta:
+            lines = []
+            for line in fasta:
+                if line.startswith(b">"):
+                    if lines:
+                        yield b"".join(lines)
+                    lines = []
+                else:
+                    lines.append(line.rstrip())
+            if lines:
+                yield b"".join(lines)
+
+
+def sampled_kmers(sequence, kmer_size, sampling):
+    """
+    Yield the sampled, canonical k-mers in a sequence, each encoded as an
+    integer at two bits per base. The canonical form of a k-mer is the lesser
+    of its own encoding and that of its reverse complement, so that a read
+    yields the same k-mers whichever strand it was sequenced from.
+
+    sequence: a sequence of bases, as bytes.
+    kmer_size: length of k-mers.
+    sampling: only k-mers whose hash is divisible by this value are yielded.
+    """
+    mask = (1 << (2 * kmer_size)) - 1
+    shift = 2 * (kmer_size - 1)
+    forward = reverse = length = 0
+
+    for code in bytearray(sequence.translate(_BASE_CODES)):
+        if code == _NOT_A_BASE:
+            forward = reverse = length = 0
+            continue
+
+        forward = ((forward << 2) | code) & mask
+        reverse = (reverse >> 2) | ((3 - code) << shift)
+        length += 1
+
+        if length >= kmer_size:
+            kmer = forward if forward < reverse else reverse
+            if (((kmer * _HASH_MULTIPLIER) & _HASH_MASK) >> _HASH_SHIFT) \
+                    % sampling == 0:
+                yield kmer
+
+
+def _write_entries(entries, output_file):
+    # Index entries are stored little-endian
+    if sys.byteorder != "little":
+        entries.byteswap()
+    entries.tofile(output_file)
+
+
+def _write_run(entries, tmp_dir):
+    run_file, run_path = tempfile.mkstemp(dir=tmp_dir, suffix=".run")
+    with os.fdopen(run_file, 'wb') as run:
+        array.array(_ENTRY_TYPE, sorted(entries)).tofile(run)
+    return run_path
+
+
+def _read_run(run_path, chunk_size=65536):
+    with open(run_path, 'rb') as run:
+        while True:
+            entries = array.array(_ENTRY_TYPE)
+            try:
+                entries.fromfile(run, chunk_size)
+            except EOFError:
+                pass
+            if len(entries) == 0:
+                return
+            for entry in entries:
+                yield entry
+
+
+def _write_species_runs(args):
+    """
+    Write the distinct, sampled k-mers in a species' genome, tagged with the
+    species index, to sorted temporary run files, and return their paths.
+    """
+    species_index, fasta_files, kmer_size, sampling, tmp_dir = args
+
+    run_paths = []
+    entries = set()
+    for sequence in _read_fasta_sequences(fasta_files):
+        for kmer in sampled_kmers(sequence, kmer_size, sampling):
+            entries.add((kmer << _SPECIES_BITS) | species_index)
+            if len(entries) >= _RUN_SIZE:
+                run_paths.append(_write_run(entries, tmp_dir))
+                entries.clear()
+
+    if entries:
+        run_paths.append(_write_run(entries, tmp_dir))
+
+    return run_paths
+
+
+def _unique_entries(entries):
+    """
+    Given index entries sorted by k-mer, yield one entry for each k-mer which
+    is tagged with only one species.
+    """
+    current = None
+    unique = False
+    for entry in entries:
+        if current is not None and entry >> _SPECIES_BITS == \
+                current >> _SPECIES_BITS:
+            unique = unique and entry == current
+            continue
+
+        if unique:
+            yield current
+        current = entry
+        unique = True
+
+    if unique:
+        yield current
+
+
+def _write_header(index_file, species, kmer_size, sampling, num_entries):
+    index_file.write(_HEADER.pack(
+        _MAGIC, _VERSION, kmer_size, len(species), sampling, num_entries))
+    for name in species:
+        name = name.encode()
+        index_file.write(_SPECIES_NAME_LENGTH.pack(len(name)) + name)
+
+    # Pad the header so that entries are aligned for memory-mapped access
+    padding = -index_file.tell() % _ENTRY_SIZE
+    index_file.write(b"\0" * padding)
+
+
+def build_index(index_path, species, genome_paths, kmer_size, sampling,
+                num_processes, tmp_dir, logger):
+    """
+    Build an index of the sampled k-mers which occur in the genome of only one
+    of a set of species.
+
+    The distinct k-mers in each species' genome are found in a separate
+    process, and written in sorted runs to temporary files; these are then
+    merged, discarding k-mers occurring in more than one genome, so that the
+    whole set of k-mers need not be held in memory.
+    index_path: path of the index file to write.
+    species: list of species names.
+    genome_paths: list of genome FASTA paths (see 'get_fasta_files') for each
+    species.
+    kmer_size: length of k-mers.
+    sampling: only k-mers whose hash is divisible by this value are indexed.
+    num_processes: number of processes used to find k-mers.
+    tmp_dir: directory in which temporary files will be written.
+    logger: logging object
+    """
+    tasks = [(i, get_fasta_files(g), kmer_size, sampling, tmp_dir)
+             for i, g in enumerate(genome_paths)]
+
+    pool = multiprocessing.Pool(min(num_processes, len(tasks)))
+    try:
+        run_paths = [p for paths in pool.map(_write_species_runs, tasks)
+                     for p in paths]
+    finally:
+        pool.close()
+        pool.join()
+
+    logger.info("Merging {n} k-mer runs".format(n=len(run_paths)))
+
+    num_entries = 0
+    with open(index_path + ".tmp", 'wb') as index_file:
+        _write_header(index_file, species, kmer_size, sampling, 0)
+
+        buffer = array.array(_ENTRY_TYPE)
+        for entry in _unique_entries(
+                heapq.merge(*[_read_run(p) for p in run_paths])):
+            buffer.append(entry)
+            if len(buffer) >= _RUN_SIZE:
+                num_entries += len(buffer)
+                _write_entries(buffer, index_file)
+                buffer = array.array(_ENTRY_TYPE)
+
+        num_entries += len(buffer)
+        _write_entries(buffer, index_file)
+
+        index_file.seek(0)
+        _write_header(index_file, species, kmer_size, sampling, num_entries)
+
+    for run_path in run_paths:
+        os.remove(run_path)
+
+    os.rename(index_path + ".tmp", index_path)
+
+    logger.info("Indexed {n} species-discriminative k-mers".format(
+        n=num_entries))
+
+
+class KmerIndex(object):
+    """
+    Looks up the species in whose genome each of a set of k-mers uniquely
+    occurs. The index file is memory-mapped, so that it is shared between
+    processes classifying reads concurrently.
+    """
+
+    def __init__(self, index_path):
+        """
+        Create object.
+        index_path: path of an index file written by 'build_index'.
+        """
+        if sys.byteorder != "little":
+            raise ValueError("K-mer indexes can only be read on little-endian " +
+                             "platforms")
+
+        with open(index_path, 'rb') as index_file:
+            self.mapped = mmap.mmap(
+                index_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.kmer_size, num_species, self.sampling, \
+            num_entries = _HEADER.unpack_from(self.mapped, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Not a k-mer index: " + index_path)
+
+        offset = _HEADER.size
+        self.species = []
+        for i in range(num_species):
+            length = _SPECIES_NAME_LENGTH.unpack_from(self.mapped, offset)[0]
+            offset += _SPECIES_NAME_LENGTH.size
+            self.species.append(
+                self.mapped[offset:offset + length].decode())
+            offset += length
+
+        offset += -offset % _ENTRY_SIZE
+        self.entries = memoryview(self.mapped)[
+            offset:offset + num_entries * _ENTRY_SIZE].cast(_ENTRY_TYPE)
+
+    def get_species(self, kmer):
+        """
+        Return the index of the species in whose genome a k-mer uniquely
+        occurs, or None if the k-mer is not in the index.
+        """
+        entry = kmer << _SPECIES_BITS
+        i = bisect.bisect_left(self.entries, entry)
+        if i < len(self.entries) and \
+                self.entries[i] >> _SPECIES_BITS == kmer:
+            return self.entries[i] & _SPECIES_MASK
+        return None
+
+    def count_species_kmers(self, sequences):
+        """
+        Return a dictionary mapping the index of each species to the number of
+        sampled k-mers in a set of sequences which uniquely occur in that
+        species' genome.
+
+        sequences: list of sequences (e.g. the mates of a read pair), as bytes.
+        """
+        counts = {}
+        for sequence in sequences:
+            for kmer in sampled_kmers(sequence, self.kmer_size, self.sampling):
+                species = self.get_species(kmer)
+                if species is not None:
+                    counts[species] = counts.get(species, 0) + 1
+        return counts
+
+    def close(self):
+        self.entries.release()
+        self.mapped.close()
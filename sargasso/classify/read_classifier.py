@@ -0,0 +1,341 @@
+import collections
+import gzip
+import multiprocessing
+import os
+import os.path
+import schema
+import shutil
+
+from sargasso.classify.kmer_index import KmerIndex
+from sargasso.separator.parameter_validator import ParameterValidator
+from sargasso.utils import log
+
+UNCLASSIFIED = -1
+
+# Names of the directories and files to which reads are written for each
+# sample. Reads confidently classified as originating from a species are
+# written to that species' directory, which also contains a link to the
+# sample's unclassified reads, so that each species' directory holds exactly
+# those reads which must be mapped to its genome.
+UNCLASSIFIED_NAME = "unclassified"
+CLASSIFIED_NAME = "classified"
+READS_DIRS = ["reads_1", "reads_2"]
+FASTQ_SUFFIX = ".fastq.gz"
+SUMMARY_FILE = "classification_summary.txt"
+
+# Classified reads are intermediate files, read once by the aligner, so are
+# compressed quickly rather than compactly
+_COMPRESS_LEVEL = 1
+
+# Number of reads classified by a worker process at a time
+_CHUNK_READS = 10000
+
+# Index used by each worker process
+_index = None
+
+
+def _init_worker(index_path):
+    global _index
+    _index = KmerIndex(index_path)
+
+
+def classify_read(index, sequences, min_hits):
+    """
+    Return the index of the species from which a read originates, if the read
+    contains at least 'min_hits' sampled k-mers unique to that species'
+    genome, and none unique to any other species' genome; otherwise return
+    UNCLASSIFIED.
+
+    index: a KmerIndex.
+    sequences: list of the sequences of the read (or of each mate of a read
+    pair), as bytes.
+    min_hits: minimum number of species-discriminative k-mers required.
+    """
+    counts = index.count_species_kmers(sequences)
+    if len(counts) == 1:
+        species, hits = list(counts.items())[0]
+        if hits >= min_hits:
+            return species
+    return UNCLASSIFIED
+
+
+def _classify_chunk(args):
+    reads, min_hits = args
+    return [classify_read(_index, sequences, min_hits)
+            for sequences in reads]
+
+
+def _open(path):
+    return gzip.open(path, 'rb') if path.endswith(".gz") else open(path, 'rb')
+
+
+def _read_records(fastq_files):
+    """
+    Yield the four-line record, and sequence, of each read in a list of FASTQ
+    files.
+    """
+    for fastq_file in fastq_files:
+        with _open(fastq_file) as fastq:
+            while True:
+                record = [fastq.readline() for i in range(4)]
+                if not record[0]:
+                    break
+                yield b"".join(record), record[1].rstrip()
+
+
+def _read_chunks(reads_files):
+    """
+    Yield lists of the records, and of the sequences, of successive chunks of
+    reads (or read pairs) in the given lists of FASTQ files.
+    """
+    records = []
+    sequences = []
+    for read in zip(*[_read_records(f) for f in reads_files]):
+        records.append([mate[0] for mate in read])
+        sequences.append([mate[1] for mate in read])
+        if len(records) == _CHUNK_READS:
+            yield records, sequences
+            records = []
+            sequences = []
+
+    if records:
+        yield records, sequences
+
+
+def _classify_chunks(chunks, index_path, min_hits, num_processes):
+    """
+    Yield the records of each chunk of reads, with the species to which each
+    read was classified, in the order in which chunks were read. No more than
+    two chunks per process are read ahead of those being written.
+    """
+    if num_processes == 1:
+        _init_worker(index_path)
+        for records, sequences in chunks:
+            yield records, _classify_chunk((sequences, min_hits))
+        return
+
+    pool = multiprocessing.Pool(num_processes, _init_worker, (index_path,))
+    try:
+        pending = collections.deque()
+        for records, sequences in chunks:
+            pending.append((records, pool.apply_async(
+                _classify_chunk, ((sequences, min_hits),))))
+            if len(pending) >= 2 * num_processes:
+                records, result = pending.popleft()
+                yield records, result.get()
+
+        while pending:
+            records, result = pending.popleft()
+            yield records, result.get()
+    finally:
+        pool.close()
+        pool.join()
+
+
+def get_output_paths(sample_dir, species, num_mates):
+    """
+    Return, for each species and finally for unclassified reads, the paths of
+    the FASTQ files to which reads (or each mate of read pairs) are written.
+    """
+    paths = []
+    for name in species:
+        paths.append([os.path.join(sample_dir, name, READS_DIRS[m],
+                                   CLASSIFIED_NAME + FASTQ_SUFFIX)
+                      for m in range(num_mates)])
+    paths.append([os.path.join(sample_dir, UNCLASSIFIED_NAME + "_" +
+                               READS_DIRS[m] + FASTQ_SUFFIX)
+                  for m in range(num_mates)])
+    return paths
+
+
+def _link_unclassified_reads(sample_dir, species, num_mates):
+    for name in species:
+        for m in range(num_mates):
+            os.symlink(
+                os.path.join("..", "..",
+                             UNCLASSIFIED_NAME + "_" + READS_DIRS[m] +
+                             FASTQ_SUFFIX),
+                os.path.join(sample_dir, name, READS_DIRS[m],
+                             UNCLASSIFIED_NAME + FASTQ_SUFFIX))
+
+
+def classify_sample(index_path, reads_files, sample_dir, min_hits,
+                    num_processes, logger):
+    """
+    Classify the reads of a sample by their k-mers, writing those confidently
+    classified as originating from a species to that species' directory, and
+    the remainder to the sample's unclassified reads files, and return the
+    numbers of reads classified as each species and of unclassified reads.
+
+    index_path: path of a k-mer index file.
+    reads_files: list containing a list of FASTQ files for single-end reads,
+    or lists of first and second mate FASTQ files for paired-end reads.
+    sample_dir: directory to which the sample's reads are written.
+    min_hits: minimum number of species-discriminative k-mers required for a
+    read to be classified.
+    num_processes: number of processes used to classify reads.
+    logger: logging object
+    """
+    index = KmerIndex(index_path)
+    species = index.species
+    index.close()
+
+    # Remove any reads written by a previous, interrupted run
+    if os.path.exists(sample_dir):
+        shutil.rmtree(sample_dir)
+
+    num_mates = len(reads_files)
+    for name in species:
+        for m in range(num_mates):
+            os.makedirs(os.path.join(sample_dir, name, READS_DIRS[m]))
+
+    outputs = [[gzip.open(p, 'wb', _COMPRESS_LEVEL) for p in paths]
+               for paths in get_output_paths(sample_dir, species, num_mates)]
+    counts = [0] * (len(species) + 1)
+
+    try:
+        for records, classes in _classify_chunks(
+                _read_chunks(reads_files), index_path, min_hits,
+                num_processes):
+            # Unclassified reads (species index -1) are buffered for the
+            # last set of outputs
+            buffers = [[[] for m in range(num_mates)] for o in outputs]
+            for read, species_index in zip(records, classes):
+                for m in range(num_mates):
+                    buffers[species_index][m].append(read[m])
+                counts[species_index] += 1
+
+            for output, buffer in zip(outputs, buffers):
+                for mate_output, mate_buffer in zip(output, buffer):
+                    if mate_buffer:
+                        mate_output.write(b"".join(mate_buffer))
+    finally:
+        for output in outputs:
+            for mate_output in output:
+                mate_output.close()
+
+    _link_unclassified_reads(sample_dir, species, num_mates)
+
+    with open(os.path.join(sample_dir, SUMMARY_FILE), 'w') as summary:
+        for name, count in zip(species + [UNCLASSIFIED_NAME], counts):
+            summary.write("{n}\t{c}\n".format(n=name, c=count))
+            logger.info("{n} reads: {c}".format(n=name, c=count))
+
+    return counts
+
+
+class ReadClassifier(object):
+    DOC = """Usage:
+    classify_reads [--log-level=<log-level>] [--num-threads=<num-threads>]
+        [--min-hits=<min-hits>]
+        <kmer-index> <samples> <input-dir> <output-dir> <reads-type>
+
+Options:
+<kmer-index>
+    K-mer index file written by build_kmer_index.
+<samples>
+    Space-separated list of sample names.
+<input-dir>
+    Directory containing per-sample directories, each of which contains links
+    to the input raw sequencing read files for that sample, in sub-directories
+    "reads_1" and, for paired-end reads, "reads_2".
+<output-dir>
+    Directory into which to write classified reads.
+<reads-type>
+    Either "single" for single-end reads, or "paired" for paired-end reads.
+-t <num-threads> --num-threads=<num-threads>
+    Number of processes used to classify reads [default: 1].
+--min-hits=<min-hits>
+    Minimum number of sampled k-mers unique to a species' genome which a read
+    (or read pair) must contain, with none unique to any other species'
+    genome, to be classified as originating from that species [default: 2].
+{help_option_spec}
+    {help_option_description}
+{ver_option_spec}
+    {ver_option_description}
+{log_option_spec}
+    {log_option_description}
+
+classify_reads classifies the reads of each sample by the species-
+discriminative k-mers they contain. Reads confidently classified as
+originating from a species are written to "<output-dir>/<sample>/<species>",
+along with a link to the sample's remaining, unclassified, reads; reads in each
+species' directory then need only be mapped to that species' genome. The number
+of reads classified as each species is written to
+"<output-dir>/<sample>/classification_summary.txt".
+
+In normal operation, the user should not need to execute this script by hand
+themselves.
+"""
+    KMER_INDEX = "<kmer-index>"
+    SAMPLES = "<samples>"
+    INPUT_DIR = "<input-dir>"
+    OUTPUT_DIR = "<output-dir>"
+    READS_TYPE = "<reads-type>"
+    NUM_THREADS = "--num-threads"
+    MIN_HITS = "--min-hits"
+
+    READS_TYPES = {"single": 1, "paired": 2}
+
+    def __init__(self, commandline_parser):
+        self.commandline_parser = commandline_parser
+
+    @classmethod
+    def _validate_command_line_options(cls, options):
+        try:
+            ParameterValidator.validate_log_level(options)
+            ParameterValidator.validate_file_option(
+                options[ReadClassifier.KMER_INDEX],
+                "Could not find k-mer index")
+            ParameterValidator.validate_dir_option(
+                options[ReadClassifier.INPUT_DIR],
+                "Raw reads directory does not exist")
+            options[ReadClassifier.READS_TYPE] = \
+                ParameterValidator.validate_dict_option(
+                    options[ReadClassifier.READS_TYPE],
+                    ReadClassifier.READS_TYPES, "Invalid reads type")
+            options[ReadClassifier.NUM_THREADS] = \
+                ParameterValidator.validate_int_option(
+                    options[ReadClassifier.NUM_THREADS],
+                    "Number of threads must be a positive integer",
+                    min_val=1)
+            options[ReadClassifier.MIN_HITS] = \
+                ParameterValidator.validate_int_option(
+                    options[ReadClassifier.MIN_HITS],
+                    "Minimum k-mer hits must be a positive integer",
+                    min_val=1)
+        except schema.SchemaError as exc:
+            exit("Exiting: " + exc.code)
+
+    @classmethod
+    def _get_reads_files(cls, input_dir, sample, num_mates):
+        reads_files = []
+        for reads_dir in READS_DIRS[:num_mates]:
+            sample_reads_dir = os.path.join(input_dir, sample, reads_dir)
+            reads_files.append([os.path.join(sample_reads_dir, f)
+                                for f in sorted(os.listdir(sample_reads_dir))])
+        return reads_files
+
+    def run(self, args):
+        """
+        Classify the reads of each sample by their k-mers.
+
+        args: list of command line arguments
+        """
+        options = self.commandline_parser.parse(args, self.DOC)
+
+        self._validate_command_line_options(options)
+
+        self.logger = log.get_logger_for_options(options)
+
+        for sample in options[ReadClassifier.SAMPLES].split():
+            self.logger.info("Classifying reads for sample {s}".format(
+                s=sample))
+            classify_sample(
+                options[ReadClassifier.KMER_INDEX],
+                self._get_reads_files(options[ReadClassifier.INPUT_DIR],
+                                      sample,
+                                      options[ReadClassifier.READS_TYPE]),
+                os.path.join(options[ReadClassifier.OUTPUT_DIR], sample),
+                options[ReadClassifier.MIN_HITS],
+                options[ReadClassifier.NUM_THREADS], self.logger)
@@ -0,0 +1,80 @@
+import schema
+import sargasso.separator.options as opts
+
+from sargasso.filter import combined_hits
+from sargasso.separator.parameter_validator import ParameterValidator
+from sargasso.utils import log
+
+
+class CombinedBlockSplitter(object):
+    DOC = """Usage:
+    split_combined_bam [--log-level=<log-level>]
+        [--compression-level=<compression-level>]
+        <combined-bam> <block-bam> <block-bam>...
+
+Options:
+<combined-bam>
+    BAM file of reads mapped to a combined genome, in which the hits for each
+    read are adjacent.
+<block-bam>
+    Block BAM file to write.
+--compression-level=<compression-level>
+    BGZF compression level, from 0 (uncompressed) to 9, of the block BAM
+    files; if not specified, pysam's default level is used.
+{help_option_spec}
+    {help_option_description}
+{ver_option_spec}
+    {ver_option_description}
+{log_option_spec}
+    {log_option_description}
+
+split_combined_bam splits a BAM file of reads mapped once to a combined genome,
+built from the genomes of all species, into blocks which may be filtered
+concurrently. As reads are not sorted by name, successive chunks of reads are
+written to each block file in turn, keeping all the hits for each read in the
+same block.
+
+In normal operation, the user should not need to execute this script by hand
+themselves.
+"""
+    COMBINED_BAM = "<combined-bam>"
+    BLOCK_BAM = "<block-bam>"
+
+    def __init__(self, commandline_parser):
+        self.commandline_parser = commandline_parser
+
+    @classmethod
+    def _validate_command_line_options(cls, options):
+        try:
+            ParameterValidator.validate_log_level(options)
+            ParameterValidator.validate_file_option(
+                options[CombinedBlockSplitter.COMBINED_BAM],
+                "Could not find combined BAM file")
+            options[opts.COMPRESSION_LEVEL] = \
+                ParameterValidator.validate_compression_level(
+                    options[opts.COMPRESSION_LEVEL],
+                    "Compression level must be between 0 and 9",
+                    nullable=True)
+        except schema.SchemaError as exc:
+            exit("Exiting: " + exc.code)
+
+    def run(self, args):
+        """
+        Split a combined BAM file into blocks of whole reads.
+
+        args: list of command line arguments
+        """
+        options = self.commandline_parser.parse(args, self.DOC)
+
+        self._validate_command_line_options(options)
+
+        self.logger = log.get_logger_for_options(options)
+
+        self.logger.info("Splitting {b} into {n} blocks".format(
+            b=options[CombinedBlockSplitter.COMBINED_BAM],
+            n=len(options[CombinedBlockSplitter.BLOCK_BAM])))
+
+        combined_hits.split_blocks(
+            options[CombinedBlockSplitter.COMBINED_BAM],
+            options[CombinedBlockSplitter.BLOCK_BAM],
+            options[opts.COMPRESSION_LEVEL])
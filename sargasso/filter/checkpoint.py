@@ -0,0 +1,84 @@
+"""
+Utility functions for recording that a block of mapped reads has been
+filtered, so that an interrupted filtering run can be resumed. Exports:
+
+get_marker_path: Return the path of the completion marker for a block.
+is_complete: Return True if a block has a completion marker.
+write_marker: Atomically write the completion marker for a block.
+read_marker: Return the filtering statistics recorded in a completion marker.
+read_marker_reasons: Return the decision reason counts recorded in a completion
+marker.
+"""
+
+import json
+import os
+
+MARKER_SUFFIX = ".done"
+
+_STATS = "stats"
+_OUTPUTS = "outputs"
+_REASONS = "reasons"
+
+
+def get_marker_path(output_bam):
+    """
+    Return the path of the completion marker for a block.
+
+    output_bam: Path of the filtered BAM file written for the first species
+    when filtering the block.
+    """
+    return output_bam + MARKER_SUFFIX
+
+
+def is_complete(marker_path):
+    """
+    Return True if a completion marker exists at the specified path.
+
+    marker_path: Path of a block completion marker.
+    """
+    return os.path.isfile(marker_path)
+
+
+def write_marker(marker_path, stats, output_bams, reasons=None):
+    """
+    Atomically write the completion marker for a block.
+
+    The marker is first written to a temporary file, which is then renamed,
+    so that a marker is only ever present once all of its contents (and the
+    filtered output files, which must already have been closed) are complete.
+    marker_path: Path of the block completion marker.
+    stats: List of filtering statistics for the block, in the order in which
+    they are written to the filtering results summary file.
+    output_bams: List of paths of the filtered BAM files written for the block.
+    reasons: List, for each species, of the counts of threshold violations and
+    decision reasons for the block.
+    """
+    tmp_path = marker_path + ".tmp"
+    with open(tmp_path, 'w') as marker_file:
+        json.dump({_STATS: stats, _OUTPUTS: output_bams, _REASONS: reasons},
+                  marker_file)
+        marker_file.flush()
+        os.fsync(marker_file.fileno())
+
+    os.rename(tmp_path, marker_path)
+
+
+def read_marker(marker_path):
+    """
+    Return the filtering statistics recorded in a block completion marker.
+
+    marker_path: Path of a block completion marker.
+    """
+    with open(marker_path) as marker_file:
+        return json.load(marker_file)[_STATS]
+
+
+def read_marker_reasons(marker_path):
+    """
+    Return the decision reason counts recorded in a block completion marker,
+    or None if none were recorded.
+
+    marker_path: Path of a block completion marker.
+    """
+    with open(marker_path) as marker_file:
+        return json.load(marker_file).get(_REASONS)
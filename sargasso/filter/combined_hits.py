@@ -0,0 +1,190 @@
+"""
+Utility functions and classes for separating reads mapped once to a combined
+genome, built from the genomes of all species with the name of each contig
+prefixed by that of its species. Exports:
+
+COMBINED_NAME: Name used in place of a species name for the combined genome.
+SPECIES_SEPARATOR: Separator between species and contig names.
+get_combined_contig_name: Return the name of a species' contig in the combined
+genome.
+CombinedHitsReader: Yield, for each read, its hits to each species' contigs.
+split_blocks: Split a combined BAM file into blocks of whole reads.
+"""
+
+import os.path
+
+import sargasso.utils.samutils as su
+
+COMBINED_NAME = "combined"
+SPECIES_SEPARATOR = "__"
+
+# Number of consecutive reads written to each block in turn when a combined
+# BAM file is split into blocks
+_BLOCK_CHUNK_READS = 10000
+
+
+def get_combined_contig_name(species, contig):
+    """
+    Return the name of a species' contig in the combined genome.
+    """
+    return species + SPECIES_SEPARATOR + contig
+
+
+class CombinedHitsReader(object):
+    """
+    Reads the hits in a BAM file of reads mapped to a combined genome, and
+    divides the hits for each read between species according to the species
+    prefix of the contigs to which they map. The reference of each hit is
+    renumbered to index the contigs of its species alone, so that hits may be
+    written to a BAM file whose header (as returned by 'get_header') names only
+    that species' contigs.
+
+    Hits for each read must be adjacent in the input file, as they are in
+    aligner output, but reads need not be sorted by name.
+    """
+
+    def __init__(self, input_bam, species, max_hits=None, tmp_dir=None):
+        """
+        Create object.
+        input_bam: path of a BAM file of reads mapped to a combined genome.
+        species: list of species names.
+        max_hits: if not None, the maximum number of hits for each read to a
+        species' contigs, besides its primary hits, held in memory; further
+        hits are spilled to a temporary BAM file in the directory 'tmp_dir'.
+        """
+        self.input_hits = su.open_samfile_for_read(input_bam)
+        self.input_size = os.path.getsize(input_bam)
+        self.num_species = len(species)
+        self.max_hits = max_hits
+        self.tmp_dir = tmp_dir
+
+        species_indices = dict([(s, i) for i, s in enumerate(species)])
+        header = self.input_hits.header.to_dict()
+
+        # Map the index of each combined contig to the index of its species,
+        # and its index amongst that species' contigs
+        self.contigs = []
+        self.headers = [dict(HD={'VN': '1.0', 'SO': 'unsorted'}, SQ=[])
+                        for s in species]
+        for contig in header.get('SQ', []):
+            prefix, separator, name = contig['SN'].partition(SPECIES_SEPARATOR)
+            if separator == "" or prefix not in species_indices:
+                raise ValueError(
+                    "Contig {c} in {b} is not prefixed by a species name".
+                    format(c=contig['SN'], b=input_bam))
+
+            species_index = species_indices[prefix]
+            sequences = self.headers[species_index]['SQ']
+            self.contigs.append((species_index, len(sequences)))
+            sequences.append(dict(contig, SN=name))
+
+        for species_header in self.headers:
+            if 'PG' in header:
+                species_header['PG'] = header['PG']
+
+    def get_header(self, species_index):
+        """
+        Return the header, as a dictionary, of a BAM file to which a species'
+        hits may be written.
+        """
+        return self.headers[species_index]
+
+    def get_fraction_read(self):
+        """
+        Return the approximate fraction of the input BAM file read so far, or
+        None if this cannot be determined.
+        """
+        if self.input_size == 0:
+            return None
+
+        try:
+            return min(1.0, (self.input_hits.tell() >> 16) /
+                       float(self.input_size))
+        except (OSError, ValueError, NotImplementedError):
+            return None
+
+    def _localise(self, hit):
+        """
+        Renumber the references of a hit, and of its mate, to index the
+        contigs of the hit's species, and return the index of the species.
+        """
+        species_index, contig_index = self.contigs[hit.reference_id]
+        hit.reference_id = contig_index
+
+        if hit.next_reference_id >= 0:
+            mate_species_index, mate_contig_index = \
+                self.contigs[hit.next_reference_id]
+            if mate_species_index == species_index:
+                hit.next_reference_id = mate_contig_index
+            else:
+                hit.next_reference_id = -1
+                hit.next_reference_start = -1
+
+        return species_index
+
+    def reads(self):
+        """
+        Yield, for each read, a list giving the hits for the read to each
+        species' contigs (empty for species to which the read did not map).
+        Unmapped hits are discarded. Hits beyond the maximum number held in
+        memory are spilled, as by 'samutils.hits_generator', so that the
+        hits for a species may be a 'samutils.SpilledHits' object.
+        """
+        read_name = None
+        species_hits = None
+
+        for hit in su.all_hits(self.input_hits):
+            if species_hits is None or hit.query_name != read_name:
+                if species_hits is not None:
+                    yield species_hits
+                read_name = hit.query_name
+                species_hits = [[] for i in range(self.num_species)]
+
+            if hit.reference_id < 0:
+                continue
+
+            species_index = self._localise(hit)
+            species_hits[species_index] = su.add_hit(
+                species_hits[species_index], hit, self.max_hits,
+                self.headers[species_index], self.tmp_dir)
+
+        if species_hits is not None:
+            yield species_hits
+
+    def close(self):
+        self.input_hits.close()
+
+
+def split_blocks(input_bam, block_bams, compression_level=None):
+    """
+    Split a BAM file of reads mapped to a combined genome into blocks, each of
+    which may be filtered separately. As reads are not sorted by name, blocks
+    are formed from successive chunks of reads written to each block file in
+    turn, keeping the hits for each read together.
+
+    input_bam: path of a BAM file of reads mapped to a combined genome.
+    block_bams: paths of the block BAM files to write.
+    compression_level: BGZF compression level of the block BAM files; if
+    None, pysam's default level is used.
+    """
+    input_hits = su.open_samfile_for_read(input_bam)
+    outputs = [su.open_samfile_for_write(b, input_hits, compression_level)
+               for b in block_bams]
+
+    # Hits are written as they are read, rather than gathered for each read,
+    # so that reads with very many hits are not held in memory
+    read_name = None
+    read_index = -1
+
+    try:
+        for hit in su.all_hits(input_hits):
+            if read_index < 0 or hit.query_name != read_name:
+                read_name = hit.query_name
+                read_index += 1
+                output = outputs[
+                    (read_index // _BLOCK_CHUNK_READS) % len(outputs)]
+            output.write(hit)
+    finally:
+        input_hits.close()
+        for output in outputs:
+            output.close()
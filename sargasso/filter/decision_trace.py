@@ -0,0 +1,208 @@
+"""
+Constants and classes describing why each read was assigned to, or rejected
+for, each species during filtering, and for writing and reading a compact
+binary trace of these decisions for a sample of reads. Exports:
+
+REASON_NAMES: Names of the reasons for which filtering decisions are made.
+DecisionTracer: Write decisions for a sample of reads to a binary trace file.
+read_trace: Return the species and the decision records in a trace file.
+merge_traces: Concatenate several trace files into one.
+"""
+
+import os.path
+import struct
+import zlib
+
+from collections import namedtuple
+
+# Reasons for which the hits for a read are assigned to or rejected for a
+# species. A read is assigned (or rejected) because: only one species had hits
+# for the read; only one species' hits did not violate the filtering
+# thresholds; a tie between species was broken by fewest primary mismatches,
+# best CIGAR check or fewest multimaps; the tie could not be broken (and the
+# read is ambiguous); all species' hits violated the thresholds; or the read
+# multimapped and multimapping reads are rejected.
+REASON_ONLY_SPECIES = 0
+REASON_ONLY_UNVIOLATED = 1
+REASON_MISMATCHES = 2
+REASON_CIGAR = 3
+REASON_MULTIMAPS = 4
+REASON_AMBIGUOUS = 5
+REASON_ALL_VIOLATED = 6
+REASON_MULTIMAPS_REJECTED = 7
+
+REASON_NAMES = [
+    "Only-Species",
+    "Only-Unviolated",
+    "Tie-Mismatches",
+    "Tie-CIGAR",
+    "Tie-Multimaps",
+    "Ambiguous",
+    "All-Violated",
+    "Multimaps-Rejected",
+]
+
+TRACE_SUFFIX = ".trace"
+
+_MAGIC = b"SGDT"
+_VERSION = 2
+_HEADER = struct.Struct("<4sBB")
+_SPECIES_NAME_LENGTH = struct.Struct("<B")
+_READ = struct.Struct("<HbB")
+_SPECIES_DATA = struct.Struct("<BHHB")
+_MAX_COUNT = 0xffff
+
+# For paired-end DNA-seq reads, multimaps and mismatches are averaged over the
+# mates of a pair, so may be halves; they are stored multiplied by this scale
+_COUNT_SCALE = 2
+
+_HAS_HITS = 1
+_VIOLATED = 2
+
+# Per-species values recorded for a read; 'has_hits' is False for species to
+# whose genome the read did not map, in which case the other values are zero.
+SpeciesDecisionData = namedtuple(
+    'SpeciesDecisionData',
+    ['has_hits', 'violated', 'multimaps', 'mismatches', 'cigar_check'])
+
+Decision = namedtuple('Decision', ['read_name', 'assignee', 'reason', 'species'])
+
+
+def _write_header(trace_file, species):
+    trace_file.write(_HEADER.pack(_MAGIC, _VERSION, len(species)))
+    for name in species:
+        name = name.encode()
+        trace_file.write(_SPECIES_NAME_LENGTH.pack(len(name)) + name)
+
+
+def _read_header(trace_file):
+    magic, version, num_species = _HEADER.unpack(
+        trace_file.read(_HEADER.size))
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("Not a decision trace file: " + trace_file.name)
+
+    species = []
+    for i in range(num_species):
+        length = _SPECIES_NAME_LENGTH.unpack(
+            trace_file.read(_SPECIES_NAME_LENGTH.size))[0]
+        species.append(trace_file.read(length).decode())
+
+    return species
+
+
+def _encode_count(count):
+    return min(int(round(count * _COUNT_SCALE)), _MAX_COUNT)
+
+
+def _decode_count(value):
+    # Whole counts are returned as integers, halves as floats
+    if value % _COUNT_SCALE == 0:
+        return value // _COUNT_SCALE
+    return value / float(_COUNT_SCALE)
+
+
+class DecisionTracer(object):
+    """
+    Writes filtering decisions, and the per-species values on which they were
+    based, to a compact binary trace file, for a deterministic sample of reads.
+    Reads are sampled according to a hash of their name, so that the same reads
+    are traced in every run, and in every block.
+    """
+
+    def __init__(self, trace_path, species, sample_rate):
+        """
+        Create object.
+        trace_path: path of the trace file to write.
+        species: list of species names.
+        sample_rate: fraction of reads whose decisions will be traced.
+        """
+        self.num_species = len(species)
+        self.threshold = int(sample_rate * 0x100000000)
+        self.trace_file = open(trace_path, 'wb')
+        _write_header(self.trace_file, species)
+
+    def trace(self, read_name, assignee, reason, threshold_data):
+        """
+        Write a decision to the trace file, if the read is sampled.
+
+        read_name: name of the read.
+        assignee: index of the species to which the read was assigned, or a
+        negative value if the read was rejected or ambiguous.
+        reason: reason for the decision, one of the REASON_ constants.
+        threshold_data: list of (species index, HitsChecker.ThresholdData)
+        pairs for the species which had hits for the read.
+        """
+        name = read_name.encode()
+        if zlib.crc32(name) & 0xffffffff >= self.threshold:
+            return
+
+        species_data = [(0, 0, 0, 0)] * self.num_species
+        for index, t in threshold_data:
+            species_data[index] = (
+                _HAS_HITS | (_VIOLATED if t.violated else 0),
+                _encode_count(t.multimaps), _encode_count(t.mismatches),
+                t.cigar_check)
+
+        self.trace_file.write(
+            _READ.pack(len(name), assignee, reason) + name +
+            b"".join([_SPECIES_DATA.pack(*d) for d in species_data]))
+
+    def close(self):
+        self.trace_file.close()
+
+
+def read_trace(trace_path):
+    """
+    Return the list of species names recorded in a trace file, and a list of
+    Decision tuples for each read traced.
+
+    trace_path: path of a trace file written by DecisionTracer.
+    """
+    decisions = []
+
+    with open(trace_path, 'rb') as trace_file:
+        species = _read_header(trace_file)
+
+        while True:
+            read = trace_file.read(_READ.size)
+            if len(read) < _READ.size:
+                break
+
+            name_length, assignee, reason = _READ.unpack(read)
+            read_name = trace_file.read(name_length).decode()
+
+            species_data = []
+            for i in range(len(species)):
+                flags, multimaps, mismatches, cigar_check = \
+                    _SPECIES_DATA.unpack(trace_file.read(_SPECIES_DATA.size))
+                species_data.append(SpeciesDecisionData(
+                    bool(flags & _HAS_HITS), bool(flags & _VIOLATED),
+                    _decode_count(multimaps), _decode_count(mismatches),
+                    cigar_check))
+
+            decisions.append(
+                Decision(read_name, assignee, reason, species_data))
+
+    return species, decisions
+
+
+def merge_traces(trace_paths, merged_path):
+    """
+    Concatenate the decisions recorded in several trace files, written for
+    the same species, into a single trace file.
+
+    trace_paths: list of paths of trace files; any which do not exist are
+    ignored.
+    merged_path: path of the trace file to write.
+    """
+    trace_paths = [p for p in trace_paths if os.path.isfile(p)]
+    if len(trace_paths) == 0:
+        return
+
+    with open(merged_path, 'wb') as merged:
+        for i, trace_path in enumerate(trace_paths):
+            with open(trace_path, 'rb') as trace_file:
+                species = _read_header(trace_file)
+                if i == 0:
+                    _write_header(merged, species)
+                merged.write(trace_file.read())
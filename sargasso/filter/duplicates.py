@@ -0,0 +1,245 @@
+"""
+Utility functions and classes for collapsing reads (or read pairs) with
+identical sequences into a single representative read before mapping, and for
+expanding the filtering decision made for each representative back to all the
+reads it stands for. Exports:
+
+DUPLICATES_FILE: Name of the file listing the reads collapsed into each
+representative read.
+COLLAPSED_READS_FILE: Name of the FASTQ file(s) of representative reads.
+collapse_reads: Write one representative of each set of identical reads.
+DuplicatesTable: Return the names of the reads a representative stands for.
+
+Each representative read is renamed "<name>|<offset>", where <offset> is the
+position in the duplicates file of the tab-separated names of the reads
+collapsed into it, or 0 if there are none. The duplicates file is
+memory-mapped while filtering, so that it is shared between the processes
+filtering blocks of a sample concurrently.
+"""
+
+import gzip
+import mmap
+import os
+import os.path
+import subprocess
+
+from sargasso.filter import read_assignments
+
+DUPLICATES_FILE = "duplicates.txt"
+COLLAPSED_READS_FILE = "collapsed.fastq.gz"
+READS_DIRS = ["reads_1", "reads_2"]
+
+NAME_SEPARATOR = "|"
+
+_DUPLICATES_HEADER = b"#duplicates\n"
+
+# Collapsed reads are intermediate files, read once by the aligner, so are
+# compressed quickly rather than compactly
+_COMPRESS_LEVEL = 1
+
+# Reads are grouped by sequence in byte order, and representatives by read
+# index in numerical order
+_SORT_ENVIRONMENT = dict(os.environ, LC_ALL="C")
+
+
+def _sort(input_path, output_path, tmp_dir, keys):
+    subprocess.check_call(
+        ["sort", "-t", "\t"] + keys + ["-T", tmp_dir, "-o", output_path,
+                                       input_path],
+        env=_SORT_ENVIRONMENT)
+
+
+def _open(path):
+    return gzip.open(path, 'rb') if path.endswith(".gz") else open(path, 'rb')
+
+
+def _read_records(fastq_files):
+    """
+    Yield the four lines of each record in a list of FASTQ files.
+    """
+    for fastq_file in fastq_files:
+        with _open(fastq_file) as fastq:
+            while True:
+                record = [fastq.readline() for i in range(4)]
+                if not record[0]:
+                    break
+                yield record
+
+
+def _read_reads(reads_files):
+    """
+    Yield the records of each read (or of each mate of a read pair).
+    """
+    return zip(*[_read_records(f) for f in reads_files])
+
+
+def _write_sequences(reads_files, sequences_path):
+    """
+    Write the sequence(s), index and name of each read to a file, and return
+    the number of reads.
+    """
+    index = 0
+    with open(sequences_path, 'wb') as sequences:
+        for read in _read_reads(reads_files):
+            sequences.write(b",".join([mate[1].rstrip() for mate in read]) +
+                            "\t{i}\t{n}\n".format(
+                                i=index,
+                                n=read_assignments.get_read_name(
+                                    read[0][0])).encode())
+            index += 1
+    return index
+
+
+def _write_groups(sorted_path, groups_path, num_reads):
+    """
+    Given reads sorted by sequence, and then by index, write the index of the
+    first read with each sequence, and the names of all later reads with the
+    same sequence, to a file. Return a table marking, for each read, whether
+    it is one of these later, duplicate, reads.
+    """
+    is_duplicate = bytearray(num_reads)
+
+    with open(sorted_path, 'rb') as sorted_reads, \
+            open(groups_path, 'wb') as groups:
+        current_sequence = None
+        group = []
+
+        def write_group():
+            if len(group) > 1:
+                groups.write(b"\t".join(group) + b"\n")
+
+        for line in sorted_reads:
+            sequence, index, name = line.rstrip(b"\n").split(b"\t")
+            if sequence != current_sequence:
+                write_group()
+                current_sequence = sequence
+                group = [index]
+            else:
+                is_duplicate[int(index)] = 1
+                group.append(name)
+
+        write_group()
+
+    return is_duplicate
+
+
+def _read_groups(groups_path):
+    """
+    Yield the index of each representative read, in increasing order, and the
+    names of the reads collapsed into it.
+    """
+    with open(groups_path, 'rb') as groups:
+        for line in groups:
+            fields = line.rstrip(b"\n").split(b"\t", 1)
+            yield int(fields[0]), fields[1]
+
+
+def _write_representatives(reads_files, is_duplicate, groups_path,
+                           output_paths, duplicates_path):
+    """
+    Write each representative read, renamed to refer to the names of the
+    reads collapsed into it, and the duplicates file of these names.
+    """
+    outputs = [gzip.open(p, 'wb', _COMPRESS_LEVEL) for p in output_paths]
+    groups = _read_groups(groups_path)
+    next_group = next(groups, None)
+
+    try:
+        with open(duplicates_path, 'wb') as duplicates:
+            duplicates.write(_DUPLICATES_HEADER)
+
+            for index, read in enumerate(_read_reads(reads_files)):
+                if is_duplicate[index]:
+                    continue
+
+                offset = 0
+                if next_group is not None and next_group[0] == index:
+                    offset = duplicates.tell()
+                    duplicates.write(next_group[1] + b"\n")
+                    next_group = next(groups, None)
+
+                name_line = "@{n}{s}{o}\n".format(
+                    n=read_assignments.get_read_name(read[0][0]),
+                    s=NAME_SEPARATOR, o=offset).encode()
+                for output, mate in zip(outputs, read):
+                    output.write(name_line + mate[1] + b"+\n" + mate[3])
+    finally:
+        for output in outputs:
+            output.close()
+
+
+def collapse_reads(reads_files, sample_dir, tmp_dir):
+    """
+    Collapse reads (or read pairs) with identical sequences into a single
+    representative read, the first such read in the input files. Write the
+    representative reads to "<sample_dir>/reads_1/collapsed.fastq.gz" (and
+    "reads_2", for paired-end reads), and the names of the reads collapsed into
+    each to "<sample_dir>/duplicates.txt". Reads are grouped by sequence via
+    the 'sort' utility, so that they need not be held in memory. Return the
+    numbers of input and of representative reads.
+
+    reads_files: list containing a list of FASTQ files for single-end reads,
+    or lists of first and second mate FASTQ files for paired-end reads.
+    sample_dir: directory to which the sample's collapsed reads are written.
+    tmp_dir: directory in which temporary files are written.
+    """
+    output_paths = []
+    for reads_dir in READS_DIRS[:len(reads_files)]:
+        output_dir = os.path.join(sample_dir, reads_dir)
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        output_paths.append(os.path.join(output_dir, COLLAPSED_READS_FILE))
+
+    sequences_path = os.path.join(tmp_dir, "sequences.tsv")
+    sorted_path = os.path.join(tmp_dir, "sorted_sequences.tsv")
+    groups_path = os.path.join(tmp_dir, "groups.tsv")
+    sorted_groups_path = os.path.join(tmp_dir, "sorted_groups.tsv")
+
+    num_reads = _write_sequences(reads_files, sequences_path)
+    _sort(sequences_path, sorted_path, tmp_dir, ["-k1,1", "-k2,2n"])
+    os.remove(sequences_path)
+
+    is_duplicate = _write_groups(sorted_path, groups_path, num_reads)
+    os.remove(sorted_path)
+    _sort(groups_path, sorted_groups_path, tmp_dir, ["-k1,1n"])
+    os.remove(groups_path)
+
+    _write_representatives(
+        reads_files, is_duplicate, sorted_groups_path, output_paths,
+        os.path.join(sample_dir, DUPLICATES_FILE))
+    os.remove(sorted_groups_path)
+
+    return num_reads, num_reads - sum(is_duplicate)
+
+
+class DuplicatesTable(object):
+    """
+    Looks up the names of the reads which a representative read stands for:
+    its own name, followed by those of the reads collapsed into it.
+    """
+
+    def __init__(self, duplicates_path):
+        """
+        Create object.
+        duplicates_path: path of a duplicates file written by
+        'collapse_reads'.
+        """
+        with open(duplicates_path, 'rb') as duplicates:
+            self.mapped = mmap.mmap(
+                duplicates.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get_read_names(self, query_name):
+        """
+        Return the original name of a representative read, given its name in
+        mapped reads, followed by the names of the reads collapsed into it.
+        """
+        name, separator, offset = query_name.rpartition(NAME_SEPARATOR)
+        offset = int(offset)
+        if offset == 0:
+            return [name]
+
+        end = self.mapped.find(b"\n", offset)
+        return [name] + self.mapped[offset:end].decode().split("\t")
+
+    def close(self):
+        self.mapped.close()
@@ -0,0 +1,211 @@
+"""
+Utility functions and classes for writing the reads assigned to a species
+directly to gzipped FASTQ files, from their primary hits, as an alternative or
+in addition to filtered BAM files. Exports:
+
+OUTPUT_FORMATS: Formats in which filtered reads may be written.
+writes_bam: Return True if an output format includes BAM files.
+writes_fastq: Return True if an output format includes FASTQ files.
+records_assignments: Return True if an output format is a record of the
+species to which each read was assigned.
+get_fastq_paths: Return the FASTQ files corresponding to a filtered BAM file.
+FastqWriter: Write reads to gzipped FASTQ files, from their primary hits.
+"""
+
+import gzip
+
+import pysam
+
+OUTPUT_FORMAT_BAM = "bam"
+OUTPUT_FORMAT_FASTQ = "fastq"
+OUTPUT_FORMAT_BOTH = "both"
+OUTPUT_FORMAT_ASSIGNMENTS = "assignments"
+
+# Map each output format to whether BAM and FASTQ files are written (when
+# neither is, only the species to which each read was assigned is recorded)
+OUTPUT_FORMATS = {
+    OUTPUT_FORMAT_BAM: (True, False),
+    OUTPUT_FORMAT_FASTQ: (False, True),
+    OUTPUT_FORMAT_BOTH: (True, True),
+    OUTPUT_FORMAT_ASSIGNMENTS: (False, False),
+}
+
+SINGLE_END_SUFFIX = ".fastq.gz"
+MATE_SUFFIXES = ["_1.fastq.gz", "_2.fastq.gz"]
+SINGLETONS_SUFFIX = "_singletons.fastq.gz"
+
+# The gzip command line tool's default; the highest levels are much slower
+# for little gain in compression of sequence data
+COMPRESS_LEVEL = 6
+
+# Number of reads for which FASTQ records are accumulated before being
+# compressed and written
+BUFFER_READS = 10000
+
+_BAM_SUFFIX = ".bam"
+
+
+def writes_bam(output_format):
+    return OUTPUT_FORMATS[output_format][0]
+
+
+def writes_fastq(output_format):
+    return OUTPUT_FORMATS[output_format][1]
+
+
+def records_assignments(output_format):
+    return output_format == OUTPUT_FORMAT_ASSIGNMENTS
+
+
+def get_fastq_paths(output_bam):
+    """
+    Return the path of the FASTQ file to which single-end reads are written,
+    the paths of the FASTQ files to which the first and second mates of
+    paired-end reads are written, and the path of the FASTQ file to which
+    paired-end reads with hits for only one mate are written, in place of or
+    alongside a filtered BAM file.
+
+    output_bam: path of a filtered BAM file.
+    """
+    if output_bam.endswith(_BAM_SUFFIX):
+        output_bam = output_bam[:-len(_BAM_SUFFIX)]
+
+    return output_bam + SINGLE_END_SUFFIX, \
+        [output_bam + s for s in MATE_SUFFIXES], \
+        output_bam + SINGLETONS_SUFFIX
+
+
+class FastqWriter(object):
+    """
+    Writes reads to gzipped FASTQ files, taking the sequence and base
+    qualities of each read (or each mate, for paired-end reads) from its
+    primary hit, in the read's original orientation. Each file is only created
+    once a read is written to it, as it is only then known whether reads are
+    single- or paired-end.
+
+    The two mates of a paired-end read are written to the first and second
+    mate files together, so that these stay in step; a paired-end read for
+    which hits were found for only one mate is instead written to a separate
+    file of singletons.
+
+    Hits need not record a read's sequence (secondary hits often do not), so
+    a hit which does is preferred; a read for which no hit of a mate records
+    its sequence cannot be written, and is skipped with a warning.
+
+    Gzip files may be concatenated, so the FASTQ files written for several
+    blocks of reads, each compressed by a separate process, can be combined
+    by simple concatenation.
+    """
+
+    def __init__(self, output_bam, logger=None):
+        """
+        Create object.
+        output_bam: path of the filtered BAM file in place of, or alongside,
+        which FASTQ files will be written.
+        logger: optional logging object, to which reads which cannot be
+        written are reported.
+        """
+        self.single_end_path, self.mate_paths, self.singletons_path = \
+            get_fastq_paths(output_bam)
+        self.logger = logger
+        self.paths = []
+        self.outputs = {}
+        self.records = {}
+        self.buffered_reads = 0
+        self.skipped_reads = 0
+
+    def _append(self, path, record):
+        if path not in self.outputs:
+            self.outputs[path] = gzip.open(path, 'wb', COMPRESS_LEVEL)
+            self.records[path] = []
+            self.paths.append(path)
+
+        self.records[path].append(record)
+
+    def _flush(self):
+        for path in self.paths:
+            records = self.records[path]
+            self.outputs[path].write("".join(records).encode())
+            del records[:]
+        self.buffered_reads = 0
+
+    @classmethod
+    def _get_preference(cls, hit):
+        # A hit recording the read's sequence is preferred to one which does
+        # not, and a primary hit to a secondary one
+        return hit.query_sequence is not None, not hit.is_secondary
+
+    def _skip(self, read_name):
+        if self.skipped_reads == 0 and self.logger is not None:
+            self.logger.warning(
+                ("No hit for read {n} records its sequence, so it is not " +
+                 "written to FASTQ files").format(n=read_name))
+        self.skipped_reads += 1
+
+    @classmethod
+    def _get_record(cls, hit):
+        qualities = hit.get_forward_qualities()
+        sequence = hit.get_forward_sequence()
+        return "@{n}\n{s}\n+\n{q}\n".format(
+            n=hit.query_name, s=sequence,
+            q=pysam.qualities_to_qualitystring(qualities)
+            if qualities is not None else "I" * len(sequence))
+
+    def write(self, hits):
+        """
+        Write the FASTQ record(s) for a read.
+
+        hits: list of hits for the read.
+        """
+        # The primary hit for each mate is used, if it records the mate's
+        # sequence; otherwise, as also when reads were mapped to a combined
+        # genome and the primary hit is to another species' genome, the first
+        # hit for the mate which records its sequence is used instead
+        mate_hits = [None, None]
+        for hit in hits:
+            if hit.is_supplementary:
+                continue
+
+            mate = 1 if hit.is_paired and hit.is_read2 else 0
+            if mate_hits[mate] is None or self._get_preference(hit) > \
+                    self._get_preference(mate_hits[mate]):
+                mate_hits[mate] = hit
+
+        if any(h is not None and h.query_sequence is None
+               for h in mate_hits):
+            self._skip(hits[0].query_name)
+            return
+
+        if mate_hits[0] is not None and mate_hits[1] is not None:
+            for path, hit in zip(self.mate_paths, mate_hits):
+                self._append(path, self._get_record(hit))
+        else:
+            hit = mate_hits[0] if mate_hits[0] is not None else mate_hits[1]
+            if hit is None:
+                return
+
+            self._append(self.singletons_path if hit.is_paired
+                         else self.single_end_path, self._get_record(hit))
+
+        self.buffered_reads += 1
+        if self.buffered_reads >= BUFFER_READS:
+            self._flush()
+
+    def get_paths(self):
+        """
+        Return the paths of the FASTQ files which have been written.
+        """
+        return list(self.paths)
+
+    def close(self):
+        if self.skipped_reads > 0 and self.logger is not None:
+            self.logger.warning(
+                ("{n} reads with no hit recording their sequence were not " +
+                 "written to FASTQ files").format(n=self.skipped_reads))
+
+        if not self.outputs:
+            return
+
+        self._flush()
+        for path in self.paths:
+            self.outputs[path].close()
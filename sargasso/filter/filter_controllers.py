@@ -1,12 +1,15 @@
-import subprocess
 import os
 import os.path
 import schema
+import time
 import sargasso.separator.options as opts
 
+from sargasso.filter import checkpoint, decision_trace, fastq_writer, \
+    read_assignments
+from sargasso.filter.separation_stats import SeparationStats
 from sargasso.separator.commandline_parser import CommandlineParser
 from sargasso.separator.parameter_validator import ParameterValidator
-from sargasso.utils import log
+from sargasso.utils import executors, log, profiling, telemetry
 
 
 class FilterController(object):
@@ -28,7 +31,12 @@ The available commands are:
 """
     BLOCK_DIR = "<block-dir>"
     SAMPLE_NAME = "<sample-name>"
+    QUEUE_DIR = "--queue-dir"
+    COMBINED = "--combined"
+    DUPLICATES = "--duplicates"
+    READ_NAMES = "--read-names"
     BLOCK_FILE_SEPARATOR = "___"
+    POLL_INTERVAL = 1
 
     def __init__(self, data_type, commandline_parser):
         self.data_type = data_type
@@ -49,43 +57,47 @@ The available commands are:
             ParameterValidator.validate_dir_option(
                 options[opts.OUTPUT_DIR_ARG],
                 "Filtered reads output directory does not exist")
+            options[opts.TRACE_SAMPLE_RATE] = \
+                ParameterValidator.validate_float_option(
+                    options[opts.TRACE_SAMPLE_RATE],
+                    "Trace sample rate must be between 0 and 1",
+                    min_val=0, max_val=1, nullable=True)
+            ParameterValidator.validate_dict_option(
+                options[opts.OUTPUT_FORMAT], fastq_writer.OUTPUT_FORMATS,
+                "Invalid output format")
+            options[opts.DECIDE_ONLY] = \
+                ParameterValidator.validate_list_option(
+                    options[opts.DECIDE_ONLY], options[opts.SPECIES_ARG],
+                    "Decide-only species must be separated species",
+                    nullable=True)
+            ParameterValidator.validate_file_option(
+                options[FilterController.DUPLICATES],
+                "Could not find duplicates file", nullable=True)
+            ParameterValidator.validate_file_option(
+                options[FilterController.READ_NAMES],
+                "Could not find read names file", nullable=True)
+            options[opts.COMPRESSION_LEVEL] = \
+                ParameterValidator.validate_compression_level(
+                    options[opts.COMPRESSION_LEVEL],
+                    "Compression level must be between 0 and 9",
+                    nullable=True)
+            options[opts.MAX_HITS_IN_MEMORY] = \
+                ParameterValidator.validate_int_option(
+                    options[opts.MAX_HITS_IN_MEMORY],
+                    "Maximum hits in memory must be a positive integer",
+                    min_val=1, nullable=True)
         except schema.SchemaError as exc:
             exit("Exiting: " + exc.code)
 
     @classmethod
-    def _all_processes_finished(cls, processes):
-        """
-        Return True if all processes have finished.
-
-        processes: List of subprocess instances.
-        """
-        finished = True
-        i = 0
-
-        while True:
-            if i < len(processes):
-                if processes[i].poll() is None:
-                    finished = False
-                elif processes[i].poll() == 0:
-                    del processes[i]
-                    i = i - 1
-                if not finished:
-                    return False
-                i = i + 1
-            else:
-                break
-
-        return True
-
-    @classmethod
-    def _get_block_files(cls, block_dir, sp1):
+    def _get_block_files(cls, block_dir, sample, sp1):
         is_block_file = lambda bf: not os.path.isdir(os.path.join(block_dir, bf))
         block_files = [f for f in os.listdir(block_dir) if is_block_file(f)]
         block_files_out = []
 
         for block_file in sorted(block_files):
             sections = block_file.split(cls.BLOCK_FILE_SEPARATOR)
-            if sections[1] == sp1:
+            if len(sections) > 1 and sections[0] == sample and sections[1] == sp1:
                 block_files_out.append(block_file)
 
         return block_files_out
@@ -97,12 +109,23 @@ The available commands are:
         block_file = cls.BLOCK_FILE_SEPARATOR.join(sections)
         return os.path.join(block_dir, block_file)
 
+    @classmethod
+    def _get_sample_file(cls, options, name):
+        return os.path.join(
+            options[opts.OUTPUT_DIR_ARG],
+            cls.BLOCK_FILE_SEPARATOR.join(
+                [options[FilterController.SAMPLE_NAME], name]))
+
+    @classmethod
+    def _get_result_file(cls, options):
+        return cls._get_sample_file(options, "filtering_result_summary.txt")
+
     @classmethod
     def _initialise_result_file(cls, options):
         """
         Initialise results summary file.
 
-        out_dir: Directory into which filtered BAM files will be written.
+        options: dictionary of command-line options
         """
         cols = []
 
@@ -115,32 +138,151 @@ The available commands are:
                 "Ambiguous-Hits-" + species_text, "Ambiguous-Reads-" + species_text
             ]
 
-        out_file = os.path.join(options[opts.OUTPUT_DIR_ARG],
-                                "filtering_result_summary.txt")
-        with open(out_file, 'w') as outf:
+        with open(cls._get_result_file(options), 'w') as outf:
             outf.write("\t".join(cols) + "\n")
 
+    @classmethod
+    def _write_result_file(cls, marker_paths, options):
+        """
+        Write results summary file from the statistics recorded for each block.
+
+        marker_paths: list of block completion marker paths
+        options: dictionary of command-line options
+        """
+        cls._initialise_result_file(options)
+
+        with open(cls._get_result_file(options), 'a') as outf:
+            for marker_path in marker_paths:
+                stats = checkpoint.read_marker(marker_path)
+                outf.write("\t".join([str(s) for s in stats]) + "\n")
+
+    @classmethod
+    def _write_reasons_file(cls, marker_paths, options):
+        """
+        Write the counts of threshold violations and decision reasons for each
+        species, summed over all blocks.
+
+        marker_paths: list of block completion marker paths
+        options: dictionary of command-line options
+        """
+        species = options[opts.SPECIES_ARG]
+        totals = [[0] * len(SeparationStats.REASON_COLUMNS) for s in species]
+
+        for marker_path in marker_paths:
+            reasons = checkpoint.read_marker_reasons(marker_path)
+            if reasons is None:
+                continue
+            for species_totals, species_reasons in zip(totals, reasons):
+                for i, count in enumerate(species_reasons):
+                    species_totals[i] += count
+
+        with open(cls._get_sample_file(
+                options, "decision_reasons.txt"), 'w') as outf:
+            outf.write("\t".join(
+                ["Species"] + SeparationStats.REASON_COLUMNS) + "\n")
+            for sp, species_totals in zip(species, totals):
+                outf.write("\t".join(
+                    [sp] + [str(t) for t in species_totals]) + "\n")
+
+    @classmethod
+    def _get_sample_status_file(cls, options):
+        return cls._get_sample_file(options, "filtering_status.json")
+
+    @classmethod
+    def _report_progress(cls, logger, status_paths, options):
+        """
+        Combine the progress status files written for each block into a
+        single status file for the sample, and log the sample's progress.
+
+        logger: logging object
+        status_paths: list of block progress status file paths
+        options: dictionary of command-line options
+        """
+        status = telemetry.aggregate_status(
+            [telemetry.read_status(p) for p in status_paths])
+
+        telemetry.write_status(cls._get_sample_status_file(options), status)
+
+        logger.info(
+            ("Filtering {s}: {p:.0%} done, {r:.0f} reads/s, estimated " +
+             "{e} s remaining").format(
+                s=options[FilterController.SAMPLE_NAME],
+                p=status[telemetry.FRACTION_DONE] or 0,
+                r=status[telemetry.READS_PER_SECOND],
+                e="?" if status[telemetry.ETA] is None
+                else int(status[telemetry.ETA])))
+
+    @classmethod
+    def _write_profile_report(cls, logger, output_prefixes, options):
+        """
+        Merge the profiles written when filtering each block into a single
+        report for the sample.
+
+        logger: logging object
+        output_prefixes: list of prefixes of block profile paths
+        options: dictionary of command-line options
+        """
+        report_prefix = cls._get_sample_file(options, "profile")
+
+        profiling.write_merged_report(output_prefixes, report_prefix)
+
+        logger.info("Wrote profiling report {r}.txt".format(r=report_prefix))
+
     def _run_processes(self, logger, options):
         """
         Run filtering script in a separate process for each pair of block files.
 
+        Processes are run locally, or, if a work queue directory was specified,
+        by queue workers. Blocks which were completely filtered by a previous,
+        interrupted run are not filtered again.
         logger: logging object
         options: dictionary of command-line options
         """
+        queue_dir = options[FilterController.QUEUE_DIR]
+        if queue_dir is not None and executors.is_serving_queue(queue_dir):
+            # Waiting on a queue for blocks could deadlock, if every worker
+            # serving it were likewise running a command which was waiting
+            logger.warning(
+                "Filtering blocks locally, as already running as a command " +
+                "pulled from the work queue in {q}".format(q=queue_dir))
+            queue_dir = None
+
+        executor = executors.get_executor(queue_dir)
+
         block_files = self._get_block_files(options[FilterController.BLOCK_DIR],
+                                            options[FilterController.SAMPLE_NAME],
                                             options[opts.SPECIES_ARG][0])
 
-        # keep track of all processes
-        all_processes = []
+        # keep track of all processes, and of the completion marker for each
+        # block
+        all_handles = []
+        marker_paths = []
+        status_paths = []
+        output_prefixes = []
         proc_no = -1
 
-        # initialise results file
-        self._initialise_result_file(options)
-
         # cycle through chunks
         for block_file in block_files:
             proc_no += 1
 
+            get_output_path = lambda x: os.path.join(
+                options[opts.OUTPUT_DIR_ARG],
+                self.BLOCK_FILE_SEPARATOR.join(
+                    [options[FilterController.SAMPLE_NAME], x,
+                     str(proc_no), "filtered.bam"]))
+
+            marker_path = checkpoint.get_marker_path(
+                os.path.abspath(get_output_path(options[opts.SPECIES_ARG][0])))
+            marker_paths.append(marker_path)
+            output_prefixes.append(
+                os.path.abspath(get_output_path(options[opts.SPECIES_ARG][0])))
+            status_paths.append(output_prefixes[-1] + telemetry.STATUS_SUFFIX)
+
+            if checkpoint.is_complete(marker_path):
+                logger.info("Skipping previously filtered block {b}".format(
+                    b=block_file))
+                continue
+
             commands = ["filter_sample_reads", self.data_type,
                         "{}={}".format(log.LOG_LEVEL_OPTION,options[log.LOG_LEVEL_OPTION]),
                         options[opts.MISMATCH_THRESHOLD_ARG],
@@ -150,13 +292,6 @@ The available commands are:
             for species in options[opts.SPECIES_ARG]:
                 sp_in = self._get_input_path(options[FilterController.BLOCK_DIR],
                                              block_file, species)
-
-                get_output_path = lambda x: os.path.join(
-                    options[opts.OUTPUT_DIR_ARG],
-                    self.BLOCK_FILE_SEPARATOR.join(
-                        [options[FilterController.SAMPLE_NAME], x,
-                         str(proc_no), "filtered.bam"]))
-
                 sp_out = get_output_path(species)
 
                 commands += [species, sp_in, os.path.abspath(sp_out)]
@@ -164,13 +299,80 @@ The available commands are:
             if options[opts.REJECT_MULTIMAPS]:
                 commands.append("--reject-multimaps")
 
-            proc = subprocess.Popen(commands)
-            all_processes.append(proc)
-
-        # check all processes finished
-        while not self._all_processes_finished(all_processes):
-            logger.info("Waiting for Threads")
-            all_processes[0].wait()
+            if options[opts.PROFILE]:
+                commands.append("--profile")
+
+            if options[opts.TRACE_SAMPLE_RATE] is not None:
+                commands.append("{o}={r}".format(
+                    o=opts.TRACE_SAMPLE_RATE,
+                    r=options[opts.TRACE_SAMPLE_RATE]))
+
+            commands.append("{o}={f}".format(
+                o=opts.OUTPUT_FORMAT, f=options[opts.OUTPUT_FORMAT]))
+
+            if options[opts.DECIDE_ONLY]:
+                commands.append("{o}={s}".format(
+                    o=opts.DECIDE_ONLY, s=",".join(options[opts.DECIDE_ONLY])))
+
+            if options[FilterController.COMBINED]:
+                commands.append(FilterController.COMBINED)
+
+            if options[FilterController.DUPLICATES] is not None:
+                commands.append("{o}={f}".format(
+                    o=FilterController.DUPLICATES,
+                    f=os.path.abspath(options[FilterController.DUPLICATES])))
+
+            if options[FilterController.READ_NAMES] is not None:
+                commands.append("{o}={f}".format(
+                    o=FilterController.READ_NAMES,
+                    f=os.path.abspath(options[FilterController.READ_NAMES])))
+
+            if options[opts.COMPRESSION_LEVEL] is not None:
+                commands.append("{o}={l}".format(
+                    o=opts.COMPRESSION_LEVEL,
+                    l=options[opts.COMPRESSION_LEVEL]))
+
+            if options[opts.MAX_HITS_IN_MEMORY] is not None:
+                commands.append("{o}={n}".format(
+                    o=opts.MAX_HITS_IN_MEMORY,
+                    n=options[opts.MAX_HITS_IN_MEMORY]))
+
+            all_handles.append(executor.submit(
+                block_file, commands))
+
+        # wait for all processes to finish, periodically reporting progress
+        last_report = time.time()
+        while len(all_handles) > 0:
+            time.sleep(FilterController.POLL_INTERVAL)
+            all_handles = [h for h in all_handles if executor.poll(h) is None]
+
+            if time.time() - last_report >= telemetry.STATUS_INTERVAL:
+                self._report_progress(logger, status_paths, options)
+                last_report = time.time()
+
+        # only report success once every block has been filtered
+        incomplete = [m for m in marker_paths if not checkpoint.is_complete(m)]
+        if len(incomplete) > 0:
+            exit("Exiting: filtering did not complete for blocks: " +
+                 ", ".join(incomplete))
+
+        self._write_result_file(marker_paths, options)
+        self._write_reasons_file(marker_paths, options)
+        self._report_progress(logger, status_paths, options)
+
+        if options[opts.PROFILE]:
+            self._write_profile_report(logger, output_prefixes, options)
+
+        if options[opts.TRACE_SAMPLE_RATE] is not None:
+            decision_trace.merge_traces(
+                [p + decision_trace.TRACE_SUFFIX for p in output_prefixes],
+                self._get_sample_file(options, "decision_trace.bin"))
+
+        if fastq_writer.records_assignments(options[opts.OUTPUT_FORMAT]):
+            read_assignments.merge_assignments(
+                [p + read_assignments.ASSIGNMENTS_SUFFIX
+                 for p in output_prefixes],
+                self._get_sample_file(options, "read_assignments.tsv.gz"))
 
         logger.info("Filtering Complete")
 
@@ -196,7 +398,12 @@ The available commands are:
 class RnaSeqFilterController(FilterController):
     DOC = """Usage:
     filter_control <data-type>
-        [--log-level=<log-level>] [--reject-multimaps]
+        [--log-level=<log-level>] [--reject-multimaps] [--profile]
+        [--trace-sample-rate=<trace-sample-rate>] [--queue-dir=<queue-dir>]
+        [--output-format=<output-format>] [--decide-only=<decide-only>]
+        [--combined] [--duplicates=<duplicates>] [--read-names=<read-names>]
+        [--compression-level=<compression-level>]
+        [--max-hits-in-memory=<max-hits-in-memory>]
         <block-dir> <output-dir> <sample-name>
         <mismatch-threshold> <minmatch-threshold> <multimap-threshold>
         (<species>) (<species>) ...
@@ -221,6 +428,62 @@ Option:
 --reject-multimaps
     If set, any read which multimaps to any species' genome will be rejected
     and not be assigned to any species.
+--profile
+    If set, the CPU and memory usage of filtering each set of block files is
+    profiled, and the profiles are merged into a report for the sample,
+    "<sample-name>___profile.txt", written to the output directory, along with
+    a merged cProfile statistics file, "<sample-name>___profile.prof".
+--trace-sample-rate=<trace-sample-rate>
+    If specified, the filtering decision made for approximately this fraction
+    of reads, and the per-species values on which it was based, are written to
+    a compact binary trace file, "<sample-name>___decision_trace.bin", in the
+    output directory.
+--queue-dir=<queue-dir>
+    If specified, filtering of each set of block files is not run locally, but
+    is instead submitted to a work queue held in this directory, from which it
+    is pulled and run by an instance of queue_worker. If filter_control is
+    itself being run by a worker serving this queue, blocks are filtered
+    locally instead, as waiting on the same queue could deadlock; a separate
+    queue, with its own workers, must be used to distribute them.
+--output-format=<output-format>
+    Format in which the reads assigned to each species are written for each
+    set of block files: "bam" for filtered BAM files, "fastq" for gzipped
+    FASTQ files, written from the reads' primary hits, or "both". If
+    "assignments", neither is written; instead, the species to which each read
+    was assigned is recorded in a single file for the sample,
+    "<sample-name>___read_assignments.tsv.gz", in the output directory, from
+    which the script split_reads can split the sample's original FASTQ files
+    by species [default: bam].
+--decide-only=<decide-only>
+    Comma-separated list of species for which reads are not written. These
+    species take part in every filtering decision, and the reads assigned to
+    them are counted, but no output files are written for them.
+--combined
+    If set, reads were mapped once to a combined genome, built from the genomes
+    of all species with the name of each contig prefixed by "<species>__". The
+    block files for every species are then the same file, and the hits for each
+    read are divided between species by the prefixes of the contigs to which
+    they map.
+--duplicates=<duplicates>
+    If specified, reads with identical sequences were collapsed into a single
+    representative read before mapping, and this is the duplicates file,
+    written by collapse_reads, listing the reads collapsed into each. The
+    species assigned to each representative read is then also assigned to
+    each of these reads, which are counted, and written, accordingly.
+--read-names=<read-names>
+    If specified, reads were renamed with compact read IDs before mapping, and
+    this is the read names file, written by compact_read_names, from which the
+    original names of filtered reads are restored.
+--compression-level=<compression-level>
+    BGZF compression level, from 0 (uncompressed) to 9, of the filtered BAM
+    files written for each set of block files; if not specified, pysam's
+    default level is used.
+--max-hits-in-memory=<max-hits-in-memory>
+    If specified, at most this many hits for each read in each species' block
+    file, besides its primary hits, are held in memory; further hits are
+    written to a temporary file, and read again only if the read is assigned
+    to that species. This bounds the memory used for reads with very many
+    multimapping hits. Filtering decisions are identical.
 {help_option_spec}
     {help_option_description}
 {ver_option_spec}
@@ -234,13 +497,16 @@ a number of species' genomes. Each set of BAM files is passed to an instance of
 the script filter_sample_reads, running on a separate thread, which determines
 where possible from which species each read originates. Read mappings for each
 pair of input files are written to a set of species-specific output BAM files
-in the specified output directory.
+in the specified output directory. Counts of the reasons for which reads were
+assigned to or rejected for each species are written to the file
+"<sample-name>___decision_reasons.txt" in the output directory.
 
 In normal operation, the user should not need to execute this script by hand
 themselves.
 
-Note: the input BAM files MUST be sorted in read name order. Failure to ensure
-input BAM files are correctly sorted will result in erroneous output.
+Note: unless "--combined" is set, the input BAM files MUST be sorted in read
+name order. Failure to ensure input BAM files are correctly sorted will result
+in erroneous output.
 """
 
 
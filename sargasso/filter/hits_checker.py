@@ -1,5 +1,9 @@
+import itertools
+
 from collections import namedtuple
 
+from sargasso.filter import decision_trace as dt
+
 
 class HitsChecker:
     REJECTED = -1
@@ -19,14 +23,25 @@ class HitsChecker:
         ['index', 'violated', 'multimaps', 'mismatches', 'cigar_check'])
 
     def __init__(self, mismatch_thresh, minmatch_thresh, multimap_thresh,
-                 reject_multimaps, logger):
+                 reject_multimaps, logger, tracer=None, recorder=None):
         self.logger = logger
         self.mismatch_thresh = mismatch_thresh / 100.0
         self.minmatch_thresh = minmatch_thresh / 100.0
         self.multimap_thresh = multimap_thresh
+        self.tracer = tracer
+        self.recorder = recorder
         self._assign_hits = self._assign_hits_reject_multimaps \
             if reject_multimaps else self._assign_hits_standard
 
+        # The maximum mismatches and minimum matched bases allowed depend only
+        # on a read's length, which takes few distinct values, so are computed
+        # once for each length
+        self.length_thresholds = {}
+
+        # Decisions between two species are looked up by an encoding of the
+        # comparison of their threshold data
+        self.pair_decisions = self._get_pair_decisions()
+
         logger.debug(("PARAMS: mismatch - {mism}, minmatch - {minm}, " +
                       "multimap - {mult}").format(
             mism=self.mismatch_thresh,
@@ -43,11 +58,7 @@ class HitsChecker:
         threshold_data = [self._check_thresholds(i, m) for i, m
                           in enumerate(hits_managers)]
 
-        if __debug__:
-            for t in threshold_data:
-                self.logger.debug(t)
-
-        assignee = self._assign_hits(threshold_data)
+        assignee, reason = self._assign_hits(threshold_data)
 
         if assignee == self.REJECTED:
             for hits_manager in hits_managers:
@@ -60,10 +71,18 @@ class HitsChecker:
                 if i == assignee:
                     hits_manager.add_accepted_hits_to_stats()
                     hits_manager.write_hits()
-                    # self.check_and_write_hits_for_read(hits_manager)
                 else:
                     hits_manager.add_rejected_hits_to_stats()
 
+        for hits_manager in hits_managers:
+            hits_manager.stats.decision(reason)
+
+        if self.tracer is not None:
+            self._trace(hits_managers, assignee, reason, threshold_data)
+
+        if self.recorder is not None:
+            self._record(hits_managers, assignee)
+
         for hits_manager in hits_managers:
             hits_manager.clear_hits()
 
@@ -71,11 +90,23 @@ class HitsChecker:
         if hits_manager.hits_info is None:
             hits_manager.update_hits_info()
 
-        if self.check_hits(hits_manager.hits_info):
+        threshold_data = self._check_thresholds(0, hits_manager)
+
+        if threshold_data.violated:
+            hits_manager.add_rejected_hits_to_stats()
+            assignee, reason = self.REJECTED, dt.REASON_ALL_VIOLATED
+        else:
             hits_manager.add_accepted_hits_to_stats()
             hits_manager.write_hits()
-        else:
-            hits_manager.add_rejected_hits_to_stats()
+            assignee, reason = 0, dt.REASON_ONLY_SPECIES
+
+        hits_manager.stats.decision(reason)
+
+        if self.tracer is not None:
+            self._trace([hits_manager], assignee, reason, [threshold_data])
+
+        if self.recorder is not None:
+            self._record([hits_manager], assignee)
 
         hits_manager.clear_hits()
 
@@ -91,107 +122,136 @@ class HitsChecker:
     def check_hits(self, hits_info):
         # check that the hits for a read are - in themselves - satisfactory to
         # be assigned to a species.
+        max_mismatches, _ = self._get_length_thresholds(
+            hits_info.get_total_length())
+        return not (
+            hits_info.get_multimaps() > self.multimap_thresh or
+            hits_info.get_primary_mismatches() > max_mismatches or
+            self._check_cigars(hits_info) == self.CIGAR_FAIL)
+
+    def _get_length_thresholds(self, total_length):
+        # Return the maximum number of mismatches and minimum number of
+        # matched bases allowed for primary hits of a given total length
+        thresholds = self.length_thresholds.get(total_length)
+        if thresholds is None:
+            thresholds = (
+                round(self.mismatch_thresh * total_length),
+                total_length - round(self.minmatch_thresh * total_length))
+            self.length_thresholds[total_length] = thresholds
+        return thresholds
+
+    def _get_pair_decisions(self):
+        # Tabulate the decision made between two species for each encoding of
+        # the comparison of their threshold data, as made by
+        # _assign_hits_general for threshold data compared in the same way
+        decisions = [None] * 108
+        for violated in itertools.product([False, True], repeat=2):
+            for comparisons in itertools.product([-1, 0, 1], repeat=3):
+                mismatches, cigar_check, multimaps = \
+                    [1 - c for c in comparisons]
+                threshold_data = [
+                    self.ThresholdData(0, violated[0], 1, 1, 1),
+                    self.ThresholdData(1, violated[1], multimaps,
+                                       mismatches, cigar_check)]
+                decisions[self._encode_pair(*threshold_data)] = \
+                    self._assign_hits_general(threshold_data)
+        return decisions
+
+    @classmethod
+    def _encode_pair(cls, first, second):
+        # Encode whether each species' hits violated the thresholds, and how
+        # the mismatches, CIGAR check and multimaps of the first compare with
+        # those of the second, as an integer from 0 to 107
+        return ((((first.violated * 2 + second.violated) * 3 +
+                  (first.mismatches > second.mismatches) -
+                  (first.mismatches < second.mismatches) + 1) * 3 +
+                 (first.cigar_check > second.cigar_check) -
+                 (first.cigar_check < second.cigar_check) + 1) * 3 +
+                (first.multimaps > second.multimaps) -
+                (first.multimaps < second.multimaps) + 1)
+
+    def _trace(self, hits_managers, assignee, reason, threshold_data):
+        # Record the decision in terms of species indices, rather than indices
+        # into the list of competing hits managers
+        species_indices = [m.species_id - 1 for m in hits_managers]
+
+        self.tracer.trace(
+            hits_managers[0].get_read_names()[0],
+            species_indices[assignee] if assignee >= 0 else assignee, reason,
+            [(species_indices[t.index], t) for t in threshold_data])
+
+    def _record(self, hits_managers, assignee):
+        assignment = hits_managers[assignee].species_id - 1 \
+            if assignee >= 0 else assignee
+        for read_name in hits_managers[0].get_read_names():
+            self.recorder.record(read_name, assignment)
 
-        violated = False
-
-        if hits_info.get_multimaps() > self.multimap_thresh:
-            violated = True
-            if __debug__:
-                self.logger.debug(
-                    'only one competing hits manager but violated multimap.')
-
-        if hits_info.get_primary_mismatches() > \
-                round(self.mismatch_thresh * hits_info.get_total_length()):
-            violated = True
-            if __debug__:
-                self.logger.debug(
-                    'only one competing hits manager but violated primary mismatches.')
-
-        if self._check_cigars(hits_info) == self.CIGAR_FAIL:
-            violated = True
-            if __debug__:
-                self.logger.debug(
-                    'only one competing hits manager but violated primary CIGAR.')
-
-        if __debug__:
-            if not violated:
-                self.logger.debug('assigned due to only one competing filterer!')
+    def _assign_hits_standard(self, threshold_data):
+        if len(threshold_data) == 2:
+            return self.pair_decisions[self._encode_pair(*threshold_data)]
 
-        return not violated
+        return self._assign_hits_general(threshold_data)
 
-    def _assign_hits_standard(self, threshold_data):
+    def _assign_hits_general(self, threshold_data):
         threshold_data = [t for t in threshold_data if not t.violated]
 
         num_hits_managers = len(threshold_data)
 
         if num_hits_managers == 0:
-            return self.REJECTED
+            return self.REJECTED, dt.REASON_ALL_VIOLATED
         elif num_hits_managers == 1:
-            if __debug__:
-                self.logger.debug('assigned due to only one filter left after checking threshold!')
-            return threshold_data[0].index
+            return threshold_data[0].index, dt.REASON_ONLY_UNVIOLATED
 
         min_mismatches = min([m.mismatches for m in threshold_data])
         threshold_data = [t for t in threshold_data
                           if t.mismatches == min_mismatches]
 
         if len(threshold_data) == 1:
-            if __debug__:
-                self.logger.debug('assigne due to primary hit min_mismatches!')
-            return threshold_data[0].index
+            return threshold_data[0].index, dt.REASON_MISMATCHES
 
         min_cigar_check = min([m.cigar_check for m in threshold_data])
         threshold_data = [t for t in threshold_data
                           if t.cigar_check == min_cigar_check]
 
         if len(threshold_data) == 1:
-            if __debug__:
-                self.logger.debug('assigne due to primart hit CIGAR!')
-            return threshold_data[0].index
+            return threshold_data[0].index, dt.REASON_CIGAR
 
         min_multimaps = min([m.multimaps for m in threshold_data])
         threshold_data = [t for t in threshold_data
                           if t.multimaps == min_multimaps]
 
         if len(threshold_data) == 1:
-            # # todo remove debug multimap
-            if __debug__:
-                self.logger.debug('assigned due to number of multimap!')
-            return threshold_data[0].index
+            return threshold_data[0].index, dt.REASON_MULTIMAPS
 
-        if __debug__:
-            self.logger.debug('assigned due to Ambigous!')
-        return self.AMBIGUOUS
+        return self.AMBIGUOUS, dt.REASON_AMBIGUOUS
 
     def _assign_hits_reject_multimaps(self, threshold_data):
         if len([t for t in threshold_data if t.multimaps > 1]) > 0:
-            return self.REJECTED
+            return self.REJECTED, dt.REASON_MULTIMAPS_REJECTED
 
         return self._assign_hits_standard(threshold_data)
 
     def _check_thresholds(self, index, hits_manager):
 
         hits_info = hits_manager.hits_info
+        stats = hits_manager.stats
         violated = False
 
         multimaps = hits_info.get_multimaps()
         if multimaps > self.multimap_thresh:
-            # # todo remove debug multimap
-            if __debug__:
-                self.logger.debug('violated due to multimap!')
+            stats.multimap_violations += stats.copies
             violated = True
 
+        max_mismatches, _ = self._get_length_thresholds(
+            hits_info.get_total_length())
         mismatches = hits_info.get_primary_mismatches()
-        if mismatches > round(self.mismatch_thresh *
-                              hits_info.get_total_length()):
-            if __debug__:
-                self.logger.debug('violated due to primary mismatches!')
+        if mismatches > max_mismatches:
+            stats.mismatch_violations += stats.copies
             violated = True
 
         cigar_check = self._check_cigars(hits_info)
         if cigar_check == self.CIGAR_FAIL:
-            if __debug__:
-                self.logger.debug('violated due to primary CIGAR!')
+            stats.cigar_violations += stats.copies
             violated = True
 
         return self.ThresholdData(
@@ -199,23 +259,13 @@ class HitsChecker:
 
     def _check_cigars(self, hits_info):
         total_length = hits_info.get_total_length()
-        min_match = total_length - round(self.minmatch_thresh * total_length)
-
-        cigars = hits_info.get_primary_cigars()
-        response = self.CIGAR_GOOD
+        _, min_match = self._get_length_thresholds(total_length)
 
-        num_matches = 0
-        for cigar in cigars:
-            for operation, length in cigar:
-                if operation == self.CIGAR_OP_MATCH:
-                    num_matches += length
-                elif operation == self.CIGAR_OP_REF_INSERTION or \
-                        operation == self.CIGAR_OP_REF_DELETION:
-                    response = self.CIGAR_LESS_GOOD
+        num_matches, has_indel = hits_info.get_primary_cigar_summary()
 
         if num_matches < min_match:
             return self.CIGAR_FAIL
-        elif num_matches < total_length:
+        elif num_matches < total_length or has_indel:
             return self.CIGAR_LESS_GOOD
 
-        return response
+        return self.CIGAR_GOOD
@@ -1,3 +1,8 @@
+CIGAR_OP_MATCH = 0  # From pysam
+CIGAR_OP_REF_INSERTION = 1  # From pysam
+CIGAR_OP_REF_DELETION = 2  # From pysam
+
+
 class HitsInfo:
     def __init__(self, hits):
         self.hits = hits
@@ -19,6 +24,20 @@ class HitsInfo:
     def get_primary_cigars(self):
         return self.primary_cigars
 
+    def get_primary_cigar_summary(self):
+        # Return the total length of match operations in the CIGAR strings of
+        # the primary hits, and whether any contain insertions or deletions
+        num_matches = 0
+        has_indel = False
+        for cigar in self.primary_cigars:
+            for operation, length in cigar:
+                if operation == CIGAR_OP_MATCH:
+                    num_matches += length
+                elif operation == CIGAR_OP_REF_INSERTION or \
+                        operation == CIGAR_OP_REF_DELETION:
+                    has_indel = True
+        return num_matches, has_indel
+
     def _get_primary_hits(self):
         first_hit = None
         for hit in self.hits:
@@ -31,6 +50,21 @@ class HitsInfo:
                 else:
                     return [hit]
 
+        if first_hit is None:
+            return self._get_first_hits()
+
+        return [first_hit]
+
+    def _get_first_hits(self):
+        # When reads are mapped to a combined genome, a read's primary hit may
+        # be to another species' genome; the first hit (or first hit for each
+        # mate) then stands in for it
+        first_hit = self.hits[0]
+        if self._is_paired_hit(first_hit):
+            for hit in self.hits[1:]:
+                if hit.is_read1 != first_hit.is_read1:
+                    return [first_hit, hit]
+
         return [first_hit]
 
     @classmethod
@@ -83,6 +117,16 @@ class RnaSeqHitsInfo(HitsInfo):
         return hit.get_tag("AS")
 
 
+class RnaSeqCombinedHitsInfo(RnaSeqHitsInfo):
+    # The NH tag counts a read's hits to the whole combined genome, rather
+    # than to a single species' genome
+    @classmethod
+    def _get_multimaps(cls, hits):
+        if cls._is_paired_hit(hits[0]):
+            return len(hits) / 2
+        return len(hits)
+
+
 class DnaSeqHitsInfo(HitsInfo):
     @classmethod
     def _get_multimaps(cls, hits):
@@ -100,3 +144,4 @@ class DnaSeqHitsInfo(HitsInfo):
     @classmethod
     def _get_alignment_scores(cls, hit):
         return hit.get_tag("AS")
+
@@ -1,26 +1,77 @@
+import os.path
 import sargasso.utils.samutils as su
 
-from sargasso.filter import hits_info
+from sargasso.filter import fastq_writer, hits_info
 from sargasso.filter.separation_stats import SeparationStats
 
 
 class HitsManager(object):
     def __init__(
-        self, hits_info_cls, species_id, input_bam, output_bam, logger):
+        self, hits_info_cls, species_id, input_bam, output_bam, logger,
+        output_format=fastq_writer.OUTPUT_FORMAT_BAM, decide_only=False,
+        combined_reader=None, duplicates=None, original_names=None,
+        compression_level=None, max_hits_in_memory=None):
 
         self.hits_info_cls = hits_info_cls
         self.species_id = species_id
-        self.stats = SeparationStats(species_id)
-
-        input_hits = su.open_samfile_for_read(input_bam)
-        self.output_bam = su.open_samfile_for_write(output_bam, input_hits)
-
-        self.hits_generator = su.hits_generator(input_hits)
+        self.stats = SeparationStats(species_id, decide_only)
+
+        # When reads were mapped to a combined genome, hits for this species
+        # are divided from those for other species by a shared reader, and
+        # set for each read via 'set_hits'. When no input file is given, hits
+        # are supplied by the caller via 'hits_generator'.
+        self.combined_reader = combined_reader
+        if combined_reader is None and input_bam is not None:
+            self.input_hits = su.open_samfile_for_read(input_bam)
+            self.input_size = os.path.getsize(input_bam)
+        else:
+            self.input_hits = None
+        self.output_bam_path = output_bam
+
+        # When identical reads were collapsed before mapping, the decision
+        # for each representative read applies to all the reads it stands for
+        self.duplicates = duplicates
+        self.read_names = None
+
+        # When reads were renamed with compact read IDs before mapping, their
+        # original names are restored when they are written
+        self.original_names = original_names
+        self.output_names = None
+
+        # Output BAM files which are merged after filtering are intermediate
+        # files, so may be compressed more quickly than final output
+        self.compression_level = compression_level
+
+        # Reads assigned to a "decide-only" species take part in filtering
+        # decisions and are counted, but are never written
+        self.output_bam = self._open_output_bam(output_bam) \
+            if fastq_writer.writes_bam(output_format) and not decide_only \
+            else None
+        self.output_fastq = fastq_writer.FastqWriter(output_bam, logger) \
+            if fastq_writer.writes_fastq(output_format) and not decide_only \
+            else None
+
+        # Hits for a read beyond the maximum number held in memory are
+        # spilled to a temporary file, alongside the output file rather than
+        # in the system temporary directory, which may be small
+        self.hits_generator = su.hits_generator(
+            self.input_hits, max_hits_in_memory,
+            os.path.dirname(os.path.abspath(output_bam))) \
+            if self.input_hits else None
         self.hits_for_read = None
         self.hits_info = None
         self.count = 0
         self.logger = logger
 
+    def _open_output_bam(self, output_bam):
+        if self.combined_reader is None:
+            return su.open_samfile_for_write(
+                output_bam, self.input_hits, self.compression_level)
+
+        return su.open_samfile_for_write_with_header(
+            output_bam, self.combined_reader.get_header(self.species_id - 1),
+            self.compression_level)
+
     def get_next_read_name(self):
         if self.hits_for_read is None:
             self.get_next_read_hits()
@@ -31,23 +82,107 @@ class HitsManager(object):
 
         return self.hits_for_read[0].query_name
 
+    def get_fraction_read(self):
+        """
+        Return the approximate fraction of the input BAM file read so far, or
+        None if this cannot be determined.
+        """
+        if self.combined_reader is not None:
+            return self.combined_reader.get_fraction_read()
+
+        if self.input_size == 0:
+            return None
+
+        try:
+            # The upper bits of a BAM virtual file offset give the position of
+            # the current compressed block in the file
+            return min(1.0, (self.input_hits.tell() >> 16) /
+                       float(self.input_size))
+        except (OSError, ValueError, NotImplementedError):
+            return None
+
+    def get_reads_processed(self):
+        return self.stats.reads_written + self.stats.reads_rejected + \
+            self.stats.reads_ambiguous
+
     def log_stats(self):
         self.logger.info(self.stats)
 
+    def get_output_paths(self):
+        """
+        Return the paths of the BAM and/or FASTQ files written.
+        """
+        paths = [self.output_bam_path] if self.output_bam else []
+        if self.output_fastq:
+            paths += self.output_fastq.get_paths()
+        return paths
+
+    def close(self):
+        if self.input_hits:
+            self.input_hits.close()
+        if self.output_bam:
+            self.output_bam.close()
+        if self.output_fastq:
+            self.output_fastq.close()
+
     def get_next_read_hits(self):
-        self.hits_for_read = next(self.hits_generator)
+        self.set_hits(next(self.hits_generator))
+
+    def set_hits(self, hits):
+        self.hits_for_read = hits
         self.hits_info = None
+        self.output_names = None
+
+        if self.duplicates is not None:
+            self.read_names = self.duplicates.get_read_names(
+                hits[0].query_name)
+            self.stats.copies = len(self.read_names)
+
+    def get_read_names(self):
+        """
+        Return the original names of the reads for which hits are currently
+        held.
+        """
+        if self.output_names is None:
+            names = self.read_names if self.duplicates is not None \
+                else [self.hits_for_read[0].query_name]
+            if self.original_names is not None:
+                names = [self.original_names.get_name(n) for n in names]
+            self.output_names = names
+
+        return self.output_names
 
     def update_hits_info(self):
         self.hits_info = self.hits_info_cls(self.hits_for_read)
 
     def write_hits(self):
-        for hit in self.hits_for_read:
-            self.output_bam.write(hit)
+        if self.duplicates is None and self.original_names is None:
+            self._write_read_hits()
+            return
+
+        for name in self.get_read_names():
+            self._write_read_hits(name)
+
+    def _write_read_hits(self, name=None):
+        if name is not None:
+            for hit in self.hits_for_read:
+                hit.query_name = name
+        if self.output_bam:
+            hits = self.hits_for_read.replay(name) \
+                if isinstance(self.hits_for_read, su.SpilledHits) \
+                else self.hits_for_read
+            for hit in hits:
+                self.output_bam.write(hit)
+        if self.output_fastq:
+            self.output_fastq.write(self.hits_for_read)
 
     def clear_hits(self):
+        if isinstance(self.hits_for_read, su.SpilledHits):
+            self.hits_for_read.close()
         self.hits_for_read = None
         self.hits_info = None
+        self.read_names = None
+        self.output_names = None
 
     def add_accepted_hits_to_stats(self):
         self.stats.accepted_hits(self.hits_for_read)
@@ -60,14 +195,27 @@ class HitsManager(object):
 
 
 class RnaSeqHitsManager(HitsManager):
-    def __init__(self, species_id, input_bam, output_bam, logger):
+    def __init__(self, species_id, input_bam, output_bam, logger,
+                 output_format=fastq_writer.OUTPUT_FORMAT_BAM,
+                 decide_only=False, combined_reader=None, duplicates=None,
+                 original_names=None, compression_level=None,
+                 max_hits_in_memory=None):
         HitsManager.__init__(
-            self, hits_info.RnaSeqHitsInfo, species_id,
-            input_bam, output_bam, logger)
+            self, hits_info.RnaSeqHitsInfo if combined_reader is None
+            else hits_info.RnaSeqCombinedHitsInfo, species_id,
+            input_bam, output_bam, logger, output_format, decide_only,
+            combined_reader, duplicates, original_names, compression_level,
+            max_hits_in_memory)
 
 
 class DnaSeqHitsManager(HitsManager):
-    def __init__(self, species_id, input_bam, output_bam, logger):
+    def __init__(self, species_id, input_bam, output_bam, logger,
+                 output_format=fastq_writer.OUTPUT_FORMAT_BAM,
+                 decide_only=False, combined_reader=None, duplicates=None,
+                 original_names=None, compression_level=None,
+                 max_hits_in_memory=None):
         HitsManager.__init__(
             self, hits_info.DnaSeqHitsInfo, species_id,
-            input_bam, output_bam, logger)
+            input_bam, output_bam, logger, output_format, decide_only,
+            combined_reader, duplicates, original_names, compression_level,
+            max_hits_in_memory)
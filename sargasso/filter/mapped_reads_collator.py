@@ -0,0 +1,156 @@
+import heapq
+import os
+import os.path
+import schema
+
+from sargasso.separator.parameter_validator import ParameterValidator
+from sargasso.utils import log, samutils
+
+
+class MappedReadsCollator(object):
+    DOC = """Usage:
+    collate_mapped_reads [--log-level=<log-level>]
+        <sample> <output-dir>
+        (<species> <bam-file>)
+        (<species> <bam-file>)
+        ...
+
+Options:
+<sample>
+    Name of the sample whose mapped reads are collated.
+<output-dir>
+    Directory in which links to the BAM files are created.
+<species>
+    Name of species.
+<bam-file>
+    BAM file of the sample's reads mapped to the species' genome.
+{help_option_spec}
+    {help_option_description}
+{ver_option_spec}
+    {ver_option_description}
+{log_option_spec}
+    {log_option_description}
+
+collate_mapped_reads checks that BAM files of reads mapped, by another
+pipeline, to each species' genome contain reads from the same set, and links
+them into "<output-dir>" as "<sample>.<species>.bam", in place of the output of
+mapping. As unmapped reads are often omitted from BAM files, the files need
+not contain the same reads; but every file must share reads with that of the
+first species. This is checked by comparing, in a single pass through each
+file, the reads whose names have the smallest hash values, so that files may
+be in any order.
+
+In normal operation, the user should not need to execute this script by hand
+themselves.
+"""
+    SAMPLE = "<sample>"
+    OUTPUT_DIR = "<output-dir>"
+    SPECIES = "<species>"
+    BAM_FILE = "<bam-file>"
+
+    # Number of read name hash values compared between the files for each
+    # species
+    SKETCH_SIZE = 10000
+
+    def __init__(self, commandline_parser):
+        self.commandline_parser = commandline_parser
+
+    @classmethod
+    def _validate_command_line_options(cls, options):
+        try:
+            ParameterValidator.validate_log_level(options)
+            ParameterValidator.validate_dir_option(
+                options[MappedReadsCollator.OUTPUT_DIR],
+                "Output directory does not exist")
+            for bam_file in options[MappedReadsCollator.BAM_FILE]:
+                ParameterValidator.validate_file_option(
+                    bam_file, "Could not find BAM file")
+        except schema.SchemaError as exc:
+            exit("Exiting: " + exc.code)
+
+    @classmethod
+    def _get_name_sketch(cls, bam_file):
+        """
+        Return the set of the smallest hash values of the names of the reads
+        in a BAM file.
+        """
+        sketch = set()
+        heap = []
+
+        samfile = samutils.open_samfile_for_read(bam_file)
+        for hit in samutils.all_hits(samfile):
+            value = hash(hit.query_name)
+            if value in sketch:
+                continue
+            if len(heap) < MappedReadsCollator.SKETCH_SIZE:
+                heapq.heappush(heap, -value)
+                sketch.add(value)
+            elif value < -heap[0]:
+                sketch.discard(-heapq.heappushpop(heap, -value))
+                sketch.add(value)
+        samfile.close()
+
+        return sketch
+
+    @classmethod
+    def _get_shared_reads(cls, sketch, other_sketch):
+        """
+        Return how many of the smallest hash values of the names of the reads
+        in either of two BAM files occur in both, and the number of values
+        compared.
+        """
+        union = sorted(sketch | other_sketch)[:MappedReadsCollator.SKETCH_SIZE]
+        shared = [v for v in union if v in sketch and v in other_sketch]
+        return len(shared), len(union)
+
+    def _check_shared_reads(self, sample, species, bam_files):
+        """
+        Exit if the BAM file for any species shares no reads with that of the
+        first species.
+        """
+        sketches = [self._get_name_sketch(f) for f in bam_files]
+
+        for index in range(1, len(bam_files)):
+            if not sketches[0] or not sketches[index]:
+                continue
+
+            shared, compared = self._get_shared_reads(
+                sketches[0], sketches[index])
+            self.logger.info(
+                "{sh} of {c} sampled reads shared by {s} and {o}".format(
+                    sh=shared, c=compared, s=species[0], o=species[index]))
+
+            if shared == 0:
+                exit(("Exiting: BAM files for sample {sample} share no " +
+                      "reads: {f} ({s}), {o} ({os})").format(
+                    sample=sample, f=bam_files[0], s=species[0],
+                    o=bam_files[index], os=species[index]))
+
+    def run(self, args):
+        """
+        Check and link to the BAM files of a sample's mapped reads.
+
+        args: list of command line arguments
+        """
+        options = self.commandline_parser.parse(args, self.DOC)
+
+        self._validate_command_line_options(options)
+
+        self.logger = log.get_logger_for_options(options)
+
+        sample = options[MappedReadsCollator.SAMPLE]
+        species = options[MappedReadsCollator.SPECIES]
+        bam_files = [os.path.abspath(f)
+                     for f in options[MappedReadsCollator.BAM_FILE]]
+
+        self.logger.info("Checking mapped reads for sample {s}".format(
+            s=sample))
+        self._check_shared_reads(sample, species, bam_files)
+
+        for species_name, bam_file in zip(species, bam_files):
+            link = os.path.join(
+                options[MappedReadsCollator.OUTPUT_DIR],
+                "{s}.{sp}.bam".format(s=sample, sp=species_name))
+            if os.path.lexists(link):
+                os.remove(link)
+            os.symlink(bam_file, link)
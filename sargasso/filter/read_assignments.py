@@ -0,0 +1,267 @@
+"""
+Constants, classes and functions for recording the species to which each read
+was assigned during filtering, as a compact alternative to writing filtered
+BAM files, and for converting these records into a table of assignments
+aligned with the order of reads in a sample's original FASTQ files. Exports:
+
+AssignmentRecorder: Write the assignment of each read in a block to a file.
+merge_assignments: Concatenate the assignment files written for several blocks.
+read_species: Return the species named in an assignment file.
+get_read_name: Return the name of a read from its FASTQ record.
+build_table: Build a table of assignments aligned with FASTQ read order.
+write_table: Write a table of assignments to a file.
+read_table: Return the species and the assignments in a table file.
+"""
+
+import gzip
+import os
+import os.path
+import shutil
+import struct
+import subprocess
+
+ASSIGNMENTS_SUFFIX = ".assignments.tsv.gz"
+
+# Codes recorded for reads not assigned to a species; reads assigned to a
+# species are recorded by the (zero-based) index of the species
+AMBIGUOUS = 253
+REJECTED = 254
+UNMAPPED = 255
+
+_SPECIES_HEADER = "#species"
+
+# Number of assignments accumulated before being compressed and written
+_BUFFER_RECORDS = 10000
+
+_MAGIC = b"SGAT"
+_VERSION = 1
+_HEADER = struct.Struct("<4sBBQ")
+_SPECIES_NAME_LENGTH = struct.Struct("<B")
+
+# Reads and assignments are sorted in byte order of read names, as are input
+# BAM files sorted by read name
+_SORT_ENVIRONMENT = dict(os.environ, LC_ALL="C")
+
+
+class AssignmentRecorder(object):
+    """
+    Writes, for each read in a block of reads, the read's name and the species
+    to which it was assigned (or whether it was rejected or ambiguous), to a
+    gzipped, tab-separated file.
+    """
+
+    def __init__(self, assignments_path, species):
+        """
+        Create object.
+        assignments_path: path of the assignments file to write.
+        species: list of species names.
+        """
+        self.assignments_file = gzip.open(assignments_path, 'wb')
+        self.records = [
+            "\t".join([_SPECIES_HEADER] + list(species)) + "\n"]
+
+    def record(self, read_name, assignee):
+        """
+        Record the assignment of a read.
+
+        read_name: name of the read.
+        assignee: index of the species to which the read was assigned, or one
+        of the values HitsChecker.REJECTED or HitsChecker.AMBIGUOUS.
+        """
+        if assignee < 0:
+            assignee = REJECTED if assignee == -1 else AMBIGUOUS
+
+        self.records.append("{r}\t{a}\n".format(r=read_name, a=assignee))
+
+        if len(self.records) >= _BUFFER_RECORDS:
+            self._flush()
+
+    def _flush(self):
+        self.assignments_file.write("".join(self.records).encode())
+        del self.records[:]
+
+    def close(self):
+        self._flush()
+        self.assignments_file.close()
+
+
+def merge_assignments(assignments_paths, merged_path):
+    """
+    Concatenate the assignment files written for several blocks of reads.
+
+    assignments_paths: list of paths of assignment files; any which do not
+    exist are ignored.
+    merged_path: path of the assignment file to write.
+    """
+    assignments_paths = [p for p in assignments_paths if os.path.isfile(p)]
+    if len(assignments_paths) == 0:
+        return
+
+    with open(merged_path + ".tmp", 'wb') as merged:
+        for assignments_path in assignments_paths:
+            with open(assignments_path, 'rb') as assignments_file:
+                shutil.copyfileobj(assignments_file, merged)
+
+    os.rename(merged_path + ".tmp", merged_path)
+
+
+def read_species(assignments_path):
+    """
+    Return the list of species names recorded in an assignments file.
+    """
+    with gzip.open(assignments_path, 'rb') as assignments_file:
+        header = assignments_file.readline().decode().rstrip("\n").split("\t")
+
+    if header[0] != _SPECIES_HEADER:
+        raise ValueError("Not a read assignments file: " + assignments_path)
+
+    return header[1:]
+
+
+def _open_fastq(fastq_file):
+    return gzip.open(fastq_file, 'rb') if fastq_file.endswith(".gz") \
+        else open(fastq_file, 'rb')
+
+
+def get_read_name(name_line):
+    """
+    Return the name of a read from the first line of its FASTQ record, as it
+    would be recorded in a BAM file.
+    """
+    read_name = name_line[1:].split()[0].decode()
+    if read_name.endswith("/1") or read_name.endswith("/2"):
+        read_name = read_name[:-2]
+    return read_name
+
+
+def _sort(input_path, output_path, tmp_dir):
+    subprocess.check_call(
+        ["sort", "-t", "\t", "-k1,1", "-T", tmp_dir, "-o", output_path,
+         input_path], env=_SORT_ENVIRONMENT)
+
+
+def _write_read_names(fastq_files, names_path):
+    """
+    Write the name and index of each read in a list of FASTQ files to a file,
+    and return the number of reads.
+    """
+    index = 0
+    with open(names_path, 'w') as names_file:
+        for fastq_file in fastq_files:
+            with _open_fastq(fastq_file) as fastq:
+                for line_number, line in enumerate(fastq):
+                    if line_number % 4 == 0:
+                        names_file.write("{r}\t{i}\n".format(
+                            r=get_read_name(line), i=index))
+                        index += 1
+
+    return index
+
+
+def _write_assignments(assignments_path, output_path):
+    with gzip.open(assignments_path, 'rb') as assignments_file, \
+            open(output_path, 'wb') as output_file:
+        for line in assignments_file:
+            if not line.startswith(b"#"):
+                output_file.write(line)
+
+
+def _split_line(line):
+    fields = line.rstrip("\n").split("\t")
+    return fields[0], int(fields[1])
+
+
+def _next_assignment(assigned):
+    line = assigned.readline()
+    return _split_line(line) if line else None
+
+
+def build_table(assignments_path, fastq_files, tmp_dir):
+    """
+    Return a bytearray, aligned with the order of reads in a sample's FASTQ
+    files, giving the species to which each read was assigned (as the index of
+    the species), or AMBIGUOUS, REJECTED or UNMAPPED.
+
+    The read names in the FASTQ files and in the assignments file are each
+    sorted with the external 'sort' utility, and then merged, so that neither
+    need be held in memory.
+    assignments_path: path of the sample's read assignments file.
+    fastq_files: list of paths of the sample's FASTQ files (for paired-end
+    reads, those containing the first read of each pair).
+    tmp_dir: directory in which temporary files will be written.
+    """
+    names_path = os.path.join(tmp_dir, "read_names.tsv")
+    sorted_names_path = names_path + ".sorted"
+    assigned_path = os.path.join(tmp_dir, "assignments.tsv")
+    sorted_assigned_path = assigned_path + ".sorted"
+
+    num_reads = _write_read_names(fastq_files, names_path)
+    _sort(names_path, sorted_names_path, tmp_dir)
+    os.remove(names_path)
+
+    _write_assignments(assignments_path, assigned_path)
+    _sort(assigned_path, sorted_assigned_path, tmp_dir)
+    os.remove(assigned_path)
+
+    table = bytearray([UNMAPPED]) * num_reads
+
+    with open(sorted_names_path) as names, \
+            open(sorted_assigned_path) as assigned:
+        assigned_read = _next_assignment(assigned)
+        for line in names:
+            read_name, index = _split_line(line)
+
+            while assigned_read is not None and assigned_read[0] < read_name:
+                assigned_read = _next_assignment(assigned)
+
+            if assigned_read is not None and assigned_read[0] == read_name:
+                table[index] = assigned_read[1]
+
+    os.remove(sorted_names_path)
+    os.remove(sorted_assigned_path)
+
+    return table
+
+
+def write_table(table_path, species, table):
+    """
+    Write a table of read assignments to a file.
+
+    table_path: path of the table file to write.
+    species: list of species names.
+    table: bytearray, as returned by 'build_table'.
+    """
+    with open(table_path, 'wb') as table_file:
+        table_file.write(
+            _HEADER.pack(_MAGIC, _VERSION, len(species), len(table)))
+        for name in species:
+            name = name.encode()
+            table_file.write(_SPECIES_NAME_LENGTH.pack(len(name)) + name)
+        table_file.write(table)
+
+
+def read_table(table_path):
+    """
+    Return the list of species names, and the bytearray of read assignments,
+    recorded in a table file written by 'write_table'.
+
+    table_path: path of a table file.
+    """
+    with open(table_path, 'rb') as table_file:
+        magic, version, num_species, num_reads = _HEADER.unpack(
+            table_file.read(_HEADER.size))
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Not a read assignments table: " + table_path)
+
+        species = []
+        for i in range(num_species):
+            length = _SPECIES_NAME_LENGTH.unpack(
+                table_file.read(_SPECIES_NAME_LENGTH.size))[0]
+            species.append(table_file.read(length).decode())
+
+        table = bytearray(table_file.read())
+
+    if len(table) != num_reads:
+        raise ValueError("Truncated read assignments table: " + table_path)
+
+    return species, table
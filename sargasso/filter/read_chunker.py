@@ -0,0 +1,120 @@
+import os.path
+import schema
+
+from sargasso.filter import read_chunks, read_names
+from sargasso.separator.parameter_validator import ParameterValidator
+from sargasso.utils import log
+
+
+class ReadChunker(object):
+    DOC = """Usage:
+    chunk_reads [--log-level=<log-level>] [--compact-read-names]
+        <num-chunks> <reads-dir> <sample> <reads-1> [<reads-2>]
+
+Options:
+<num-chunks>
+    Number of chunks into which to split the sample's reads.
+<reads-dir>
+    Directory into which to write a sub-directory of reads for each chunk.
+<sample>
+    Name of the sample whose reads are split.
+<reads-1>
+    Comma-separated list of the sample's FASTQ files (gzipped or not); for
+    paired-end reads, those containing the first read of each pair.
+<reads-2>
+    Comma-separated list of the sample's FASTQ files containing the second
+    read of each pair, for paired-end reads.
+--compact-read-names
+    If specified, reads are also renamed with compact read IDs, as by
+    compact_read_names.
+{help_option_spec}
+    {help_option_description}
+{ver_option_spec}
+    {ver_option_description}
+{log_option_spec}
+    {log_option_description}
+
+chunk_reads splits a sample's reads into "<num-chunks>" chunks of equal size,
+dealing reads (or read pairs) to each chunk in turn, so that each chunk can be
+mapped, sorted and filtered independently of the others. The reads of the
+chunk with index i (counting from 1) are written to
+"<reads-dir>/<sample>.chunk<i>/reads_1/chunk.fastq.gz" (and "reads_2").
+
+If "--compact-read-names" is specified, reads are written instead to
+"compacted.fastq.gz" in each chunk's directories, renamed with read IDs
+assigned across the whole sample, and the original names to
+"<reads-dir>/<sample>/read_names.txt".
+
+In normal operation, the user should not need to execute this script by hand
+themselves.
+"""
+    NUM_CHUNKS = "<num-chunks>"
+    READS_DIR = "<reads-dir>"
+    SAMPLE = "<sample>"
+    READS_1 = "<reads-1>"
+    READS_2 = "<reads-2>"
+    COMPACT_READ_NAMES = "--compact-read-names"
+
+    def __init__(self, commandline_parser):
+        self.commandline_parser = commandline_parser
+
+    @classmethod
+    def _validate_command_line_options(cls, options):
+        try:
+            ParameterValidator.validate_log_level(options)
+
+            options[ReadChunker.NUM_CHUNKS] = \
+                ParameterValidator.validate_int_option(
+                    options[ReadChunker.NUM_CHUNKS],
+                    "Number of chunks must be a positive integer",
+                    min_val=1)
+
+            for reads in [ReadChunker.READS_1, ReadChunker.READS_2]:
+                if options[reads] is None:
+                    continue
+                options[reads] = options[reads].split(",")
+                for reads_file in options[reads]:
+                    ParameterValidator.validate_file_option(
+                        reads_file, "Could not find reads file")
+
+            if options[ReadChunker.READS_2] is not None and \
+                    len(options[ReadChunker.READS_1]) != \
+                    len(options[ReadChunker.READS_2]):
+                raise schema.SchemaError(
+                    None, "The same number of first and second read files " +
+                          "must be specified")
+        except schema.SchemaError as exc:
+            exit("Exiting: " + exc.code)
+
+    def run(self, args):
+        """
+        Split a sample's reads into chunks.
+
+        args: list of command line arguments
+        """
+        options = self.commandline_parser.parse(args, self.DOC)
+
+        self._validate_command_line_options(options)
+
+        self.logger = log.get_logger_for_options(options)
+
+        reads_files = [options[ReadChunker.READS_1]]
+        if options[ReadChunker.READS_2] is not None:
+            reads_files.append(options[ReadChunker.READS_2])
+
+        sample = options[ReadChunker.SAMPLE]
+        reads_dir = options[ReadChunker.READS_DIR]
+        chunk_dirs = [os.path.join(reads_dir, c) for c in
+                      read_chunks.get_chunk_names(
+                          sample, options[ReadChunker.NUM_CHUNKS])]
+
+        self.logger.info("Splitting reads for sample {s} into {n} chunks".format(
+            s=sample, n=len(chunk_dirs)))
+
+        if options[ReadChunker.COMPACT_READ_NAMES]:
+            num_reads = read_names.compact_read_names(
+                reads_files, os.path.join(reads_dir, sample), chunk_dirs)
+        else:
+            num_reads = read_chunks.split_reads(reads_files, chunk_dirs)
+
+        self.logger.info("Split {n} reads".format(n=num_reads))
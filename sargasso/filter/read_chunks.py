@@ -0,0 +1,96 @@
+"""
+Utility functions for splitting the reads of a sample into chunks, each of
+which is mapped, sorted and filtered independently of the others, before the
+filtered reads of every chunk are merged. Exports:
+
+CHUNK_READS_FILE: Name of the FASTQ file(s) of the reads in a chunk.
+get_chunk_name: Return the name under which a chunk of a sample is processed.
+get_chunk_names: Return the names of all the chunks of a sample.
+split_reads: Write a sample's reads, in turn, to each of its chunks.
+
+Reads (or read pairs) are dealt to chunks in turn, so that chunks are of equal
+size without the reads first being counted, and the mates of each pair are
+always written to the same chunk.
+"""
+
+import gzip
+import os
+import os.path
+
+CHUNK_READS_FILE = "chunk.fastq.gz"
+READS_DIRS = ["reads_1", "reads_2"]
+
+CHUNK_SEPARATOR = ".chunk"
+
+# Chunked reads are intermediate files, read once by the next stage, so are
+# compressed quickly rather than compactly
+_COMPRESS_LEVEL = 1
+
+
+def get_chunk_name(sample, index):
+    """
+    Return the name under which the chunk of a sample's reads with a given
+    (one-based) index is mapped and sorted.
+    """
+    return "{s}{sep}{i}".format(s=sample, sep=CHUNK_SEPARATOR, i=index)
+
+
+def get_chunk_names(sample, num_chunks):
+    """
+    Return the names of all the chunks into which a sample's reads are split.
+    """
+    return [get_chunk_name(sample, i) for i in range(1, num_chunks + 1)]
+
+
+def _open(path):
+    return gzip.open(path, 'rb') if path.endswith(".gz") else open(path, 'rb')
+
+
+def _read_records(fastq_files):
+    """
+    Yield the four lines of each record in a list of FASTQ files.
+    """
+    for fastq_file in fastq_files:
+        with _open(fastq_file) as fastq:
+            while True:
+                record = [fastq.readline() for i in range(4)]
+                if not record[0]:
+                    break
+                yield record
+
+
+def split_reads(reads_files, chunk_dirs):
+    """
+    Write the reads (or read pairs) of a sample, in turn, to
+    "<chunk_dir>/reads_1/chunk.fastq.gz" (and "reads_2", for paired-end
+    reads) for each of the given chunk directories, and return the number of
+    reads.
+
+    reads_files: list containing a list of FASTQ files for single-end reads,
+    or lists of first and second mate FASTQ files for paired-end reads.
+    chunk_dirs: directories to which the reads of each chunk are written.
+    """
+    outputs = []
+    for chunk_dir in chunk_dirs:
+        chunk_outputs = []
+        for reads_dir in READS_DIRS[:len(reads_files)]:
+            output_dir = os.path.join(chunk_dir, reads_dir)
+            if not os.path.exists(output_dir):
+                os.makedirs(output_dir)
+            chunk_outputs.append(gzip.open(
+                os.path.join(output_dir, CHUNK_READS_FILE), 'wb',
+                _COMPRESS_LEVEL))
+        outputs.append(chunk_outputs)
+
+    num_reads = 0
+
+    try:
+        for read in zip(*[_read_records(f) for f in reads_files]):
+            for output, mate in zip(outputs[num_reads % len(outputs)], read):
+                output.write(b"".join(mate))
+            num_reads += 1
+    finally:
+        for output in [o for chunk_outputs in outputs for o in chunk_outputs]:
+            output.close()
+
+    return num_reads
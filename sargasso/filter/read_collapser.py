@@ -0,0 +1,123 @@
+import os
+import os.path
+import schema
+import shutil
+import tempfile
+
+from sargasso.filter import duplicates
+from sargasso.separator.parameter_validator import ParameterValidator
+from sargasso.utils import log
+
+SUMMARY_FILE = "collapse_summary.txt"
+
+
+class ReadCollapser(object):
+    DOC = """Usage:
+    collapse_reads [--log-level=<log-level>] [--tmp-dir=<tmp-dir>]
+        <samples> <input-dir> <output-dir> <reads-type>
+
+Options:
+<samples>
+    Space-separated list of sample names.
+<input-dir>
+    Directory containing per-sample directories, each of which contains the
+    sample's reads files, in sub-directories "reads_1" and, for paired-end
+    reads, "reads_2".
+<output-dir>
+    Directory into which to write collapsed reads.
+<reads-type>
+    Either "single" for single-end reads, or "paired" for paired-end reads.
+--tmp-dir=<tmp-dir>
+    Directory in which temporary files are written while grouping reads by
+    sequence [default: .].
+{help_option_spec}
+    {help_option_description}
+{ver_option_spec}
+    {ver_option_description}
+{log_option_spec}
+    {log_option_description}
+
+collapse_reads collapses the reads of each sample with identical sequences
+(for paired-end reads, identical sequences of both mates) into a single
+representative read, so that each distinct sequence need only be mapped once.
+Representative reads are written to "<output-dir>/<sample>/reads_1" (and
+"reads_2"), named so as to refer to the names of the reads collapsed into them,
+which are written to "<output-dir>/<sample>/duplicates.txt"; after filtering,
+the species assigned to each representative read is applied to each of these
+reads. The numbers of input and representative reads are written to
+"<output-dir>/<sample>/collapse_summary.txt".
+
+In normal operation, the user should not need to execute this script by hand
+themselves.
+"""
+    SAMPLES = "<samples>"
+    INPUT_DIR = "<input-dir>"
+    OUTPUT_DIR = "<output-dir>"
+    READS_TYPE = "<reads-type>"
+    TMP_DIR = "--tmp-dir"
+
+    READS_TYPES = {"single": 1, "paired": 2}
+
+    def __init__(self, commandline_parser):
+        self.commandline_parser = commandline_parser
+
+    @classmethod
+    def _validate_command_line_options(cls, options):
+        try:
+            ParameterValidator.validate_log_level(options)
+            ParameterValidator.validate_dir_option(
+                options[ReadCollapser.INPUT_DIR],
+                "Reads directory does not exist")
+            options[ReadCollapser.READS_TYPE] = \
+                ParameterValidator.validate_dict_option(
+                    options[ReadCollapser.READS_TYPE],
+                    ReadCollapser.READS_TYPES, "Invalid reads type")
+            ParameterValidator.validate_dir_option(
+                options[ReadCollapser.TMP_DIR],
+                "Temporary directory does not exist")
+        except schema.SchemaError as exc:
+            exit("Exiting: " + exc.code)
+
+    @classmethod
+    def _get_reads_files(cls, input_dir, sample, num_mates):
+        reads_files = []
+        for reads_dir in duplicates.READS_DIRS[:num_mates]:
+            sample_reads_dir = os.path.join(input_dir, sample, reads_dir)
+            reads_files.append([os.path.join(sample_reads_dir, f)
+                                for f in sorted(os.listdir(sample_reads_dir))])
+        return reads_files
+
+    def run(self, args):
+        """
+        Collapse the reads of each sample with identical sequences.
+
+        args: list of command line arguments
+        """
+        options = self.commandline_parser.parse(args, self.DOC)
+
+        self._validate_command_line_options(options)
+
+        self.logger = log.get_logger_for_options(options)
+
+        for sample in options[ReadCollapser.SAMPLES].split():
+            self.logger.info("Collapsing reads for sample {s}".format(
+                s=sample))
+
+            sample_dir = os.path.join(options[ReadCollapser.OUTPUT_DIR], sample)
+
+            tmp_dir = tempfile.mkdtemp(dir=options[ReadCollapser.TMP_DIR])
+            try:
+                num_reads, num_collapsed = duplicates.collapse_reads(
+                    self._get_reads_files(options[ReadCollapser.INPUT_DIR],
+                                          sample,
+                                          options[ReadCollapser.READS_TYPE]),
+                    sample_dir, tmp_dir)
+            finally:
+                shutil.rmtree(tmp_dir)
+
+            with open(os.path.join(sample_dir, SUMMARY_FILE), 'w') as summary:
+                summary.write("reads\t{n}\n".format(n=num_reads))
+                summary.write("collapsed\t{n}\n".format(n=num_collapsed))
+
+            self.logger.info("Collapsed {n} reads to {c} distinct reads".format(
+                n=num_reads, c=num_collapsed))
@@ -0,0 +1,93 @@
+import schema
+
+from sargasso.filter import read_names
+from sargasso.separator.parameter_validator import ParameterValidator
+from sargasso.utils import log
+
+
+class ReadNameCompactor(object):
+    DOC = """Usage:
+    compact_read_names [--log-level=<log-level>]
+        <sample-dir> <reads-1> [<reads-2>]
+
+Options:
+<sample-dir>
+    Directory into which to write the sample's renamed reads and the table of
+    their original names.
+<reads-1>
+    Comma-separated list of the sample's FASTQ files (gzipped or not); for
+    paired-end reads, those containing the first read of each pair.
+<reads-2>
+    Comma-separated list of the sample's FASTQ files containing the second
+    read of each pair, for paired-end reads.
+{help_option_spec}
+    {help_option_description}
+{ver_option_spec}
+    {ver_option_description}
+{log_option_spec}
+    {log_option_description}
+
+compact_read_names replaces the name of each of a sample's reads with a
+compact read ID, the read's index in the sample's FASTQ files, zero-padded to
+a fixed width, so that mapped reads are smaller, and cheaper to sort and to
+compare, and their name order is the order in which they were sequenced.
+Renamed reads are written to "<sample-dir>/reads_1/compacted.fastq.gz" (and
+"reads_2"), and the original names to "<sample-dir>/read_names.txt", from
+which they are restored when filtered reads are written.
+
+In normal operation, the user should not need to execute this script by hand
+themselves.
+"""
+    SAMPLE_DIR = "<sample-dir>"
+    READS_1 = "<reads-1>"
+    READS_2 = "<reads-2>"
+
+    def __init__(self, commandline_parser):
+        self.commandline_parser = commandline_parser
+
+    @classmethod
+    def _validate_command_line_options(cls, options):
+        try:
+            ParameterValidator.validate_log_level(options)
+
+            for reads in [ReadNameCompactor.READS_1,
+                          ReadNameCompactor.READS_2]:
+                if options[reads] is None:
+                    continue
+                options[reads] = options[reads].split(",")
+                for reads_file in options[reads]:
+                    ParameterValidator.validate_file_option(
+                        reads_file, "Could not find reads file")
+
+            if options[ReadNameCompactor.READS_2] is not None and \
+                    len(options[ReadNameCompactor.READS_1]) != \
+                    len(options[ReadNameCompactor.READS_2]):
+                raise schema.SchemaError(
+                    None, "The same number of first and second read files " +
+                          "must be specified")
+        except schema.SchemaError as exc:
+            exit("Exiting: " + exc.code)
+
+    def run(self, args):
+        """
+        Replace the names of a sample's reads with compact read IDs.
+
+        args: list of command line arguments
+        """
+        options = self.commandline_parser.parse(args, self.DOC)
+
+        self._validate_command_line_options(options)
+
+        self.logger = log.get_logger_for_options(options)
+
+        reads_files = [options[ReadNameCompactor.READS_1]]
+        if options[ReadNameCompactor.READS_2] is not None:
+            reads_files.append(options[ReadNameCompactor.READS_2])
+
+        self.logger.info("Compacting read names in {d}".format(
+            d=options[ReadNameCompactor.SAMPLE_DIR]))
+
+        num_reads = read_names.compact_read_names(
+            reads_files, options[ReadNameCompactor.SAMPLE_DIR])
+
+        self.logger.info("Renamed {n} reads".format(n=num_reads))
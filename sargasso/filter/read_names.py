@@ -0,0 +1,169 @@
+"""
+Utility functions and classes for replacing the names of a sample's reads
+with compact, sequential read IDs before mapping, and for restoring the
+original names of reads once they have been filtered. Exports:
+
+READ_NAMES_FILE: Name of the file of original read names.
+COMPACTED_READS_FILE: Name of the FASTQ file(s) of renamed reads.
+get_read_id: Return the read ID for the read with a given index.
+compact_read_names: Write a sample's reads renamed with read IDs.
+ReadNamesTable: Return the original name of a read given its read ID.
+
+Read IDs are the zero-based index of each read in the sample's FASTQ files,
+zero-padded to a fixed width, so that read IDs compare, as strings, in the
+same order as the reads occur in the FASTQ files. The original names are
+written, in order, to a names file, alongside an index holding the offset of
+each name in that file (and finally the file's length); both are
+memory-mapped while filtering, so that they are shared between the processes
+filtering blocks of a sample concurrently.
+"""
+
+import gzip
+import mmap
+import os
+import os.path
+import struct
+
+from sargasso.filter import read_assignments
+
+READ_NAMES_FILE = "read_names.txt"
+INDEX_SUFFIX = ".idx"
+COMPACTED_READS_FILE = "compacted.fastq.gz"
+READS_DIRS = ["reads_1", "reads_2"]
+
+READ_ID_WIDTH = 10
+
+_OFFSET = struct.Struct("<Q")
+
+# Renamed reads are intermediate files, read once by the next stage, so are
+# compressed quickly rather than compactly
+_COMPRESS_LEVEL = 1
+
+# Number of reads whose name offsets are written to the index at a time
+_BUFFER_READS = 10000
+
+
+def get_read_id(index):
+    """
+    Return the read ID for the read with a given (zero-based) index in the
+    sample's FASTQ files.
+    """
+    return "{i:0{w}d}".format(i=index, w=READ_ID_WIDTH)
+
+
+def _open(path):
+    return gzip.open(path, 'rb') if path.endswith(".gz") else open(path, 'rb')
+
+
+def _read_records(fastq_files):
+    """
+    Yield the four lines of each record in a list of FASTQ files.
+    """
+    for fastq_file in fastq_files:
+        with _open(fastq_file) as fastq:
+            while True:
+                record = [fastq.readline() for i in range(4)]
+                if not record[0]:
+                    break
+                yield record
+
+
+def _get_output_paths(reads_dir, num_mates):
+    """
+    Return the paths of the files of renamed reads (one per mate) in a
+    directory, creating their parent directories if necessary.
+    """
+    output_paths = []
+    for mate_dir in READS_DIRS[:num_mates]:
+        output_dir = os.path.join(reads_dir, mate_dir)
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        output_paths.append(os.path.join(output_dir, COMPACTED_READS_FILE))
+    return output_paths
+
+
+def compact_read_names(reads_files, sample_dir, chunk_dirs=None):
+    """
+    Write the reads (or read pairs) of a sample, renamed with read IDs, to
+    "<sample_dir>/reads_1/compacted.fastq.gz" (and "reads_2", for paired-end
+    reads), and their original names to "<sample_dir>/read_names.txt", and
+    return the number of reads.
+
+    reads_files: list containing a list of FASTQ files for single-end reads,
+    or lists of first and second mate FASTQ files for paired-end reads.
+    sample_dir: directory to which the sample's renamed reads are written.
+    chunk_dirs: if given, directories to which successive renamed reads are
+    written in turn, in place of "sample_dir"; read IDs are still assigned
+    across the whole sample, so that one names file serves every chunk.
+    """
+    output_paths = [_get_output_paths(d, len(reads_files))
+                    for d in (chunk_dirs or [sample_dir])]
+    if not os.path.exists(sample_dir):
+        os.makedirs(sample_dir)
+
+    names_path = os.path.join(sample_dir, READ_NAMES_FILE)
+    outputs = [[gzip.open(p, 'wb', _COMPRESS_LEVEL) for p in paths]
+               for paths in output_paths]
+    num_reads = 0
+
+    try:
+        with open(names_path, 'wb') as names, \
+                open(names_path + INDEX_SUFFIX, 'wb') as index:
+            offsets = []
+            for read in zip(*[_read_records(f) for f in reads_files]):
+                offsets.append(names.tell())
+                names.write(read_assignments.get_read_name(
+                    read[0][0]).encode() + b"\n")
+
+                name_line = "@{i}\n".format(i=get_read_id(num_reads)).encode()
+                for output, mate in zip(
+                        outputs[num_reads % len(outputs)], read):
+                    output.write(name_line + mate[1] + b"+\n" + mate[3])
+
+                num_reads += 1
+                if len(offsets) == _BUFFER_READS:
+                    index.write(b"".join([_OFFSET.pack(o) for o in offsets]))
+                    offsets = []
+
+            offsets.append(names.tell())
+            index.write(b"".join([_OFFSET.pack(o) for o in offsets]))
+    finally:
+        for output in [o for chunk_outputs in outputs for o in chunk_outputs]:
+            output.close()
+
+    return num_reads
+
+
+class ReadNamesTable(object):
+    """
+    Looks up the original name of a read given its read ID.
+    """
+
+    def __init__(self, names_path):
+        """
+        Create object.
+        names_path: path of a names file written by 'compact_read_names'.
+        """
+        self.names = self._map(names_path)
+        self.offsets = self._map(names_path + INDEX_SUFFIX)
+
+    @classmethod
+    def _map(cls, path):
+        with open(path, 'rb') as mapped_file:
+            # A file of no names cannot be mapped, but neither will it be read
+            if os.fstat(mapped_file.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get_name(self, read_id):
+        """
+        Return the original name of the read with the given read ID.
+        """
+        position = int(read_id) * _OFFSET.size
+        start, end = struct.unpack_from("<QQ", self.offsets, position)
+        return self.names[start:end - 1].decode()
+
+    def close(self):
+        for mapped in [self.names, self.offsets]:
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
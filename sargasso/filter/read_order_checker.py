@@ -0,0 +1,120 @@
+import schema
+
+from sargasso.separator.parameter_validator import ParameterValidator
+from sargasso.utils import log, samutils
+
+
+class ReadOrderChecker(object):
+    DOC = """Usage:
+    check_read_order [--log-level=<log-level>] [--sample-reads=<sample-reads>]
+        <bam-file>
+
+Options:
+<bam-file>
+    BAM file of mapped reads.
+--sample-reads=<sample-reads>
+    Number of reads at the start of the BAM file whose order is checked, if
+    its header declares it to be sorted by read name [default: 100000].
+{help_option_spec}
+    {help_option_description}
+{ver_option_spec}
+    {ver_option_description}
+{log_option_spec}
+    {log_option_description}
+
+check_read_order determines whether a BAM file of mapped reads is already in
+the order required for filtering, that is, with the hits for each read
+adjacent, and reads sorted lexicographically by name, so that it need not be
+sorted. Files whose header declares them to be sorted by read name are checked
+only for a sample of reads at their start, to confirm that names are compared
+lexicographically rather than "naturally"; other files are read until a read
+is found out of order. check_read_order exits with status 0 if the file is in
+order, or 1 if it must be sorted.
+
+In normal operation, the user should not need to execute this script by hand
+themselves.
+"""
+    BAM_FILE = "<bam-file>"
+    SAMPLE_READS = "--sample-reads"
+
+    QUERYNAME_SORT_ORDER = "queryname"
+    NATURAL_SUB_SORT = "queryname:natural"
+
+    def __init__(self, commandline_parser):
+        self.commandline_parser = commandline_parser
+
+    @classmethod
+    def _validate_command_line_options(cls, options):
+        try:
+            ParameterValidator.validate_log_level(options)
+            ParameterValidator.validate_file_option(
+                options[ReadOrderChecker.BAM_FILE],
+                "Could not find BAM file")
+            options[ReadOrderChecker.SAMPLE_READS] = \
+                ParameterValidator.validate_int_option(
+                    options[ReadOrderChecker.SAMPLE_READS],
+                    "Number of reads to sample must be a positive integer",
+                    min_val=1)
+        except schema.SchemaError as exc:
+            exit("Exiting: " + exc.code)
+
+    @classmethod
+    def _declares_name_order(cls, samfile):
+        """
+        Return True if a BAM file's header declares it to be sorted by read
+        name, other than in "natural" order.
+        """
+        header = samfile.header.to_dict().get("HD", {})
+        return header.get("SO") == ReadOrderChecker.QUERYNAME_SORT_ORDER and \
+            header.get("SS") != ReadOrderChecker.NATURAL_SUB_SORT
+
+    @classmethod
+    def _get_first_unordered_read(cls, samfile, max_reads):
+        """
+        Return the index of the first hit in a BAM file whose read name sorts
+        before that of the preceding hit, or None if there is none among the
+        first 'max_reads' hits (or among all hits, if 'max_reads' is None).
+        """
+        last_name = None
+        for index, hit in enumerate(samutils.all_hits(samfile)):
+            if index == max_reads:
+                break
+            name = hit.query_name
+            if last_name is not None and name < last_name:
+                return index
+            last_name = name
+
+        return None
+
+    def run(self, args):
+        """
+        Exit with a non-zero status if a BAM file of mapped reads must be
+        sorted by read name before it can be filtered.
+
+        args: list of command line arguments
+        """
+        options = self.commandline_parser.parse(args, self.DOC)
+
+        self._validate_command_line_options(options)
+
+        self.logger = log.get_logger_for_options(options)
+
+        bam_file = options[ReadOrderChecker.BAM_FILE]
+        samfile = samutils.open_samfile_for_read(bam_file)
+
+        # A declared sort order is trusted once a sample of reads confirms
+        # that names are compared as the filter compares them; otherwise, as
+        # reads out of order are typically found early, the whole file is
+        # read only if it is, in fact, in order
+        max_reads = options[ReadOrderChecker.SAMPLE_READS] \
+            if self._declares_name_order(samfile) else None
+        unordered_read = self._get_first_unordered_read(samfile, max_reads)
+        samfile.close()
+
+        if unordered_read is not None:
+            self.logger.info("{b} is not in read name order (hit {i})".format(
+                b=bam_file, i=unordered_read))
+            exit(1)
+
+        self.logger.info("{b} is already in read name order".format(
+            b=bam_file))
@@ -0,0 +1,226 @@
+import gzip
+import os.path
+import schema
+import shutil
+import tempfile
+
+from sargasso.filter import fastq_writer, read_assignments
+from sargasso.separator.parameter_validator import ParameterValidator
+from sargasso.utils import log
+
+
+class ReadSplitter(object):
+    DOC = """Usage:
+    split_reads [--log-level=<log-level>] [--table-file=<table-file>]
+        [--tmp-dir=<tmp-dir>]
+        <assignments-file> <output-prefix> <reads-1> [<reads-2>]
+
+Options:
+<assignments-file>
+    Read assignments file, "<sample-name>___read_assignments.tsv.gz", written
+    by species separation when run with output format "assignments".
+<output-prefix>
+    Prefix of the gzipped FASTQ files to which the reads assigned to each
+    species will be written.
+<reads-1>
+    Comma-separated list of the sample's original FASTQ files (gzipped or
+    not); for paired-end reads, those containing the first read of each pair.
+<reads-2>
+    Comma-separated list of the sample's original FASTQ files containing the
+    second read of each pair, for paired-end reads.
+--table-file=<table-file>
+    If specified, and this file exists, assignments are read from this table,
+    previously written by split_reads for the same FASTQ files, rather than
+    from the assignments file; if it does not exist, the table of assignments
+    is written to it.
+--tmp-dir=<tmp-dir>
+    Directory in which temporary files are written while building the table of
+    assignments [default: .].
+{help_option_spec}
+    {help_option_description}
+{ver_option_spec}
+    {ver_option_description}
+{log_option_spec}
+    {log_option_description}
+
+split_reads splits a sample's original FASTQ files by species, according to the
+species to which each read was assigned by species separation. The recorded
+assignments are first converted to a table, holding one byte per read, in the
+order in which reads occur in the FASTQ files; the FASTQ files are then read
+in a single streaming pass, and each read assigned to a species is written,
+unchanged, to the gzipped FASTQ file "<output-prefix>.<species>.fastq.gz" (or,
+for paired-end reads, "<output-prefix>.<species>_1.fastq.gz" and
+"<output-prefix>.<species>_2.fastq.gz"). Rejected, ambiguous and unmapped
+reads are not written.
+"""
+    ASSIGNMENTS_FILE = "<assignments-file>"
+    OUTPUT_PREFIX = "<output-prefix>"
+    READS_1 = "<reads-1>"
+    READS_2 = "<reads-2>"
+    TABLE_FILE = "--table-file"
+    TMP_DIR = "--tmp-dir"
+
+    def __init__(self, commandline_parser):
+        self.commandline_parser = commandline_parser
+
+    @classmethod
+    def _validate_command_line_options(cls, options):
+        try:
+            ParameterValidator.validate_log_level(options)
+
+            ParameterValidator.validate_file_option(
+                options[ReadSplitter.ASSIGNMENTS_FILE],
+                "Could not find read assignments file")
+
+            for reads in [ReadSplitter.READS_1, ReadSplitter.READS_2]:
+                if options[reads] is None:
+                    continue
+                options[reads] = options[reads].split(",")
+                for reads_file in options[reads]:
+                    ParameterValidator.validate_file_option(
+                        reads_file, "Could not find reads file")
+
+            if options[ReadSplitter.READS_2] is not None and \
+                    len(options[ReadSplitter.READS_1]) != \
+                    len(options[ReadSplitter.READS_2]):
+                raise schema.SchemaError(
+                    None, "The same number of first and second read files " +
+                          "must be specified")
+
+            ParameterValidator.validate_dir_option(
+                options[ReadSplitter.TMP_DIR],
+                "Temporary directory does not exist")
+
+        except schema.SchemaError as exc:
+            exit("Exiting: " + exc.code)
+
+    def _get_table(self, options):
+        """
+        Return the species names, and the table of assignments for each read
+        in FASTQ order, reading or writing the table file if one is specified.
+        """
+        table_file = options[ReadSplitter.TABLE_FILE]
+        if table_file is not None and os.path.isfile(table_file):
+            self.logger.info("Reading assignments table {t}".format(
+                t=table_file))
+            return read_assignments.read_table(table_file)
+
+        self.logger.info("Building assignments table from {a}".format(
+            a=options[ReadSplitter.ASSIGNMENTS_FILE]))
+
+        species = read_assignments.read_species(
+            options[ReadSplitter.ASSIGNMENTS_FILE])
+
+        tmp_dir = tempfile.mkdtemp(dir=options[ReadSplitter.TMP_DIR])
+        try:
+            table = read_assignments.build_table(
+                options[ReadSplitter.ASSIGNMENTS_FILE],
+                options[ReadSplitter.READS_1], tmp_dir)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        if table_file is not None:
+            read_assignments.write_table(table_file, species, table)
+
+        return species, table
+
+    @classmethod
+    def _read_records(cls, fastq_files):
+        """
+        Yield each four-line record in a list of FASTQ files.
+        """
+        for fastq_file in fastq_files:
+            with gzip.open(fastq_file, 'rb') if fastq_file.endswith(".gz") \
+                    else open(fastq_file, 'rb') as fastq:
+                while True:
+                    record = [fastq.readline() for i in range(4)]
+                    if not record[0]:
+                        break
+                    yield b"".join(record)
+
+    @classmethod
+    def _split(cls, species, table, reads_files, output_prefix):
+        """
+        Write each read assigned to a species to that species' FASTQ file(s),
+        and return the number of reads read.
+        """
+        suffixes = [fastq_writer.SINGLE_END_SUFFIX] \
+            if len(reads_files) == 1 else fastq_writer.MATE_SUFFIXES
+
+        outputs = [[gzip.open("{p}.{s}{x}".format(p=output_prefix, s=s, x=x),
+                              'wb', fastq_writer.COMPRESS_LEVEL)
+                    for x in suffixes] for s in species]
+        records = [[[] for x in suffixes] for s in species]
+
+        def flush():
+            for species_outputs, species_records in zip(outputs, records):
+                for output, mate_records in zip(species_outputs,
+                                                species_records):
+                    output.write(b"".join(mate_records))
+                    del mate_records[:]
+
+        num_reads = 0
+        try:
+            for read in zip(*[cls._read_records(f) for f in reads_files]):
+                if num_reads >= len(table):
+                    exit("Exiting: FASTQ files contain more reads than the " +
+                         "table of assignments")
+
+                assignee = table[num_reads]
+                if assignee < len(species):
+                    for mate_records, record in zip(records[assignee], read):
+                        mate_records.append(record)
+
+                num_reads += 1
+                if num_reads % fastq_writer.BUFFER_READS == 0:
+                    flush()
+
+            flush()
+        finally:
+            for species_outputs in outputs:
+                for output in species_outputs:
+                    output.close()
+
+        return num_reads
+
+    def _log_counts(self, species, table):
+        counts = [0] * 256
+        for assignee in table:
+            counts[assignee] += 1
+
+        for index, name in enumerate(species):
+            self.logger.info("Reads assigned to {s}: {n}".format(
+                s=name, n=counts[index]))
+        self.logger.info("Reads rejected: {n}".format(
+            n=counts[read_assignments.REJECTED]))
+        self.logger.info("Reads ambiguous: {n}".format(
+            n=counts[read_assignments.AMBIGUOUS]))
+        self.logger.info("Reads unmapped: {n}".format(
+            n=counts[read_assignments.UNMAPPED]))
+
+    def run(self, args):
+        """
+        Split a sample's FASTQ files by the species assigned to each read.
+
+        args: list of command line arguments
+        """
+        options = self.commandline_parser.parse(args, self.DOC)
+
+        self._validate_command_line_options(options)
+
+        self.logger = log.get_logger_for_options(options)
+
+        species, table = self._get_table(options)
+
+        reads_files = [options[ReadSplitter.READS_1]]
+        if options[ReadSplitter.READS_2] is not None:
+            reads_files.append(options[ReadSplitter.READS_2])
+
+        num_reads = self._split(species, table, reads_files,
+                                options[ReadSplitter.OUTPUT_PREFIX])
+
+        if num_reads != len(table):
+            exit("Exiting: FASTQ files contain fewer reads than the table " +
+                 "of assignments")
+
+        self._log_counts(species, table)
@@ -4,10 +4,12 @@ import os.path
 import schema
 import sargasso.separator.options as opts
 
-from sargasso.filter import hits_manager, hits_checker
+from sargasso.filter import checkpoint, combined_hits, decision_trace, \
+    duplicates, fastq_writer, hits_manager, hits_checker, read_assignments, \
+    read_names
 from sargasso.separator.commandline_parser import CommandlineParser
 from sargasso.separator.parameter_validator import ParameterValidator
-from sargasso.utils import log
+from sargasso.utils import log, profiling, telemetry
 
 
 class SampleFilterer(object):
@@ -29,6 +31,13 @@ The available commands are:
 """
     SPECIES_INPUT_BAM = "<species-input-bam>"
     SPECIES_OUTPUT_BAM = "<species-output-bam>"
+    COMBINED = "--combined"
+    DUPLICATES = "--duplicates"
+    READ_NAMES = "--read-names"
+
+    # Number of reads processed between checks of whether the progress status
+    # file is due to be updated
+    PROGRESS_CHECK_READS = 10000
 
     def __init__(self, hits_manager_cls, commandline_parser):
 
@@ -50,40 +59,225 @@ The available commands are:
                 opts.MINMATCH_THRESHOLD_ARG,
                 opts.MULTIMAP_THRESHOLD_ARG)
 
+            options[opts.TRACE_SAMPLE_RATE] = \
+                ParameterValidator.validate_float_option(
+                    options[opts.TRACE_SAMPLE_RATE],
+                    "Trace sample rate must be between 0 and 1",
+                    min_val=0, max_val=1, nullable=True)
+
+            ParameterValidator.validate_dict_option(
+                options[opts.OUTPUT_FORMAT], fastq_writer.OUTPUT_FORMATS,
+                "Invalid output format")
+
+            options[opts.DECIDE_ONLY] = \
+                ParameterValidator.validate_list_option(
+                    options[opts.DECIDE_ONLY], options[opts.SPECIES_ARG],
+                    "Decide-only species must be separated species",
+                    nullable=True)
+
+            ParameterValidator.validate_file_option(
+                options[SampleFilterer.DUPLICATES],
+                "Could not find duplicates file", nullable=True)
+
+            ParameterValidator.validate_file_option(
+                options[SampleFilterer.READ_NAMES],
+                "Could not find read names file", nullable=True)
+
+            options[opts.COMPRESSION_LEVEL] = \
+                ParameterValidator.validate_compression_level(
+                    options[opts.COMPRESSION_LEVEL],
+                    "Compression level must be between 0 and 9",
+                    nullable=True)
+
+            options[opts.MAX_HITS_IN_MEMORY] = \
+                ParameterValidator.validate_int_option(
+                    options[opts.MAX_HITS_IN_MEMORY],
+                    "Maximum hits in memory must be a positive integer",
+                    min_val=1, nullable=True)
+
         except schema.SchemaError as exc:
             exit(exc.code)
 
+    @classmethod
+    def _get_profiler(cls, h_check, hits_managers, options):
+        """
+        Return a profiler which times the decoding, decision and writing
+        phases of filtering for a block, or None if profiling was not
+        requested.
+        """
+        if not options[opts.PROFILE]:
+            return None
+
+        profiler = profiling.Profiler(
+            options[SampleFilterer.SPECIES_OUTPUT_BAM][0])
+
+        for man in hits_managers:
+            man.get_next_read_hits = profiler.wrap(
+                "decode", man.get_next_read_hits)
+            man.update_hits_info = profiler.wrap(
+                "decode", man.update_hits_info)
+            man.write_hits = profiler.wrap("write", man.write_hits)
+
+        h_check.compare_and_write_hits = profiler.wrap(
+            "decide", h_check.compare_and_write_hits)
+        h_check.check_and_write_hits_for_read = profiler.wrap(
+            "decide", h_check.check_and_write_hits_for_read)
+
+        profiler.start()
+        return profiler
+
     def _filter_sample_reads(self, logger, options):
         logger.info("Starting species separation.")
 
+        out_bams = options[SampleFilterer.SPECIES_OUTPUT_BAM]
+
+        tracer = None
+        if options[opts.TRACE_SAMPLE_RATE] is not None:
+            tracer = decision_trace.DecisionTracer(
+                out_bams[0] + decision_trace.TRACE_SUFFIX,
+                options[opts.SPECIES_ARG], options[opts.TRACE_SAMPLE_RATE])
+
+        recorder = None
+        if fastq_writer.records_assignments(options[opts.OUTPUT_FORMAT]):
+            recorder = read_assignments.AssignmentRecorder(
+                out_bams[0] + read_assignments.ASSIGNMENTS_SUFFIX,
+                options[opts.SPECIES_ARG])
+
         h_check = hits_checker.HitsChecker(
                 options[opts.MISMATCH_THRESHOLD_ARG],
                 options[opts.MINMATCH_THRESHOLD_ARG],
                 options[opts.MULTIMAP_THRESHOLD_ARG],
                 options[opts.REJECT_MULTIMAPS],
-                logger)
+                logger, tracer, recorder)
+
+        # Reads mapped to a combined genome are all read from the first
+        # species' input file; surplus hits are spilled alongside the first
+        # species' output file
+        combined_reader = combined_hits.CombinedHitsReader(
+            options[SampleFilterer.SPECIES_INPUT_BAM][0],
+            options[opts.SPECIES_ARG], options[opts.MAX_HITS_IN_MEMORY],
+            os.path.dirname(os.path.abspath(out_bams[0]))) \
+            if options[SampleFilterer.COMBINED] else None
+
+        # The duplicates file, if any, is shared by all species
+        duplicates_table = duplicates.DuplicatesTable(
+            options[SampleFilterer.DUPLICATES]) \
+            if options[SampleFilterer.DUPLICATES] else None
+
+        original_names = read_names.ReadNamesTable(
+            options[SampleFilterer.READ_NAMES]) \
+            if options[SampleFilterer.READ_NAMES] else None
 
         hits_managers = [self.hits_manager_cls(
                              i + 1,
                              options[SampleFilterer.SPECIES_INPUT_BAM][i],
                              options[SampleFilterer.SPECIES_OUTPUT_BAM][i],
-                             logger)
+                             logger, options[opts.OUTPUT_FORMAT],
+                             species in options[opts.DECIDE_ONLY],
+                             combined_reader, duplicates_table,
+                             original_names, options[opts.COMPRESSION_LEVEL],
+                             options[opts.MAX_HITS_IN_MEMORY])
                      for i, species in enumerate(options[opts.SPECIES_ARG])]
 
-        all_hits_managers = hits_managers
+        profiler = self._get_profiler(h_check, hits_managers, options)
+
+        reporter = telemetry.ProgressReporter(
+            self._get_status_path(out_bams[0]))
+
+        def check_progress():
+            self._report_progress(reporter, hits_managers, options)
+            if profiler:
+                profiler.sample_memory()
+
+        if combined_reader:
+            self._filter_combined_reads(
+                h_check, hits_managers, combined_reader, check_progress)
+            combined_reader.close()
+        else:
+            self._filter_sorted_reads(h_check, hits_managers, check_progress)
+
+        for filt in hits_managers:
+            filt.log_stats()
+            filt.close()
+
+        if duplicates_table:
+            duplicates_table.close()
+
+        if original_names:
+            original_names.close()
+
+        if profiler:
+            profiler.stop()
+
+        if tracer:
+            tracer.close()
+
+        outputs = [p for m in hits_managers for p in m.get_output_paths()]
+        if recorder:
+            recorder.close()
+            outputs.append(out_bams[0] + read_assignments.ASSIGNMENTS_SUFFIX)
+
+        self._report_progress(reporter, hits_managers, options, True)
+
+        # Only mark the block as complete once all output has been written,
+        # so that a resumed run will re-filter a partially filtered block. The
+        # marker also records the filtering statistics for the block.
+        checkpoint.write_marker(
+            checkpoint.get_marker_path(out_bams[0]),
+            self._get_stats(hits_managers),
+            outputs,
+            [m.stats.get_reason_counts() for m in hits_managers])
+
+    @classmethod
+    def _filter_combined_reads(cls, h_check, hits_managers, combined_reader,
+                               check_progress):
+        """
+        Filter reads mapped to a combined genome, for which the hits to each
+        species' genome are divided from one another by a reader of the
+        combined input file.
+        """
+        reads_until_progress_check = 0
+
+        for species_hits in combined_reader.reads():
+            if reads_until_progress_check == 0:
+                check_progress()
+                reads_until_progress_check = SampleFilterer.PROGRESS_CHECK_READS
+            reads_until_progress_check -= 1
+
+            competing_hits_managers = []
+            for man, hits in zip(hits_managers, species_hits):
+                if hits:
+                    man.set_hits(hits)
+                    competing_hits_managers.append(man)
+
+            if len(competing_hits_managers) == 1:
+                h_check.check_and_write_hits_for_read(
+                    competing_hits_managers[0])
+            elif len(competing_hits_managers) > 1:
+                h_check.compare_and_write_hits(competing_hits_managers)
+
+    @classmethod
+    def _filter_sorted_reads(cls, h_check, hits_managers, check_progress):
+        """
+        Filter reads mapped separately to each species' genome, reading the
+        hits for each species from an input file sorted by read name.
+        """
+        reads_until_progress_check = 0
 
         while True:
+            if reads_until_progress_check == 0:
+                check_progress()
+                reads_until_progress_check = SampleFilterer.PROGRESS_CHECK_READS
+            reads_until_progress_check -= 1
+
             # Retain only hits managers which have hits for the remaining reads
             hits_managers = [m for m in hits_managers
-                             if self._get_next_read_name(m) is not None]
+                             if cls._get_next_read_name(m) is not None]
 
             # If no hits managers remain, we're done
             if len(hits_managers) == 0:
                 break
 
-            if __debug__:
-                logger.debug("Read:{}".format(hits_managers[0].hits_for_read[0].qname))
-
             # If only one hits manager remains, all remaining reads in the
             # input file for that species can be written to the output file for
             # that species (or discarded as ambiguous, if necessary).
@@ -94,10 +288,10 @@ The available commands are:
             # Compare read names for the hits managers, and find the set that
             # have the "lowest" name
             competing_hits_managers = [hits_managers[0]]
-            min_read_name = self._get_next_read_name(hits_managers[0])
+            min_read_name = cls._get_next_read_name(hits_managers[0])
 
             for cman in hits_managers[1:]:
-                read_name = self._get_next_read_name(cman)
+                read_name = cls._get_next_read_name(cman)
                 if read_name == min_read_name:
                     competing_hits_managers.append(cman)
                 elif read_name < min_read_name:
@@ -116,16 +310,36 @@ The available commands are:
             # species to assign the read to.
             h_check.compare_and_write_hits(competing_hits_managers)
 
-        for filt in all_hits_managers:
-            filt.log_stats()
+    @classmethod
+    def _get_status_path(cls, output_bam):
+        """
+        Return the path of the progress status file for a block.
 
-        self._write_stats(all_hits_managers,
-                          options[SampleFilterer.SPECIES_OUTPUT_BAM][0])
+        output_bam: Path of the filtered BAM file written for the first species
+        when filtering the block.
+        """
+        return output_bam + telemetry.STATUS_SUFFIX
 
-    # write filter stats to table in file
     @classmethod
-    def _write_stats(cls, hits_managers, out_bam):
+    def _report_progress(cls, reporter, hits_managers, options, finished=False):
+        species = options[opts.SPECIES_ARG]
+        records_in = dict([(sp, m.get_reads_processed())
+                           for sp, m in zip(species, hits_managers)])
+        records_out = dict([(sp, m.stats.reads_written)
+                            for sp, m in zip(species, hits_managers)])
+
+        if finished:
+            reporter.finish(records_in, records_out)
+            return
 
+        fractions = [m.get_fraction_read() for m in hits_managers]
+        fraction_done = None if None in fractions else \
+            sum(fractions) / len(fractions)
+
+        reporter.update(records_in, records_out, fraction_done)
+
+    @classmethod
+    def _get_stats(cls, hits_managers):
         stats = []
 
         for man in hits_managers:
@@ -135,10 +349,7 @@ The available commands are:
                       mstats.hits_rejected, mstats.reads_rejected,
                       mstats.hits_ambiguous, mstats.reads_ambiguous]
 
-        out_file = os.path.join(
-            os.path.dirname(out_bam), "filtering_result_summary.txt")
-        with open(out_file, 'a') as outf:
-            outf.write("\t".join([str(s) for s in stats]) + "\n")
+        return stats
 
     @classmethod
     def _get_next_read_name(cls, f):
@@ -168,7 +379,12 @@ class RnaSeqSampleFilterer(SampleFilterer):
     DOC = """
 Usage:
 filter_sample_reads <data-type>
-    [--log-level=<log-level>] [--reject-multimaps]
+    [--log-level=<log-level>] [--reject-multimaps] [--profile]
+    [--trace-sample-rate=<trace-sample-rate>]
+    [--output-format=<output-format>] [--decide-only=<decide-only>]
+    [--combined] [--duplicates=<duplicates>] [--read-names=<read-names>]
+    [--compression-level=<compression-level>]
+    [--max-hits-in-memory=<max-hits-in-memory>]
     <mismatch-threshold> <minmatch-threshold> <multimap-threshold>
     (<species> <species-input-bam> <species-output-bam>)
     (<species> <species-input-bam> <species-output-bam>) ...
@@ -198,17 +414,80 @@ Options:
 --reject-multimaps
     If set, any read which multimaps to *either* species' genome will be
     rejected and not be assigned to either species.
+--profile
+    If set, CPU and memory usage are profiled, and the time spent decoding
+    input reads, deciding their species of origin, and writing output reads is
+    recorded. Profiles are written to files alongside the first species' output
+    BAM file.
+--trace-sample-rate=<trace-sample-rate>
+    If specified, the decision made for a sample of reads, of approximately
+    this fraction of all reads, is written to a compact binary trace file
+    alongside the first species' output BAM file, along with the values of
+    multimaps, mismatches and CIGAR check for each species on which the
+    decision was based. Reads are sampled by a hash of their name.
+--output-format=<output-format>
+    Format in which reads assigned to each species are written: "bam" to write
+    their hits to the species' output BAM file; "fastq" to instead write
+    their sequences, from their primary hits, to gzipped FASTQ files named
+    after the output BAM file ("<name>_1.fastq.gz" and "<name>_2.fastq.gz" for
+    paired-end reads, "<name>_singletons.fastq.gz" for paired-end reads with
+    hits for only one mate, or "<name>.fastq.gz" for single-end reads);
+    "both"; or "assignments" to write neither, but instead record the species
+    to which each read was assigned (or whether it was rejected or ambiguous)
+    in a gzipped file named after the first species' output BAM file
+    ("<name>.assignments.tsv.gz") [default: bam].
+--decide-only=<decide-only>
+    Comma-separated list of species for which reads are not written. Reads
+    mapping to these species still take part in every filtering decision, and
+    those assigned to them are counted, but no output file is written for them
+    (for example, for the host species in xenograft experiments).
+--combined
+    If set, reads were mapped once to a combined genome, built from the genomes
+    of all species with the name of each contig prefixed by "<species>__".
+    All hits are read from the first species' input BAM file, in which the hits
+    for each read must be adjacent, but reads need not be sorted by name; the
+    hits for each read are divided between species by the prefixes of the
+    contigs to which they map. Filtered BAM files name only each species' own
+    contigs, without prefixes.
+--duplicates=<duplicates>
+    If specified, reads with identical sequences were collapsed into a single
+    representative read, named "<name>|<offset>", before mapping, and this is
+    the duplicates file, written by collapse_reads, listing the names of the
+    reads collapsed into each. The decision made for each representative read
+    applies to each of these reads: their hits are written under each read's
+    own name, and each read is counted in the filtering statistics.
+--read-names=<read-names>
+    If specified, reads were renamed with compact read IDs before mapping,
+    and this is the read names file, written by compact_read_names, from which
+    the original name of each read is restored when its hits are written or
+    its assignment recorded.
+--compression-level=<compression-level>
+    BGZF compression level, from 0 (uncompressed) to 9, of the output BAM
+    files; if not specified, pysam's default level is used.
+--max-hits-in-memory=<max-hits-in-memory>
+    If specified, at most this many hits for each read (along with its primary
+    hits) are held in memory for each species; the remaining hits of reads
+    with more are written to a temporary BAM file, in the directory of the
+    species' output BAM file, and read again only if the read is assigned to
+    that species. Filtering decisions are identical.
 
 filter_sample_reads takes a set of BAM files as input, the results of mapping a set
 of mixed species sequencing reads against a number of species' genomes, and
 determines, if possible, from which species each read originates. Disambiguated
 read mappings are written to species-specific output BAM files.
 
+Filtering statistics are not written to a summary file; instead, they are
+logged, and recorded, with the decision reason counts, in a JSON completion
+marker written alongside the first species' output BAM file
+("<species-output-bam>.done"), from which filter_control assembles the summary
+for a sample.
+
 In normal operation, the user should not need to execute this script by hand
 themselves.
 
-Note: the input BAM files MUST be sorted in read name order. Failure to
-ensure input BAM files are correctly sorted will result in erroneous output.
+Note: unless "--combined" is set, the input BAM files MUST be sorted in read
+name order. Failure to ensure input BAM files are correctly sorted will result
+in erroneous output.
 """
 
     def __init__(self, commandline_parser):
@@ -0,0 +1,168 @@
+"""
+A library interface for separating mixed-species reads within a Python
+process, applying the same filtering decisions as filter_sample_reads to hits
+supplied by the caller, rather than to BAM files named on a command line.
+Exports:
+
+REJECTED: Assignment of a read rejected by every species.
+AMBIGUOUS: Assignment of a read rejected as ambiguous between species.
+SpeciesSeparator: Assign reads to species from each species' hits.
+
+For example, to separate reads mapped to the mouse and rat genomes, counting
+the reads assigned to each species:
+
+    separator = SpeciesSeparator(["mouse", "rat"], "rnaseq")
+    with pysam.AlignmentFile("mouse.bam") as mouse, \\
+            pysam.AlignmentFile("rat.bam") as rat:
+        stats = separator.separate([mouse, rat])
+    print(stats["mouse"].reads_written, stats["rat"].reads_written)
+"""
+
+import logging
+import pysam
+
+import sargasso.utils.samutils as su
+
+from sargasso.filter import hits_checker, hits_info, hits_manager
+from sargasso.filter.sample_filterer import SampleFilterer
+
+REJECTED = hits_checker.HitsChecker.REJECTED
+AMBIGUOUS = hits_checker.HitsChecker.AMBIGUOUS
+
+_HITS_INFO_CLASSES = {
+    "rnaseq": hits_info.RnaSeqHitsInfo,
+    "dnaseq": hits_info.DnaSeqHitsInfo
+}
+
+
+class _SuppliedHitsManager(hits_manager.HitsManager):
+    """
+    Manages the hits for a species supplied by the caller, writing the hits
+    of reads assigned to the species to a sink owned by the caller.
+    """
+
+    def __init__(self, hits_info_cls, species_id, read_hits, sink, logger):
+        hits_manager.HitsManager.__init__(
+            self, hits_info_cls, species_id, None, None, logger,
+            decide_only=True)
+
+        self.hits_generator = iter(read_hits)
+        self.output_bam = sink
+
+    def close(self):
+        # Sinks are closed by the caller
+        pass
+
+
+class _AssignmentCallback(object):
+    """
+    Passes the assignment of each read, by species name, to a function.
+    """
+
+    def __init__(self, species, on_assignment):
+        self.species = species
+        self.on_assignment = on_assignment
+
+    def record(self, read_name, assignee):
+        self.on_assignment(
+            read_name, self.species[assignee] if assignee >= 0 else assignee)
+
+
+class SpeciesSeparator(object):
+    """
+    Assigns reads to their species of origin, given the hits of each read
+    against the genome of each species.
+    """
+
+    def __init__(self, species, data_type="rnaseq", mismatch_threshold=0,
+                 minmatch_threshold=0, multimap_threshold=1,
+                 reject_multimaps=False, max_hits_in_memory=None,
+                 logger=None):
+        """
+        Create object.
+        species: list of species names.
+        data_type: "rnaseq" or "dnaseq".
+        mismatch_threshold, minmatch_threshold, multimap_threshold,
+        reject_multimaps: filtering thresholds, as for species_separator.
+        max_hits_in_memory: if specified, at most this many hits for each read
+        read from a pysam AlignmentFile, besides its primary hits, are held in
+        memory, as for filter_sample_reads.
+        logger: logger to which debug messages are written; by default, that
+        of this module.
+        """
+        if data_type not in _HITS_INFO_CLASSES:
+            raise ValueError("Unknown data type: " + data_type)
+        if len(species) < 2:
+            raise ValueError("At least two species must be specified")
+
+        self.species = list(species)
+        self.hits_info_cls = _HITS_INFO_CLASSES[data_type]
+        self.max_hits_in_memory = max_hits_in_memory
+        self.thresholds = (mismatch_threshold, minmatch_threshold,
+                           multimap_threshold, reject_multimaps)
+        self.logger = logger if logger is not None \
+            else logging.getLogger(__name__)
+
+    def separate(self, species_hits, sinks=None, on_assignment=None):
+        """
+        Assign each read to a species, or reject it, and return a dictionary
+        mapping from species name to the SeparationStats for the species.
+
+        species_hits: list, in the order of species, of the hits of reads
+        against each species' genome: either a pysam AlignmentFile, or an
+        iterable yielding, for each read, the list of its hits (pysam
+        AlignedSegments). Reads must be in the same order, by name, for every
+        species, as in BAM files sorted by read name for filtering.
+        sinks: optional list, in the order of species, of objects with a
+        'write' method, such as pysam AlignmentFiles opened for writing, to
+        which each hit of the reads assigned to each species is written; an
+        entry may be None, if hits for that species are not needed. Sinks are
+        not closed.
+        on_assignment: optional function called, for each read, with the
+        read's name and the name of the species to which it was assigned, or
+        REJECTED or AMBIGUOUS.
+        """
+        if len(species_hits) != len(self.species):
+            raise ValueError("Hits must be given for each species")
+        if sinks is None:
+            sinks = [None] * len(self.species)
+        elif len(sinks) != len(self.species):
+            raise ValueError("A sink (or None) must be given for each species")
+
+        recorder = _AssignmentCallback(self.species, on_assignment) \
+            if on_assignment is not None else None
+
+        h_check = hits_checker.HitsChecker(
+            *self.thresholds, logger=self.logger, recorder=recorder)
+
+        hits_managers = [
+            _SuppliedHitsManager(
+                self.hits_info_cls, i + 1, self._get_read_hits(hits), sink,
+                self.logger)
+            for i, (hits, sink) in enumerate(zip(species_hits, sinks))]
+
+        SampleFilterer._filter_sorted_reads(
+            h_check, hits_managers, lambda: None)
+
+        return dict([(sp, m.stats)
+                     for sp, m in zip(self.species, hits_managers)])
+
+    def assign(self, species_hits):
+        """
+        Return a list of the name of each read and the name of the species to
+        which it was assigned, or REJECTED or AMBIGUOUS, along with the
+        dictionary of SeparationStats returned by 'separate'.
+
+        species_hits: the hits for each species, as for 'separate'.
+        """
+        assignments = []
+        stats = self.separate(
+            species_hits,
+            on_assignment=lambda name, species:
+                assignments.append((name, species)))
+        return assignments, stats
+
+    def _get_read_hits(self, hits):
+        if isinstance(hits, pysam.AlignmentFile):
+            return su.hits_generator(hits, self.max_hits_in_memory)
+        return hits
@@ -1,30 +1,61 @@
+from sargasso.filter import decision_trace
+
+
 class SeparationStats:
-    def __init__(self, species_id):
+    REASON_COLUMNS = ["Multimap-Violations", "Mismatch-Violations",
+                      "CIGAR-Violations"] + decision_trace.REASON_NAMES
+
+    def __init__(self, species_id, decide_only=False):
         self.name = "Species {n}".format(n=species_id)
+
+        # Hits accepted for a species whose reads are only assigned, and not
+        # written, are reported as accepted rather than written
+        self.decide_only = decide_only
         self.hits_written = 0
         self.reads_written = 0
         self.hits_rejected = 0
         self.reads_rejected = 0
         self.hits_ambiguous = 0
         self.reads_ambiguous = 0
+        self.multimap_violations = 0
+        self.mismatch_violations = 0
+        self.cigar_violations = 0
+        self.decision_reasons = [0] * len(decision_trace.REASON_NAMES)
+
+        # Number of reads for which the current read stands, when identical
+        # reads were collapsed into one before mapping
+        self.copies = 1
 
     def accepted_hits(self, hits):
-        self.hits_written += len(hits)
-        self.reads_written += 1
+        self.hits_written += len(hits) * self.copies
+        self.reads_written += self.copies
 
     def rejected_hits(self, hits):
-        self.hits_rejected += len(hits)
-        self.reads_rejected += 1
+        self.hits_rejected += len(hits) * self.copies
+        self.reads_rejected += self.copies
 
     def ambiguous_hits(self, hits):
-        self.hits_ambiguous += len(hits)
-        self.reads_ambiguous += 1
+        self.hits_ambiguous += len(hits) * self.copies
+        self.reads_ambiguous += self.copies
+
+    def decision(self, reason):
+        self.decision_reasons[reason] += self.copies
+
+    def get_reason_counts(self):
+        """
+        Return counts of threshold violations and of the reasons for which
+        reads were assigned or rejected, in the order given by REASON_COLUMNS.
+        """
+        return [self.multimap_violations, self.mismatch_violations,
+                self.cigar_violations] + self.decision_reasons
 
     def __str__(self):
-        return ("{n}: wrote {f} filtered hits for {fr} reads; {r} hits for " +
+        return ("{n}: {v} {f} filtered hits for {fr} reads; {r} hits for " +
                 "{rr} reads were rejected outright, and {a} hits for " +
-                "{ar} reads were rejected as ambiguous.").format(
-            n=self.name,
+                "{ar} reads were rejected as ambiguous. Reasons: {reasons}.").format(
+            n=self.name, v="accepted" if self.decide_only else "wrote",
             f=self.hits_written, fr=self.reads_written,
             r=self.hits_rejected, rr=self.reads_rejected,
-            a=self.hits_ambiguous, ar=self.reads_ambiguous)
+            a=self.hits_ambiguous, ar=self.reads_ambiguous,
+            reasons=", ".join(["{c} {n}".format(c=c, n=n) for n, c in
+                               zip(self.REASON_COLUMNS, self.get_reason_counts())]))
@@ -98,6 +98,11 @@ class CommandlineParser(object):
         for line in open(options[opts.SAMPLES_FILE_ARG], 'r'):
             sample_data = line.split()
 
+            if options[opts.PREMAPPED_BAMS]:
+                cls._check_mapped_sample_data(options, sample_data, line)
+                sample_info.add_mapped_sample_data(sample_data)
+                continue
+
             if len(sample_data) < 2 or len(sample_data) > 3:
                 line = line.rstrip('\n')
                 if len(line) > 80:
@@ -112,6 +117,22 @@ class CommandlineParser(object):
 
         return sample_info
 
+    @classmethod
+    def _check_mapped_sample_data(cls, options, sample_data, line):
+        """
+        Check that a samples file line gives a BAM file of mapped reads for
+        each species.
+        """
+        if len(sample_data) != len(options[opts.SPECIES_ARG]) + 1:
+            line = line.rstrip('\n')
+            if len(line) > 80:
+                line = line[0:77] + "..."
+            raise schema.SchemaError(
+                None, "Sample file line should contain sample name and a " +
+                      "BAM file of mapped reads for each species, in the " +
+                      "order species are specified, separated by " +
+                      "whitespace: \n{info}".format(info=line))
+
     @classmethod
     def parse_species_options(cls, options):
         species_options = {}
@@ -194,12 +215,14 @@ class SampleInfo(object):
         self.left_reads = {}
         self.right_reads = {}
         self.paired_end = None
+        self.mapped_reads = {}
 
     def get_sample_names(self):
         """
         Return a list of sample names.
         """
-        return self.left_reads.keys()
+        return self.mapped_reads.keys() if self.premapped_reads() \
+            else self.left_reads.keys()
 
     def get_left_reads(self, sample_name):
         """
@@ -213,6 +236,18 @@ class SampleInfo(object):
         """
         return self.right_reads[sample_name]
 
+    def get_mapped_reads(self, sample_name):
+        """
+        Return list of BAM files of mapped reads for sample, one per species.
+        """
+        return self.mapped_reads[sample_name]
+
+    def premapped_reads(self):
+        """
+        Returns True iff samples are given as BAM files of mapped reads.
+        """
+        return len(self.mapped_reads) > 0
+
     def paired_end_reads(self):
         """
         Returns True iff sample read files are paired-end data.
@@ -234,3 +269,11 @@ class SampleInfo(object):
             self.paired_end = True
         else:
             self.paired_end = False
+
+    def add_mapped_sample_data(self, sample_data):
+        """
+        Add mapped reads information for a single sample.
+        sample_data: list of strings - sample name, followed by a BAM file of
+        mapped reads for each species.
+        """
+        self.mapped_reads[sample_data[0]] = sample_data[1:]
@@ -47,7 +47,8 @@ class _BaseDataTypeManager(object):
                 self.command_line_parser,
                 self.parameter_validator,
                 self.makefile_writer,
-                fw.ExecutionRecordWriter())
+                fw.ExecutionRecordWriter(),
+                fw.JobPlanWriter(self.NAME))
         self.filter_controller = filter_controller_cls(
                 self.NAME,
                 self.command_line_parser)
@@ -4,7 +4,12 @@ import os
 import os.path
 import sargasso.separator.options as opts
 
-from sargasso.utils import log
+from sargasso.classify import read_classifier
+from sargasso.filter import combined_hits, duplicates, fastq_writer, \
+    read_chunks, read_names
+from sargasso.separator import genome_combiner
+from sargasso.separator.job_scheduler import Job, JobPlan
+from sargasso.utils import log, telemetry
 from datetime import datetime
 
 
@@ -33,8 +38,14 @@ class Writer(object):
 class MakefileWriter(Writer):
     ALL_TARGET = "all"
     CLEAN_TARGET = "clean"
+    FORCE_TARGET = "FORCE"
     MAPPER_INDICES_TARGET = "MAPPER_INDICES"
     COLLATE_RAW_READS_TARGET = "COLLATE_RAW_READS"
+    MASK_INDEX_TARGET = "MASK_INDEX"
+    MASKED_READS_TARGET = "MASKED_READS"
+    COLLAPSED_READS_TARGET = "COLLAPSED_READS"
+    KMER_INDEX_TARGET = "KMER_INDEX"
+    CLASSIFIED_READS_TARGET = "CLASSIFIED_READS"
     MAPPED_READS_TARGET = "MAPPED_READS"
     SORTED_READS_TARGET = "SORTED_READS"
     FILTERED_READS_TARGET = "FILTERED_READS"
@@ -43,9 +54,29 @@ class MakefileWriter(Writer):
     NUM_THREADS_VARIABLE = "NUM_THREADS"
     SAMBAMBA_SORT_TMP_DIR_VARIABLE = "SAMBAMBA_SORT_TMP_DIR"
     SAMPLES_VARIABLE = "SAMPLES"
+    CHUNKS_VARIABLE = "CHUNKS"
     RAW_READS_DIRECTORY_VARIABLE = "RAW_READS_DIRECTORY"
     RAW_READS_LEFT_VARIABLE = "RAW_READS_FILES_1"
     RAW_READS_RIGHT_VARIABLE = "RAW_READS_FILES_2"
+    TELEMETRY_VARIABLE = "TELEMETRY"
+
+    TARGET_DIRECTORIES = {
+        MAPPER_INDICES_TARGET: "mapper_indexes",
+        COLLATE_RAW_READS_TARGET: "raw_reads",
+        MASK_INDEX_TARGET: "mask_index",
+        MASKED_READS_TARGET: "masked_reads",
+        COLLAPSED_READS_TARGET: "collapsed_reads",
+        KMER_INDEX_TARGET: "kmer_index",
+        CLASSIFIED_READS_TARGET: "classified_reads",
+        MAPPED_READS_TARGET: "mapped_reads",
+        SORTED_READS_TARGET: "sorted_reads",
+        FILTERED_READS_TARGET: "filtered_reads",
+    }
+
+    OVERALL_FILTERING_SUMMARY_FILE = "overall_filtering_summary.txt"
+    KMER_INDEX_FILE = "kmer_index.bin"
+    MASKED_READS_FILE = "masked.fastq.gz"
+    COMBINED_GENOME_DIR = "combined_genome"
 
     SINGLE_END_READS_TYPE = "single"
     PAIRED_END_READS_TYPE = "paired"
@@ -57,6 +88,235 @@ class MakefileWriter(Writer):
         self.data_type = data_type
         self.indent_level = 0
 
+    @classmethod
+    def preclassification_requested(cls, options):
+        """
+        Return True if reads should be classified by their k-mers before
+        mapping.
+
+        options: dictionary of command-line options
+        """
+        return options[opts.KMER_PRECLASSIFY] or \
+            options[opts.KMER_INDEX] is not None
+
+    @classmethod
+    def premapped_reads_requested(cls, options):
+        """
+        Return True if samples are given as BAM files of reads already mapped
+        to each species' genome, rather than as raw reads files.
+
+        options: dictionary of command-line options
+        """
+        return options[opts.PREMAPPED_BAMS]
+
+    @classmethod
+    def get_mapped_reads_files(cls, sample_info, sample):
+        """
+        Return the absolute paths of the BAM files of a sample's reads mapped
+        to each species' genome, when samples are given as mapped reads.
+
+        sample_info: object encapsulating samples and their accompanying read files
+        sample: sample name
+        """
+        base_dir = sample_info.base_reads_dir or ""
+        return [os.path.abspath(os.path.join(base_dir, f))
+                for f in sample_info.get_mapped_reads(sample)]
+
+    @classmethod
+    def read_name_compaction_requested(cls, options):
+        """
+        Return True if reads should be renamed with compact read IDs when raw
+        reads are collated.
+
+        options: dictionary of command-line options
+        """
+        return options[opts.COMPACT_READ_NAMES]
+
+    @classmethod
+    def chunking_requested(cls, options):
+        """
+        Return True if each sample's reads should be split into chunks which
+        are mapped and sorted independently.
+
+        options: dictionary of command-line options
+        """
+        return options[opts.NUM_CHUNKS] > 1
+
+    @classmethod
+    def coordinate_sort_requested(cls, options):
+        """
+        Return True if the filtered reads for each sample and species should
+        be sorted by coordinate and indexed.
+
+        options: dictionary of command-line options
+        """
+        return options[opts.COORDINATE_SORT]
+
+    @classmethod
+    def get_mapped_samples_variable(cls, options):
+        """
+        Return the variable listing the names under which reads are mapped
+        and sorted; these are the chunks of each sample, if reads are split
+        into chunks, and otherwise the samples themselves.
+
+        options: dictionary of command-line options
+        """
+        return MakefileWriter.CHUNKS_VARIABLE \
+            if cls.chunking_requested(options) \
+            else MakefileWriter.SAMPLES_VARIABLE
+
+    @classmethod
+    def masking_requested(cls, options):
+        """
+        Return True if reads aligning to a set of mask sequences should be
+        discarded before reads are mapped.
+
+        options: dictionary of command-line options
+        """
+        return options[opts.MASK_SEQUENCES] is not None
+
+    @classmethod
+    def get_masked_reads_target(cls, options):
+        """
+        Return the target whose directory holds the reads for each sample
+        remaining after (optional) masking.
+
+        options: dictionary of command-line options
+        """
+        return MakefileWriter.MASKED_READS_TARGET \
+            if cls.masking_requested(options) \
+            else MakefileWriter.COLLATE_RAW_READS_TARGET
+
+    @classmethod
+    def collapsing_requested(cls, options):
+        """
+        Return True if reads with identical sequences should be collapsed into
+        a single representative read before mapping.
+
+        options: dictionary of command-line options
+        """
+        return options[opts.COLLAPSE_DUPLICATES]
+
+    @classmethod
+    def get_collapsed_reads_target(cls, options):
+        """
+        Return the target whose directory holds the reads for each sample
+        remaining after (optional) masking and collapsing of duplicates.
+
+        options: dictionary of command-line options
+        """
+        return MakefileWriter.COLLAPSED_READS_TARGET \
+            if cls.collapsing_requested(options) \
+            else cls.get_masked_reads_target(options)
+
+    @classmethod
+    def get_reads_target(cls, options):
+        """
+        Return the target whose directory holds the reads for each sample to
+        be mapped.
+
+        options: dictionary of command-line options
+        """
+        # When reads are classified before mapping, each sample's reads
+        # directory contains a sub-directory per species, holding just those
+        # reads to be mapped to that species' genome
+        return MakefileWriter.CLASSIFIED_READS_TARGET \
+            if cls.preclassification_requested(options) \
+            else cls.get_collapsed_reads_target(options)
+
+    @classmethod
+    def get_filter_reads_environment(cls, options, get_directory):
+        """
+        Return the environment variable assignments via which filter_reads
+        finds the files, written by earlier stages, of duplicate reads and of
+        original read names, the number of chunks into which each sample's
+        reads were split, the format in which filtered reads are written and
+        the species for which they are not, how block and filtered files are
+        written and sorted, how many hits for each read are held in memory,
+        whether filtering is profiled and its decisions traced, and the work
+        queue, if any, to which blocks of reads are submitted.
+
+        options: dictionary of command-line options
+        get_directory: function returning the directory of a target
+        """
+        environment = []
+        if cls.collapsing_requested(options):
+            environment.append("SARGASSO_DUPLICATES_DIR=" + get_directory(
+                MakefileWriter.COLLAPSED_READS_TARGET))
+        if cls.read_name_compaction_requested(options):
+            environment.append("SARGASSO_READ_NAMES_DIR=" + get_directory(
+                MakefileWriter.COLLATE_RAW_READS_TARGET))
+        if cls.chunking_requested(options):
+            environment.append("SARGASSO_NUM_CHUNKS={n}".format(
+                n=options[opts.NUM_CHUNKS]))
+        if options[opts.OUTPUT_FORMAT] != fastq_writer.OUTPUT_FORMAT_BAM:
+            environment.append("SARGASSO_OUTPUT_FORMAT=" +
+                               options[opts.OUTPUT_FORMAT])
+        if options[opts.DECIDE_ONLY]:
+            environment.append("SARGASSO_DECIDE_ONLY=" +
+                               ",".join(options[opts.DECIDE_ONLY]))
+        if options[opts.PROFILE]:
+            environment.append("SARGASSO_PROFILE=1")
+        if options[opts.TRACE_SAMPLE_RATE] is not None:
+            environment.append("SARGASSO_TRACE_SAMPLE_RATE={r}".format(
+                r=options[opts.TRACE_SAMPLE_RATE]))
+        if options[opts.MAX_HITS_IN_MEMORY] is not None:
+            environment.append("SARGASSO_MAX_HITS_IN_MEMORY={n}".format(
+                n=options[opts.MAX_HITS_IN_MEMORY]))
+        if options[opts.QUEUE_DIR] is not None:
+            environment.append("SARGASSO_QUEUE_DIR=" +
+                               os.path.abspath(options[opts.QUEUE_DIR]))
+        environment.append("SARGASSO_INTERMEDIATE_COMPRESSION={l}".format(
+            l=options[opts.INTERMEDIATE_COMPRESSION]))
+        if options[opts.OUTPUT_COMPRESSION] is not None:
+            environment.append("SARGASSO_OUTPUT_COMPRESSION={l}".format(
+                l=options[opts.OUTPUT_COMPRESSION]))
+        if options[opts.OUTPUT_THREADS] is not None:
+            environment.append("SARGASSO_OUTPUT_THREADS={t}".format(
+                t=options[opts.OUTPUT_THREADS]))
+        if options[opts.BLOCK_DIR] is not None:
+            environment.append("SARGASSO_BLOCK_DIR=" +
+                               os.path.abspath(options[opts.BLOCK_DIR]))
+        if cls.coordinate_sort_requested(options):
+            environment.append("SARGASSO_COORDINATE_SORT=1")
+            environment.append("SARGASSO_SORT_TMP_DIR=" +
+                               options[opts.SAMBAMBA_SORT_TMP_DIR])
+        return environment
+
+    @classmethod
+    def combined_genome_requested(cls, options):
+        """
+        Return True if reads should be mapped once to a combined genome built
+        from the genomes of all species.
+
+        options: dictionary of command-line options
+        """
+        return options[opts.COMBINED_GENOME]
+
+    @classmethod
+    def get_mapped_genomes(cls, options):
+        """
+        Return the names of the genomes (and hence mapper indexes) to which
+        reads are mapped.
+
+        options: dictionary of command-line options
+        """
+        return [combined_hits.COMBINED_NAME] \
+            if cls.combined_genome_requested(options) \
+            else options[opts.SPECIES_ARG]
+
+    @classmethod
+    def get_filter_input_target(cls, options):
+        """
+        Return the target whose directory holds the BAM files to be filtered;
+        reads mapped to a combined genome are filtered without being sorted.
+
+        options: dictionary of command-line options
+        """
+        return MakefileWriter.MAPPED_READS_TARGET \
+            if cls.combined_genome_requested(options) \
+            else MakefileWriter.SORTED_READS_TARGET
+
     def indent(self):
         self.indent_level += 1
 
@@ -110,6 +370,15 @@ class MakefileWriter(Writer):
         line_elements = [command_name] + options
         self.add_line(" ".join([str(l) for l in line_elements]))
 
+    def add_stage_command(self, stage, command_name, options):
+        """
+        Add a command performing a stage of species separation, whose progress
+        and resource usage are recorded in the telemetry directory.
+        """
+        self.add_command("record_stage", [
+            self.variable_val(MakefileWriter.TELEMETRY_VARIABLE), stage, "--",
+            command_name] + options)
+
     def _write_variable_definitions(self, options, sample_info, species_options):
         """
         Write variable definitions to Makefile.
@@ -133,6 +402,20 @@ class MakefileWriter(Writer):
 
         sample_names = sample_info.get_sample_names()
         self.set_variable(MakefileWriter.SAMPLES_VARIABLE, " ".join(sample_names))
+
+        if self.chunking_requested(options):
+            self.set_variable(
+                MakefileWriter.CHUNKS_VARIABLE,
+                " ".join([chunk for name in sample_names for chunk in
+                          read_chunks.get_chunk_names(
+                              name, options[opts.NUM_CHUNKS])]))
+
+        # Neither raw reads nor species' genomes are needed when reads have
+        # already been mapped
+        if self.premapped_reads_requested(options):
+            self.add_blank_line()
+            return
+
         self.set_variable(
             MakefileWriter.RAW_READS_DIRECTORY_VARIABLE,
             options[opts.READS_BASE_DIR] if options[opts.READS_BASE_DIR] else "/")
@@ -164,11 +447,19 @@ class MakefileWriter(Writer):
         logger: logging object
         writer: Makefile writer object
         """
-        self.set_variable(MakefileWriter.MAPPER_INDICES_TARGET, "mapper_indexes")
-        self.set_variable(MakefileWriter.COLLATE_RAW_READS_TARGET, "raw_reads")
-        self.set_variable(MakefileWriter.MAPPED_READS_TARGET, "mapped_reads")
-        self.set_variable(MakefileWriter.SORTED_READS_TARGET, "sorted_reads")
-        self.set_variable(MakefileWriter.FILTERED_READS_TARGET, "filtered_reads")
+        for target in [MakefileWriter.MAPPER_INDICES_TARGET,
+                       MakefileWriter.COLLATE_RAW_READS_TARGET,
+                       MakefileWriter.MASK_INDEX_TARGET,
+                       MakefileWriter.MASKED_READS_TARGET,
+                       MakefileWriter.COLLAPSED_READS_TARGET,
+                       MakefileWriter.KMER_INDEX_TARGET,
+                       MakefileWriter.CLASSIFIED_READS_TARGET,
+                       MakefileWriter.MAPPED_READS_TARGET,
+                       MakefileWriter.SORTED_READS_TARGET,
+                       MakefileWriter.FILTERED_READS_TARGET]:
+            self.set_variable(target, MakefileWriter.TARGET_DIRECTORIES[target])
+        self.set_variable(MakefileWriter.TELEMETRY_VARIABLE,
+                          telemetry.TELEMETRY_DIR)
         self.add_blank_line()
 
     def _write_phony_targets(self):
@@ -179,10 +470,20 @@ class MakefileWriter(Writer):
         writer: Makefile writer object
         """
         with self.target_definition(
-                ".PHONY", [MakefileWriter.ALL_TARGET, MakefileWriter.CLEAN_TARGET],
+                ".PHONY", [MakefileWriter.ALL_TARGET, MakefileWriter.CLEAN_TARGET,
+                           MakefileWriter.FORCE_TARGET],
                 raw_target=True, raw_dependencies=True):
             pass
 
+    def _write_force_target(self):
+        """
+        Write an empty target which forces any target depending on it to be
+        rebuilt.
+        """
+        with self.target_definition(
+                MakefileWriter.FORCE_TARGET, [], raw_target=True):
+            pass
+
     def _write_all_target(self):
         """
         Write main target definition to Makefile.
@@ -194,7 +495,9 @@ class MakefileWriter(Writer):
                 MakefileWriter.ALL_TARGET,
                 [MakefileWriter.FILTERED_READS_TARGET],
                 raw_target=True):
-            pass
+            self.add_command("write_run_report", [
+                self.variable_val(MakefileWriter.TELEMETRY_VARIABLE),
+                telemetry.RUN_REPORT_FILE])
 
     def _write_filtered_reads_target(self, options):
         """
@@ -203,19 +506,37 @@ class MakefileWriter(Writer):
         logger: logging object
         writer: Makefile writer object
         """
+        # The overall filtering summary is only written once all samples have
+        # been filtered; until then, filtering is re-run (resuming from where
+        # any previous, interrupted run stopped) even though the output
+        # directory already exists.
+        incomplete_check = "$(if $(wildcard {dir}/{summary}),,{force})".format(
+            dir=self.variable_val(MakefileWriter.FILTERED_READS_TARGET),
+            summary=MakefileWriter.OVERALL_FILTERING_SUMMARY_FILE,
+            force=MakefileWriter.FORCE_TARGET)
+
+        input_target = self.get_filter_input_target(options)
+
         with self.target_definition(
                 MakefileWriter.FILTERED_READS_TARGET,
-                [MakefileWriter.SORTED_READS_TARGET]):
+                [self.variable_val(input_target), incomplete_check],
+                raw_dependencies=True):
             self.add_comment(
                 "For each sample, take the reads mapping to each genome and " +
                 "filter them to their correct species of origin")
             self.make_target_directory(MakefileWriter.FILTERED_READS_TARGET)
 
-            self.add_command("filter_reads", [
+            environment = self.get_filter_reads_environment(
+                options, self.variable_val)
+            filter_reads_command = " ".join(
+                (["env"] + environment if environment else []) +
+                ["filter_reads"])
+
+            self.add_stage_command("filter_reads", filter_reads_command, [
                 self.variable_val(MakefileWriter.DATA_TYPE_VARIABLE),
                 "\"{var}\"".format(
                     var=self.variable_val(MakefileWriter.SAMPLES_VARIABLE)),
-                self.variable_val(MakefileWriter.SORTED_READS_TARGET),
+                self.variable_val(input_target),
                 self.variable_val(MakefileWriter.FILTERED_READS_TARGET),
                 self.variable_val(MakefileWriter.NUM_THREADS_VARIABLE),
                 options[opts.MISMATCH_THRESHOLD],
@@ -226,7 +547,17 @@ class MakefileWriter(Writer):
                 "{sl}".format(sl=" ".join(options[opts.SPECIES_ARG]))])
 
             if options[opts.DELETE_INTERMEDIATE]:
-                self.remove_target_directory(MakefileWriter.SORTED_READS_TARGET)
+                self.remove_target_directory(input_target)
+                if self.combined_genome_requested(options):
+                    self._remove_intermediate_reads_directories(options)
+                # Collapsed and renamed reads are kept until filtering, which
+                # needs the duplicates and read names files written with them
+                if self.collapsing_requested(options):
+                    self.remove_target_directory(
+                        MakefileWriter.COLLAPSED_READS_TARGET)
+                if self.read_name_compaction_requested(options):
+                    self.remove_target_directory(
+                        MakefileWriter.COLLATE_RAW_READS_TARGET)
 
     def _write_sorted_reads_target(self, options):
         """
@@ -243,18 +574,66 @@ class MakefileWriter(Writer):
                 "For each sample, sort the mapped reads into read name order")
             self.make_target_directory(MakefileWriter.SORTED_READS_TARGET)
 
-            self.add_command(
-                "sort_reads",
+            self.add_stage_command(
+                "sort_reads", "sort_reads",
                 ["\"{sl}\"".format(sl=" ".join(options[opts.SPECIES_ARG])),
                  "\"{var}\"".format(
-                     var=self.variable_val(MakefileWriter.SAMPLES_VARIABLE)),
+                     var=self.variable_val(
+                         self.get_mapped_samples_variable(options))),
                  self.variable_val(MakefileWriter.NUM_THREADS_VARIABLE),
                  self.variable_val(MakefileWriter.MAPPED_READS_TARGET),
                  self.variable_val(MakefileWriter.SORTED_READS_TARGET),
-                 self.variable_val(MakefileWriter.SAMBAMBA_SORT_TMP_DIR_VARIABLE)])
+                 self.variable_val(MakefileWriter.SAMBAMBA_SORT_TMP_DIR_VARIABLE),
+                 str(options[opts.INTERMEDIATE_COMPRESSION])])
 
             if options[opts.DELETE_INTERMEDIATE]:
                 self.remove_target_directory(MakefileWriter.MAPPED_READS_TARGET)
+                self._remove_intermediate_reads_directories(options)
+
+    def _remove_intermediate_reads_directories(self, options):
+        """
+        Remove the directories of masked and classified reads, and of chunked
+        reads, once reads have been mapped.
+        """
+        # Renamed reads are kept until filtering, which needs the read names
+        # files written with them
+        if self.chunking_requested(options) and \
+                not self.read_name_compaction_requested(options):
+            self.remove_target_directory(
+                MakefileWriter.COLLATE_RAW_READS_TARGET)
+        if self.masking_requested(options):
+            self.remove_target_directory(MakefileWriter.MASKED_READS_TARGET)
+        if self.preclassification_requested(options):
+            self.remove_target_directory(
+                MakefileWriter.CLASSIFIED_READS_TARGET)
+
+    def _write_collate_mapped_reads_target(self, sample_info, options):
+        """
+        Write target to collect BAM files of reads already mapped to each
+        species to Makefile.
+
+        sample_info: object encapsulating samples and their accompanying read files
+        options: dictionary of command-line options
+        """
+        with self.target_definition(MakefileWriter.MAPPED_READS_TARGET, []):
+            self.add_comment(
+                "For each sample, check that the given BAM files of reads " +
+                "mapped to each species' genome contain reads from the same " +
+                "set, and link to them in place of mapping reads")
+            self.make_target_directory(MakefileWriter.MAPPED_READS_TARGET)
+
+            for sample in sample_info.get_sample_names():
+                collate_mapped_reads_params = [
+                    sample,
+                    self.variable_val(MakefileWriter.MAPPED_READS_TARGET)]
+                for species, bam_file in zip(
+                        options[opts.SPECIES_ARG],
+                        self.get_mapped_reads_files(sample_info, sample)):
+                    collate_mapped_reads_params += [species, bam_file]
+
+                self.add_stage_command(
+                    "collate_" + sample, "collate_mapped_reads",
+                    collate_mapped_reads_params)
 
     def _write_mapped_reads_target(self, sample_info, options):
         """
@@ -264,13 +643,16 @@ class MakefileWriter(Writer):
         writer: Makefile writer object
         """
 
+        mapped_genomes = self.get_mapped_genomes(options)
+
         index_targets = ["{index}/{species}".format(
             index=self.variable_val(MakefileWriter.MAPPER_INDICES_TARGET),
             species=species)
-            for species in options[opts.SPECIES_ARG]]
+            for species in mapped_genomes]
+
+        reads_target = self.get_reads_target(options)
 
-        index_targets.append(
-                self.variable_val(MakefileWriter.COLLATE_RAW_READS_TARGET))
+        index_targets.append(self.variable_val(reads_target))
 
         with self.target_definition(
                 MakefileWriter.MAPPED_READS_TARGET, index_targets,
@@ -281,33 +663,214 @@ class MakefileWriter(Writer):
             self.make_target_directory(MakefileWriter.MAPPED_READS_TARGET)
 
             map_reads_params = \
-                ["\"{sl}\"".format(sl=" ".join(options[opts.SPECIES_ARG])),
+                ["\"{sl}\"".format(sl=" ".join(mapped_genomes)),
                  "\"{var}\"".format(
-                     var=self.variable_val(MakefileWriter.SAMPLES_VARIABLE)),
+                     var=self.variable_val(
+                         self.get_mapped_samples_variable(options))),
                  self.variable_val(MakefileWriter.MAPPER_INDICES_TARGET),
                  self.variable_val(MakefileWriter.NUM_THREADS_VARIABLE),
-                 self.variable_val(MakefileWriter.COLLATE_RAW_READS_TARGET),
+                 self.variable_val(reads_target),
                  self.variable_val(MakefileWriter.MAPPED_READS_TARGET),
                  MakefileWriter.PAIRED_END_READS_TYPE if
                      sample_info.paired_end_reads() else
                      MakefileWriter.SINGLE_END_READS_TYPE,
-                 options[opts.MAPPER_EXECUTABLE]]
+                 options[opts.MAPPER_EXECUTABLE],
+                 str(options[opts.INTERMEDIATE_COMPRESSION])]
 
-            self.add_command("map_reads_" + self.data_type, map_reads_params)
+            self.add_stage_command("map_reads", "map_reads_" + self.data_type,
+                                   map_reads_params)
 
-    def _write_collate_raw_reads_target(self, sample_info):
+    def _write_classified_reads_target(self, sample_info, options):
+        """
+        Write target to classify reads by their k-mers to Makefile.
+
+        sample_info: object encapsulating samples and their accompanying read files
+        options: dictionary of command-line options
+        """
+        reads_target = self.get_collapsed_reads_target(options)
+
+        with self.target_definition(
+                MakefileWriter.CLASSIFIED_READS_TARGET,
+                [MakefileWriter.KMER_INDEX_TARGET, reads_target]):
+            self.add_comment(
+                "For each sample, classify reads by the species-" +
+                "discriminative k-mers they contain, so that reads " +
+                "confidently classified as originating from a species need " +
+                "only be mapped to that species' genome")
+            self.make_target_directory(MakefileWriter.CLASSIFIED_READS_TARGET)
+
+            self.add_stage_command(
+                "classify_reads", "classify_reads",
+                ["--num-threads=" +
+                 self.variable_val(MakefileWriter.NUM_THREADS_VARIABLE),
+                 "{dir}/{file}".format(
+                     dir=self.variable_val(MakefileWriter.KMER_INDEX_TARGET),
+                     file=MakefileWriter.KMER_INDEX_FILE),
+                 "\"{var}\"".format(
+                     var=self.variable_val(
+                         self.get_mapped_samples_variable(options))),
+                 self.variable_val(reads_target),
+                 self.variable_val(MakefileWriter.CLASSIFIED_READS_TARGET),
+                 MakefileWriter.PAIRED_END_READS_TYPE if
+                     sample_info.paired_end_reads() else
+                     MakefileWriter.SINGLE_END_READS_TYPE])
+
+    def _write_collapsed_reads_target(self, sample_info, options):
+        """
+        Write target to collapse reads with identical sequences to Makefile.
+
+        sample_info: object encapsulating samples and their accompanying read files
+        options: dictionary of command-line options
+        """
+        reads_target = self.get_masked_reads_target(options)
+
+        with self.target_definition(
+                MakefileWriter.COLLAPSED_READS_TARGET, [reads_target]):
+            self.add_comment(
+                "For each sample, collapse reads with identical sequences " +
+                "into a single representative read, so that each distinct " +
+                "sequence need only be mapped once")
+            self.make_target_directory(MakefileWriter.COLLAPSED_READS_TARGET)
+
+            self.add_stage_command(
+                "collapse_reads", "collapse_reads",
+                ["--tmp-dir=" + self.variable_val(
+                    MakefileWriter.SAMBAMBA_SORT_TMP_DIR_VARIABLE),
+                 "\"{var}\"".format(
+                     var=self.variable_val(
+                         self.get_mapped_samples_variable(options))),
+                 self.variable_val(reads_target),
+                 self.variable_val(MakefileWriter.COLLAPSED_READS_TARGET),
+                 MakefileWriter.PAIRED_END_READS_TYPE if
+                     sample_info.paired_end_reads() else
+                     MakefileWriter.SINGLE_END_READS_TYPE])
+
+    def _write_masked_reads_target(self, sample_info, options):
+        """
+        Write target to discard reads aligning to the mask sequences to
+        Makefile.
+
+        sample_info: object encapsulating samples and their accompanying read files
+        options: dictionary of command-line options
+        """
+        with self.target_definition(
+                MakefileWriter.MASKED_READS_TARGET,
+                [MakefileWriter.MASK_INDEX_TARGET,
+                 MakefileWriter.COLLATE_RAW_READS_TARGET]):
+            self.add_comment(
+                "For each sample, map reads to the mask sequences, and keep " +
+                "only those reads which do not align to them")
+            self.make_target_directory(MakefileWriter.MASKED_READS_TARGET)
+
+            self.add_stage_command(
+                "mask_reads", "mask_reads_" + self.data_type,
+                ["\"{var}\"".format(
+                    var=self.variable_val(
+                        self.get_mapped_samples_variable(options))),
+                 self.variable_val(MakefileWriter.MASK_INDEX_TARGET),
+                 self.variable_val(MakefileWriter.NUM_THREADS_VARIABLE),
+                 self.variable_val(MakefileWriter.COLLATE_RAW_READS_TARGET),
+                 self.variable_val(MakefileWriter.MASKED_READS_TARGET),
+                 MakefileWriter.PAIRED_END_READS_TYPE if
+                     sample_info.paired_end_reads() else
+                     MakefileWriter.SINGLE_END_READS_TYPE,
+                 options[opts.MAPPER_EXECUTABLE]])
+
+    def _write_kmer_index_target(self, options):
+        """
+        Write target to build or link to the index of species-discriminative
+        k-mers to Makefile.
+
+        options: dictionary of command-line options
+        """
+        index_file = "{dir}/{file}".format(
+            dir=self.variable_val(MakefileWriter.KMER_INDEX_TARGET),
+            file=MakefileWriter.KMER_INDEX_FILE)
+
+        with self.target_definition(MakefileWriter.KMER_INDEX_TARGET, []):
+            self.make_target_directory(MakefileWriter.KMER_INDEX_TARGET)
+
+            if options[opts.KMER_INDEX] is not None:
+                self.add_command("ln", ["-s", options[opts.KMER_INDEX],
+                                        index_file])
+            else:
+                build_kmer_index_params = [
+                    "--num-threads=" +
+                    self.variable_val(MakefileWriter.NUM_THREADS_VARIABLE),
+                    index_file]
+                for species in options[opts.SPECIES_ARG]:
+                    build_kmer_index_params += [
+                        species,
+                        self.variable_val(
+                            self._get_genome_fasta_variable(species))]
+
+                self.add_stage_command("build_kmer_index", "build_kmer_index",
+                                       build_kmer_index_params)
+
+    def _write_combined_genome_index_target(self, options):
+        """
+        Write target to combine the genomes of all species, and to build a
+        mapper index of the combined genome, to Makefile.
+
+        options: dictionary of command-line options
+        """
+        target = "{index}/{combined}".format(
+            index=self.variable_val(MakefileWriter.MAPPER_INDICES_TARGET),
+            combined=combined_hits.COMBINED_NAME)
+        genome_dir = "{index}/{dir}".format(
+            index=self.variable_val(MakefileWriter.MAPPER_INDICES_TARGET),
+            dir=MakefileWriter.COMBINED_GENOME_DIR)
+
+        combine_genomes_params = \
+            ["--gtf-file=" + gtf for gtf in
+             self._get_combined_annotation_files(options)] + [genome_dir]
+        for species in options[opts.SPECIES_ARG]:
+            combine_genomes_params += [
+                species,
+                self.variable_val(self._get_genome_fasta_variable(species))]
+
+        with self.target_definition(target, [], raw_target=True):
+            self.add_comment(
+                "Concatenate the genomes of all species, prefixing the name " +
+                "of each contig by that of its species, and index the result")
+            self.make_target_directory(target, raw_target=True)
+            self.add_stage_command("combine_genomes", "combine_genomes",
+                                   combine_genomes_params)
+            self._add_combined_genome_index_command(
+                target, genome_dir, options)
+
+    def _get_combined_annotation_files(self, options):
+        return []
+
+    def _add_combined_genome_index_command(self, target, genome_dir, options):
+        raise NotImplementedError()
+
+    def _write_collate_raw_reads_target(self, sample_info, options):
         """
         Write target to collect raw reads files to Makefile.
 
         logger: logging object
         writer: Makefile writer object
         sample_info: object encapsulating samples and their accompanying read files
+        options: dictionary of command-line options
         """
         with self.target_definition(MakefileWriter.COLLATE_RAW_READS_TARGET, []):
-            self.add_comment(
-                "Create a directory with sub-directories for each sample, " +
-                "each of which contains links to the input raw reads files " +
-                "for that sample")
+            if self.chunking_requested(options):
+                self.add_comment(
+                    "Create a directory with sub-directories for each chunk " +
+                    "of each sample, each of which contains the reads " +
+                    "(or read pairs) in that chunk")
+            elif self.read_name_compaction_requested(options):
+                self.add_comment(
+                    "Create a directory with sub-directories for each " +
+                    "sample, each of which contains the sample's reads, " +
+                    "renamed with compact read IDs, and a table of their " +
+                    "original names")
+            else:
+                self.add_comment(
+                    "Create a directory with sub-directories for each " +
+                    "sample, each of which contains links to the input raw " +
+                    "reads files for that sample")
             self.make_target_directory(MakefileWriter.COLLATE_RAW_READS_TARGET)
 
             collate_raw_reads_params = [
@@ -336,7 +899,18 @@ class MakefileWriter(Writer):
                     "\"\""
                 ]
 
-            self.add_command("collate_raw_reads", collate_raw_reads_params)
+            # Reads may instead be renamed with compact read IDs, keeping a
+            # table of their original names, and split into chunks
+            if self.read_name_compaction_requested(options):
+                collate_raw_reads_params.append("--compact-read-names")
+            elif self.chunking_requested(options):
+                collate_raw_reads_params.append("\"\"")
+
+            if self.chunking_requested(options):
+                collate_raw_reads_params.append(str(options[opts.NUM_CHUNKS]))
+
+            self.add_stage_command("collate_raw_reads", "collate_raw_reads",
+                                   collate_raw_reads_params)
 
     @classmethod
     def _get_species_options(cls, options, species_index):
@@ -365,21 +939,53 @@ class RnaSeqMakefileWriter(MakefileWriter):
             self._write_phony_targets()
             self._write_all_target()
             self._write_filtered_reads_target(options)
-            self._write_sorted_reads_target(options)
-            self._write_mapped_reads_target(sample_info, options)
-            # # self._write_masked_reads_target(logger)
-            self._write_collate_raw_reads_target(sample_info)
-            # self._write_mask_star_index_targets(logger, options)
-            self._write_main_star_index_targets(options)
+            if not self.combined_genome_requested(options):
+                self._write_sorted_reads_target(options)
+            if self.premapped_reads_requested(options):
+                self._write_collate_mapped_reads_target(sample_info, options)
+            else:
+                self._write_mapping_targets(sample_info, options)
             self._write_clean_target()
+            self._write_force_target()
 
-    # def _write_masked_reads_target(logger, options):
-    # TODO: Write "masked_reads" target
-    # pass
+    def _write_mapping_targets(self, sample_info, options):
+        """
+        Write targets to map reads, and those of the stages preceding mapping,
+        to Makefile.
 
-    # def _write_mask_star_index_targets(logger, options):
-    # TODO: Write targets for STAR indices for mask sequences
-    # pass
+        sample_info: object encapsulating samples and their accompanying read files
+        options: dictionary of command-line options
+        """
+        self._write_mapped_reads_target(sample_info, options)
+        if self.preclassification_requested(options):
+            self._write_classified_reads_target(sample_info, options)
+            self._write_kmer_index_target(options)
+        if self.collapsing_requested(options):
+            self._write_collapsed_reads_target(sample_info, options)
+        if self.masking_requested(options):
+            self._write_masked_reads_target(sample_info, options)
+        self._write_collate_raw_reads_target(sample_info, options)
+        if self.masking_requested(options):
+            self._write_mask_star_index_target(options)
+        if self.combined_genome_requested(options):
+            self._write_combined_genome_index_target(options)
+        else:
+            self._write_main_star_index_targets(options)
+
+    def _write_mask_star_index_target(self, options):
+        """
+        Write target to build a STAR index of the mask sequences to Makefile.
+
+        options: dictionary of command-line options
+        """
+        with self.target_definition(MakefileWriter.MASK_INDEX_TARGET, []):
+            self.make_target_directory(MakefileWriter.MASK_INDEX_TARGET)
+            self.add_stage_command(
+                "build_mask_index", "build_star_mask_index",
+                [options[opts.MASK_SEQUENCES],
+                 self.variable_val(MakefileWriter.NUM_THREADS_VARIABLE),
+                 self.variable_val(MakefileWriter.MASK_INDEX_TARGET),
+                 options[opts.MAPPER_EXECUTABLE]])
 
     def _write_main_star_index_targets(self, options):
         """
@@ -419,13 +1025,26 @@ class RnaSeqMakefileWriter(MakefileWriter):
                      target])
             else:
                 self.make_target_directory(target, raw_target=True)
-                self.add_command(
-                    "build_star_index",
+                self.add_stage_command(
+                    "build_index_" + species, "build_star_index",
                     [self.variable_val(self._get_genome_fasta_variable(species)),
                      self.variable_val(self._get_gtf_file_variable(species)),
                      self.variable_val(MakefileWriter.NUM_THREADS_VARIABLE),
                      target, executable])
 
+    def _get_combined_annotation_files(self, options):
+        return [self.variable_val(self._get_gtf_file_variable(species))
+                for species in options[opts.SPECIES_ARG]]
+
+    def _add_combined_genome_index_command(self, target, genome_dir, options):
+        self.add_stage_command(
+            "build_index_" + combined_hits.COMBINED_NAME, "build_star_index",
+            [genome_dir,
+             "{dir}/{gtf}".format(dir=genome_dir,
+                                  gtf=genome_combiner.GTF_FILE),
+             self.variable_val(MakefileWriter.NUM_THREADS_VARIABLE),
+             target, options[opts.MAPPER_EXECUTABLE]])
+
     def _write_clean_target(self):
         """
         Write target to clean results directory to Makefile.
@@ -437,6 +1056,11 @@ class RnaSeqMakefileWriter(MakefileWriter):
                                     raw_target=True):
             self.remove_target_directory(MakefileWriter.MAPPER_INDICES_TARGET)
             self.remove_target_directory(MakefileWriter.COLLATE_RAW_READS_TARGET)
+            self.remove_target_directory(MakefileWriter.MASK_INDEX_TARGET)
+            self.remove_target_directory(MakefileWriter.MASKED_READS_TARGET)
+            self.remove_target_directory(MakefileWriter.COLLAPSED_READS_TARGET)
+            self.remove_target_directory(MakefileWriter.KMER_INDEX_TARGET)
+            self.remove_target_directory(MakefileWriter.CLASSIFIED_READS_TARGET)
             self.remove_target_directory(MakefileWriter.MAPPED_READS_TARGET)
             self.remove_target_directory(MakefileWriter.SORTED_READS_TARGET)
             self.remove_target_directory(MakefileWriter.FILTERED_READS_TARGET)
@@ -507,13 +1131,54 @@ class DnaSeqMakefileWriter(MakefileWriter):
             self._write_phony_targets()
             self._write_all_target()
             self._write_filtered_reads_target(options)
-            self._write_sorted_reads_target(options)
-            self._write_mapped_reads_target(sample_info, options)
-            # # # self._write_masked_reads_target(logger)
-            self._write_collate_raw_reads_target(sample_info)
-            # # self._write_mask_star_index_targets(logger, options)
-            self._write_main_bowtie2_index_targets(options)
+            if not self.combined_genome_requested(options):
+                self._write_sorted_reads_target(options)
+            if self.premapped_reads_requested(options):
+                self._write_collate_mapped_reads_target(sample_info, options)
+            else:
+                self._write_mapping_targets(sample_info, options)
             # self._write_clean_target(logger)
+            self._write_force_target()
+
+    def _write_mapping_targets(self, sample_info, options):
+        """
+        Write targets to map reads, and those of the stages preceding mapping,
+        to Makefile.
+
+        sample_info: object encapsulating samples and their accompanying read files
+        options: dictionary of command-line options
+        """
+        self._write_mapped_reads_target(sample_info, options)
+        if self.preclassification_requested(options):
+            self._write_classified_reads_target(sample_info, options)
+            self._write_kmer_index_target(options)
+        if self.collapsing_requested(options):
+            self._write_collapsed_reads_target(sample_info, options)
+        if self.masking_requested(options):
+            self._write_masked_reads_target(sample_info, options)
+        self._write_collate_raw_reads_target(sample_info, options)
+        if self.masking_requested(options):
+            self._write_mask_bowtie2_index_target(options)
+        if self.combined_genome_requested(options):
+            self._write_combined_genome_index_target(options)
+        else:
+            self._write_main_bowtie2_index_targets(options)
+
+    def _write_mask_bowtie2_index_target(self, options):
+        """
+        Write target to build a Bowtie2 index of the mask sequences to
+        Makefile.
+
+        options: dictionary of command-line options
+        """
+        with self.target_definition(MakefileWriter.MASK_INDEX_TARGET, []):
+            self.make_target_directory(MakefileWriter.MASK_INDEX_TARGET)
+            self.add_stage_command(
+                "build_mask_index", "build_bowtie2_index",
+                [options[opts.MASK_SEQUENCES],
+                 self.variable_val(MakefileWriter.NUM_THREADS_VARIABLE),
+                 self.variable_val(MakefileWriter.MASK_INDEX_TARGET),
+                 options[opts.MAPPER_INDEX_EXECUTABLE]])
 
     def _write_main_bowtie2_index_targets(self, options):
         """
@@ -553,12 +1218,20 @@ class DnaSeqMakefileWriter(MakefileWriter):
                      target])
             else:
                 self.make_target_directory(target, raw_target=True)
-                self.add_command(
-                    "build_bowtie2_index",
+                self.add_stage_command(
+                    "build_index_" + species, "build_bowtie2_index",
                     [self.variable_val(self._get_genome_fasta_variable(species)),
                      self.variable_val(MakefileWriter.NUM_THREADS_VARIABLE),
                      target, executable])
 
+    def _add_combined_genome_index_command(self, target, genome_dir, options):
+        self.add_stage_command(
+            "build_index_" + combined_hits.COMBINED_NAME, "build_bowtie2_index",
+            ["{dir}/{fasta}".format(dir=genome_dir,
+                                    fasta=genome_combiner.GENOME_FASTA_FILE),
+             self.variable_val(MakefileWriter.NUM_THREADS_VARIABLE),
+             target, options[opts.MAPPER_INDEX_EXECUTABLE]])
+
     def _write_species_variable_definitions(self, species, species_options):
         """
         Write variable definitions for a particular species.
@@ -586,6 +1259,491 @@ class DnaSeqMakefileWriter(MakefileWriter):
         return "{species}_GENOME_FASTA_FILE".format(species=species.upper())
 
 
+class JobPlanWriter(Writer):
+    """
+    Writes a job plan, via which the stages of species separation are run for
+    each sample as separate jobs by the job scheduler, subject to limits on the
+    total resources used by concurrently running jobs.
+    """
+    JOB_PLAN_FILE = "job_plan.json"
+
+    # Approximate resource requirements of each stage, used in scheduling jobs.
+    # Sizes of mapped reads files are estimated, per species, relative to the
+    # size of the (compressed) raw reads files for a sample.
+    MAPPED_READS_SIZE_FACTOR = 1.5
+    MASK_MEMORY = 4
+    SORT_MEMORY = 2
+    FILTER_MEMORY_PER_THREAD = 1
+
+    BYTES_PER_GIGABYTE = 1024.0 ** 3
+
+    def __init__(self, data_type):
+        Writer.__init__(self)
+        self.data_type = data_type
+
+    @classmethod
+    def scheduling_requested(cls, options):
+        """
+        Return True if jobs should be run via the job scheduler.
+
+        options: dictionary of command-line options
+        """
+        return options[opts.MAX_MEMORY] is not None or \
+            options[opts.MAX_DISK] is not None
+
+    @classmethod
+    def _get_directory(cls, target):
+        return MakefileWriter.TARGET_DIRECTORIES[target]
+
+    @classmethod
+    def _get_raw_reads_size(cls, sample_info, sample):
+        """
+        Return the total size, in gigabytes, of the raw reads files for a
+        sample.
+        """
+        reads_files = sample_info.get_left_reads(sample)
+        if sample_info.paired_end_reads():
+            reads_files = reads_files + sample_info.get_right_reads(sample)
+
+        if sample_info.base_reads_dir:
+            reads_files = [os.path.join(sample_info.base_reads_dir, f)
+                           for f in reads_files]
+
+        return sum([os.path.getsize(f) for f in reads_files]) / \
+            cls.BYTES_PER_GIGABYTE
+
+    @classmethod
+    def _get_mapped_reads_size(cls, options, sample):
+        """
+        Return the estimated total size, in gigabytes, of the mapped reads
+        files for a sample; when reads have already been mapped, this is the
+        size of the given BAM files.
+        """
+        sample_info = options[opts.SAMPLE_INFO_INDEX]
+        if MakefileWriter.premapped_reads_requested(options):
+            return sum([os.path.getsize(f) for f in
+                        MakefileWriter.get_mapped_reads_files(
+                            sample_info, sample)]) / cls.BYTES_PER_GIGABYTE
+
+        return JobPlanWriter.MAPPED_READS_SIZE_FACTOR * \
+            len(options[opts.SPECIES_ARG]) * \
+            cls._get_raw_reads_size(sample_info, sample)
+
+    @classmethod
+    def _get_species_files(cls, target, sample, options):
+        return [os.path.join(cls._get_directory(target),
+                             "{s}.{sp}.bam".format(s=sample, sp=species))
+                for species in MakefileWriter.get_mapped_genomes(options)]
+
+    @classmethod
+    def _get_recorded_job(cls, name, command, **kwargs):
+        """
+        Return a job whose progress and resource usage are recorded in the
+        telemetry directory.
+        """
+        return Job(name, ["record_stage", telemetry.TELEMETRY_DIR, name, "--"] +
+                   command, **kwargs)
+
+    def _get_prepare_job(self, options):
+        """
+        Return a job which builds or links to mapper indexes and collates raw
+        reads files for all samples, via the Makefile.
+        """
+        targets = ["{index}/{species}".format(
+            index=self._get_directory(MakefileWriter.MAPPER_INDICES_TARGET),
+            species=species)
+            for species in MakefileWriter.get_mapped_genomes(options)]
+        targets.append(
+            self._get_directory(MakefileWriter.COLLATE_RAW_READS_TARGET))
+        if MakefileWriter.masking_requested(options):
+            targets.append(
+                self._get_directory(MakefileWriter.MASK_INDEX_TARGET))
+        if MakefileWriter.preclassification_requested(options):
+            targets.append(
+                self._get_directory(MakefileWriter.KMER_INDEX_TARGET))
+
+        return Job("prepare", ["make"] + targets,
+                   threads=options[opts.NUM_THREADS],
+                   memory=options[opts.MAPPER_MEMORY])
+
+    def _get_mask_job(self, options, sample, threads, reads_type,
+                      reads_size):
+        """
+        Return a job which discards the reads for a sample aligning to the
+        mask sequences.
+        """
+        return self._get_recorded_job(
+            "mask_" + sample,
+            ["mask_reads_" + self.data_type, sample,
+             self._get_directory(MakefileWriter.MASK_INDEX_TARGET),
+             str(threads),
+             self._get_directory(MakefileWriter.COLLATE_RAW_READS_TARGET),
+             self._get_directory(MakefileWriter.MASKED_READS_TARGET),
+             reads_type, options[opts.MAPPER_EXECUTABLE]],
+            threads=threads, memory=JobPlanWriter.MASK_MEMORY,
+            disk=reads_size, dependencies=["prepare"])
+
+    def _get_masked_reads_files(self, options, sample):
+        """
+        Return the paths of the files of a sample's reads remaining after
+        masking.
+        """
+        num_mates = len(read_classifier.READS_DIRS) if \
+            options[opts.SAMPLE_INFO_INDEX].paired_end_reads() else 1
+        return [os.path.join(
+                    self._get_directory(MakefileWriter.MASKED_READS_TARGET),
+                    sample, reads_dir, MakefileWriter.MASKED_READS_FILE)
+                for reads_dir in read_classifier.READS_DIRS[:num_mates]]
+
+    def _get_collapse_job(self, options, sample, reads_type, reads_size,
+                          dependency):
+        """
+        Return a job which collapses the reads for a sample with identical
+        sequences.
+        """
+        return self._get_recorded_job(
+            "collapse_" + sample,
+            ["collapse_reads",
+             "--tmp-dir=" + options[opts.SAMBAMBA_SORT_TMP_DIR], sample,
+             self._get_directory(
+                 MakefileWriter.get_masked_reads_target(options)),
+             self._get_directory(MakefileWriter.COLLAPSED_READS_TARGET),
+             reads_type],
+            disk=reads_size, dependencies=[dependency])
+
+    def _get_collated_reads_files(self, options, sample):
+        """
+        Return the paths of the files of a sample's (or chunk's) reads written
+        when raw reads are collated, when these are renamed with compact read
+        IDs or split into chunks, rather than being links to raw reads files.
+        """
+        reads_file = read_names.COMPACTED_READS_FILE \
+            if MakefileWriter.read_name_compaction_requested(options) \
+            else read_chunks.CHUNK_READS_FILE
+        num_mates = len(read_names.READS_DIRS) if \
+            options[opts.SAMPLE_INFO_INDEX].paired_end_reads() else 1
+        return [os.path.join(
+                    self._get_directory(
+                        MakefileWriter.COLLATE_RAW_READS_TARGET),
+                    sample, reads_dir, reads_file)
+                for reads_dir in read_names.READS_DIRS[:num_mates]]
+
+    def _get_collapsed_reads_files(self, options, sample):
+        """
+        Return the paths of the files of a sample's collapsed reads.
+        """
+        num_mates = len(duplicates.READS_DIRS) if \
+            options[opts.SAMPLE_INFO_INDEX].paired_end_reads() else 1
+        return [os.path.join(
+                    self._get_directory(MakefileWriter.COLLAPSED_READS_TARGET),
+                    sample, reads_dir, duplicates.COLLAPSED_READS_FILE)
+                for reads_dir in duplicates.READS_DIRS[:num_mates]]
+
+    def _get_classify_job(self, options, sample, threads, reads_type,
+                          reads_size, dependency):
+        """
+        Return a job which classifies the reads for a sample by their k-mers.
+        """
+        return self._get_recorded_job(
+            "classify_" + sample,
+            ["classify_reads", "--num-threads=" + str(threads),
+             os.path.join(
+                 self._get_directory(MakefileWriter.KMER_INDEX_TARGET),
+                 MakefileWriter.KMER_INDEX_FILE),
+             sample,
+             self._get_directory(
+                 MakefileWriter.get_collapsed_reads_target(options)),
+             self._get_directory(MakefileWriter.CLASSIFIED_READS_TARGET),
+             reads_type],
+            threads=threads, disk=reads_size, dependencies=[dependency])
+
+    def _get_collate_mapped_reads_job(self, options, sample):
+        """
+        Return a job which checks and links to the BAM files of a sample's
+        reads already mapped to each species' genome.
+        """
+        command = ["collate_mapped_reads", sample,
+                   self._get_directory(MakefileWriter.MAPPED_READS_TARGET)]
+        for species, bam_file in zip(
+                options[opts.SPECIES_ARG],
+                MakefileWriter.get_mapped_reads_files(
+                    options[opts.SAMPLE_INFO_INDEX], sample)):
+            command += [species, bam_file]
+
+        return self._get_recorded_job("collate_" + sample, command)
+
+    def _get_mapping_jobs(self, options, sample, threads, reads_size,
+                          mapped_size):
+        """
+        Return jobs which (optionally mask, collapse and classify, and) map
+        the reads for a sample, or for a chunk of a sample's reads.
+        """
+        sample_info = options[opts.SAMPLE_INFO_INDEX]
+        species = " ".join(MakefileWriter.get_mapped_genomes(options))
+        delete_intermediate = options[opts.DELETE_INTERMEDIATE]
+        reads_type = MakefileWriter.PAIRED_END_READS_TYPE if \
+            sample_info.paired_end_reads() else \
+            MakefileWriter.SINGLE_END_READS_TYPE
+
+        jobs = []
+        if MakefileWriter.masking_requested(options):
+            jobs.append(self._get_mask_job(
+                options, sample, threads, reads_type, reads_size))
+
+        collapse_job = None
+        if MakefileWriter.collapsing_requested(options):
+            collapse_job = self._get_collapse_job(
+                options, sample, reads_type, reads_size,
+                jobs[-1].name if jobs else "prepare")
+            jobs.append(collapse_job)
+
+        classify_job = None
+        if MakefileWriter.preclassification_requested(options):
+            classify_job = self._get_classify_job(
+                options, sample, threads, reads_type, reads_size,
+                jobs[-1].name if jobs else "prepare")
+            jobs.append(classify_job)
+
+        reads_target = MakefileWriter.get_reads_target(options)
+
+        map_job = self._get_recorded_job(
+            "map_" + sample,
+            ["map_reads_" + self.data_type, species, sample,
+             self._get_directory(MakefileWriter.MAPPER_INDICES_TARGET),
+             str(threads),
+             self._get_directory(reads_target),
+             self._get_directory(MakefileWriter.MAPPED_READS_TARGET),
+             reads_type, options[opts.MAPPER_EXECUTABLE],
+             str(options[opts.INTERMEDIATE_COMPRESSION])],
+            threads=threads, memory=options[opts.MAPPER_MEMORY],
+            disk=mapped_size,
+            dependencies=[jobs[-1].name if jobs else "prepare"])
+
+        jobs.append(map_job)
+
+        if not delete_intermediate:
+            return jobs
+
+        # Masked reads are deleted once they have been classified or mapped
+        if MakefileWriter.masking_requested(options):
+            jobs[1].cleanup = self._get_masked_reads_files(options, sample)
+            jobs[1].releases = [jobs[0].name]
+
+        # Likewise renamed, chunked and collapsed reads, although the read
+        # names and duplicates files written with them are kept until the
+        # sample has been filtered
+        if MakefileWriter.read_name_compaction_requested(options) or \
+                MakefileWriter.chunking_requested(options):
+            jobs[0].cleanup = self._get_collated_reads_files(options, sample)
+
+        if collapse_job:
+            consumer = jobs[jobs.index(collapse_job) + 1]
+            consumer.cleanup = self._get_collapsed_reads_files(options, sample)
+            consumer.releases = [collapse_job.name]
+
+        if classify_job:
+            map_job.cleanup = [
+                path for paths in read_classifier.get_output_paths(
+                    os.path.join(self._get_directory(reads_target), sample),
+                    options[opts.SPECIES_ARG],
+                    len(read_classifier.READS_DIRS) if
+                        sample_info.paired_end_reads() else 1)
+                for path in paths]
+            map_job.releases = [classify_job.name]
+
+        return jobs
+
+    def _get_sorted_reads_jobs(self, options, sample, threads, reads_size,
+                               mapped_size):
+        """
+        Return jobs which (optionally mask, collapse and classify,) map, or
+        collate already mapped reads, and sort (unless reads are mapped to a
+        combined genome) the reads for a sample, or for a chunk of a sample's
+        reads.
+        """
+        species = " ".join(MakefileWriter.get_mapped_genomes(options))
+
+        if MakefileWriter.premapped_reads_requested(options):
+            jobs = [self._get_collate_mapped_reads_job(options, sample)]
+        else:
+            jobs = self._get_mapping_jobs(
+                options, sample, threads, reads_size, mapped_size)
+        map_job = jobs[-1]
+
+        if not MakefileWriter.combined_genome_requested(options):
+            sort_job = self._get_recorded_job(
+                "sort_" + sample,
+                ["sort_reads", species, sample, str(threads),
+                 self._get_directory(MakefileWriter.MAPPED_READS_TARGET),
+                 self._get_directory(MakefileWriter.SORTED_READS_TARGET),
+                 options[opts.SAMBAMBA_SORT_TMP_DIR],
+                 str(options[opts.INTERMEDIATE_COMPRESSION])],
+                threads=threads, memory=JobPlanWriter.SORT_MEMORY,
+                disk=mapped_size, dependencies=[map_job.name])
+
+            # Links to already mapped reads are deleted in the same way,
+            # leaving the files linked to in place
+            if options[opts.DELETE_INTERMEDIATE]:
+                sort_job.cleanup = self._get_species_files(
+                    MakefileWriter.MAPPED_READS_TARGET, sample, options)
+                sort_job.releases = [map_job.name]
+
+            jobs.append(sort_job)
+
+        return jobs
+
+    def _get_sample_jobs(self, options, sample, threads, mapped_size):
+        """
+        Return jobs which (optionally mask, collapse and classify,) map, or
+        collate already mapped reads, sort (unless reads are mapped to a
+        combined genome) and filter the reads for a sample.
+        """
+        delete_intermediate = options[opts.DELETE_INTERMEDIATE]
+        reads_size = None if \
+            MakefileWriter.premapped_reads_requested(options) else \
+            self._get_raw_reads_size(options[opts.SAMPLE_INFO_INDEX], sample)
+
+        # Each chunk of a sample's reads is mapped and sorted by its own jobs,
+        # sharing the sample's cores, which may run concurrently; the jobs for
+        # the same stage of every chunk are listed together, so that later
+        # stages are still preferred. Each chunk is then filtered as one block
+        # of the sample's reads.
+        if MakefileWriter.chunking_requested(options):
+            num_chunks = options[opts.NUM_CHUNKS]
+            sorted_names = read_chunks.get_chunk_names(sample, num_chunks)
+            chunk_jobs = [self._get_sorted_reads_jobs(
+                options, chunk, max(1, threads // num_chunks),
+                reads_size / num_chunks, mapped_size / num_chunks)
+                for chunk in sorted_names]
+            jobs = [cj[stage] for stage in range(len(chunk_jobs[0]))
+                    for cj in chunk_jobs]
+            sorted_jobs = [cj[-1] for cj in chunk_jobs]
+            filter_threads = num_chunks
+        else:
+            sorted_names = [sample]
+            jobs = self._get_sorted_reads_jobs(
+                options, sample, threads, reads_size, mapped_size)
+            sorted_jobs = [jobs[-1]]
+            filter_threads = threads
+
+        # When filtered reads are sorted by coordinate, the filtered file for
+        # each block is sorted concurrently
+        filter_memory = JobPlanWriter.SORT_MEMORY \
+            if MakefileWriter.coordinate_sort_requested(options) \
+            else JobPlanWriter.FILTER_MEMORY_PER_THREAD
+
+        filter_job = self._get_recorded_job(
+            "filter_" + sample,
+            self._get_filter_reads_command(
+                options, [sample], threads, overall_summary=False),
+            threads=filter_threads,
+            memory=filter_memory * filter_threads,
+            disk=mapped_size, dependencies=[j.name for j in sorted_jobs])
+
+        if delete_intermediate:
+            filter_job.cleanup = [
+                path for name in sorted_names
+                for path in self._get_species_files(
+                    MakefileWriter.get_filter_input_target(options), name,
+                    options)]
+            filter_job.releases = [j.name for j in sorted_jobs]
+
+            if MakefileWriter.collapsing_requested(options):
+                filter_job.cleanup.append(os.path.join(
+                    self._get_directory(MakefileWriter.COLLAPSED_READS_TARGET),
+                    sample, duplicates.DUPLICATES_FILE))
+
+            if MakefileWriter.read_name_compaction_requested(options):
+                names_path = os.path.join(
+                    self._get_directory(
+                        MakefileWriter.COLLATE_RAW_READS_TARGET),
+                    sample, read_names.READ_NAMES_FILE)
+                filter_job.cleanup += \
+                    [names_path, names_path + read_names.INDEX_SUFFIX]
+
+        return jobs + [filter_job]
+
+    def _get_filter_reads_command(self, options, samples, threads,
+                                  overall_summary=True):
+        environment = MakefileWriter.get_filter_reads_environment(
+            options, self._get_directory)
+
+        # Filtering a single sample must not write the overall filtering
+        # summary, which marks every sample as filtered; it is written by the
+        # final job, once all samples have been filtered
+        if not overall_summary:
+            environment.append("SARGASSO_SKIP_OVERALL_SUMMARY=1")
+
+        command = ["env"] + environment if environment else []
+
+        return command + ["filter_reads", self.data_type, " ".join(samples),
+                self._get_directory(
+                    MakefileWriter.get_filter_input_target(options)),
+                self._get_directory(MakefileWriter.FILTERED_READS_TARGET),
+                str(threads),
+                str(options[opts.MISMATCH_THRESHOLD]),
+                str(options[opts.MINMATCH_THRESHOLD]),
+                str(options[opts.MULTIMAP_THRESHOLD]),
+                "--reject-multimaps" if options[opts.REJECT_MULTIMAPS] else "",
+                options[log.LOG_LEVEL_OPTION]] + options[opts.SPECIES_ARG]
+
+    def write(self, logger, options):
+        """
+        Write job plan to results directory to perform species separation.
+
+        logger: logging object
+        options: dictionary of command-line options
+        """
+        sample_info = options[opts.SAMPLE_INFO_INDEX]
+        samples = list(sample_info.get_sample_names())
+
+        # Divide cores between samples, so that the stages for each sample can
+        # be run concurrently when memory and disk space allow
+        threads = max(1, options[opts.NUM_THREADS] // len(samples))
+
+        sample_jobs = [self._get_sample_jobs(
+            options, sample, threads,
+            self._get_mapped_reads_size(options, sample))
+            for sample in samples]
+
+        # Jobs for later stages are listed first, so that they are preferred
+        # when several jobs are ready to run; this means intermediate files are
+        # consumed, and can be deleted, as early as possible. Nothing need be
+        # prepared when reads have already been mapped.
+        jobs = [] if MakefileWriter.premapped_reads_requested(options) \
+            else [self._get_prepare_job(options)]
+        for stage in reversed(range(len(sample_jobs[0]))):
+            jobs += [sj[stage] for sj in sample_jobs]
+
+        # Once all samples have been filtered, re-running filter_reads for all
+        # samples writes the overall filtering summary
+        jobs.append(self._get_recorded_job(
+            "filter_summary",
+            self._get_filter_reads_command(options, samples, 1),
+            dependencies=[sj[-1].name for sj in sample_jobs]))
+
+        jobs.append(Job(
+            "run_report",
+            ["write_run_report", telemetry.TELEMETRY_DIR,
+             telemetry.RUN_REPORT_FILE],
+            dependencies=["filter_summary"]))
+
+        directories = [self._get_directory(t) for t in [
+            MakefileWriter.MASKED_READS_TARGET,
+            MakefileWriter.COLLAPSED_READS_TARGET,
+            MakefileWriter.CLASSIFIED_READS_TARGET,
+            MakefileWriter.MAPPED_READS_TARGET,
+            MakefileWriter.SORTED_READS_TARGET,
+            MakefileWriter.FILTERED_READS_TARGET]]
+
+        plan = JobPlan(jobs, directories, options[opts.NUM_THREADS],
+                       options[opts.MAX_MEMORY], options[opts.MAX_DISK])
+
+        with self.writing_to_file(options[opts.OUTPUT_DIR_ARG],
+                                  JobPlanWriter.JOB_PLAN_FILE):
+            self._add_line(plan.to_json())
+
+
 class ExecutionRecordWriter(Writer):
     EXECUTION_RECORD_ENTRIES = [
         ["Data Type", opts.DATA_TYPE_ARG],
@@ -608,12 +1766,35 @@ class ExecutionRecordWriter(Writer):
         ["Mapper Executable Path", opts.MAPPER_EXECUTABLE],
         ["Mapper Indexing Executable Path", opts.MAPPER_INDEX_EXECUTABLE],
         ["Sambamba Sort Tmp Dir", opts.SAMBAMBA_SORT_TMP_DIR],
+        ["Intermediate Compression", opts.INTERMEDIATE_COMPRESSION],
+        ["Output Compression", opts.OUTPUT_COMPRESSION],
+        ["Output Threads", opts.OUTPUT_THREADS],
+        ["Block Dir", opts.BLOCK_DIR],
+        ["Coordinate Sort", opts.COORDINATE_SORT],
+        ["Output Format", opts.OUTPUT_FORMAT],
+        ["Decide Only", opts.DECIDE_ONLY],
+        ["Profile", opts.PROFILE],
+        ["Trace Sample Rate", opts.TRACE_SAMPLE_RATE],
+        ["Maximum Hits in Memory", opts.MAX_HITS_IN_MEMORY],
+        ["Queue Dir", opts.QUEUE_DIR],
+        ["Maximum Memory", opts.MAX_MEMORY],
+        ["Maximum Disk", opts.MAX_DISK],
+        ["Mapper Memory", opts.MAPPER_MEMORY],
+        ["K-mer Preclassify", opts.KMER_PRECLASSIFY],
+        ["K-mer Index", opts.KMER_INDEX],
+        ["Combined Genome", opts.COMBINED_GENOME],
+        ["Mask Sequences", opts.MASK_SEQUENCES],
+        ["Collapse Duplicates", opts.COLLAPSE_DUPLICATES],
+        ["Compact Read Names", opts.COMPACT_READ_NAMES],
+        ["Premapped BAMs", opts.PREMAPPED_BAMS],
+        ["Number of Chunks", opts.NUM_CHUNKS],
     ]
 
     def write(self, options):
         """
         Write a log file containing all execution parameters in addition to the
-        time and date of execution
+        time and date of execution, and the location of the run report which
+        will be written once species separation has completed.
 
         options: dictionary of command-line options
         """
@@ -622,6 +1803,8 @@ class ExecutionRecordWriter(Writer):
         out_text += "\n".join(["{desc}: {val}".format(
             desc=it[0], val=str(options[it[1]]))
             for it in self.EXECUTION_RECORD_ENTRIES])
+        out_text += "\nRun Report: {r}".format(r=os.path.join(
+            options[opts.OUTPUT_DIR_ARG], telemetry.RUN_REPORT_FILE))
 
         out_file = os.path.join(options[opts.OUTPUT_DIR_ARG],
                                 "execution_record.txt")
@@ -0,0 +1,163 @@
+import gzip
+import os
+import os.path
+import schema
+
+from sargasso.classify import kmer_index
+from sargasso.filter import combined_hits
+from sargasso.separator.parameter_validator import ParameterValidator
+from sargasso.utils import log
+
+GENOME_FASTA_FILE = "genome.fa"
+GTF_FILE = "genes.gtf"
+
+
+def _open(path):
+    return gzip.open(path, 'rb') if path.endswith(".gz") else open(path, 'rb')
+
+
+def _prefix(species):
+    return (species + combined_hits.SPECIES_SEPARATOR).encode()
+
+
+def write_combined_fasta(output_path, species, genome_paths):
+    """
+    Write a single FASTA file containing the genome sequences of all species,
+    with the name of each contig prefixed by that of its species.
+
+    output_path: path of the FASTA file to write.
+    species: list of species names.
+    genome_paths: list of genome FASTA paths (see 'get_fasta_files') for each
+    species.
+    """
+    with open(output_path, 'wb') as output:
+        for name, genome_path in zip(species, genome_paths):
+            prefix = b">" + _prefix(name)
+            for fasta_file in kmer_index.get_fasta_files(genome_path):
+                with _open(fasta_file) as fasta:
+                    for line in fasta:
+                        if line.startswith(b">"):
+                            line = prefix + line[1:]
+                        output.write(line)
+
+
+def write_combined_gtf(output_path, species, gtf_files):
+    """
+    Write a single GTF file containing the annotations of all species, with
+    the name of the contig of each feature prefixed by that of its species.
+
+    output_path: path of the GTF file to write.
+    species: list of species names.
+    gtf_files: list of GTF files for each species.
+    """
+    with open(output_path, 'wb') as output:
+        for name, gtf_file in zip(species, gtf_files):
+            prefix = _prefix(name)
+            with _open(gtf_file) as gtf:
+                for line in gtf:
+                    if not line.startswith(b"#"):
+                        output.write(prefix + line)
+
+
+class GenomeCombiner(object):
+    DOC = """Usage:
+    combine_genomes [--log-level=<log-level>] [--gtf-file=<gtf-file>]...
+        <output-dir> (<species> <genome-fasta>) (<species> <genome-fasta>) ...
+
+Options:
+<output-dir>
+    Directory to which the combined genome will be written.
+<species>
+    Name of species.
+<genome-fasta>
+    Genome FASTA file for the species, a comma-separated list of such files,
+    or a directory containing them (with suffix ".fa" or ".fasta", optionally
+    gzipped).
+--gtf-file=<gtf-file>
+    GTF annotation file for a species; if given, one must be specified for
+    each species, in the same order as the species' genomes.
+{help_option_spec}
+    {help_option_description}
+{ver_option_spec}
+    {ver_option_description}
+{log_option_spec}
+    {log_option_description}
+
+combine_genomes concatenates the genomes of a set of species into a single
+FASTA file, "<output-dir>/genome.fa", in which the name of each contig is
+prefixed by that of its species (e.g. "mouse__chr1"), so that reads may be
+mapped once to all species' genomes together. If GTF annotation files are
+given, these are similarly combined into "<output-dir>/genes.gtf".
+
+In normal operation, the user should not need to execute this script by hand
+themselves.
+"""
+
+    OUTPUT_DIR = "<output-dir>"
+    SPECIES = "<species>"
+    GENOME_FASTA = "<genome-fasta>"
+    GTF_FILE = "--gtf-file"
+
+    def __init__(self, commandline_parser):
+        self.commandline_parser = commandline_parser
+
+    @classmethod
+    def _validate_command_line_options(cls, options):
+        try:
+            ParameterValidator.validate_log_level(options)
+
+            for species in options[GenomeCombiner.SPECIES]:
+                if combined_hits.SPECIES_SEPARATOR in species:
+                    raise schema.SchemaError(
+                        None, "Species name {s} may not contain '{sep}'".format(
+                            s=species, sep=combined_hits.SPECIES_SEPARATOR))
+
+            for genome in options[GenomeCombiner.GENOME_FASTA]:
+                fasta_files = kmer_index.get_fasta_files(genome)
+                if len(fasta_files) == 0:
+                    raise schema.SchemaError(
+                        None, "No genome FASTA files found: " + genome)
+                for fasta_file in fasta_files:
+                    ParameterValidator.validate_file_option(
+                        fasta_file, "Could not open genome FASTA file")
+
+            gtf_files = options[GenomeCombiner.GTF_FILE]
+            if gtf_files and \
+                    len(gtf_files) != len(options[GenomeCombiner.SPECIES]):
+                raise schema.SchemaError(
+                    None, "A GTF file must be specified for each species")
+            for gtf_file in gtf_files:
+                ParameterValidator.validate_file_option(
+                    gtf_file, "Could not open GTF file")
+        except schema.SchemaError as exc:
+            exit("Exiting: " + exc.code)
+
+    def run(self, args):
+        """
+        Combine the genomes of a set of species.
+
+        args: list of command line arguments
+        """
+        options = self.commandline_parser.parse(args, self.DOC)
+
+        self._validate_command_line_options(options)
+
+        self.logger = log.get_logger_for_options(options)
+
+        output_dir = options[GenomeCombiner.OUTPUT_DIR]
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        species = options[GenomeCombiner.SPECIES]
+
+        self.logger.info("Combining genomes of {s}".format(
+            s=", ".join(species)))
+        write_combined_fasta(
+            os.path.join(output_dir, GENOME_FASTA_FILE), species,
+            options[GenomeCombiner.GENOME_FASTA])
+
+        if options[GenomeCombiner.GTF_FILE]:
+            self.logger.info("Combining GTF annotations")
+            write_combined_gtf(
+                os.path.join(output_dir, GTF_FILE), species,
+                options[GenomeCombiner.GTF_FILE])
@@ -0,0 +1,340 @@
+import json
+import os
+import os.path
+import schema
+import time
+
+from sargasso.separator.parameter_validator import ParameterValidator
+from sargasso.utils import executors, log
+
+
+class Job(object):
+    """
+    Encapsulates a command to be run, and the resources it requires.
+    """
+
+    def __init__(self, name, command, threads=1, memory=0, disk=0,
+                 dependencies=None, cleanup=None, releases=None):
+        """
+        Create object.
+        name: unique name of the job.
+        command: list of command line arguments to be executed.
+        threads: number of cores used by the job.
+        memory: memory, in gigabytes, used by the job.
+        disk: disk space, in gigabytes, occupied by the output of the job.
+        dependencies: names of jobs which must complete before this job starts.
+        cleanup: paths of files to be deleted when the job has completed.
+        releases: names of jobs whose output is deleted by 'cleanup', and whose
+        disk space is thus freed when this job has completed.
+        """
+        self.name = name
+        self.command = command
+        self.threads = threads
+        self.memory = memory
+        self.disk = disk
+        self.dependencies = dependencies if dependencies else []
+        self.cleanup = cleanup if cleanup else []
+        self.releases = releases if releases else []
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, job_dict):
+        return cls(**job_dict)
+
+
+class JobPlan(object):
+    """
+    Encapsulates a set of jobs, and the limits on the resources they may use
+    when running concurrently.
+    """
+    JOBS = "jobs"
+    DIRECTORIES = "directories"
+    MAX_THREADS = "max_threads"
+    MAX_MEMORY = "max_memory"
+    MAX_DISK = "max_disk"
+
+    def __init__(self, jobs, directories, max_threads,
+                 max_memory=None, max_disk=None):
+        """
+        Create object.
+        jobs: list of Job objects, in the order in which they should be
+        preferred for execution when several are ready to run.
+        directories: directories to be created before any jobs are run.
+        max_threads: maximum total number of cores used by running jobs.
+        max_memory: maximum total memory, in gigabytes, used by running jobs,
+        or None if unlimited.
+        max_disk: maximum total disk space, in gigabytes, occupied by the output
+        of jobs, or None if unlimited.
+        """
+        self.jobs = jobs
+        self.directories = directories
+        self.max_threads = max_threads
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+
+    def to_json(self):
+        return json.dumps({
+            JobPlan.JOBS: [j.to_dict() for j in self.jobs],
+            JobPlan.DIRECTORIES: self.directories,
+            JobPlan.MAX_THREADS: self.max_threads,
+            JobPlan.MAX_MEMORY: self.max_memory,
+            JobPlan.MAX_DISK: self.max_disk}, indent=2, sort_keys=True)
+
+    @classmethod
+    def read(cls, plan_file):
+        with open(plan_file) as plan:
+            plan_dict = json.load(plan)
+
+        return cls([Job.from_dict(j) for j in plan_dict[JobPlan.JOBS]],
+                   plan_dict[JobPlan.DIRECTORIES],
+                   plan_dict[JobPlan.MAX_THREADS],
+                   plan_dict[JobPlan.MAX_MEMORY],
+                   plan_dict[JobPlan.MAX_DISK])
+
+
+class JobScheduler(object):
+    DOC = """Usage:
+    schedule_jobs [--log-level=<log-level>]
+        [--queue-dir=<queue-dir>] [--local-workers=<local-workers>]
+        <job-plan-file>
+
+Options:
+<job-plan-file>
+    JSON file describing the jobs to be run and resource limits, as written by
+    species_separator.
+--queue-dir=<queue-dir>
+    If specified, jobs are not run locally, but are instead submitted to a work
+    queue held in this directory, from which they are pulled and run by
+    instances of queue_worker. Both the queue directory and the species
+    separation output directory must be on a filesystem shared by all nodes
+    running workers.
+--local-workers=<local-workers>
+    If specified, jobs are submitted to a work queue which is served by this
+    number of queue_worker processes started on the local machine.
+{help_option_spec}
+    {help_option_description}
+{ver_option_spec}
+    {ver_option_description}
+{log_option_spec}
+    {log_option_description}
+
+schedule_jobs runs the stages of species separation (mapping, sorting and
+filtering) for each sample as separate jobs. As many jobs are run concurrently
+as possible while keeping the total number of cores, memory and disk space used
+within the limits given in the job plan file, and, where requested, the
+intermediate files for a sample are deleted as soon as the stage which reads
+them has completed. Output from each job is written to a log file in the
+directory "job_logs". When jobs are run by queue workers, resource limits apply
+to the total resources used by all running jobs, across all nodes.
+
+In normal operation, the user should not need to execute this script by hand
+themselves.
+"""
+    JOB_PLAN_FILE = "<job-plan-file>"
+    QUEUE_DIR = "--queue-dir"
+    LOCAL_WORKERS = "--local-workers"
+    JOB_LOGS_DIR = "job_logs"
+    POLL_INTERVAL = 5
+
+    def __init__(self, commandline_parser):
+        self.commandline_parser = commandline_parser
+
+    @classmethod
+    def _validate_command_line_options(cls, options):
+        try:
+            ParameterValidator.validate_log_level(options)
+            ParameterValidator.validate_file_option(
+                options[JobScheduler.JOB_PLAN_FILE],
+                "Could not open job plan file")
+            options[JobScheduler.LOCAL_WORKERS] = \
+                ParameterValidator.validate_int_option(
+                    options[JobScheduler.LOCAL_WORKERS],
+                    "Number of local workers must be a positive integer",
+                    min_val=1, nullable=True)
+        except schema.SchemaError as exc:
+            exit("Exiting: " + exc.code)
+
+    @classmethod
+    def _within_limit(cls, used, required, limit):
+        return limit is None or used + required <= limit
+
+    def _can_start(self, job, plan, running):
+        """
+        Return True if a job can be started without exceeding resource limits.
+
+        A job whose requirements exceed the limits by themselves is allowed to
+        run when no other jobs are running, so that all jobs are eventually
+        run.
+        """
+        if len(running) == 0:
+            return True
+
+        return self._within_limit(self.threads_used, job.threads,
+                                  plan.max_threads) and \
+            self._within_limit(self.memory_used, job.memory,
+                               plan.max_memory) and \
+            self._within_limit(self.disk_used, job.disk, plan.max_disk)
+
+    def _start_job(self, logger, job):
+        logger.info("Starting job {j}".format(j=job.name))
+
+        self.threads_used += job.threads
+        self.memory_used += job.memory
+        self.disk_used += job.disk
+
+        return self.executor.submit(
+            job.name, job.command,
+            os.path.join(JobScheduler.JOB_LOGS_DIR, job.name + ".log"))
+
+    def _finish_job(self, logger, job, succeeded, jobs_by_name):
+        self.threads_used -= job.threads
+        self.memory_used -= job.memory
+
+        if not succeeded:
+            logger.error("Job {j} failed; see {d}/{j}.log".format(
+                j=job.name, d=JobScheduler.JOB_LOGS_DIR))
+            self.disk_used -= job.disk
+            return
+
+        logger.info("Finished job {j}".format(j=job.name))
+
+        for path in job.cleanup:
+            if os.path.exists(path):
+                os.remove(path)
+
+        for name in job.releases:
+            self.disk_used -= jobs_by_name[name].disk
+
+    def _run_jobs(self, logger, plan):
+        """
+        Run all jobs in a plan, respecting their dependencies and resource
+        limits. Return True if all jobs completed successfully.
+
+        logger: logging object
+        plan: JobPlan object
+        """
+        for directory in plan.directories + [JobScheduler.JOB_LOGS_DIR]:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+        self.threads_used = 0
+        self.memory_used = 0
+        self.disk_used = 0
+
+        jobs_by_name = dict([(j.name, j) for j in plan.jobs])
+        pending = list(plan.jobs)
+        running = {}
+        succeeded = set()
+        failed = set()
+
+        while len(pending) > 0 or len(running) > 0:
+            # Start, in order of preference, any jobs whose dependencies have
+            # completed and which fit within the remaining resources
+            for job in list(pending):
+                if any(d in failed for d in job.dependencies):
+                    logger.error(("Not running job {j} as a job it depends " +
+                                  "on failed").format(j=job.name))
+                    pending.remove(job)
+                    failed.add(job.name)
+                elif all(d in succeeded for d in job.dependencies) and \
+                        self._can_start(job, plan, running):
+                    running[job.name] = self._start_job(logger, job)
+                    pending.remove(job)
+
+            if len(running) == 0:
+                if len(pending) > 0 and not any(
+                        d in failed for j in pending for d in j.dependencies):
+                    logger.error("Unsatisfiable dependencies for jobs: " +
+                                 ", ".join([j.name for j in pending]))
+                    return False
+                continue
+
+            time.sleep(JobScheduler.POLL_INTERVAL)
+
+            for name, handle in list(running.items()):
+                return_code = self.executor.poll(handle)
+                if return_code is None:
+                    continue
+
+                del running[name]
+                self._finish_job(logger, jobs_by_name[name],
+                                 return_code == 0, jobs_by_name)
+                (succeeded if return_code == 0 else failed).add(name)
+
+        return len(failed) == 0
+
+    def run(self, args):
+        """
+        Run the jobs described in a job plan file.
+
+        args: list of command line arguments
+        """
+        options = self.commandline_parser.parse(args, self.DOC)
+
+        self._validate_command_line_options(options)
+
+        self.logger = log.get_logger_for_options(options)
+
+        plan = JobPlan.read(options[JobScheduler.JOB_PLAN_FILE])
+
+        self.executor = executors.get_executor(
+            options[JobScheduler.QUEUE_DIR],
+            options[JobScheduler.LOCAL_WORKERS],
+            options[log.LOG_LEVEL_OPTION])
+
+        try:
+            succeeded = self._run_jobs(self.logger, plan)
+        finally:
+            self.executor.shutdown()
+
+        if not succeeded:
+            exit("Exiting: not all jobs completed successfully.")
+
+        self.logger.info("All jobs complete")
+
+
+class JobWorker(object):
+    DOC = """Usage:
+    queue_worker [--log-level=<log-level>] <queue-dir>
+
+Options:
+<queue-dir>
+    Directory, on a filesystem shared by all nodes, holding the work queue from
+    which commands will be pulled.
+{help_option_spec}
+    {help_option_description}
+{ver_option_spec}
+    {ver_option_description}
+{log_option_spec}
+    {log_option_description}
+
+queue_worker repeatedly pulls commands submitted by schedule_jobs or
+filter_control from a work queue, and executes them, one at a time. Any number
+of workers, on any number of nodes, may pull commands from the same queue. The
+worker exits once the queue has been shut down and no commands remain.
+"""
+    QUEUE_DIR = "<queue-dir>"
+
+    def __init__(self, commandline_parser):
+        self.commandline_parser = commandline_parser
+
+    def run(self, args):
+        """
+        Execute commands pulled from a work queue.
+
+        args: list of command line arguments
+        """
+        options = self.commandline_parser.parse(args, self.DOC)
+
+        try:
+            ParameterValidator.validate_log_level(options)
+            ParameterValidator.validate_dir_option(
+                options[JobWorker.QUEUE_DIR], "Queue directory does not exist")
+        except schema.SchemaError as exc:
+            exit("Exiting: " + exc.code)
+
+        self.logger = log.get_logger_for_options(options)
+
+        executors.QueueWorker(options[JobWorker.QUEUE_DIR], self.logger).run()
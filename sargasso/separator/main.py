@@ -1,7 +1,22 @@
+from sargasso.benchmark.filter_benchmark import FilterBenchmark
+from sargasso.benchmark.pipeline_benchmark import PipelineBenchmark
+from sargasso.classify.index_builder import KmerIndexBuilder
+from sargasso.classify.read_classifier import ReadClassifier
+from sargasso.filter.block_splitter import CombinedBlockSplitter
 from sargasso.filter.filter_controllers import FilterController
+from sargasso.filter.mapped_reads_collator import MappedReadsCollator
+from sargasso.filter.read_chunker import ReadChunker
+from sargasso.filter.read_collapser import ReadCollapser
+from sargasso.filter.read_name_compactor import ReadNameCompactor
+from sargasso.filter.read_order_checker import ReadOrderChecker
+from sargasso.filter.read_splitter import ReadSplitter
 from sargasso.filter.sample_filterer import SampleFilterer
+from sargasso.separator.commandline_parser import CommandlineParser
 from sargasso.separator.data_types import get_data_type_manager
+from sargasso.separator.genome_combiner import GenomeCombiner
+from sargasso.separator.job_scheduler import JobScheduler, JobWorker
 from sargasso.separator.separators import Separator
+from sargasso.separator.stage_recorder import RunReportWriter, StageRecorder
 
 
 def separate_species(args):
@@ -17,3 +32,67 @@ def filter_control(args):
 def filter_sample_reads(args):
     data_type_manager = get_data_type_manager(args, SampleFilterer.DOC)
     data_type_manager.get_sample_filterer().run(args)
+
+
+def schedule_jobs(args):
+    JobScheduler(CommandlineParser()).run(args)
+
+
+def queue_worker(args):
+    JobWorker(CommandlineParser()).run(args)
+
+
+def record_stage(args):
+    StageRecorder(CommandlineParser()).run(args)
+
+
+def write_run_report(args):
+    RunReportWriter(CommandlineParser()).run(args)
+
+
+def filter_benchmark(args):
+    FilterBenchmark(CommandlineParser()).run(args)
+
+
+def pipeline_benchmark(args):
+    PipelineBenchmark(CommandlineParser()).run(args)
+
+
+def split_reads(args):
+    ReadSplitter(CommandlineParser()).run(args)
+
+
+def build_kmer_index(args):
+    KmerIndexBuilder(CommandlineParser()).run(args)
+
+
+def classify_reads(args):
+    ReadClassifier(CommandlineParser()).run(args)
+
+
+def collapse_reads(args):
+    ReadCollapser(CommandlineParser()).run(args)
+
+
+def collate_mapped_reads(args):
+    MappedReadsCollator(CommandlineParser()).run(args)
+
+
+def compact_read_names(args):
+    ReadNameCompactor(CommandlineParser()).run(args)
+
+
+def check_read_order(args):
+    ReadOrderChecker(CommandlineParser()).run(args)
+
+
+def chunk_reads(args):
+    ReadChunker(CommandlineParser()).run(args)
+
+
+def split_combined_bam(args):
+    CombinedBlockSplitter(CommandlineParser()).run(args)
+
+
+def combine_genomes(args):
+    GenomeCombiner(CommandlineParser()).run(args)
@@ -23,6 +23,29 @@ DELETE_INTERMEDIATE = "--delete-intermediate"
 MAPPER_EXECUTABLE = "--mapper-executable"
 MAPPER_INDEX_EXECUTABLE = "--mapper-index-executable"
 SAMBAMBA_SORT_TMP_DIR = "--sambamba-sort-tmp-dir"
+MAX_MEMORY = "--max-memory"
+MAX_DISK = "--max-disk"
+MAPPER_MEMORY = "--mapper-memory"
+PROFILE = "--profile"
+TRACE_SAMPLE_RATE = "--trace-sample-rate"
+OUTPUT_FORMAT = "--output-format"
+DECIDE_ONLY = "--decide-only"
+KMER_PRECLASSIFY = "--kmer-preclassify"
+KMER_INDEX = "--kmer-index"
+COMBINED_GENOME = "--combined-genome"
+MASK_SEQUENCES = "--mask-sequences"
+COLLAPSE_DUPLICATES = "--collapse-duplicates"
+COMPACT_READ_NAMES = "--compact-read-names"
+PREMAPPED_BAMS = "--premapped-bams"
+NUM_CHUNKS = "--num-chunks"
+INTERMEDIATE_COMPRESSION = "--intermediate-compression"
+OUTPUT_COMPRESSION = "--output-compression"
+OUTPUT_THREADS = "--output-threads"
+BLOCK_DIR = "--block-dir"
+COORDINATE_SORT = "--coordinate-sort"
+COMPRESSION_LEVEL = "--compression-level"
+MAX_HITS_IN_MEMORY = "--max-hits-in-memory"
+QUEUE_DIR = "--queue-dir"
 
 SPECIES_NAME = "species-name"
 GTF_FILE = "gtf-file"
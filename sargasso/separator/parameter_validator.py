@@ -3,6 +3,7 @@ import schema
 import sargasso.separator.options as opts
 
 from schema import And, Or, Schema, Use
+from sargasso.filter import combined_hits, fastq_writer
 from sargasso.utils import log
 
 
@@ -28,6 +29,59 @@ class ParameterValidator(object):
                 options[opts.NUM_THREADS],
                 "Number of threads must be a positive integer",
                 min_val=1, nullable=True)
+            options[opts.NUM_CHUNKS] = cls.validate_int_option(
+                options[opts.NUM_CHUNKS],
+                "Number of chunks must be a positive integer", min_val=1)
+            options[opts.INTERMEDIATE_COMPRESSION] = \
+                cls.validate_compression_level(
+                    options[opts.INTERMEDIATE_COMPRESSION],
+                    "Intermediate compression level must be between 0 and 9")
+            options[opts.OUTPUT_COMPRESSION] = cls.validate_compression_level(
+                options[opts.OUTPUT_COMPRESSION],
+                "Output compression level must be between 0 and 9",
+                nullable=True)
+            options[opts.OUTPUT_THREADS] = cls.validate_int_option(
+                options[opts.OUTPUT_THREADS],
+                "Number of output threads must be a positive integer",
+                min_val=1, nullable=True)
+            cls.validate_dir_option(
+                options[opts.BLOCK_DIR], "Block directory does not exist",
+                nullable=True)
+            cls.validate_dict_option(
+                options[opts.OUTPUT_FORMAT], fastq_writer.OUTPUT_FORMATS,
+                "Invalid output format")
+            if options[opts.COORDINATE_SORT] and \
+                    not fastq_writer.writes_bam(options[opts.OUTPUT_FORMAT]):
+                raise schema.SchemaError(
+                    None, "Option {sort} requires BAM output".format(
+                        sort=opts.COORDINATE_SORT))
+            options[opts.DECIDE_ONLY] = cls.validate_list_option(
+                options[opts.DECIDE_ONLY], options[opts.SPECIES_ARG],
+                "Decide-only species must be separated species",
+                nullable=True)
+            options[opts.TRACE_SAMPLE_RATE] = cls.validate_float_option(
+                options[opts.TRACE_SAMPLE_RATE],
+                "Trace sample rate must be between 0 and 1",
+                min_val=0, max_val=1, nullable=True)
+            options[opts.MAX_HITS_IN_MEMORY] = cls.validate_int_option(
+                options[opts.MAX_HITS_IN_MEMORY],
+                "Maximum hits in memory must be a positive integer",
+                min_val=1, nullable=True)
+            cls.validate_dir_option(
+                options[opts.QUEUE_DIR], "Queue directory does not exist",
+                nullable=True)
+            options[opts.MAX_MEMORY] = cls.validate_float_option(
+                options[opts.MAX_MEMORY],
+                "Maximum memory must be a positive number of gigabytes",
+                min_val=0, nullable=True)
+            options[opts.MAX_DISK] = cls.validate_float_option(
+                options[opts.MAX_DISK],
+                "Maximum disk space must be a positive number of gigabytes",
+                min_val=0, nullable=True)
+            options[opts.MAPPER_MEMORY] = cls.validate_float_option(
+                options[opts.MAPPER_MEMORY],
+                "Mapper memory must be a positive number of gigabytes",
+                min_val=0)
             cls.validate_file_option(
                 options[opts.SAMPLES_FILE_ARG],
                 "Could not open samples definition file")
@@ -40,8 +94,34 @@ class ParameterValidator(object):
                 options, opts.MISMATCH_THRESHOLD, opts.MINMATCH_THRESHOLD,
                 opts.MULTIMAP_THRESHOLD)
 
-            for i, species in enumerate(options[opts.SPECIES_ARG]):
-                cls._validate_species_options(species, species_options[i])
+            # Species' genomes are not used when reads have already been
+            # mapped
+            if options[opts.PREMAPPED_BAMS]:
+                cls._validate_premapped_options(options)
+            else:
+                for i, species in enumerate(options[opts.SPECIES_ARG]):
+                    cls._validate_species_options(species, species_options[i])
+
+            cls.validate_file_option(
+                options[opts.MASK_SEQUENCES],
+                "Could not open mask sequences FASTA file", nullable=True)
+            cls.validate_file_option(
+                options[opts.KMER_INDEX], "Could not open k-mer index",
+                nullable=True)
+            if options[opts.KMER_PRECLASSIFY] and \
+                    options[opts.KMER_INDEX] is None:
+                for i, species in enumerate(options[opts.SPECIES_ARG]):
+                    if species_options[i][opts.GENOME_FASTA] is None:
+                        raise schema.SchemaError(
+                            None, ("Genome FASTA for species {species} is " +
+                                   "needed to build a k-mer index").format(
+                                species=species))
+
+            if options[opts.COMBINED_GENOME]:
+                cls._validate_combined_genome_options(options, species_options)
+
+            if options[opts.NUM_CHUNKS] > 1:
+                cls._validate_chunk_options(options)
 
             # TODO: validate that all samples consistently have either single- or
             # paired-end reads
@@ -51,6 +131,59 @@ class ParameterValidator(object):
         except schema.SchemaError as exc:
             exit("Exiting: " + exc.code)
 
+    @classmethod
+    def _validate_premapped_options(cls, options):
+        """
+        Validate that no stage preceding the mapping of reads is requested
+        when samples are given as BAM files of mapped reads.
+        """
+        for option in [opts.MASK_SEQUENCES, opts.COLLAPSE_DUPLICATES,
+                       opts.COMPACT_READ_NAMES, opts.KMER_PRECLASSIFY,
+                       opts.KMER_INDEX, opts.COMBINED_GENOME]:
+            if options[option]:
+                raise schema.SchemaError(
+                    None, "Option {option} cannot be used with {premapped}".
+                    format(option=option, premapped=opts.PREMAPPED_BAMS))
+
+    @classmethod
+    def _validate_chunk_options(cls, options):
+        """
+        Validate that each sample's reads may be split into chunks which are
+        mapped, sorted and filtered independently.
+        """
+        for option in [opts.COLLAPSE_DUPLICATES, opts.COMBINED_GENOME,
+                       opts.PREMAPPED_BAMS]:
+            if options[option]:
+                raise schema.SchemaError(
+                    None, "Option {option} cannot be used with {chunks}".
+                    format(option=option, chunks=opts.NUM_CHUNKS))
+
+    @classmethod
+    def _validate_combined_genome_options(cls, options, species_options):
+        """
+        Validate that reads may be mapped to a combined genome built from the
+        genomes of all species.
+        """
+        if options[opts.KMER_PRECLASSIFY] or options[opts.KMER_INDEX] is not None:
+            raise schema.SchemaError(
+                None, "K-mer pre-classification cannot be used with a " +
+                      "combined genome")
+
+        for i, species in enumerate(options[opts.SPECIES_ARG]):
+            if combined_hits.SPECIES_SEPARATOR in species or \
+                    species == combined_hits.COMBINED_NAME:
+                raise schema.SchemaError(
+                    None, ("Species name {species} may not contain '{sep}' " +
+                           "or be '{combined}' when using a combined " +
+                           "genome").format(
+                        species=species, sep=combined_hits.SPECIES_SEPARATOR,
+                        combined=combined_hits.COMBINED_NAME))
+            if species_options[i][opts.GENOME_FASTA] is None:
+                raise schema.SchemaError(
+                    None, ("Genome FASTA for species {species} is needed to " +
+                           "build a combined genome index").format(
+                        species=species))
+
     @classmethod
     def validate_log_level(cls, options):
         """
@@ -82,6 +215,31 @@ class ParameterValidator(object):
         return Schema(Use(lambda x: values_dict[x]), error=msg). \
             validate(dict_option)
 
+    @classmethod
+    def validate_list_option(cls, list_option, values, msg, nullable=False):
+        """
+        Check if a command line option is a list of permitted values.
+
+        Check if a command line option string is a comma-separated list, each
+        element of which is one of the specified values and, if so, return the
+        list. The option can be allowed to equal 'None' if 'nullable' is set to
+        True, in which case an empty list is returned. If any element is not a
+        permitted value, a SchemaError is raised.
+
+        list_option: The command line option, a string.
+        values: A list of permitted values.
+        msg: Text for the SchemaError exception raised if the test fails.
+        nullable: If set to True, the command line option is allowed to be 'None'
+        (i.e. the option has not been specified).
+        """
+        if nullable and list_option is None:
+            return []
+
+        msg = "{msg}: '{opt}'.".format(msg=msg, opt=list_option)
+        return Schema(And(Use(lambda x: x.split(",")),
+                          lambda l: all(v in values for v in l)),
+                      error=msg).validate(list_option)
+
     @classmethod
     def validate_dir_option(cls, dir_option, msg, should_exist=True, nullable=False):
         """
@@ -130,7 +288,8 @@ class ParameterValidator(object):
         Schema(validator, error=msg).validate(file_option)
 
     @classmethod
-    def validate_int_option(cls, int_option, msg, min_val=None, nullable=False):
+    def validate_int_option(cls, int_option, msg, min_val=None,
+                            nullable=False, max_val=None):
         """
         Check if a command line option is an integer.
 
@@ -145,16 +304,33 @@ class ParameterValidator(object):
         min_val: If set, the integer must be greater than or equal to this value.
         nullable: If set to True, the command line option is allowed to be 'None'
         (i.e. the option has not been specified).
+        max_val: If set, the integer must be less than or equal to this value.
         """
         msg = "{msg}: '{val}'".format(msg=msg, val=int_option)
         validator = Use(int)
         if min_val is not None:
             validator = And(validator, lambda x: x >= min_val)
+        if max_val is not None:
+            validator = And(validator, lambda x: x <= max_val)
         if nullable:
             validator = ParameterValidator._nullable_validator(validator)
 
         return Schema(validator, error=msg).validate(int_option)
 
+    @classmethod
+    def validate_compression_level(cls, level_option, msg, nullable=False):
+        """
+        Check if a command line option is a BGZF compression level, and, if
+        so, return the integer level, from 0 (uncompressed) to 9.
+
+        level_option: The command line option, a string.
+        msg: Text for the SchemaError exception raised if the test fails.
+        nullable: If set to True, the command line option is allowed to be 'None'
+        (i.e. the option has not been specified).
+        """
+        return cls.validate_int_option(
+            level_option, msg, min_val=0, max_val=9, nullable=nullable)
+
     @classmethod
     def validate_float_option(cls, float_option, msg, min_val=None,
                               max_val=None, nullable=False):
@@ -214,7 +390,8 @@ class ParameterValidator(object):
         """
         Validate all raw reads files exist.
         """
-        for reads_set in [sample_info.left_reads, sample_info.right_reads]:
+        for reads_set in [sample_info.left_reads, sample_info.right_reads,
+                          sample_info.mapped_reads]:
             for reads_file_list in reads_set.values():
                 for reads_file in reads_file_list:
                     if sample_info.base_reads_dir:
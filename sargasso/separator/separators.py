@@ -23,12 +23,13 @@ The available data types are:
         """
 
     def __init__(self, commandline_parser, parameter_validator,
-                 makefile_writer, executionrecord_writer):
+                 makefile_writer, executionrecord_writer, job_plan_writer):
 
         self.commandline_parser = commandline_parser
         self.parameter_validator = parameter_validator
         self.makefile_writer = makefile_writer
         self.executionrecord_writer = executionrecord_writer
+        self.job_plan_writer = job_plan_writer
 
     def run(self, args):
         options = self.commandline_parser.parse_parameters(args, self.DOC)
@@ -45,24 +46,35 @@ The available data types are:
         # Write Makefile to output directory
         self.makefile_writer.write(self.logger, options)
 
+        # If resource limits were specified, write a job plan via which
+        # samples will be processed concurrently within those limits
+        if self.job_plan_writer.scheduling_requested(options):
+            self.job_plan_writer.write(self.logger, options)
+
         # Write Execution Record to output directory
         self.executionrecord_writer.write(options)
 
-        # If specified, execute the Makefile with nohup
+        # If specified, execute the Makefile (or job plan) with nohup
         if options[opts.RUN_SEPARATION]:
             self._run_species_separation(options)
 
-    @classmethod
-    def _run_species_separation(cls, options):
+    def _run_species_separation(self, options):
         """
-        Executes the written Makefile with nohup.
+        Executes the written Makefile, or job plan, with nohup.
 
-        logger: logging object
         options: dictionary of command-line options
         """
+        if self.job_plan_writer.scheduling_requested(options):
+            command = ["nohup", "schedule_jobs",
+                       "{opt}={val}".format(opt=log.LOG_LEVEL_OPTION,
+                                            val=options[log.LOG_LEVEL_OPTION]),
+                       self.job_plan_writer.JOB_PLAN_FILE]
+        else:
+            command = ["nohup", "make"]
+
         cwd = os.getcwd()
         os.chdir(options[opts.OUTPUT_DIR_ARG])
-        subprocess.Popen(["nohup", "make"])
+        subprocess.Popen(command)
         os.chdir(cwd)
 
 class RnaSeqSeparator(Separator):
@@ -81,6 +93,22 @@ class RnaSeqSeparator(Separator):
         [--mapper-executable=<mapper-executable>]
         [--mapper-index-executable=<mapper-executable>]
         [--sambamba-sort-tmp-dir=<sambamba-sort-tmp-dir>]
+        [--intermediate-compression=<intermediate-compression>]
+        [--output-compression=<output-compression>]
+        [--output-threads=<output-threads>] [--block-dir=<block-dir>]
+        [--coordinate-sort]
+        [--max-memory=<max-memory>] [--max-disk=<max-disk>]
+        [--mapper-memory=<mapper-memory>]
+        [--kmer-preclassify] [--kmer-index=<kmer-index>]
+        [--combined-genome] [--mask-sequences=<mask-sequences>]
+        [--collapse-duplicates] [--compact-read-names]
+        [--premapped-bams] [--num-chunks=<num-chunks>]
+        [--output-format=<output-format>]
+        [--decide-only=<decide-only>]
+        [--profile]
+        [--trace-sample-rate=<trace-sample-rate>]
+        [--max-hits-in-memory=<max-hits-in-memory>]
+        [--queue-dir=<queue-dir>]
         <samples-file> <output-dir>
         (<species> <species-info>)
         (<species> <species-info>)
@@ -90,7 +118,8 @@ class RnaSeqSeparator(Separator):
 Options:
 <samples-file>
     TSV file giving paths (relative to <reads-base-dir>) of raw RNA-seq read
-    data files for each sample.
+    data files for each sample (or, if --premapped-bams is specified, of a BAM
+    file of mapped reads for each species).
 <output-dir>
     Output directory into which Makefile will be written, and in which species
     separation will be performed.
@@ -158,6 +187,122 @@ Options:
     same as <mapper-executable>  [default: STAR].
 --sambamba-sort-tmp-dir=<sambamba-sort-tmp-dir>
     Specify 'sambamba sort' temporary folder path [default: /tmp].
+--intermediate-compression=<intermediate-compression>
+    BGZF compression level, from 0 (uncompressed) to 9, of the intermediate
+    BAM files written by mapping, sorting and the filtering of each block of
+    reads, each of which is read once and then deleted [default: 1].
+--output-compression=<output-compression>
+    BGZF compression level, from 0 to 9, of the filtered BAM files written
+    for each sample and species. If not specified, the default level of
+    'sambamba merge' (or of pysam, when reads are filtered in one block) is
+    used.
+--output-threads=<output-threads>
+    Number of threads used to compress the filtered BAM files written for
+    each sample and species, when the output of each block of reads is merged
+    (by default, the value of "--num-threads").
+--block-dir=<block-dir>
+    Directory, for example on a memory-backed filesystem, in which the block
+    files into which mapped reads are divided for filtering are written, in
+    place of the "Blocks" directory in the filtered reads directory. When
+    filtering is distributed via a work queue, this directory must be shared
+    between nodes.
+--coordinate-sort
+    If specified, the filtered BAM files written for each sample and species
+    are sorted by coordinate and indexed, rather than sorted by read name.
+--max-memory=<max-memory>
+    Maximum total memory, in gigabytes, to be used by concurrently running
+    jobs. If this option or "--max-disk" is specified, the stages of species
+    separation are run for several samples concurrently by a job scheduler,
+    rather than for one sample at a time via the Makefile; the number of
+    cores used is limited by "--num-threads".
+--max-disk=<max-disk>
+    Maximum total disk space, in gigabytes, to be occupied by intermediate
+    and output files written by concurrently running jobs (see
+    "--max-memory").
+--mapper-memory=<mapper-memory>
+    Memory, in gigabytes, required by each instance of the read aligner when
+    running jobs via the job scheduler [default: 32].
+--kmer-preclassify
+    If specified, before reads are mapped, they are classified by the k-mers
+    they contain, using an index of the k-mers occurring in only one species'
+    genome, built from the species' genome FASTA files. Reads containing
+    k-mers unique to one species' genome, and none unique to any other, are
+    mapped only to that species' genome; only the remaining reads are mapped
+    to every species' genome.
+--kmer-index=<kmer-index>
+    K-mer index, previously built by build_kmer_index for the same species,
+    used to classify reads before mapping (implies "--kmer-preclassify"; the
+    index need not then be built from genome FASTA files).
+--combined-genome
+    If specified, a single STAR index is built from the genomes of all species,
+    with the name of each contig prefixed by that of its species, and the reads
+    of each sample are mapped only once, to this combined genome, rather than
+    to each species' genome in turn; mapped reads are then filtered without
+    being sorted. A GTF file and genome FASTA directory must be specified for
+    each species, and "--mapper-memory" should allow for the size of the
+    combined index.
+--mask-sequences=<mask-sequences>
+    FASTA file of sequences (e.g. rRNA, mitochondrial or adapter sequences) to
+    which reads are mapped, with STAR, before being mapped to each species'
+    genome; reads (or read pairs) aligning to these sequences are discarded.
+    The FASTA file must not be compressed.
+--premapped-bams
+    If specified, each line of <samples-file> gives a sample name followed by
+    a BAM file of the sample's reads already mapped to each species' genome,
+    in the order species are specified; reads are then sorted (unless already
+    in read name order) and filtered, without being mapped again. In this
+    case <species-info> is not used, and may be given as "-". This option
+    cannot be combined with options for stages preceding mapping.
+--compact-read-names
+    If specified, the name of each read is replaced, when raw reads are
+    collated, by a compact read ID, its index in the sample's FASTQ files
+    zero-padded to a fixed width; this makes mapped reads smaller, and cheaper
+    to sort and filter. Original read names are restored when filtered reads
+    are written.
+--collapse-duplicates
+    If specified, reads (or read pairs) with identical sequences are collapsed
+    into a single representative read before mapping, so that each distinct
+    sequence is mapped and filtered only once; the species assigned to each
+    representative read is then assigned to every read it stands for, and
+    each such read is written and counted separately.
+--num-chunks=<num-chunks>
+    Number of chunks into which the reads (or read pairs) of each sample are
+    split when raw reads are collated. Each chunk is mapped and sorted
+    independently of the others, and the chunks of a sample are filtered
+    concurrently and their filtered reads merged; when jobs are run via the
+    job scheduler, the chunks of a sample may be mapped and sorted
+    concurrently. This option cannot be used with "--collapse-duplicates",
+    "--combined-genome" or "--premapped-bams" [default: 1].
+--output-format=<output-format>
+    Format in which the reads assigned to each species are written: "bam"
+    for filtered BAM files, "fastq" for gzipped FASTQ files, written from the
+    reads' primary alignments, or "both". If "assignments", neither is
+    written; instead, the species to which each read was assigned is
+    recorded in a single file for each sample, which split_reads can use to
+    split the sample's original reads by species. "--coordinate-sort"
+    requires BAM files to be written [default: bam].
+--decide-only=<decide-only>
+    Comma-separated list of species whose filtered reads are not needed.
+    These species still take part in every filtering decision, and the reads
+    assigned to them are counted, but no filtered files are written for them.
+--profile
+    If specified, filtering of each block of reads is profiled, and a
+    profiling report is written for each sample to the filtered reads
+    directory. Profiling slows filtering considerably.
+--trace-sample-rate=<trace-sample-rate>
+    If specified, the filtering decisions made for approximately this
+    fraction (between 0 and 1) of reads, along with the values on which they
+    were based, are written to a decision trace file for each sample.
+--max-hits-in-memory=<max-hits-in-memory>
+    If specified, at most this many hits for each read and species, besides
+    the read's primary hits, are held in memory during filtering; further
+    hits are written to a temporary file, and read again only if the read is
+    assigned to that species. Filtering decisions are unchanged.
+--queue-dir=<queue-dir>
+    Directory, on a filesystem shared by all nodes, holding a work queue to
+    which the filtering of each block of reads is submitted, to be run by
+    instances of queue_worker, rather than being run locally. The output
+    directory (and any "--block-dir") must also be shared between nodes.
 {help_option_spec}
     {help_option_description}
 {ver_option_spec}
@@ -210,6 +355,22 @@ Usage:
         [--mapper-executable=<mapper-executable>]
         [--mapper-index-executable=<mapper-index-executable>]
         [--sambamba-sort-tmp-dir=<sambamba-sort-tmp-dir>]
+        [--intermediate-compression=<intermediate-compression>]
+        [--output-compression=<output-compression>]
+        [--output-threads=<output-threads>] [--block-dir=<block-dir>]
+        [--coordinate-sort]
+        [--max-memory=<max-memory>] [--max-disk=<max-disk>]
+        [--mapper-memory=<mapper-memory>]
+        [--kmer-preclassify] [--kmer-index=<kmer-index>]
+        [--combined-genome] [--mask-sequences=<mask-sequences>]
+        [--collapse-duplicates] [--compact-read-names]
+        [--premapped-bams] [--num-chunks=<num-chunks>]
+        [--output-format=<output-format>]
+        [--decide-only=<decide-only>]
+        [--profile]
+        [--trace-sample-rate=<trace-sample-rate>]
+        [--max-hits-in-memory=<max-hits-in-memory>]
+        [--queue-dir=<queue-dir>]
         <samples-file> <output-dir>
         (<species> <species-info>)
         (<species> <species-info>)
@@ -219,7 +380,8 @@ Usage:
 Options:
 <samples-file>
     TSV file giving paths (relative to <reads-base-dir>) of raw RNA-seq read
-    data files for each sample.
+    data files for each sample (or, if --premapped-bams is specified, of a BAM
+    file of mapped reads for each species).
 <output-dir>
     Output directory into which Makefile will be written, and in which species
     separation will be performed.
@@ -287,6 +449,123 @@ Options:
     version of bowtie2 [default: bowtie2-build].
 --sambamba-sort-tmp-dir=<sambamba-sort-tmp-dir>
     Specify 'sambamba sort' temporary folder path [default: /tmp].
+--intermediate-compression=<intermediate-compression>
+    BGZF compression level, from 0 (uncompressed) to 9, of the intermediate
+    BAM files written by mapping, sorting and the filtering of each block of
+    reads, each of which is read once and then deleted [default: 1].
+--output-compression=<output-compression>
+    BGZF compression level, from 0 to 9, of the filtered BAM files written
+    for each sample and species. If not specified, the default level of
+    'sambamba merge' (or of pysam, when reads are filtered in one block) is
+    used.
+--output-threads=<output-threads>
+    Number of threads used to compress the filtered BAM files written for
+    each sample and species, when the output of each block of reads is merged
+    (by default, the value of "--num-threads").
+--block-dir=<block-dir>
+    Directory, for example on a memory-backed filesystem, in which the block
+    files into which mapped reads are divided for filtering are written, in
+    place of the "Blocks" directory in the filtered reads directory. When
+    filtering is distributed via a work queue, this directory must be shared
+    between nodes.
+--coordinate-sort
+    If specified, the filtered BAM files written for each sample and species
+    are sorted by coordinate and indexed, rather than sorted by read name.
+--max-memory=<max-memory>
+    Maximum total memory, in gigabytes, to be used by concurrently running
+    jobs. If this option or "--max-disk" is specified, the stages of species
+    separation are run for several samples concurrently by a job scheduler,
+    rather than for one sample at a time via the Makefile; the number of
+    cores used is limited by "--num-threads".
+--max-disk=<max-disk>
+    Maximum total disk space, in gigabytes, to be occupied by intermediate
+    and output files written by concurrently running jobs (see
+    "--max-memory").
+--mapper-memory=<mapper-memory>
+    Memory, in gigabytes, required by each instance of the read aligner when
+    running jobs via the job scheduler [default: 8].
+--kmer-preclassify
+    If specified, before reads are mapped, they are classified by the k-mers
+    they contain, using an index of the k-mers occurring in only one species'
+    genome, built from the species' genome FASTA files. Reads containing
+    k-mers unique to one species' genome, and none unique to any other, are
+    mapped only to that species' genome; only the remaining reads are mapped
+    to every species' genome.
+--kmer-index=<kmer-index>
+    K-mer index, previously built by build_kmer_index for the same species,
+    used to classify reads before mapping (implies "--kmer-preclassify"; the
+    index need not then be built from genome FASTA files).
+--combined-genome
+    If specified, a single Bowtie2 index is built from the genomes of all species,
+    with the name of each contig prefixed by that of its species, and the reads
+    of each sample are mapped only once, to this combined genome, rather than
+    to each species' genome in turn; mapped reads are then filtered without
+    being sorted. A genome FASTA file must be specified for
+    each species, and "--mapper-memory" should allow for the size of the
+    combined index.
+--mask-sequences=<mask-sequences>
+    FASTA file of sequences (e.g. rRNA, mitochondrial or adapter sequences) to
+    which reads are mapped, with Bowtie2, before being mapped to each species'
+    genome; reads (or read pairs) aligning to these sequences are discarded.
+--premapped-bams
+    If specified, each line of <samples-file> gives a sample name followed by
+    a BAM file of the sample's reads already mapped to each species' genome,
+    in the order species are specified; reads are then sorted (unless already
+    in read name order) and filtered, without being mapped again. In this
+    case <species-info> is not used, and may be given as "-". This option
+    cannot be combined with options for stages preceding mapping.
+--compact-read-names
+    If specified, the name of each read is replaced, when raw reads are
+    collated, by a compact read ID, its index in the sample's FASTQ files
+    zero-padded to a fixed width; this makes mapped reads smaller, and cheaper
+    to sort and filter. Original read names are restored when filtered reads
+    are written.
+--collapse-duplicates
+    If specified, reads (or read pairs) with identical sequences are collapsed
+    into a single representative read before mapping, so that each distinct
+    sequence is mapped and filtered only once; the species assigned to each
+    representative read is then assigned to every read it stands for, and
+    each such read is written and counted separately. As Bowtie2 alignment
+    scores take account of base qualities, reads are assigned, and written,
+    using the base qualities of their representative read.
+--num-chunks=<num-chunks>
+    Number of chunks into which the reads (or read pairs) of each sample are
+    split when raw reads are collated. Each chunk is mapped and sorted
+    independently of the others, and the chunks of a sample are filtered
+    concurrently and their filtered reads merged; when jobs are run via the
+    job scheduler, the chunks of a sample may be mapped and sorted
+    concurrently. This option cannot be used with "--collapse-duplicates",
+    "--combined-genome" or "--premapped-bams" [default: 1].
+--output-format=<output-format>
+    Format in which the reads assigned to each species are written: "bam"
+    for filtered BAM files, "fastq" for gzipped FASTQ files, written from the
+    reads' primary alignments, or "both". If "assignments", neither is
+    written; instead, the species to which each read was assigned is
+    recorded in a single file for each sample, which split_reads can use to
+    split the sample's original reads by species. "--coordinate-sort"
+    requires BAM files to be written [default: bam].
+--decide-only=<decide-only>
+    Comma-separated list of species whose filtered reads are not needed.
+    These species still take part in every filtering decision, and the reads
+    assigned to them are counted, but no filtered files are written for them.
+--profile
+    If specified, filtering of each block of reads is profiled, and a
+    profiling report is written for each sample to the filtered reads
+    directory. Profiling slows filtering considerably.
+--trace-sample-rate=<trace-sample-rate>
+    If specified, the filtering decisions made for approximately this
+    fraction (between 0 and 1) of reads, along with the values on which they
+    were based, are written to a decision trace file for each sample.
+--max-hits-in-memory=<max-hits-in-memory>
+    If specified, at most this many hits for each read and species, besides
+    the read's primary hits, are held in memory during filtering; further
+    hits are written to a temporary file, and read again only if the read is
+    assigned to that species. Filtering decisions are unchanged.
+--queue-dir=<queue-dir>
+    Directory, on a filesystem shared by all nodes, holding a work queue to
+    which the filtering of each block of reads is submitted, to be run by
+    instances of queue_worker, rather than being run locally. The output
+    directory (and any "--block-dir") must also be shared between nodes.
 {help_option_spec}
     {help_option_description}
 {ver_option_spec}
@@ -0,0 +1,119 @@
+import schema
+
+from sargasso.separator.parameter_validator import ParameterValidator
+from sargasso.utils import log, telemetry
+
+
+class StageRecorder(object):
+    DOC = """Usage:
+    record_stage [--log-level=<log-level>]
+        <telemetry-dir> <stage-name> [--] <command>...
+
+Options:
+<telemetry-dir>
+    Directory in which stage status files and resource usage records are
+    written.
+<stage-name>
+    Name of the stage of species separation performed by the command.
+<command>
+    Command, and its arguments, to be run.
+{help_option_spec}
+    {help_option_description}
+{ver_option_spec}
+    {ver_option_description}
+{log_option_spec}
+    {log_option_description}
+
+record_stage runs a command performing one stage of species separation. While
+the command runs, a status file "<stage-name>.status" recording the time
+elapsed is periodically updated; once it completes, a record of the command's
+wall time, CPU time, peak memory usage, and bytes read and written, is written
+to the file "<stage-name>.json". record_stage exits with the return code of the
+command.
+
+In normal operation, the user should not need to execute this script by hand
+themselves.
+"""
+    TELEMETRY_DIR = "<telemetry-dir>"
+    STAGE_NAME = "<stage-name>"
+    COMMAND = "<command>"
+
+    def __init__(self, commandline_parser):
+        self.commandline_parser = commandline_parser
+
+    def run(self, args):
+        """
+        Run a command, recording its resource usage.
+
+        args: list of command line arguments
+        """
+        options = self.commandline_parser.parse(args, self.DOC)
+
+        try:
+            ParameterValidator.validate_log_level(options)
+        except schema.SchemaError as exc:
+            exit("Exiting: " + exc.code)
+
+        self.logger = log.get_logger_for_options(options)
+
+        return_code = telemetry.record_stage(
+            options[StageRecorder.TELEMETRY_DIR],
+            options[StageRecorder.STAGE_NAME],
+            options[StageRecorder.COMMAND])
+
+        if return_code != 0:
+            self.logger.error("Stage {s} failed with return code {r}".format(
+                s=options[StageRecorder.STAGE_NAME], r=return_code))
+            exit(return_code)
+
+
+class RunReportWriter(object):
+    DOC = """Usage:
+    write_run_report [--log-level=<log-level>] <telemetry-dir> <report-file>
+
+Options:
+<telemetry-dir>
+    Directory in which stage resource usage records were written by
+    record_stage.
+<report-file>
+    JSON file to which the run report will be written.
+{help_option_spec}
+    {help_option_description}
+{ver_option_spec}
+    {ver_option_description}
+{log_option_spec}
+    {log_option_description}
+
+write_run_report combines the resource usage records written for each stage of
+species separation into a single JSON run report, which also contains the
+total resources used by all stages.
+
+In normal operation, the user should not need to execute this script by hand
+themselves.
+"""
+    TELEMETRY_DIR = "<telemetry-dir>"
+    REPORT_FILE = "<report-file>"
+
+    def __init__(self, commandline_parser):
+        self.commandline_parser = commandline_parser
+
+    def run(self, args):
+        """
+        Write a run report from stage resource usage records.
+
+        args: list of command line arguments
+        """
+        options = self.commandline_parser.parse(args, self.DOC)
+
+        try:
+            ParameterValidator.validate_log_level(options)
+        except schema.SchemaError as exc:
+            exit("Exiting: " + exc.code)
+
+        self.logger = log.get_logger_for_options(options)
+
+        telemetry.write_run_report(options[RunReportWriter.TELEMETRY_DIR],
+                                   options[RunReportWriter.REPORT_FILE])
+
+        self.logger.info("Wrote run report {r}".format(
+            r=options[RunReportWriter.REPORT_FILE]))
@@ -0,0 +1,393 @@
+"""
+Classes for executing commands, either locally or by worker processes, which
+may run on any number of nodes, pulling commands from a work queue held in a
+directory on a shared filesystem. Exports:
+
+LocalExecutor: Run commands as local subprocesses.
+QueueExecutor: Submit commands to a shared-filesystem work queue.
+LocalClusterExecutor: Submit commands to a work queue served by several local
+worker processes.
+QueueWorker: Execute commands pulled from a shared-filesystem work queue.
+get_executor: Return an executor for command-line specified options.
+is_serving_queue: Return True if running as a command pulled from a queue.
+"""
+
+import errno
+import json
+import os
+import os.path
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+import uuid
+
+PENDING_DIR = "pending"
+RUNNING_DIR = "running"
+DONE_DIR = "done"
+SHUTDOWN_FILE = "shutdown"
+
+# Set, in the environment of each command run by a queue worker, to the
+# directory of the queue from which the command was pulled
+QUEUE_DIR_VARIABLE = "SARGASSO_SERVING_QUEUE_DIR"
+
+_NAME = "name"
+_COMMAND = "command"
+_CWD = "cwd"
+_LOG = "log"
+_RETURN_CODE = "return_code"
+_WORKER = "worker"
+_HOST = "host"
+_PID = "pid"
+
+
+def _write_json_atomically(path, contents):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as out_file:
+        json.dump(contents, out_file)
+    os.rename(tmp_path, path)
+
+
+def _makedirs(directory):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+
+def _is_process_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as exc:
+        return exc.errno != errno.ESRCH
+    return True
+
+
+class Executor(object):
+    """
+    Executes commands, returning a handle via which each command's progress
+    can be monitored.
+    """
+    POLL_INTERVAL = 2
+
+    def submit(self, name, command, log_path=None):
+        """
+        Start execution of a command, and return a handle for it.
+
+        name: name of the command, used to identify it in logs.
+        command: list of command line arguments.
+        log_path: file to which command output will be written, or None if the
+        output should be written to the executor's own output streams.
+        """
+        raise NotImplementedError('Need to implement in subclass')
+
+    def poll(self, handle):
+        """
+        Return the command's return code if it has finished, otherwise None.
+
+        handle: handle returned by 'submit'.
+        """
+        raise NotImplementedError('Need to implement in subclass')
+
+    def wait(self, handle):
+        """
+        Wait for a command to finish, and return its return code.
+
+        handle: handle returned by 'submit'.
+        """
+        while True:
+            return_code = self.poll(handle)
+            if return_code is not None:
+                return return_code
+            time.sleep(self.POLL_INTERVAL)
+
+    def shutdown(self):
+        """
+        Release any resources held by the executor.
+        """
+        pass
+
+
+class LocalExecutor(Executor):
+    def submit(self, name, command, log_path=None):
+        if log_path is None:
+            return subprocess.Popen(command)
+
+        with open(log_path, 'w') as log_file:
+            return subprocess.Popen(
+                command, stdout=log_file, stderr=subprocess.STDOUT)
+
+    def poll(self, handle):
+        return handle.poll()
+
+    def wait(self, handle):
+        return handle.wait()
+
+
+class QueueExecutor(Executor):
+    """
+    Submits commands to a work queue held in a directory on a shared
+    filesystem, from which they are pulled and executed by QueueWorker
+    instances. Commands are run in the directory from which they were
+    submitted, which must therefore also be on the shared filesystem.
+    """
+
+    def __init__(self, queue_dir):
+        self.queue_dir = queue_dir
+        for sub_dir in [PENDING_DIR, RUNNING_DIR, DONE_DIR]:
+            _makedirs(os.path.join(queue_dir, sub_dir))
+
+    def submit(self, name, command, log_path=None):
+        handle = "{t:.6f}-{n}-{u}".format(
+            t=time.time(), n=name, u=uuid.uuid4().hex)
+
+        _write_json_atomically(
+            os.path.join(self.queue_dir, PENDING_DIR, handle + ".json"),
+            {_NAME: name, _COMMAND: command, _CWD: os.getcwd(),
+             _LOG: os.path.abspath(log_path) if log_path else None})
+
+        return handle
+
+    def poll(self, handle):
+        done_file = os.path.join(self.queue_dir, DONE_DIR, handle + ".json")
+        if not os.path.exists(done_file):
+            return None
+
+        with open(done_file) as done:
+            return json.load(done)[_RETURN_CODE]
+
+
+class LocalClusterExecutor(QueueExecutor):
+    """
+    Submits commands to a work queue served by several QueueWorker processes
+    running on the local machine; this exercises the same code paths as
+    execution across several nodes, without requiring a cluster.
+    """
+
+    def __init__(self, num_workers, queue_dir=None, log_level="info"):
+        self.remove_queue_dir = queue_dir is None
+        QueueExecutor.__init__(
+            self, tempfile.mkdtemp(prefix="sargasso_queue_")
+            if queue_dir is None else queue_dir)
+
+        self.workers = [subprocess.Popen(
+            ["queue_worker", "--log-level=" + log_level, self.queue_dir])
+            for i in range(num_workers)]
+
+    def shutdown(self):
+        open(os.path.join(self.queue_dir, SHUTDOWN_FILE), 'w').close()
+
+        for worker in self.workers:
+            worker.wait()
+
+        if self.remove_queue_dir:
+            shutil.rmtree(self.queue_dir)
+
+
+class QueueWorker(object):
+    """
+    Repeatedly pulls commands from a shared-filesystem work queue and executes
+    them, until the queue is empty and has been shut down.
+
+    While a command runs, the worker periodically touches the command's file
+    in the 'running' directory, which also records the worker's host and
+    process ID. A command whose worker has stopped doing so, or whose worker
+    is known to have died, is returned to the 'pending' directory, to be run
+    again by another worker.
+    """
+    POLL_INTERVAL = 2
+    HEARTBEAT_INTERVAL = 30
+    STALE_TIMEOUT = 600
+
+    def __init__(self, queue_dir, logger):
+        self.queue_dir = queue_dir
+        self.logger = logger
+        for sub_dir in [PENDING_DIR, RUNNING_DIR, DONE_DIR]:
+            _makedirs(os.path.join(queue_dir, sub_dir))
+        self.host = socket.gethostname()
+        self.pid = os.getpid()
+        self.worker_id = "{h}-{p}".format(h=self.host, p=self.pid)
+        self.last_stale_check = None
+
+    def _claim_next_command(self):
+        """
+        Claim the oldest pending command, and return its handle, or None if no
+        commands are pending. Commands are claimed by renaming them into the
+        'running' directory; as renaming is atomic, each command is claimed by
+        exactly one worker.
+        """
+        pending_dir = os.path.join(self.queue_dir, PENDING_DIR)
+
+        for command_file in sorted(os.listdir(pending_dir)):
+            if not command_file.endswith(".json"):
+                continue
+            pending_file = os.path.join(pending_dir, command_file)
+            try:
+                # Renaming preserves the file's modification time, which is
+                # refreshed so that the claimed command is not taken as stale
+                os.utime(pending_file, None)
+                os.rename(pending_file,
+                          os.path.join(self.queue_dir, RUNNING_DIR,
+                                       command_file))
+                return command_file[:-len(".json")]
+            except OSError:
+                # Another worker claimed this command first
+                pass
+
+        return None
+
+    def _is_stale(self, running_file):
+        """
+        Return True if the worker running a command has died, or has not
+        touched the command's file for longer than STALE_TIMEOUT seconds.
+        """
+        try:
+            modified = os.path.getmtime(running_file)
+            with open(running_file) as running:
+                spec = json.load(running)
+        except (OSError, IOError, ValueError):
+            # The command has finished, or been claimed or re-queued by
+            # another worker
+            return False
+
+        if spec.get(_HOST) == self.host and _PID in spec and \
+                not _is_process_running(spec[_PID]):
+            return True
+
+        return time.time() - modified > QueueWorker.STALE_TIMEOUT
+
+    def _requeue_stale_commands(self):
+        """
+        Return each command whose worker has died to the 'pending' directory,
+        unless the command had already finished.
+        """
+        running_dir = os.path.join(self.queue_dir, RUNNING_DIR)
+
+        for command_file in sorted(os.listdir(running_dir)):
+            running_file = os.path.join(running_dir, command_file)
+            if not command_file.endswith(".json") or \
+                    not self._is_stale(running_file):
+                continue
+
+            try:
+                if os.path.exists(os.path.join(
+                        self.queue_dir, DONE_DIR, command_file)):
+                    os.remove(running_file)
+                else:
+                    os.rename(running_file, os.path.join(
+                        self.queue_dir, PENDING_DIR, command_file))
+                    self.logger.warning(
+                        "Worker {w} re-queued stale command {c}".format(
+                            w=self.worker_id, c=command_file[:-len(".json")]))
+            except OSError:
+                # Another worker re-queued this command first
+                pass
+
+    def _run_command(self, spec, running_file, log_file):
+        """
+        Run a command, touching its file in the 'running' directory every
+        HEARTBEAT_INTERVAL seconds until it finishes, and return its return
+        code.
+        """
+        environment = dict(os.environ)
+        environment[QUEUE_DIR_VARIABLE] = os.path.realpath(self.queue_dir)
+
+        process = subprocess.Popen(
+            spec[_COMMAND], cwd=spec[_CWD], env=environment, stdout=log_file,
+            stderr=subprocess.STDOUT if log_file else None)
+
+        last_heartbeat = time.time()
+        while process.poll() is None:
+            time.sleep(QueueWorker.POLL_INTERVAL)
+            if time.time() - last_heartbeat >= QueueWorker.HEARTBEAT_INTERVAL:
+                try:
+                    os.utime(running_file, None)
+                except OSError:
+                    self.logger.warning(
+                        "Command {n} is no longer recorded as running".format(
+                            n=spec[_NAME]))
+                last_heartbeat = time.time()
+
+        return process.returncode
+
+    def _execute(self, handle):
+        running_file = os.path.join(
+            self.queue_dir, RUNNING_DIR, handle + ".json")
+        with open(running_file) as running:
+            spec = json.load(running)
+
+        spec[_WORKER] = self.worker_id
+        spec[_HOST] = self.host
+        spec[_PID] = self.pid
+        _write_json_atomically(running_file, spec)
+
+        self.logger.info("Worker {w} running {n}".format(
+            w=self.worker_id, n=spec[_NAME]))
+
+        try:
+            if spec[_LOG] is None:
+                return_code = self._run_command(spec, running_file, None)
+            else:
+                with open(spec[_LOG], 'w') as log_file:
+                    return_code = self._run_command(
+                        spec, running_file, log_file)
+        except OSError as exc:
+            self.logger.error("Could not run {n}: {e}".format(
+                n=spec[_NAME], e=exc))
+            return_code = 127
+
+        spec[_RETURN_CODE] = return_code
+        _write_json_atomically(
+            os.path.join(self.queue_dir, DONE_DIR, handle + ".json"), spec)
+        try:
+            os.remove(running_file)
+        except OSError:
+            # The command was taken as stale, and re-queued
+            pass
+
+    def run(self):
+        while True:
+            if self.last_stale_check is None or time.time() - \
+                    self.last_stale_check >= QueueWorker.HEARTBEAT_INTERVAL:
+                self._requeue_stale_commands()
+                self.last_stale_check = time.time()
+
+            handle = self._claim_next_command()
+
+            if handle is not None:
+                self._execute(handle)
+            elif os.path.exists(os.path.join(self.queue_dir, SHUTDOWN_FILE)):
+                break
+            else:
+                time.sleep(QueueWorker.POLL_INTERVAL)
+
+
+def is_serving_queue(queue_dir):
+    """
+    Return True if this process was started by a queue worker, to run a
+    command pulled from the work queue in the specified directory. Commands
+    submitted to that queue by such a process, and waited for, might never
+    run, if every worker is similarly waiting.
+
+    queue_dir: work queue directory.
+    """
+    serving_dir = os.environ.get(QUEUE_DIR_VARIABLE)
+    return serving_dir is not None and \
+        serving_dir == os.path.realpath(queue_dir)
+
+
+def get_executor(queue_dir=None, local_workers=None, log_level="info"):
+    """
+    Return an executor appropriate to command-line specified options.
+
+    queue_dir: If specified, a shared-filesystem work queue directory to
+    which commands will be submitted.
+    local_workers: If specified, the number of local worker processes which
+    will execute commands submitted to a work queue.
+    log_level: Logging level for any local worker processes.
+    """
+    if local_workers is not None:
+        return LocalClusterExecutor(local_workers, queue_dir, log_level)
+    elif queue_dir is not None:
+        return QueueExecutor(queue_dir)
+
+    return LocalExecutor()
@@ -0,0 +1,198 @@
+"""
+Utility functions and classes for profiling the CPU and memory usage of
+filtering, and for merging the profiles of filtering several blocks into a
+single report. Exports:
+
+Profiler: Collect CPU, memory and phase timing profiles for a process.
+write_merged_report: Merge profiles written by several processes into a report.
+"""
+
+import cProfile
+import functools
+import json
+import os.path
+import pstats
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+CPU_PROFILE_SUFFIX = ".prof"
+PROFILE_SUFFIX = ".profile.json"
+
+PHASE_TIMES = "phase_times"
+PHASE_CALLS = "phase_calls"
+PEAK_MEMORY = "peak_memory_mb"
+TOP_ALLOCATIONS = "top_allocations"
+
+NUM_TOP_ALLOCATIONS = 10
+NUM_TOP_FUNCTIONS = 30
+
+_BYTES_PER_MB = 1024.0 * 1024
+
+
+class Profiler(object):
+    """
+    Collects cProfile statistics, tracemalloc memory allocation statistics
+    (where available), and the time spent in coarse phases of processing, for
+    the current process.
+
+    Phase timings are collected by wrapping the functions which perform each
+    phase; the time recorded for a phase excludes the time spent in any other
+    wrapped function which it calls, so that phase times can be summed.
+    """
+
+    def __init__(self, output_prefix):
+        """
+        Create object.
+        output_prefix: prefix of the paths of the files to which profiles will
+        be written.
+        """
+        self.output_prefix = output_prefix
+        self.cpu_profile = cProfile.Profile()
+        self.phase_times = {}
+        self.phase_calls = {}
+        self.phase_stack = []
+        self.peak_memory = 0
+        self.peak_snapshot = None
+
+    def start(self):
+        if tracemalloc is not None:
+            tracemalloc.start()
+        self.cpu_profile.enable()
+
+    def wrap(self, phase, func):
+        """
+        Return a function which calls 'func', recording the time spent in it
+        against the specified phase.
+
+        phase: name of the phase of processing performed by the function.
+        func: function to be timed.
+        """
+        self.phase_times.setdefault(phase, 0.0)
+        self.phase_calls.setdefault(phase, 0)
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            # Time spent in this call is excluded from the phase of any
+            # enclosing wrapped call
+            self.phase_stack.append(0.0)
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.time() - start
+                inner = self.phase_stack.pop()
+                self.phase_times[phase] += elapsed - inner
+                self.phase_calls[phase] += 1
+                if self.phase_stack:
+                    self.phase_stack[-1] += elapsed
+
+        return timed
+
+    def sample_memory(self):
+        """
+        Record a snapshot of current memory allocations, if more memory is
+        currently allocated than at any previous sample.
+        """
+        if tracemalloc is None:
+            return
+
+        current = tracemalloc.get_traced_memory()[0]
+        if current > self.peak_memory:
+            self.peak_memory = current
+            self.peak_snapshot = tracemalloc.take_snapshot()
+
+    def stop(self):
+        """
+        Stop profiling, and write the CPU profile and a JSON file containing
+        phase timings and memory allocation statistics.
+        """
+        self.cpu_profile.disable()
+        self.cpu_profile.dump_stats(self.output_prefix + CPU_PROFILE_SUFFIX)
+
+        profile = {PHASE_TIMES: self.phase_times,
+                   PHASE_CALLS: self.phase_calls,
+                   PEAK_MEMORY: None,
+                   TOP_ALLOCATIONS: []}
+
+        if tracemalloc is not None:
+            profile[PEAK_MEMORY] = \
+                tracemalloc.get_traced_memory()[1] / _BYTES_PER_MB
+            if self.peak_snapshot is not None:
+                profile[TOP_ALLOCATIONS] = [
+                    [str(s.traceback), s.size / _BYTES_PER_MB, s.count]
+                    for s in self.peak_snapshot.statistics("lineno")
+                    [:NUM_TOP_ALLOCATIONS]]
+            tracemalloc.stop()
+
+        with open(self.output_prefix + PROFILE_SUFFIX, 'w') as profile_file:
+            json.dump(profile, profile_file, indent=2, sort_keys=True)
+
+
+def write_merged_report(output_prefixes, report_prefix):
+    """
+    Merge the profiles written by several processes, writing a merged CPU
+    profile, and a text report of the total time spent in each phase of
+    processing, peak memory usage and the most expensive functions.
+
+    output_prefixes: list of prefixes of the paths of profiles written by
+    Profiler instances; profiles which do not exist are ignored.
+    report_prefix: prefix of the paths of the merged profile and report.
+    """
+    output_prefixes = [p for p in output_prefixes
+                       if os.path.isfile(p + PROFILE_SUFFIX)]
+
+    phase_times = {}
+    phase_calls = {}
+    peak_memories = []
+    top_allocations = []
+
+    for prefix in output_prefixes:
+        with open(prefix + PROFILE_SUFFIX) as profile_file:
+            profile = json.load(profile_file)
+
+        for phase, phase_time in profile[PHASE_TIMES].items():
+            phase_times[phase] = phase_times.get(phase, 0.0) + phase_time
+            phase_calls[phase] = phase_calls.get(phase, 0) + \
+                profile[PHASE_CALLS][phase]
+
+        if profile[PEAK_MEMORY] is not None:
+            peak_memories.append((profile[PEAK_MEMORY], prefix))
+            if profile[PEAK_MEMORY] == max(peak_memories)[0]:
+                top_allocations = profile[TOP_ALLOCATIONS]
+
+    with open(report_prefix + ".txt", 'w') as report:
+        report.write("Phase times (seconds, summed over {n} blocks):\n".format(
+            n=len(output_prefixes)))
+        for phase in sorted(phase_times):
+            report.write("  {p}: {t:.3f} ({c} calls)\n".format(
+                p=phase, t=phase_times[phase], c=phase_calls[phase]))
+
+        report.write("\nPeak traced memory (MB) per block:\n")
+        if len(peak_memories) == 0:
+            report.write("  not available\n")
+        for peak_memory, prefix in peak_memories:
+            report.write("  {b}: {m:.1f}\n".format(
+                b=os.path.basename(prefix), m=peak_memory))
+
+        if len(top_allocations) > 0:
+            report.write("\nLargest allocations at peak, for block with " +
+                         "highest peak memory (MB, count):\n")
+            for location, size, count in top_allocations:
+                report.write("  {l}: {s:.2f} ({c})\n".format(
+                    l=location, s=size, c=count))
+
+        if len(output_prefixes) == 0:
+            return
+
+        report.write("\n")
+        stats = pstats.Stats(output_prefixes[0] + CPU_PROFILE_SUFFIX,
+                             stream=report)
+        for prefix in output_prefixes[1:]:
+            stats.add(prefix + CPU_PROFILE_SUFFIX)
+
+        stats.dump_stats(report_prefix + CPU_PROFILE_SUFFIX)
+        stats.sort_stats("tottime").print_stats(NUM_TOP_FUNCTIONS)
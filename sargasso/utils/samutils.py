@@ -1,4 +1,6 @@
+import os
 import pysam
+import tempfile
 
 
 def open_samfile_for_read(filename):
@@ -8,13 +10,32 @@ def open_samfile_for_read(filename):
     # https://github.com/pysam-developers/pysam/issues/51
     return pysam.Samfile(filename, "rb", check_sq=False)
 
-def open_samfile_for_write(filename, template):
-    return pysam.Samfile(filename, "wb", template=template)
+def _get_format_options(compression_level):
+    # If no BGZF compression level is given, htslib's default is used
+    return [] if compression_level is None else \
+        ["level={l}".format(l=compression_level)]
+
+def open_samfile_for_write(filename, template, compression_level=None):
+    return pysam.Samfile(filename, "wb", template=template,
+                         format_options=_get_format_options(compression_level))
+
+def open_samfile_for_write_with_header(filename, header,
+                                       compression_level=None):
+    return pysam.Samfile(filename, "wb", header=header,
+                         format_options=_get_format_options(compression_level))
 
 def all_hits(samfile):
     return samfile.fetch(until_eof=True)
 
-def hits_generator(samfile):
+def hits_generator(samfile, max_hits=None, tmp_dir=None):
+    # If a maximum number of hits is given, hits for a read beyond this number
+    # are spilled to a temporary file in 'tmp_dir' (by default, the system
+    # temporary directory), rather than held in memory
+    if max_hits is not None:
+        return _bounded_hits_generator(samfile, max_hits, tmp_dir)
+    return _hits_generator(samfile)
+
+def _hits_generator(samfile):
     last_hit_name = None
     current_hits = None
 
@@ -36,3 +57,99 @@ def hits_generator(samfile):
 
     if current_hits is not None:
         yield current_hits
+
+def _bounded_hits_generator(samfile, max_hits, tmp_dir):
+    current_hits = None
+
+    for hit in all_hits(samfile):
+        if current_hits is None or \
+                hit.query_name != current_hits[0].query_name:
+            if current_hits is not None:
+                yield current_hits
+            current_hits = [hit]
+        else:
+            current_hits = add_hit(
+                current_hits, hit, max_hits, samfile.header, tmp_dir)
+
+    if current_hits is not None:
+        yield current_hits
+
+def add_hit(hits, hit, max_hits, header, tmp_dir=None):
+    # Add a hit to those for a read, returning the read's hits. If the read
+    # already has 'max_hits' hits (and 'max_hits' is not None), the hit is
+    # spilled to a temporary BAM file in 'tmp_dir', with the given header
+    if isinstance(hits, SpilledHits):
+        hits.spill(hit)
+    elif max_hits is None or len(hits) < max_hits:
+        hits.append(hit)
+    else:
+        hits = SpilledHits(hits, header, tmp_dir)
+        hits.spill(hit)
+    return hits
+
+
+class SpilledHits(object):
+    """
+    The hits for a read with more hits than are held in memory. The first hits
+    are held in memory, along with any primary hits among the rest, which are
+    needed to decide the read's species; the remaining hits are written to a
+    temporary BAM file, and only read again if the read's hits are written.
+    """
+
+    # At most two primary hits, for the mates of a read pair, are used
+    MAX_PRIMARY_HITS = 2
+
+    def __init__(self, hits, header, tmp_dir=None):
+        self.hits = hits
+        self.num_held = len(hits)
+        self.num_spilled = 0
+        self.num_primary_spilled = 0
+
+        spill_fd, self.spill_path = tempfile.mkstemp(
+            suffix=".bam", dir=tmp_dir)
+        os.close(spill_fd)
+        self.spill_bam = pysam.AlignmentFile(
+            self.spill_path, "wbu", header=header)
+
+    def __len__(self):
+        return self.num_held + self.num_spilled
+
+    def __getitem__(self, index):
+        return self.hits[index]
+
+    def __iter__(self):
+        return iter(self.hits)
+
+    def spill(self, hit):
+        self.spill_bam.write(hit)
+        self.num_spilled += 1
+
+        if not hit.is_secondary and \
+                self.num_primary_spilled < self.MAX_PRIMARY_HITS:
+            self.hits.append(hit)
+            self.num_primary_spilled += 1
+
+    def replay(self, name=None):
+        """
+        Yield all the hits for the read, in their original order, optionally
+        renaming those read from the temporary file.
+        """
+        for hit in self.hits[:self.num_held]:
+            yield hit
+
+        if self.spill_bam is not None:
+            self.spill_bam.close()
+            self.spill_bam = None
+
+        with open_samfile_for_read(self.spill_path) as spilled:
+            for hit in all_hits(spilled):
+                if name is not None:
+                    hit.query_name = name
+                yield hit
+
+    def close(self):
+        if self.spill_bam is not None:
+            self.spill_bam.close()
+            self.spill_bam = None
+        if os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
@@ -0,0 +1,295 @@
+"""
+Utility functions and classes for recording the progress and resource usage
+of the stages of species separation. Exports:
+
+ProgressReporter: Periodically write a machine-readable progress status file.
+write_status: Write a progress status file.
+read_status: Return the contents of a progress status file.
+aggregate_status: Combine the contents of several progress status files.
+record_stage: Run a command, recording its resource usage.
+write_run_report: Combine the resource usage of all stages into a run report.
+"""
+
+import json
+import os
+import os.path
+import resource
+import subprocess
+import sys
+import time
+
+STATUS_INTERVAL = 10
+
+TELEMETRY_DIR = "telemetry"
+RUN_REPORT_FILE = "run_report.json"
+
+STAGE_RECORD_SUFFIX = ".json"
+STATUS_SUFFIX = ".status"
+
+STATE = "state"
+RUNNING = "running"
+COMPLETE = "complete"
+FAILED = "failed"
+
+ELAPSED = "elapsed_seconds"
+RECORDS_IN = "records_in"
+RECORDS_OUT = "records_out"
+READS_PER_SECOND = "reads_per_second"
+FRACTION_DONE = "fraction_done"
+ETA = "eta_seconds"
+UPDATED = "updated"
+
+STAGE = "stage"
+COMMAND = "command"
+RETURN_CODE = "return_code"
+WALL_TIME = "wall_time_seconds"
+CPU_TIME = "cpu_time_seconds"
+PEAK_RSS = "peak_rss_mb"
+BYTES_READ = "bytes_read"
+BYTES_WRITTEN = "bytes_written"
+STAGES = "stages"
+TOTALS = "totals"
+
+# Block input and output counts returned by getrusage() are in units of 512
+# bytes; the maximum resident set size is in kilobytes on Linux, but in bytes
+# on macOS.
+_BLOCK_SIZE = 512
+
+_POLL_INTERVAL = 0.1
+_MAX_RSS_PER_MB = 1024.0 * 1024 if sys.platform == "darwin" else 1024.0
+
+
+def _write_json_atomically(path, contents):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as out_file:
+        json.dump(contents, out_file, indent=2, sort_keys=True)
+    os.rename(tmp_path, path)
+
+
+def _get_resource_usage(who):
+    usage = resource.getrusage(who)
+    return {
+        CPU_TIME: usage.ru_utime + usage.ru_stime,
+        PEAK_RSS: usage.ru_maxrss / _MAX_RSS_PER_MB,
+        BYTES_READ: usage.ru_inblock * _BLOCK_SIZE,
+        BYTES_WRITTEN: usage.ru_oublock * _BLOCK_SIZE,
+    }
+
+
+class ProgressReporter(object):
+    """
+    Periodically writes a small JSON file describing the progress of a piece of
+    work - the number of records read and written for each species, the rate
+    at which reads are being processed, and an estimate of the time remaining.
+    """
+
+    def __init__(self, status_file, interval=STATUS_INTERVAL):
+        """
+        Create object.
+        status_file: path of the file to which progress will be written.
+        interval: minimum time, in seconds, between writes of the status file.
+        """
+        self.status_file = status_file
+        self.interval = interval
+        self.start_time = time.time()
+        self.last_update = None
+
+    def update(self, records_in, records_out, fraction_done=None,
+               state=RUNNING, force=False):
+        """
+        Write the status file, if the update interval has elapsed since it was
+        last written.
+
+        records_in: dictionary mapping species to number of reads read.
+        records_out: dictionary mapping species to number of reads written.
+        fraction_done: estimated fraction of the input processed, or None if
+        this cannot be estimated.
+        state: one of RUNNING, COMPLETE or FAILED.
+        force: if True, write the status file regardless of the interval.
+        """
+        now = time.time()
+        if not force and self.last_update is not None and \
+                now - self.last_update < self.interval:
+            return
+
+        self.last_update = now
+        elapsed = now - self.start_time
+        reads = max(records_in.values()) if records_in else 0
+
+        eta = None
+        if state == COMPLETE:
+            fraction_done = 1.0
+            eta = 0
+        elif fraction_done:
+            eta = elapsed * (1 - fraction_done) / fraction_done
+
+        write_status(self.status_file, {
+            STATE: state,
+            ELAPSED: elapsed,
+            RECORDS_IN: records_in,
+            RECORDS_OUT: records_out,
+            READS_PER_SECOND: reads / elapsed if elapsed > 0 else 0,
+            FRACTION_DONE: fraction_done,
+            ETA: eta,
+            UPDATED: now})
+
+    def finish(self, records_in, records_out):
+        """
+        Write the status file, recording that the work is complete.
+
+        records_in: dictionary mapping species to number of reads read.
+        records_out: dictionary mapping species to number of reads written.
+        """
+        self.update(records_in, records_out, state=COMPLETE, force=True)
+
+
+def write_status(status_file, status):
+    """
+    Atomically write a progress status file.
+
+    status_file: path of a progress status file.
+    status: dictionary describing progress, as written by ProgressReporter.
+    """
+    _write_json_atomically(status_file, status)
+
+
+def read_status(status_file):
+    """
+    Return the contents of a progress status file, or None if it has not yet
+    been written.
+
+    status_file: path of a progress status file.
+    """
+    if not os.path.isfile(status_file):
+        return None
+
+    with open(status_file) as status:
+        return json.load(status)
+
+
+def aggregate_status(statuses):
+    """
+    Combine the contents of several progress status files, describing pieces
+    of work running concurrently, into a single status.
+
+    statuses: list of progress statuses, as returned by 'read_status'; any
+    which are None are treated as not yet having started.
+    """
+    records_in = {}
+    records_out = {}
+    reads_per_second = 0
+    elapsed = 0
+    eta = 0
+    fractions = []
+
+    for status in statuses:
+        if status is None:
+            fractions.append(0.0)
+            eta = None
+            continue
+
+        for totals, counts in [(records_in, status[RECORDS_IN]),
+                               (records_out, status[RECORDS_OUT])]:
+            for species, count in counts.items():
+                totals[species] = totals.get(species, 0) + count
+
+        reads_per_second += status[READS_PER_SECOND]
+
+        elapsed = max(elapsed, status[ELAPSED])
+        fractions.append(status[FRACTION_DONE] or 0.0)
+
+        if eta is not None:
+            eta = None if status[ETA] is None else max(eta, status[ETA])
+
+    if all(s is not None and s[STATE] == COMPLETE for s in statuses):
+        state = COMPLETE
+    elif any(s is not None and s[STATE] == FAILED for s in statuses):
+        state = FAILED
+    else:
+        state = RUNNING
+
+    return {
+        STATE: state,
+        ELAPSED: elapsed,
+        RECORDS_IN: records_in,
+        RECORDS_OUT: records_out,
+        READS_PER_SECOND: reads_per_second,
+        FRACTION_DONE: sum(fractions) / len(fractions) if fractions else None,
+        ETA: eta,
+        UPDATED: time.time()}
+
+
+def _get_stage_record_path(telemetry_dir, stage):
+    return os.path.join(telemetry_dir, stage + STAGE_RECORD_SUFFIX)
+
+
+def record_stage(telemetry_dir, stage, command, interval=STATUS_INTERVAL):
+    """
+    Run a command, periodically writing a status file while it runs, and
+    afterwards writing a record of its wall time, CPU time, peak memory usage
+    and the number of bytes it read from and wrote to disk. Return the
+    command's return code.
+
+    Resource usage is that of the command and all the processes it started.
+    Bytes read and written count only input and output performed by the
+    filesystem, and so exclude reads satisfied from the page cache.
+    telemetry_dir: directory in which status files and records are written.
+    stage: name of the stage the command performs.
+    command: list of command line arguments.
+    interval: time, in seconds, between writes of the status file.
+    """
+    if not os.path.isdir(telemetry_dir):
+        os.makedirs(telemetry_dir)
+
+    status_file = os.path.join(telemetry_dir, stage + STATUS_SUFFIX)
+    reporter = ProgressReporter(status_file, interval)
+
+    start_time = time.time()
+    process = subprocess.Popen(command)
+
+    while process.poll() is None:
+        reporter.update({}, {})
+        time.sleep(_POLL_INTERVAL)
+
+    return_code = process.returncode
+    reporter.update({}, {}, state=COMPLETE if return_code == 0 else FAILED,
+                    force=True)
+
+    record = _get_resource_usage(resource.RUSAGE_CHILDREN)
+    record.update({
+        STAGE: stage,
+        COMMAND: command,
+        RETURN_CODE: return_code,
+        WALL_TIME: time.time() - start_time})
+
+    _write_json_atomically(
+        _get_stage_record_path(telemetry_dir, stage), record)
+
+    return return_code
+
+
+def write_run_report(telemetry_dir, report_file):
+    """
+    Write a JSON run report combining the resource usage records of all
+    stages, in the order in which they completed, along with their totals.
+
+    telemetry_dir: directory in which stage records were written.
+    report_file: path of the run report to write.
+    """
+    stages = []
+
+    if os.path.isdir(telemetry_dir):
+        for record_file in os.listdir(telemetry_dir):
+            if record_file.endswith(STAGE_RECORD_SUFFIX):
+                record_path = os.path.join(telemetry_dir, record_file)
+                with open(record_path) as record:
+                    stages.append((os.path.getmtime(record_path),
+                                   json.load(record)))
+
+    stages = [s[1] for s in sorted(stages, key=lambda s: s[0])]
+
+    totals = dict([(key, sum([s[key] for s in stages])) for key in
+                   [WALL_TIME, CPU_TIME, BYTES_READ, BYTES_WRITTEN]])
+    totals[PEAK_RSS] = max([s[PEAK_RSS] for s in stages]) if stages else 0
+
+    _write_json_atomically(report_file, {STAGES: stages, TOTALS: totals})
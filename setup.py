@@ -19,14 +19,33 @@ setup(
     scripts=[
         'bin/build_star_index',
         'bin/build_bowtie2_index',
+        'bin/build_star_mask_index',
+        'bin/build_kmer_index',
+        'bin/classify_reads',
+        'bin/collapse_reads',
+        'bin/collate_mapped_reads',
         'bin/collate_raw_reads',
+        'bin/combine_genomes',
+        'bin/compact_read_names',
+        'bin/check_read_order',
+        'bin/chunk_reads',
+        'bin/filter_benchmark',
         'bin/filter_control',
         'bin/filter_reads',
         'bin/filter_sample_reads',
         'bin/map_reads_rnaseq',
         'bin/map_reads_dnaseq',
+        'bin/mask_reads_rnaseq',
+        'bin/mask_reads_dnaseq',
+        'bin/pipeline_benchmark',
+        'bin/queue_worker',
+        'bin/record_stage',
         'bin/sargasso_parameter_test',
+        'bin/schedule_jobs',
         'bin/sort_reads',
+        'bin/split_combined_bam',
+        'bin/split_reads',
         'bin/species_separator',
+        'bin/write_run_report',
     ]
 )
@@ -0,0 +1,30 @@
+import gzip
+
+import pytest
+
+
+def _write_fastq(path, reads):
+    # Write reads, given as pairs of header line (without the leading '@')
+    # and sequence, to a gzipped FASTQ file
+    with gzip.open(path, 'wt') as fastq:
+        for header, sequence in reads:
+            fastq.write("@{h}\n{s}\n+\n{q}\n".format(
+                h=header, s=sequence, q="I" * len(sequence)))
+
+
+def _read_fastq(path):
+    # Return the header line (without the leading '@') and sequence of each
+    # read in a gzipped FASTQ file
+    with gzip.open(path, 'rt') as fastq:
+        lines = fastq.read().splitlines()
+    return [(lines[i][1:], lines[i + 1]) for i in range(0, len(lines), 4)]
+
+
+@pytest.fixture
+def write_fastq():
+    return _write_fastq
+
+
+@pytest.fixture
+def read_fastq():
+    return _read_fastq
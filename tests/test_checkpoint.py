@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from sargasso.filter import checkpoint
+
+
+def test_marker_round_trip(tmpdir):
+    output_bam = str(tmpdir.join("s1___mouse___0___filtered.bam"))
+    marker_path = checkpoint.get_marker_path(output_bam)
+    stats = [10, 4, 6, 2, 1, 1]
+    reasons = [[1, 2, 3], [4, 5, 6]]
+
+    assert not checkpoint.is_complete(marker_path)
+
+    checkpoint.write_marker(marker_path, stats, [output_bam], reasons)
+
+    assert checkpoint.is_complete(marker_path)
+    assert checkpoint.read_marker(marker_path) == stats
+    assert checkpoint.read_marker_reasons(marker_path) == reasons
+    assert tmpdir.listdir() == [tmpdir.join(os.path.basename(marker_path))]
+
+
+def test_failed_write_leaves_no_marker(tmpdir):
+    marker_path = checkpoint.get_marker_path(str(tmpdir.join("out.bam")))
+
+    # Statistics which cannot be serialised fail part way through writing
+    with pytest.raises(TypeError):
+        checkpoint.write_marker(marker_path, [1, object()], [])
+
+    assert not checkpoint.is_complete(marker_path)
+
+
+def test_rewritten_marker_replaces_previous(tmpdir):
+    marker_path = checkpoint.get_marker_path(str(tmpdir.join("out.bam")))
+
+    # A temporary file left by an interrupted write does not mark the block
+    # complete, and is replaced by the next write
+    tmpdir.join("out.bam.done.tmp").write("{\"stats\": [1")
+    assert not checkpoint.is_complete(marker_path)
+
+    checkpoint.write_marker(marker_path, [1, 2], [])
+    checkpoint.write_marker(marker_path, [3, 4], [])
+
+    assert checkpoint.read_marker(marker_path) == [3, 4]
+    assert checkpoint.read_marker_reasons(marker_path) is None
+    assert not tmpdir.join("out.bam.done.tmp").check()
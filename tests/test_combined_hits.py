@@ -0,0 +1,115 @@
+import pysam
+
+import sargasso.utils.samutils as su
+
+from sargasso.filter import combined_hits
+
+SPECIES = ["mouse", "rat"]
+
+HEADER = {"HD": {"VN": "1.0", "SO": "unsorted"},
+          "SQ": [{"SN": "mouse__chr1", "LN": 10000},
+                 {"SN": "rat__chr1", "LN": 10000},
+                 {"SN": "rat__chr2", "LN": 10000}]}
+
+# Reads, not sorted by name, and the combined contig index and start position
+# of each of their hits; the first hit of each read is its primary hit, except
+# for r1, whose primary hit to rat falls beyond the number held in memory
+READS = [
+    ("r2", [(0, 100), (2, 200)]),
+    ("r1", [(1, 300), (0, 400), (2, 500), (2, 600), (0, 700), (1, 800)]),
+    ("r3", [(-1, -1)]),
+]
+PRIMARY_HITS = {"r2": 100, "r1": 800}
+
+
+def _write_bam(path):
+    with pysam.AlignmentFile(path, "wb", header=HEADER) as bam:
+        for name, hits in READS:
+            for reference_id, start in hits:
+                hit = pysam.AlignedSegment()
+                hit.query_name = name
+                hit.query_sequence = "ACGT"
+                hit.reference_id = reference_id
+                hit.reference_start = start
+                if reference_id < 0:
+                    hit.is_unmapped = True
+                else:
+                    hit.cigartuples = [(0, 4)]
+                    hit.is_secondary = start != PRIMARY_HITS[name]
+                bam.write(hit)
+
+
+def _positions(hits):
+    return [(hit.query_name, hit.reference_id, hit.reference_start)
+            for hit in hits]
+
+
+def _read_species_hits(bam_path, max_hits=None, tmp_dir=None):
+    reader = combined_hits.CombinedHitsReader(
+        bam_path, SPECIES, max_hits, tmp_dir)
+    reads = []
+    for species_hits in reader.reads():
+        read = []
+        for hits in species_hits:
+            if isinstance(hits, su.SpilledHits):
+                read.append(_positions(hits.replay()))
+                hits.close()
+            else:
+                read.append(_positions(hits))
+        reads.append(read)
+    reader.close()
+    return reads
+
+
+def test_reads_divides_hits_between_species(tmpdir):
+    bam_path = str(tmpdir.join("combined.bam"))
+    _write_bam(bam_path)
+
+    assert _read_species_hits(bam_path) == [
+        [[("r2", 0, 100)], [("r2", 1, 200)]],
+        [[("r1", 0, 400), ("r1", 0, 700)],
+         [("r1", 0, 300), ("r1", 1, 500), ("r1", 1, 600), ("r1", 0, 800)]],
+        [[], []],
+    ]
+
+
+def test_bounded_reads_spill_each_species_hits(tmpdir):
+    bam_path = str(tmpdir.join("combined.bam"))
+    _write_bam(bam_path)
+    spill_dir = tmpdir.mkdir("spill")
+
+    reader = combined_hits.CombinedHitsReader(
+        bam_path, SPECIES, 2, str(spill_dir))
+    r2, r1, r3 = list(reader.reads())
+
+    mouse_hits, rat_hits = r1
+    assert not isinstance(mouse_hits, su.SpilledHits)
+    assert isinstance(rat_hits, su.SpilledHits)
+    assert len(rat_hits) == 4
+    # The hits held in memory include the spilled primary hit
+    assert _positions(rat_hits) == \
+        [("r1", 0, 300), ("r1", 1, 500), ("r1", 0, 800)]
+    assert [str(path) for path in spill_dir.listdir()] == \
+        [rat_hits.spill_path]
+    rat_hits.close()
+    reader.close()
+
+    assert _read_species_hits(bam_path, 2, str(spill_dir)) == \
+        _read_species_hits(bam_path)
+    assert spill_dir.listdir() == []
+
+
+def test_split_blocks_keeps_read_hits_together(tmpdir, monkeypatch):
+    monkeypatch.setattr(combined_hits, "_BLOCK_CHUNK_READS", 1)
+    bam_path = str(tmpdir.join("combined.bam"))
+    _write_bam(bam_path)
+    block_bams = [str(tmpdir.join("block_{i}.bam".format(i=i)))
+                  for i in range(2)]
+
+    combined_hits.split_blocks(bam_path, block_bams)
+
+    blocks = []
+    for block_bam in block_bams:
+        with su.open_samfile_for_read(block_bam) as bam:
+            blocks.append([hit.query_name for hit in su.all_hits(bam)])
+    assert blocks == [["r2"] * 2 + ["r3"], ["r1"] * 6]
@@ -0,0 +1,89 @@
+from sargasso.filter import decision_trace as dt
+from sargasso.filter.hits_checker import HitsChecker
+
+
+def _threshold_data(index, violated, multimaps, mismatches, cigar_check):
+    return HitsChecker.ThresholdData(
+        index, violated, multimaps, mismatches, cigar_check)
+
+
+def _write_trace(trace_path, species, decisions):
+    tracer = dt.DecisionTracer(str(trace_path), species, 1)
+    for decision in decisions:
+        tracer.trace(*decision)
+    tracer.close()
+
+
+def test_trace_round_trip(tmpdir):
+    trace_path = tmpdir.join("block.trace")
+    _write_trace(trace_path, ["mouse", "rat"], [
+        ("read1", 0, dt.REASON_MISMATCHES,
+         [(0, _threshold_data(0, False, 1, 0, HitsChecker.CIGAR_GOOD)),
+          (1, _threshold_data(1, False, 2, 3, HitsChecker.CIGAR_LESS_GOOD))]),
+        ("read2", HitsChecker.REJECTED, dt.REASON_ALL_VIOLATED,
+         [(1, _threshold_data(0, True, 12, 5, HitsChecker.CIGAR_FAIL))]),
+    ])
+
+    species, decisions = dt.read_trace(str(trace_path))
+
+    assert species == ["mouse", "rat"]
+    assert [d.read_name for d in decisions] == ["read1", "read2"]
+    assert decisions[0].assignee == 0
+    assert decisions[0].reason == dt.REASON_MISMATCHES
+    assert decisions[0].species == [
+        dt.SpeciesDecisionData(True, False, 1, 0, HitsChecker.CIGAR_GOOD),
+        dt.SpeciesDecisionData(True, False, 2, 3, HitsChecker.CIGAR_LESS_GOOD)]
+    assert decisions[1].assignee == HitsChecker.REJECTED
+    assert decisions[1].species == [
+        dt.SpeciesDecisionData(False, False, 0, 0, 0),
+        dt.SpeciesDecisionData(True, True, 12, 5, HitsChecker.CIGAR_FAIL)]
+
+
+def test_trace_paired_dnaseq_values(tmpdir):
+    # For paired-end DNA-seq reads, multimaps and mismatches are averaged over
+    # the mates of a pair
+    trace_path = tmpdir.join("block.trace")
+    _write_trace(trace_path, ["mouse", "rat"], [
+        ("pair1", 1, dt.REASON_MISMATCHES,
+         [(0, _threshold_data(0, False, 1.0, 1.5, HitsChecker.CIGAR_GOOD)),
+          (1, _threshold_data(1, False, 2.5, 0.5, HitsChecker.CIGAR_GOOD))]),
+    ])
+
+    species, decisions = dt.read_trace(str(trace_path))
+
+    assert [(s.multimaps, s.mismatches) for s in decisions[0].species] == \
+        [(1, 1.5), (2.5, 0.5)]
+
+
+def test_trace_sampling_is_deterministic(tmpdir):
+    names = ["read{i}".format(i=i) for i in range(1000)]
+    traced = []
+    for run in range(2):
+        trace_path = tmpdir.join("run{r}.trace".format(r=run))
+        tracer = dt.DecisionTracer(str(trace_path), ["mouse", "rat"], 0.25)
+        for name in names:
+            tracer.trace(name, 0, dt.REASON_ONLY_SPECIES,
+                         [(0, _threshold_data(0, False, 1, 0, 0))])
+        tracer.close()
+        traced.append([d.read_name for d in dt.read_trace(str(trace_path))[1]])
+
+    assert traced[0] == traced[1]
+    assert 150 < len(traced[0]) < 350
+
+
+def test_merge_traces(tmpdir):
+    trace_paths = []
+    for block in range(2):
+        trace_path = tmpdir.join("block{b}.trace".format(b=block))
+        _write_trace(trace_path, ["mouse", "rat"], [
+            ("read{b}".format(b=block), 0, dt.REASON_ONLY_SPECIES,
+             [(0, _threshold_data(0, False, 1, 0, 0))])])
+        trace_paths.append(str(trace_path))
+
+    merged_path = str(tmpdir.join("merged.trace"))
+    dt.merge_traces(trace_paths + [str(tmpdir.join("missing.trace"))],
+                    merged_path)
+
+    species, decisions = dt.read_trace(merged_path)
+    assert species == ["mouse", "rat"]
+    assert [d.read_name for d in decisions] == ["read0", "read1"]
@@ -0,0 +1,42 @@
+from sargasso.filter import duplicates
+
+# Read pairs, in sequencing order: r2 and r4 duplicate r1, while r3 differs
+# from r1 only in its second mate
+READS = [
+    ("r1", "ACGT", "TTTT"),
+    ("r2", "ACGT", "TTTT"),
+    ("r3", "ACGT", "GGGG"),
+    ("r4", "ACGT", "TTTT"),
+    ("r5", "CCCC", "AAAA"),
+]
+
+
+def test_collapse_and_expand_read_pairs(tmpdir, write_fastq, read_fastq):
+    reads_files = []
+    for mate in [1, 2]:
+        fastq_path = str(tmpdir.join("reads_{m}.fastq.gz".format(m=mate)))
+        write_fastq(fastq_path, [("{n}/{m}".format(n=read[0], m=mate),
+                                  read[mate]) for read in READS])
+        reads_files.append([fastq_path])
+    sample_dir = tmpdir.join("sample")
+
+    assert duplicates.collapse_reads(
+        reads_files, str(sample_dir), str(tmpdir)) == (5, 3)
+
+    collapsed = [read_fastq(str(sample_dir.join(
+        reads_dir, duplicates.COLLAPSED_READS_FILE)))
+        for reads_dir in duplicates.READS_DIRS]
+    names = [name for name, sequence in collapsed[0]]
+    assert [name for name, sequence in collapsed[1]] == names
+    assert [sequence for name, sequence in collapsed[1]] == \
+        ["TTTT", "GGGG", "AAAA"]
+
+    table = duplicates.DuplicatesTable(
+        str(sample_dir.join(duplicates.DUPLICATES_FILE)))
+    try:
+        assert [table.get_read_names(name) for name in names] == \
+            [["r1", "r2", "r4"], ["r3"], ["r5"]]
+    finally:
+        table.close()
+
+    assert names[1:] == ["r3|0", "r5|0"]
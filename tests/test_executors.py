@@ -0,0 +1,88 @@
+import json
+import logging
+import os
+import socket
+import subprocess
+import time
+
+from sargasso.utils import executors
+
+
+def _write_running(queue_dir, handle, **spec):
+    spec.update({"name": handle, "command": ["true"], "cwd": str(queue_dir),
+                 "log": None})
+    running_file = queue_dir.join(executors.RUNNING_DIR, handle + ".json")
+    running_file.write(json.dumps(spec))
+    return running_file
+
+
+def _worker(queue_dir):
+    return executors.QueueWorker(str(queue_dir), logging.getLogger(__name__))
+
+
+def _dead_pid():
+    process = subprocess.Popen(["true"])
+    process.wait()
+    return process.pid
+
+
+def test_command_of_dead_worker_is_requeued(tmpdir):
+    worker = _worker(tmpdir)
+    _write_running(tmpdir, "dead", host=socket.gethostname(), pid=_dead_pid())
+    _write_running(tmpdir, "alive", host=socket.gethostname(), pid=os.getpid())
+
+    worker._requeue_stale_commands()
+
+    assert tmpdir.join(executors.PENDING_DIR).listdir() == \
+        [tmpdir.join(executors.PENDING_DIR, "dead.json")]
+    assert tmpdir.join(executors.RUNNING_DIR, "alive.json").check()
+
+
+def test_command_without_heartbeat_is_requeued(tmpdir):
+    worker = _worker(tmpdir)
+    stale_time = time.time() - executors.QueueWorker.STALE_TIMEOUT - 1
+    running_file = _write_running(tmpdir, "remote", host="elsewhere", pid=1)
+    os.utime(str(running_file), (stale_time, stale_time))
+    _write_running(tmpdir, "fresh", host="elsewhere", pid=1)
+
+    worker._requeue_stale_commands()
+
+    assert tmpdir.join(executors.PENDING_DIR, "remote.json").check()
+    assert tmpdir.join(executors.RUNNING_DIR, "fresh.json").check()
+
+
+def test_finished_command_is_not_requeued(tmpdir):
+    worker = _worker(tmpdir)
+    _write_running(tmpdir, "finished", host=socket.gethostname(),
+                   pid=_dead_pid())
+    tmpdir.join(executors.DONE_DIR, "finished.json").write(
+        json.dumps({"return_code": 0}))
+
+    worker._requeue_stale_commands()
+
+    assert tmpdir.join(executors.RUNNING_DIR).listdir() == []
+    assert tmpdir.join(executors.PENDING_DIR).listdir() == []
+
+
+def test_worker_runs_commands_serving_queue(tmpdir, monkeypatch):
+    monkeypatch.setattr(executors.QueueWorker, "POLL_INTERVAL", 0.01)
+    monkeypatch.chdir(tmpdir)
+
+    executor = executors.QueueExecutor(str(tmpdir))
+    log_path = str(tmpdir.join("command.log"))
+    handle = executor.submit(
+        "echo", ["sh", "-c", "echo $" + executors.QUEUE_DIR_VARIABLE],
+        log_path)
+    tmpdir.join(executors.SHUTDOWN_FILE).write("")
+
+    _worker(tmpdir).run()
+
+    assert executor.poll(handle) == 0
+    assert tmpdir.join(executors.RUNNING_DIR).listdir() == []
+    with open(log_path) as log_file:
+        serving_dir = log_file.read().strip()
+    assert serving_dir == os.path.realpath(str(tmpdir))
+
+    monkeypatch.setenv(executors.QUEUE_DIR_VARIABLE, serving_dir)
+    assert executors.is_serving_queue(str(tmpdir))
+    assert not executors.is_serving_queue(str(tmpdir.join("other")))
@@ -0,0 +1,84 @@
+import logging
+
+import pysam
+
+from sargasso.filter.fastq_writer import FastqWriter
+
+
+def _hit(name, sequence, paired=True, read2=False, secondary=False):
+    hit = pysam.AlignedSegment()
+    hit.query_name = name
+    if sequence is not None:
+        hit.query_sequence = sequence
+        hit.query_qualities = pysam.qualitystring_to_array(
+            "I" * len(sequence))
+    hit.is_paired = paired
+    hit.is_read1 = paired and not read2
+    hit.is_read2 = read2
+    hit.is_secondary = secondary
+    return hit
+
+
+def _names(reads):
+    return [name for name, sequence in reads]
+
+
+def test_mates_are_written_together(tmpdir, read_fastq):
+    writer = FastqWriter(str(tmpdir.join("out.bam")))
+    writer.write([_hit("r1", "ACGT"), _hit("r1", "TTTT", read2=True)])
+    writer.write([_hit("r2", "ACGT")])
+    writer.write([_hit("r3", "GGGG", read2=True)])
+    writer.write([_hit("r4", "ACGT"), _hit("r4", "CCCC", read2=True),
+                  _hit("r4", "CCCC", read2=True, secondary=True)])
+    writer.close()
+
+    prefix = str(tmpdir.join("out"))
+    assert writer.get_paths() == [
+        prefix + "_1.fastq.gz", prefix + "_2.fastq.gz",
+        prefix + "_singletons.fastq.gz"]
+    assert _names(read_fastq(prefix + "_1.fastq.gz")) == ["r1", "r4"]
+    assert _names(read_fastq(prefix + "_2.fastq.gz")) == ["r1", "r4"]
+    assert _names(read_fastq(prefix + "_singletons.fastq.gz")) == ["r2", "r3"]
+
+
+def test_single_end_reads(tmpdir, read_fastq):
+    writer = FastqWriter(str(tmpdir.join("out.bam")))
+    writer.write([_hit("r1", "ACGT", paired=False)])
+    writer.write([_hit("r2", "ACGT", paired=False)])
+    writer.close()
+
+    assert writer.get_paths() == [str(tmpdir.join("out.fastq.gz"))]
+    assert _names(read_fastq(str(tmpdir.join("out.fastq.gz")))) == ["r1", "r2"]
+
+
+def test_no_files_written_without_reads(tmpdir):
+    writer = FastqWriter(str(tmpdir.join("out.bam")))
+    writer.close()
+
+    assert writer.get_paths() == []
+    assert tmpdir.listdir() == []
+
+
+def test_hits_recording_sequence_are_preferred(tmpdir, read_fastq):
+    # The primary hit for the first mate does not record its sequence, but a
+    # secondary hit does
+    writer = FastqWriter(str(tmpdir.join("out.bam")))
+    writer.write([_hit("r1", None), _hit("r1", "ACGT", secondary=True),
+                  _hit("r1", "TTTT", read2=True)])
+    writer.close()
+
+    prefix = str(tmpdir.join("out"))
+    assert read_fastq(prefix + "_1.fastq.gz") == [("r1", "ACGT")]
+    assert read_fastq(prefix + "_2.fastq.gz") == [("r1", "TTTT")]
+
+
+def test_read_without_sequence_is_skipped(tmpdir, read_fastq, caplog):
+    writer = FastqWriter(str(tmpdir.join("out.bam")),
+                         logging.getLogger(__name__))
+    writer.write([_hit("r1", None, paired=False, secondary=True)])
+    writer.write([_hit("r2", "ACGT", paired=False, secondary=True)])
+    writer.close()
+
+    assert read_fastq(str(tmpdir.join("out.fastq.gz"))) == [("r2", "ACGT")]
+    assert writer.skipped_reads == 1
+    assert "r1" in caplog.text
@@ -0,0 +1,29 @@
+import itertools
+import logging
+
+from sargasso.filter.hits_checker import HitsChecker
+
+CIGAR_CHECKS = [
+    HitsChecker.CIGAR_GOOD, HitsChecker.CIGAR_LESS_GOOD,
+    HitsChecker.CIGAR_FAIL]
+
+
+def test_pair_decisions_match_general_decisions():
+    checker = HitsChecker(0, 0, 1, False, logging.getLogger(__name__))
+
+    # Each species' hits may or may not violate the thresholds, and have
+    # fewer, the same or more mismatches (which, for paired DNA-seq reads,
+    # are averaged over mates), CIGAR problems and multimaps than the other's
+    for violated in itertools.product([False, True], repeat=2):
+        for mismatches, cigar_checks, multimaps in itertools.product(
+                itertools.product([0, 0.5, 2], repeat=2),
+                itertools.product(CIGAR_CHECKS, repeat=2),
+                itertools.product([1, 2, 3], repeat=2)):
+            threshold_data = [
+                HitsChecker.ThresholdData(
+                    i, violated[i], multimaps[i], mismatches[i],
+                    cigar_checks[i])
+                for i in range(2)]
+
+            assert checker._assign_hits_standard(threshold_data) == \
+                checker._assign_hits_general(threshold_data), threshold_data
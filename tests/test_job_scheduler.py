@@ -0,0 +1,100 @@
+import logging
+
+from sargasso.separator.job_scheduler import Job, JobPlan, JobScheduler
+
+
+class _Executor(object):
+    """
+    Records the resources in use as each job is started; every job finishes,
+    with the given return code, when next polled.
+    """
+
+    def __init__(self, scheduler, return_codes=None):
+        self.scheduler = scheduler
+        self.return_codes = return_codes if return_codes else {}
+        self.started = []
+        self.usage = []
+
+    def submit(self, name, command, log_path=None):
+        self.started.append(name)
+        self.usage.append((self.scheduler.threads_used,
+                           self.scheduler.memory_used,
+                           self.scheduler.disk_used))
+        return name
+
+    def poll(self, handle):
+        return self.return_codes.get(handle, 0)
+
+
+def _run(tmpdir, monkeypatch, plan, return_codes=None):
+    monkeypatch.setattr(JobScheduler, "POLL_INTERVAL", 0)
+    monkeypatch.chdir(tmpdir)
+
+    scheduler = JobScheduler(None)
+    scheduler.executor = _Executor(scheduler, return_codes)
+    succeeded = scheduler._run_jobs(logging.getLogger(__name__), plan)
+    return scheduler, succeeded
+
+
+def test_running_jobs_stay_within_limits(tmpdir, monkeypatch):
+    names = ["map_{i}".format(i=i) for i in range(4)]
+    jobs = [Job(name, [name], threads=2, memory=10) for name in names]
+    plan = JobPlan(jobs, [], max_threads=4, max_memory=25)
+
+    scheduler, succeeded = _run(tmpdir, monkeypatch, plan)
+
+    assert succeeded
+    assert scheduler.executor.started == names
+    assert max(threads for threads, memory, disk
+               in scheduler.executor.usage) == 4
+    assert max(memory for threads, memory, disk
+               in scheduler.executor.usage) == 20
+    assert (scheduler.threads_used, scheduler.memory_used) == (0, 0)
+
+
+def test_oversized_job_runs_alone(tmpdir, monkeypatch):
+    jobs = [Job("small", ["small"], memory=1),
+            Job("large", ["large"], memory=50),
+            Job("after", ["after"], memory=1)]
+    plan = JobPlan(jobs, [], max_threads=4, max_memory=10)
+
+    scheduler, succeeded = _run(tmpdir, monkeypatch, plan)
+
+    assert succeeded
+    # Later jobs which fit are started while the large job waits
+    assert scheduler.executor.started == ["small", "after", "large"]
+    assert scheduler.executor.usage == [(1, 1, 0), (2, 2, 0), (1, 50, 0)]
+
+
+def test_disk_is_released_by_cleanup(tmpdir, monkeypatch):
+    mapped = tmpdir.join("mapped.bam")
+    mapped.write("")
+    jobs = [Job("map", ["map"], disk=5),
+            Job("sort", ["sort"], disk=2, dependencies=["map"],
+                cleanup=[str(mapped)], releases=["map"]),
+            Job("map_2", ["map_2"], disk=7)]
+    plan = JobPlan(jobs, [], max_threads=4, max_disk=10)
+
+    scheduler, succeeded = _run(tmpdir, monkeypatch, plan)
+
+    assert succeeded
+    # The second sample's mapping cannot start until the first's mapped
+    # reads have been deleted by sorting
+    assert scheduler.executor.started == ["map", "sort", "map_2"]
+    assert scheduler.executor.usage == [(1, 0, 5), (1, 0, 7), (1, 0, 9)]
+    assert scheduler.disk_used == 9
+    assert not mapped.check()
+
+
+def test_failed_job_frees_disk_and_skips_dependents(tmpdir, monkeypatch):
+    jobs = [Job("map", ["map"], disk=5),
+            Job("sort", ["sort"], disk=5, dependencies=["map"],
+                releases=["map"]),
+            Job("filter", ["filter"], dependencies=["sort"])]
+    plan = JobPlan(jobs, [], max_threads=4, max_disk=10)
+
+    scheduler, succeeded = _run(tmpdir, monkeypatch, plan, {"map": 1})
+
+    assert not succeeded
+    assert scheduler.executor.started == ["map"]
+    assert scheduler.disk_used == 0
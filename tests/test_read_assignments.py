@@ -0,0 +1,79 @@
+from sargasso.filter import read_assignments
+from sargasso.filter.hits_checker import HitsChecker
+from sargasso.separator import main
+
+SPECIES = ["mouse", "rat"]
+
+# Reads, in sequencing order, and the assignment recorded for each, or None
+# for reads which were not mapped
+READS = [
+    ("r03", 1),
+    ("r01", 0),
+    ("r10", HitsChecker.REJECTED),
+    ("r02", None),
+    ("r07", HitsChecker.AMBIGUOUS),
+    ("r05", 0),
+]
+
+
+def _get_reads(mate):
+    return [("{n}/{m} extra".format(n=name, m=mate), "ACGT")
+            for name, assignee in READS]
+
+
+def _write_assignments(tmpdir):
+    # Reads are recorded by two blocks, each in read name order
+    block_paths = []
+    for block, names in enumerate([["r01", "r03", "r05"], ["r07", "r10"]]):
+        block_path = str(tmpdir.join("block{b}.tsv.gz".format(b=block)))
+        recorder = read_assignments.AssignmentRecorder(block_path, SPECIES)
+        for name in names:
+            recorder.record(name, dict(READS)[name])
+        recorder.close()
+        block_paths.append(block_path)
+
+    assignments_path = str(tmpdir.join("s1___read_assignments.tsv.gz"))
+    read_assignments.merge_assignments(
+        block_paths + [str(tmpdir.join("missing.tsv.gz"))], assignments_path)
+    return assignments_path
+
+
+def test_table_is_aligned_with_fastq_order(tmpdir, write_fastq):
+    assignments_path = _write_assignments(tmpdir)
+    fastq_path = str(tmpdir.join("reads_1.fastq.gz"))
+    write_fastq(fastq_path, _get_reads(1))
+
+    assert read_assignments.read_species(assignments_path) == SPECIES
+
+    table = read_assignments.build_table(
+        assignments_path, [fastq_path], str(tmpdir))
+    assert list(table) == [
+        1, 0, read_assignments.REJECTED, read_assignments.UNMAPPED,
+        read_assignments.AMBIGUOUS, 0]
+
+    table_path = str(tmpdir.join("table.bin"))
+    read_assignments.write_table(table_path, SPECIES, table)
+    assert read_assignments.read_table(table_path) == (SPECIES, table)
+
+
+def test_split_reads_writes_assigned_pairs(tmpdir, write_fastq, read_fastq):
+    assignments_path = _write_assignments(tmpdir)
+    fastq_paths = [str(tmpdir.join("reads_{m}.fastq.gz".format(m=m)))
+                   for m in [1, 2]]
+    for mate, fastq_path in enumerate(fastq_paths):
+        write_fastq(fastq_path, _get_reads(mate + 1))
+    table_path = str(tmpdir.join("table.bin"))
+    prefix = str(tmpdir.join("split"))
+
+    # The second run reads the table written by the first
+    for i in range(2):
+        main.split_reads(["--table-file=" + table_path,
+                          "--tmp-dir=" + str(tmpdir), assignments_path,
+                          prefix] + fastq_paths)
+
+        for mate in [1, 2]:
+            for species, names in [("mouse", ["r01", "r05"]),
+                                   ("rat", ["r03"])]:
+                assert [header.split("/")[0] for header, sequence
+                        in read_fastq("{p}.{s}_{m}.fastq.gz".format(
+                            p=prefix, s=species, m=mate))] == names
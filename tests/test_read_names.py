@@ -0,0 +1,76 @@
+import gzip
+import os.path
+
+from sargasso.filter import read_names
+
+NAMES = ["SRR1.{i} instrument:{i}".format(i=i) for i in range(5)]
+
+
+def _get_reads_files(tmpdir, write_fastq):
+    reads_files = []
+    for mate in [1, 2]:
+        fastq_path = str(tmpdir.join("reads_{m}.fastq.gz".format(m=mate)))
+        write_fastq(fastq_path, [("{n}/{m}".format(n=name, m=mate), "ACGT")
+                                 for name in NAMES])
+        reads_files.append([fastq_path])
+    return reads_files
+
+
+def _read_ids(path, read_fastq):
+    return [header for header, sequence in read_fastq(path)]
+
+
+def test_compacted_names_are_restored(tmpdir, write_fastq, read_fastq):
+    sample_dir = tmpdir.join("sample")
+
+    assert read_names.compact_read_names(
+        _get_reads_files(tmpdir, write_fastq), str(sample_dir)) == len(NAMES)
+
+    read_ids = [read_names.get_read_id(i) for i in range(len(NAMES))]
+    for reads_dir in read_names.READS_DIRS:
+        assert _read_ids(str(sample_dir.join(
+            reads_dir, read_names.COMPACTED_READS_FILE)), read_fastq) == \
+            read_ids
+
+    table = read_names.ReadNamesTable(
+        str(sample_dir.join(read_names.READ_NAMES_FILE)))
+    try:
+        assert [table.get_name(read_id) for read_id in read_ids] == \
+            [name.split()[0] for name in NAMES]
+    finally:
+        table.close()
+
+
+def test_read_ids_are_assigned_across_chunks(tmpdir, write_fastq,
+                                             read_fastq):
+    sample_dir = tmpdir.join("sample")
+    chunk_dirs = [str(tmpdir.join("chunk{c}".format(c=c))) for c in [1, 2]]
+
+    read_names.compact_read_names(
+        _get_reads_files(tmpdir, write_fastq), str(sample_dir), chunk_dirs)
+
+    chunk_ids = [_read_ids(os.path.join(
+        chunk_dir, "reads_2", read_names.COMPACTED_READS_FILE), read_fastq)
+        for chunk_dir in chunk_dirs]
+    assert chunk_ids == [
+        [read_names.get_read_id(i) for i in [0, 2, 4]],
+        [read_names.get_read_id(i) for i in [1, 3]]]
+
+    table = read_names.ReadNamesTable(
+        str(sample_dir.join(read_names.READ_NAMES_FILE)))
+    try:
+        assert table.get_name(chunk_ids[1][1]) == "SRR1.3"
+    finally:
+        table.close()
+
+
+def test_empty_names_file(tmpdir):
+    sample_dir = tmpdir.join("sample")
+    empty = tmpdir.join("empty.fastq.gz")
+    with gzip.open(str(empty), 'wt'):
+        pass
+
+    assert read_names.compact_read_names([[str(empty)]], str(sample_dir)) == 0
+
+    read_names.ReadNamesTable(
+        str(sample_dir.join(read_names.READ_NAMES_FILE))).close()
@@ -0,0 +1,105 @@
+import logging
+import os.path
+
+import pysam
+
+import sargasso.utils.samutils as su
+
+from sargasso.filter.hits_manager import HitsManager
+
+HEADER = {"HD": {"VN": "1.0", "SO": "queryname"},
+          "SQ": [{"SN": "chr1", "LN": 10000}]}
+
+# Reads, in name order, and the start position of each of their hits; the
+# primary hit of r2 falls beyond the number of hits held in memory
+READS = [
+    ("r1", [100, 200]),
+    ("r2", [300, 400, 500, 600, 700, 800]),
+    ("r3", [900]),
+]
+PRIMARY_HITS = {"r1": 100, "r2": 700, "r3": 900}
+
+
+def _write_bam(path):
+    with pysam.AlignmentFile(path, "wb", header=HEADER) as bam:
+        for name, starts in READS:
+            for start in starts:
+                hit = pysam.AlignedSegment()
+                hit.query_name = name
+                hit.query_sequence = "ACGT"
+                hit.reference_id = 0
+                hit.reference_start = start
+                hit.cigartuples = [(0, 4)]
+                hit.is_secondary = start != PRIMARY_HITS[name]
+                bam.write(hit)
+
+
+def _positions(hits):
+    return [(hit.query_name, hit.reference_start) for hit in hits]
+
+
+def _read_hits(bam_path, max_hits=None, tmp_dir=None):
+    with su.open_samfile_for_read(bam_path) as bam:
+        for hits in su.hits_generator(bam, max_hits, tmp_dir):
+            yield hits
+
+
+def test_spilled_hits_replay_in_original_order(tmpdir):
+    bam_path = str(tmpdir.join("hits.bam"))
+    _write_bam(bam_path)
+
+    unbounded = [_positions(hits) for hits in _read_hits(bam_path)]
+
+    spill_dir = tmpdir.mkdir("spill")
+    bounded = []
+    for hits in _read_hits(bam_path, 2, str(spill_dir)):
+        if isinstance(hits, su.SpilledHits):
+            assert os.path.dirname(hits.spill_path) == str(spill_dir)
+            # The hits held in memory include the spilled primary hit
+            assert len(hits) == 6
+            assert _positions(hits) == [("r2", 300), ("r2", 400), ("r2", 700)]
+
+            bounded.append(_positions(hits.replay()))
+            spill_path = hits.spill_path
+            hits.close()
+            assert not os.path.exists(spill_path)
+        else:
+            bounded.append(_positions(hits))
+
+    assert bounded == unbounded
+
+
+class _OriginalNames(object):
+    def get_name(self, read_id):
+        return "original_" + read_id
+
+
+def _write_renamed_hits(bam_path, output_bam, max_hits):
+    hits_manager = HitsManager(
+        None, 1, bam_path, output_bam, logging.getLogger(__name__),
+        original_names=_OriginalNames(), max_hits_in_memory=max_hits)
+    try:
+        while True:
+            hits_manager.get_next_read_hits()
+            hits_manager.write_hits()
+            hits_manager.clear_hits()
+    except StopIteration:
+        pass
+    hits_manager.close()
+
+    with su.open_samfile_for_read(output_bam) as bam:
+        return _positions(su.all_hits(bam))
+
+
+def test_spilled_hits_are_written_renamed(tmpdir):
+    bam_path = str(tmpdir.join("hits.bam"))
+    _write_bam(bam_path)
+
+    unbounded = _write_renamed_hits(
+        bam_path, str(tmpdir.join("unbounded.bam")), None)
+    bounded = _write_renamed_hits(
+        bam_path, str(tmpdir.join("bounded.bam")), 2)
+
+    assert bounded == unbounded
+    assert [name for name, start in bounded] == \
+        ["original_r1"] * 2 + ["original_r2"] * 6 + ["original_r3"]
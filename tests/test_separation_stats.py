@@ -0,0 +1,18 @@
+from sargasso.filter.separation_stats import SeparationStats
+
+
+def test_written_hits_are_reported_as_written():
+    stats = SeparationStats(1)
+    stats.accepted_hits(["hit_1", "hit_2"])
+
+    assert str(stats).startswith(
+        "Species 1: wrote 2 filtered hits for 1 reads;")
+
+
+def test_decide_only_hits_are_reported_as_accepted():
+    stats = SeparationStats(2, decide_only=True)
+    stats.copies = 3
+    stats.accepted_hits(["hit_1", "hit_2"])
+
+    assert str(stats).startswith(
+        "Species 2: accepted 6 filtered hits for 3 reads;")